@@ -2,27 +2,65 @@
 
 from __future__ import annotations
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException
-from fastapi.responses import FileResponse
-
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import time
+from collections.abc import AsyncIterator
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from api.artifact_response import ArtifactResponse, content_digest
+from core.config import get_settings
 from core.logging_config import get_logger
 from models.map_request import (
     JobStatusResponse,
     MapGenerationRequest,
     MapGenerationResponse,
 )
+from services.admission import AdmissionController, resolve_budget
 from services.data_sources import DataSourceFactory, DataSourceType
 from services.data_sources.base import Capability
+from services.job_queue.dispatcher import QueueDispatcher
 from services.jobs import JobStatus, job_store
 from services.pipeline import MapGenerationPipeline
+from services.scheduler import JobScheduler, QueueFullError
 
 logger = get_logger(__name__)
 
 router = APIRouter()
 
-#: One pipeline per process; it owns the concurrency semaphore.
+#: One pipeline per process; it owns the stage worker processes.
 _pipeline: MapGenerationPipeline | None = None
 
+#: One scheduler per process; it owns the queue and the generation slots. In
+#: worker mode a dispatcher hands jobs to the workers instead.
+_scheduler: JobScheduler | QueueDispatcher | None = None
+
+#: Seconds a client is told to wait when the queue is full.
+_RETRY_AFTER_SECONDS = 60
+
+#: How long deleting a running job waits for it to stop.
+_STOP_TIMEOUT_SECONDS = 5.0
+
+#: Least time between two events on a status stream. Updates in between are
+#: coalesced into one event carrying the newest state.
+_EVENT_INTERVAL_SECONDS = 0.25
+
+#: Longest silence on a status stream before a comment line is sent, so that
+#: proxies do not close it as idle.
+_KEEPALIVE_SECONDS = 15.0
+
+#: Most jobs one ``/api/jobs`` page returns.
+_MAX_PAGE_SIZE = 500
+
+#: How often a status stream re-reads its job in worker mode, where progress
+#: is reported by other processes and never published in this one.
+_SHARED_POLL_SECONDS = 1.0
+
 
 def get_pipeline() -> MapGenerationPipeline:
     """Return the shared pipeline, constructing it on first use."""
@@ -32,6 +70,55 @@ def get_pipeline() -> MapGenerationPipeline:
     return _pipeline
 
 
+def get_scheduler() -> JobScheduler | QueueDispatcher:
+    """
+    Return the shared scheduler, constructing it on first use.
+
+    With a shared job store (``QUEUE_URL``) this is a dispatcher that queues
+    jobs for worker processes.
+    """
+    global _scheduler
+    if _scheduler is None:
+        settings = get_settings()
+        if job_store.shared is not None:
+            _scheduler = QueueDispatcher(
+                job_store.shared, job_store, max_queued=settings.max_queued_jobs
+            )
+            return _scheduler
+        _scheduler = JobScheduler(
+            get_pipeline().run,
+            job_store,
+            workers=settings.max_concurrent_jobs,
+            fast_lane_workers=settings.fast_lane_workers,
+            max_queued=settings.max_queued_jobs,
+            fast_max_heightmap=settings.fast_lane_max_heightmap,
+            admission=AdmissionController(resolve_budget(settings.memory_budget_mb)),
+            state_path=settings.temp_dir / "queue.json",
+        )
+    return _scheduler
+
+
+def start_scheduler() -> int:
+    """Build the scheduler and requeue jobs left by the previous process."""
+    return get_scheduler().restore()
+
+
+def close_pipeline() -> None:
+    """
+    Stop the scheduler and the pipeline's worker processes.
+
+    Running generations finish first; queued ones stay recorded for the next
+    start.
+    """
+    global _pipeline, _scheduler
+    if _scheduler is not None:
+        _scheduler.shutdown()
+        _scheduler = None
+    if _pipeline is not None:
+        _pipeline.close()
+        _pipeline = None
+
+
 @router.get("/data-sources")
 async def get_data_sources() -> dict:
     """
@@ -91,9 +178,7 @@ async def get_data_sources() -> dict:
 
 
 @router.post("/generate", response_model=MapGenerationResponse, status_code=202)
-async def generate_map(
-    request: MapGenerationRequest, background_tasks: BackgroundTasks
-) -> MapGenerationResponse:
+async def generate_map(request: MapGenerationRequest) -> MapGenerationResponse:
     """
     Start map generation.
 
@@ -101,8 +186,24 @@ async def generate_map(
     progress. The request body is fully validated first (name slug, bbox
     extent, power-of-two heightmap), so an invalid request fails with a 422 and
     a clear message rather than halfway through the pipeline.
+
+    Resubmitting an identical request does not start another generation: the
+    response carries the running or finished job's id, with ``reused`` set.
+    When the queue is full the request is refused with a 503 and nothing is
+    recorded.
     """
-    job = job_store.create(request.name)
+    pipeline = get_pipeline()
+    job, reused = job_store.create_or_reuse(request.name, pipeline.result_key(request))
+    if reused:
+        finished = job.status is JobStatus.COMPLETED
+        return MapGenerationResponse(
+            success=True,
+            message="Map already generated" if finished else "Identical map generation already running",
+            map_id=job.job_id,
+            map_name=job.map_name,
+            download_url=f"/api/download/{job.job_id}" if finished else None,
+            reused=True,
+        )
 
     logger.info(
         "Job %s queued: %s, bbox=%s, %.2f km2, source=%s",
@@ -113,15 +214,20 @@ async def generate_map(
         request.data_source,
     )
 
-    # A *sync* callable, so Starlette runs it in the worker thread pool instead
-    # of on the event loop.
-    background_tasks.add_task(get_pipeline().run, job.job_id, request)
+    try:
+        position = get_scheduler().submit(job.job_id, request)
+    except QueueFullError as exc:
+        job_store.discard(job.job_id)
+        raise HTTPException(
+            status_code=503, detail=str(exc), headers={"Retry-After": str(_RETRY_AFTER_SECONDS)}
+        ) from exc
 
     return MapGenerationResponse(
         success=True,
-        message="Map generation started",
+        message="Map generation queued",
         map_id=job.job_id,
         map_name=job.map_name,
+        queue_position=position,
     )
 
 
@@ -134,15 +240,68 @@ async def get_generation_status(job_id: str) -> JobStatusResponse:
     return JobStatusResponse(**job.to_dict())
 
 
+@router.get("/status/{job_id}/events")
+async def stream_generation_status(job_id: str) -> StreamingResponse:
+    """
+    Stream the status of a generation job as Server-Sent Events.
+
+    Each event's data is the body ``/api/status/{job_id}`` would return, sent
+    as soon as the job changes; a burst of changes arrives as one event with
+    the newest state. The stream ends after the job reaches a terminal state
+    or is deleted.
+    """
+    if job_store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return StreamingResponse(
+        _status_events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/jobs")
-async def list_jobs() -> dict:
-    """List known jobs, newest first."""
-    jobs = sorted(job_store, key=lambda job: job.created_at, reverse=True)
-    return {"jobs": [job.to_dict() for job in jobs], "count": len(jobs)}
+async def list_jobs(
+    request: Request,
+    status: JobStatus | None = None,
+    name: str | None = None,
+    limit: int = Query(default=100, ge=1, le=_MAX_PAGE_SIZE),
+    cursor: str | None = None,
+) -> Response:
+    """
+    List known jobs, newest first, one page at a time.
+
+    ``next_cursor`` fetches the following page and is ``null`` on the last.
+    The response carries an ``ETag``; sending it back as ``If-None-Match``
+    with the same query answers ``304`` while no job has changed, without
+    reading any job.
+    """
+    before = _decode_cursor(cursor) if cursor is not None else None
+    query = {"status": status, "name": name, "limit": limit, "before": before}
+    version = job_store.version
+    if version is not None:
+        etag = _listing_etag(version, query)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
+    page = job_store.page(limit=limit, before=before, status=status, name=name)
+    body = {
+        "jobs": [job.to_dict() for job in page.jobs],
+        "count": len(page.jobs),
+        "next_cursor": _encode_cursor(page.next_before) if page.next_before else None,
+    }
+    if page.version is not None:
+        etag = _listing_etag(page.version, query)
+    else:
+        # Other processes change a shared store, so no version is known here.
+        digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()[:16]
+        etag = _listing_etag(digest, query)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(body, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 
 @router.get("/download/{job_id}")
-async def download_map(job_id: str) -> FileResponse:
+async def download_map(job_id: str) -> ArtifactResponse:
     """
     Download the generated mod archive.
 
@@ -151,46 +310,159 @@ async def download_map(job_id: str) -> FileResponse:
     ``output / f"{job['map_name']}.zip"``, which let a crafted map name reach
     any file the server process could read.
     """
-    return _serve_artifact(job_id, "archive", media_type="application/zip", as_attachment=True)
+    return await _serve_artifact(job_id, "archive", media_type="application/zip", as_attachment=True)
 
 
 @router.get("/preview/{job_id}")
-async def get_preview(job_id: str) -> FileResponse:
+async def get_preview(job_id: str) -> ArtifactResponse:
     """Get the rendered heightmap preview image."""
-    return _serve_artifact(job_id, "preview", media_type="image/png", as_attachment=False)
+    return await _serve_artifact(job_id, "preview", media_type="image/png", as_attachment=False)
+
+
+@router.get("/profile/{job_id}")
+async def get_profile(job_id: str) -> ArtifactResponse:
+    """
+    Download a profiled job's stack samples, in the folded format flame graph tools read.
+
+    Served for failed and cancelled jobs too: a job that was too slow is often
+    one that was given up on.
+    """
+    return await _serve_artifact(
+        job_id,
+        "profile",
+        media_type="text/plain; charset=utf-8",
+        as_attachment=True,
+        extension=".folded",
+        any_outcome=True,
+    )
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobStatusResponse, status_code=202)
+async def cancel_job(job_id: str) -> JobStatusResponse:
+    """
+    Cancel a queued or running job.
+
+    A queued job is cancelled at once. A running job stops at its next
+    cancellation point, normally within a second, and then reports
+    ``cancelled``; poll ``/api/status/{job_id}`` to see it happen. A job that
+    has already finished answers 409.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if job.status.is_terminal or not get_scheduler().cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job has already finished")
+    # Read again: a queued job is cancelled by now.
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return JobStatusResponse(**job.to_dict())
 
 
 @router.delete("/jobs/{job_id}")
 async def delete_job(job_id: str) -> dict:
-    """Delete a job and the files it produced."""
+    """
+    Delete a job and the files it produced.
+
+    A queued or running job is cancelled first. If a running job does not stop
+    within a few seconds the request answers 409 and can be retried; the job
+    is still being cancelled.
+    """
     job = job_store.get(job_id)
     if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    if not job.status.is_terminal:
-        raise HTTPException(status_code=409, detail="Job is still running")
+    scheduler = get_scheduler()
+    if not job.status.is_terminal and scheduler.cancel(job_id):
+        stopped = await asyncio.to_thread(scheduler.wait_stopped, job_id, _STOP_TIMEOUT_SECONDS)
+        if not stopped:
+            raise HTTPException(status_code=409, detail="Job is still stopping; try again shortly")
+
+    # Artefacts shared with other jobs through the blob store survive until
+    # their last user is gone.
+    job_store.discard(job_id)
+    return {"deleted": job_id}
 
-    for path in job.artifacts.values():
-        try:
-            path.unlink(missing_ok=True)
-        except OSError as exc:  # pragma: no cover - platform dependent
-            logger.warning("Could not delete %s: %s", path, exc)
 
-    job_store.update(job_id, status=JobStatus.CANCELLED)
-    job_store.cleanup_expired(now=job.updated_at + job_store.retention_seconds + 1)
-    return {"deleted": job_id}
+async def _status_events(job_id: str) -> AsyncIterator[str]:
+    """The event stream behind :func:`stream_generation_status`."""
+    watch = job_store.events.subscribe(job_id, asyncio.get_running_loop())
+    # Subscribed before the first read, so no change can fall in between.
+    payload = _status_payload(job_id)
+    wait_seconds = _SHARED_POLL_SECONDS if job_store.shared is not None else _KEEPALIVE_SECONDS
+    sent: str | None = None
+    written_at = time.monotonic()
+    try:
+        while payload is not None:
+            if payload != sent:
+                yield f"data: {payload}\n\n"
+                sent, written_at = payload, time.monotonic()
+                if JobStatus(json.loads(payload)["status"]).is_terminal:
+                    return
+                await asyncio.sleep(_EVENT_INTERVAL_SECONDS)
+            elif time.monotonic() - written_at >= _KEEPALIVE_SECONDS:
+                yield ": keep-alive\n\n"
+                written_at = time.monotonic()
+
+            if await watch.wait(wait_seconds):
+                payload = watch.take()
+            elif job_store.shared is not None:
+                payload = _status_payload(job_id)
+    finally:
+        job_store.events.unsubscribe(watch)
+
+
+def _status_payload(job_id: str) -> str | None:
+    job = job_store.get(job_id)
+    return json.dumps(job.to_dict()) if job is not None else None
+
+
+def _listing_etag(version: str, query: dict[str, object]) -> str:
+    """
+    Tag a listing by the store's version and the normalised query.
 
+    The version alone would be shared by every page and filter, so a client
+    revalidating one page could be told it still holds another.
+    """
+    canonical = json.dumps({"version": version, "query": query}, sort_keys=True)
+    return f'"jobs-{hashlib.sha256(canonical.encode()).hexdigest()[:16]}"'
+
+
+def _encode_cursor(order_key: tuple[float, str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(order_key)).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[float, str]:
+    """Inverse of :func:`_encode_cursor`; a malformed cursor answers 400."""
+    try:
+        created_at, job_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(created_at), str(job_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
 
-def _serve_artifact(
-    job_id: str, role: str, *, media_type: str, as_attachment: bool
-) -> FileResponse:
-    """Resolve and serve a job artefact, with precise error codes."""
+
+async def _serve_artifact(
+    job_id: str,
+    role: str,
+    *,
+    media_type: str,
+    as_attachment: bool,
+    extension: str = ".zip",
+    any_outcome: bool = False,
+) -> ArtifactResponse:
+    """
+    Resolve and serve a job artefact, with precise error codes.
+
+    Only a completed job's artefacts are served, unless ``any_outcome``: then
+    those of any finished job.
+    """
     job = job_store.get(job_id)
     if job is None:
         raise HTTPException(status_code=404, detail="Job not found or expired")
 
-    if job.status is JobStatus.FAILED:
-        raise HTTPException(status_code=409, detail=job.error or "Map generation failed")
-    if job.status is not JobStatus.COMPLETED:
+    servable = job.status.is_terminal if any_outcome else job.status is JobStatus.COMPLETED
+    if not servable:
+        if job.status is JobStatus.FAILED:
+            raise HTTPException(status_code=409, detail=job.error or "Map generation failed")
         raise HTTPException(
             status_code=409,
             detail=f"Map generation is not finished yet ({job.progress}%)",
@@ -200,8 +472,14 @@ def _serve_artifact(
     if path is None or not path.exists():
         raise HTTPException(status_code=404, detail=f"{role.title()} file is no longer available")
 
-    return FileResponse(
-        path=path,
+    # A blob is named by its hash; any other file is hashed (once) here.
+    blobs = job_store.blobs
+    content_addressed = blobs is not None and blobs.owns(path)
+    digest = blobs.digest(path) if content_addressed else await asyncio.to_thread(content_digest, path)
+    return ArtifactResponse(
+        path,
+        digest=digest,
+        immutable=content_addressed,
         media_type=media_type,
-        filename=f"{job.map_name}.zip" if as_attachment else None,
+        filename=f"{job.map_name}{extension}" if as_attachment else None,
     )
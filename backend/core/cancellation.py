@@ -0,0 +1,199 @@
+"""
+Cooperative cancellation of generation jobs.
+
+A running job could not be stopped: ``DELETE /api/jobs/{id}`` answered 409 and
+the only way out of a mistaken 8192 px request was to wait for it. Python
+threads cannot be killed, so cancellation is cooperative. The job's code checks
+a token at points where stopping is cheap and safe:
+
+* **Between stages.** :meth:`~services.pipeline.ProgressReporter.start` is a
+  cancellation point, so a cancelled job never begins another stage.
+* **Inside long loops.** Tile downloads, the banded heightmap resample, the
+  per-building mesh loop and ZIP chunking call :func:`check_cancelled` on every
+  iteration.
+* **Around blocking network calls.** ``requests`` cannot be interrupted from
+  another thread. :func:`run_abandonable` runs such a call on a helper thread
+  and gives up waiting for it as soon as the token fires. The helper keeps the
+  token and stops at its own next check, usually the next tile or the next
+  chunk of a download (:func:`~services.data_sources.base.stream_request`),
+  and its result is discarded. Async clients such as the Ollama one are cancelled properly:
+  :func:`await_cancellable` cancels the task, which closes the request.
+
+The token is carried in a :class:`~contextvars.ContextVar` rather than passed
+through every signature: data sources, the terrain processor and the ZIP
+writer are shared library code with no notion of a job. Code that starts a
+thread on a job's behalf must copy the context, or the thread cannot see the
+token.
+
+:class:`JobCancelledError` derives from :class:`BaseException`, like
+:class:`asyncio.CancelledError`. The pipeline has several deliberate
+``except Exception`` blocks that degrade gracefully: AI segmentation is
+optional, and a failed tile is skipped. A cancellation must not be absorbed by
+one of them and turned into a job that "succeeds" without its roads.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager, suppress
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+#: How often a caller waiting on abandonable work looks at its token, in seconds.
+POLL_INTERVAL_SECONDS = 0.1
+
+
+class JobCancelledError(BaseException):
+    """Raised at a cancellation point once the job's token has been cancelled."""
+
+
+class CancellationToken:
+    """
+    A one-way flag shared by the canceller and the job being cancelled.
+
+    A token with a ``parent`` is also cancelled when its parent is: a branch of
+    a job can then be stopped on its own, and still stops with the job.
+    """
+
+    def __init__(self, parent: CancellationToken | None = None) -> None:
+        self._event = threading.Event()
+        self._parent = parent
+        self._superseded = False
+
+    def cancel(self) -> None:
+        """Request cancellation. Idempotent."""
+        self._event.set()
+
+    def supersede(self) -> None:
+        """
+        Cancel because another run has taken the job over.
+
+        The job's record belongs to that run now, so this one must stop without
+        writing to it: :class:`~services.jobs.JobStore` drops changes made under
+        a superseded token.
+        """
+        self._superseded = True
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set() or (self._parent is not None and self._parent.cancelled)
+
+    @property
+    def superseded(self) -> bool:
+        return self._superseded or (self._parent is not None and self._parent.superseded)
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise JobCancelledError("Job was cancelled")
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until cancelled or ``timeout`` elapses; returns :attr:`cancelled`."""
+        if self._parent is None:
+            return self._event.wait(timeout)
+        # The parent's event cannot wake this one, so look at it now and then.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.cancelled:
+            remaining = POLL_INTERVAL_SECONDS if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._event.wait(min(remaining, POLL_INTERVAL_SECONDS))
+        return self.cancelled
+
+
+_current: contextvars.ContextVar[CancellationToken | None] = contextvars.ContextVar(
+    "cancellation_token", default=None
+)
+
+
+@contextmanager
+def cancellation_scope(token: CancellationToken) -> Iterator[CancellationToken]:
+    """Make ``token`` the current one for the duration of the block."""
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+
+def current_token() -> CancellationToken | None:
+    """The token of the job running in this context, if any."""
+    return _current.get()
+
+
+def check_cancelled() -> None:
+    """
+    A cancellation point.
+
+    Raises :class:`JobCancelledError` if the current job has been cancelled;
+    outside a job it does nothing.
+    """
+    token = _current.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def is_superseded() -> bool:
+    """Whether the job running in this context has been taken over by another run."""
+    token = _current.get()
+    return token is not None and token.superseded
+
+
+def run_abandonable(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Call ``fn`` but stop waiting for it as soon as the job is cancelled.
+
+    ``fn`` runs on a daemon thread in a copy of the caller's context, so its own
+    cancellation points still see the token. Without a current token this is a
+    plain call.
+    """
+    token = _current.get()
+    if token is None:
+        return fn(*args, **kwargs)
+    token.raise_if_cancelled()
+
+    context = contextvars.copy_context()
+    outcome: dict[str, Any] = {}
+    done = threading.Event()
+
+    def target() -> None:
+        try:
+            outcome["value"] = context.run(fn, *args, **kwargs)
+        except BaseException as exc:  # noqa: BLE001 - handed back to the caller
+            outcome["error"] = exc
+        finally:
+            done.set()
+
+    threading.Thread(target=target, name="abandonable", daemon=True).start()
+    while not done.wait(POLL_INTERVAL_SECONDS):
+        token.raise_if_cancelled()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["value"]
+
+
+async def await_cancellable(awaitable: Awaitable[T]) -> T:
+    """
+    Await ``awaitable``, cancelling it when the current job is cancelled.
+
+    Task cancellation propagates into the client, so an in-flight HTTP request
+    is closed rather than left to finish.
+    """
+    token = _current.get()
+    task = asyncio.ensure_future(awaitable)
+    if token is None:
+        return await task
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=POLL_INTERVAL_SECONDS)
+        if done:
+            return task.result()
+        if token.cancelled:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+            raise JobCancelledError("Job was cancelled")
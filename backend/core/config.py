@@ -94,8 +94,63 @@ class Settings(BaseSettings):
         ge=60,
         description="How long a finished job (and its artefacts) is kept before cleanup",
     )
+    persist_jobs: bool = Field(
+        True, description="Record jobs in OUTPUT_DIR/jobs.db so they survive a restart"
+    )
     max_concurrent_jobs: int = Field(
-        2, ge=1, le=16, description="Maximum map generations running at the same time"
+        2,
+        ge=1,
+        le=16,
+        description="Maximum map generations running at the same time, memory permitting",
+    )
+    memory_budget_mb: int = Field(
+        0,
+        ge=0,
+        description="Estimated peak memory running generations may hold together (0 = half the RAM)",
+    )
+    max_queued_jobs: int = Field(
+        32,
+        ge=1,
+        le=1000,
+        description="Generations allowed to wait for a free slot before new ones are refused",
+    )
+    fast_lane_workers: int = Field(
+        1, ge=0, le=8, description="Extra slots that only run small jobs (no AI, small heightmap)"
+    )
+    fast_lane_max_heightmap: int = Field(
+        1024, ge=256, le=16384, description="Largest heightmap size that counts as a small job"
+    )
+    export_workers: int = Field(
+        0,
+        ge=0,
+        le=64,
+        description="Threads used to compress mod archives (0 = one per CPU core)",
+    )
+    vector_tile_size: int = Field(
+        1024,
+        ge=0,
+        le=16384,
+        description=(
+            "Masks larger than this are vectorised in tiles, one thread per CPU core "
+            "(0 = never tile); the vectors are identical either way"
+        ),
+    )
+    queue_url: str = Field(
+        "",
+        description=(
+            "Shared job queue for separate worker processes (sqlite:///<path> or redis://<host>); "
+            "empty runs generations in the API process"
+        ),
+    )
+    process_workers: int = Field(
+        0,
+        ge=0,
+        le=64,
+        description="Worker processes for CPU-heavy stages (0 = run them in the job's thread)",
+    )
+    profile_jobs: bool = Field(
+        False,
+        description="Sample every job with the built-in profiler and keep the profile as an artefact",
     )
 
     # -- Data sources ---------------------------------------------------------
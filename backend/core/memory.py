@@ -0,0 +1,132 @@
+"""
+Process and machine memory figures, without third-party dependencies.
+
+Admission control needs two numbers: how much RAM the machine has, to size the
+default budget, and how much this process is using right now, to record what a
+job actually cost. ``psutil`` would provide both but is a compiled dependency
+the bundled executable does not otherwise need. Linux and macOS expose them
+through ``/proc`` and ``sysconf``; Windows through two kernel32/psapi calls.
+
+Stage metrics also want the bytes the process has read and written, network
+included; Linux has them in ``/proc/self/io`` and Windows in one more
+kernel32 call.
+
+All of these return ``None`` when the platform gives no answer, and callers
+must cope with that.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import os
+import sys
+from pathlib import Path
+
+_STATM = Path("/proc/self/statm")
+_IO = Path("/proc/self/io")
+
+
+def physical_memory_bytes() -> int | None:
+    """Total physical memory of the machine."""
+    if sys.platform == "win32":
+        return _windows_physical_memory()
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def current_rss_bytes() -> int | None:
+    """Resident set size of this process right now."""
+    if sys.platform == "win32":
+        return _windows_working_set()
+    try:
+        # Second field: resident pages.
+        resident_pages = int(_STATM.read_text().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def io_bytes() -> tuple[int, int] | None:
+    """
+    Bytes this process has read and written so far, as ``(read, written)``.
+
+    Counted at the system call, so sockets are included along with files: a
+    download shows up as bytes read.
+    """
+    if sys.platform == "win32":
+        return _windows_io_bytes()
+    try:
+        fields = dict(line.split(": ", 1) for line in _IO.read_text().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+# -- Windows --------------------------------------------------------------------
+
+
+class _MemoryStatusEx(ctypes.Structure):
+    _fields_ = [
+        ("dwLength", ctypes.c_ulong),
+        ("dwMemoryLoad", ctypes.c_ulong),
+        ("ullTotalPhys", ctypes.c_ulonglong),
+        ("ullAvailPhys", ctypes.c_ulonglong),
+        ("ullTotalPageFile", ctypes.c_ulonglong),
+        ("ullAvailPageFile", ctypes.c_ulonglong),
+        ("ullTotalVirtual", ctypes.c_ulonglong),
+        ("ullAvailVirtual", ctypes.c_ulonglong),
+        ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+    ]
+
+
+class _IoCounters(ctypes.Structure):
+    _fields_ = [
+        ("ReadOperationCount", ctypes.c_ulonglong),
+        ("WriteOperationCount", ctypes.c_ulonglong),
+        ("OtherOperationCount", ctypes.c_ulonglong),
+        ("ReadTransferCount", ctypes.c_ulonglong),
+        ("WriteTransferCount", ctypes.c_ulonglong),
+        ("OtherTransferCount", ctypes.c_ulonglong),
+    ]
+
+
+class _ProcessMemoryCounters(ctypes.Structure):
+    _fields_ = [
+        ("cb", ctypes.c_ulong),
+        ("PageFaultCount", ctypes.c_ulong),
+        ("PeakWorkingSetSize", ctypes.c_size_t),
+        ("WorkingSetSize", ctypes.c_size_t),
+        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+        ("PagefileUsage", ctypes.c_size_t),
+        ("PeakPagefileUsage", ctypes.c_size_t),
+    ]
+
+
+def _windows_physical_memory() -> int | None:  # pragma: no cover - Windows only
+    status = _MemoryStatusEx()
+    status.dwLength = ctypes.sizeof(_MemoryStatusEx)
+    if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+        return None
+    return int(status.ullTotalPhys)
+
+
+def _windows_working_set() -> int | None:  # pragma: no cover - Windows only
+    counters = _ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(_ProcessMemoryCounters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return int(counters.WorkingSetSize)
+
+
+def _windows_io_bytes() -> tuple[int, int] | None:  # pragma: no cover - Windows only
+    counters = _IoCounters()
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.kernel32.GetProcessIoCounters(process, ctypes.byref(counters)):
+        return None
+    return int(counters.ReadTransferCount), int(counters.WriteTransferCount)
@@ -0,0 +1,9 @@
+"""
+Application version.
+
+Kept out of ``main.py`` so services can read it without importing the FastAPI
+app: the result cache keys generated maps by it, so an upgrade never serves an
+archive built by older code.
+"""
+
+APP_VERSION = "1.8.0"
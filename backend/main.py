@@ -7,6 +7,7 @@ FastAPI application that turns a selected map region into a BeamNG.drive mod.
 from __future__ import annotations
 
 import asyncio
+import multiprocessing
 import sys
 from contextlib import asynccontextmanager, suppress
 
@@ -14,21 +15,24 @@ import uvicorn
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
 from api.routes import map_generation
 from api.routes import settings as settings_routes
-from core.config import get_settings
+from core.config import DATA_ROOT, get_settings
 from core.logging_config import configure_logging, get_logger
+from core.version import APP_VERSION
+from services.blob_store import BlobStore
+from services.job_queue import QueueBackendError, open_backend
+from services.job_queue.sqlite_backend import SqliteJobBackend
 from services.jobs import job_store
+from services.metrics import render_gauge, stage_metrics
 
 settings = get_settings()
 configure_logging(settings.log_level)
 logger = get_logger(__name__)
 
-APP_VERSION = "1.8.0"
-
 #: How often finished jobs are swept.
 _CLEANUP_INTERVAL_SECONDS = 15 * 60
 
@@ -52,12 +56,32 @@ async def _cleanup_loop() -> None:
 async def lifespan(app: FastAPI):
     """Application startup and shutdown."""
     logger.info("Starting BeamNG.WorldForge %s", APP_VERSION)
+    # Read afresh rather than at import: the job database and blobs must land
+    # where the settings point now (tests point them at a new directory each).
+    settings = get_settings()
 
     settings.ensure_directories()
     job_store.retention_seconds = settings.job_retention_seconds
+    if settings.queue_url:
+        # Worker mode: jobs run in `python worker.py` processes and their state
+        # lives in the queue backend. Blob references are counted per process,
+        # so artefacts are stored in place.
+        job_store.shared = open_backend(settings.queue_url, base_dir=DATA_ROOT)
+        logger.info("Worker mode: generations are queued at %s", settings.queue_url)
+    else:
+        job_store.blobs = BlobStore(settings.output_dir / "blobs")
+        if settings.persist_jobs:
+            try:
+                job_store.open_database(SqliteJobBackend(settings.output_dir / "jobs.db"))
+            except QueueBackendError as exc:
+                logger.warning("Jobs will not survive a restart: %s", exc)
     logger.info("Output: %s | Temp: %s | Config: %s",
                 settings.output_dir, settings.temp_dir, settings.config_dir)
 
+    restored = map_generation.start_scheduler()
+    if restored:
+        logger.info("Resuming %d generation(s) queued before the last shutdown", restored)
+
     cleanup_task = asyncio.create_task(_cleanup_loop())
 
     yield
@@ -65,6 +89,11 @@ async def lifespan(app: FastAPI):
     cleanup_task.cancel()
     with suppress(asyncio.CancelledError):
         await cleanup_task
+    await asyncio.to_thread(map_generation.close_pipeline)
+    job_store.close_database()
+    if job_store.shared is not None:
+        job_store.shared.close()
+        job_store.shared = None
     logger.info("Shutting down BeamNG.WorldForge")
 
 
@@ -127,11 +156,29 @@ async def health() -> dict:
     return {
         "status": "healthy",
         "version": APP_VERSION,
-        "jobs": {"total": len(job_store), "active": job_store.active_count()},
+        "jobs": {
+            "total": len(job_store),
+            "active": job_store.active_count(),
+            "by_status": {status.value: count for status, count in job_store.status_counts().items()},
+        },
         "frontend_bundled": settings.bundled_static_dir.exists(),
     }
 
 
+@app.get("/api/metrics", tags=["health"], response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Per-stage timings, memory and I/O, and job counts, for Prometheus to scrape."""
+    jobs = render_gauge(
+        "worldforge_jobs",
+        "Jobs held by this process, by status.",
+        "status",
+        {status.value: count for status, count in job_store.status_counts().items()},
+    )
+    return PlainTextResponse(
+        jobs + stage_metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # -- Frontend -------------------------------------------------------------------
 
 _static_dir = settings.bundled_static_dir
@@ -204,4 +251,8 @@ def main() -> None:
 
 
 if __name__ == "__main__":
+    # In the bundled executable, stage worker processes (PROCESS_WORKERS) are
+    # started by re-running this executable; this hands them to their task
+    # instead of starting a second server.
+    multiprocessing.freeze_support()
     main()
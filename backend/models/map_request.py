@@ -96,6 +96,10 @@ class MapGenerationRequest(BaseModel):
         False,
         description="Run AI segmentation over satellite imagery (requires Ollama and an imagery source)",
     )
+    profile: bool = Field(
+        False,
+        description="Profile this job and keep the profile for download (GET /api/profile/{job_id})",
+    )
 
     @field_validator("name", mode="after")
     @classmethod
@@ -150,6 +154,12 @@ class MapGenerationResponse(BaseModel):
     download_url: str | None = None
     preview_url: str | None = None
     error: str | None = None
+    reused: bool = Field(
+        False, description="An identical request's job was returned instead of starting a new one"
+    )
+    queue_position: int | None = Field(
+        None, description="Place in the generation queue when accepted (1 = next to start)"
+    )
 
 
 class JobStatusResponse(BaseModel):
@@ -163,6 +173,10 @@ class JobStatusResponse(BaseModel):
     error: str | None = None
     download_url: str | None = None
     preview_url: str | None = None
+    profile_url: str | None = None
     stats: dict[str, Any] | None = None
+    active_stages: list[str] | None = None
+    completed_stages: list[str] | None = None
+    queue_position: int | None = None
     created_at: float | None = None
     updated_at: float | None = None
@@ -0,0 +1,179 @@
+"""
+Memory-aware admission of generation jobs.
+
+``MAX_CONCURRENT_JOBS`` counts jobs, but jobs differ enormously in size: a
+256 px preview over 1 km² peaks at about 100 MB, while a 4096 px AI job
+over 400 km² holds a DEM mosaic, a resampled heightmap, satellite imagery and
+four masks at once - gigabytes. A count low enough to keep two large jobs from
+exhausting RAM left small jobs queueing for no reason, and a count high enough
+for small jobs let large ones take the server down.
+
+Jobs are now admitted against a memory budget instead:
+
+* :func:`estimate_peak_bytes` predicts a request's peak from the rasters it
+  will hold: the DEM, at the requested resolution or as the source's tile
+  mosaic, whichever is larger; the heightmap; and with AI, the imagery and its
+  masks. Per-pixel costs count the working copies each stage makes, such as
+  the nearest-valid fill indices and the float resampling buffer.
+* :class:`AdmissionController` admits a job only while the estimates of the
+  running jobs plus this one fit in ``MEMORY_BUDGET_MB``. A job larger than the
+  whole budget still runs, alone, rather than never.
+* :class:`PeakRssSampler` records the process's resident set while a job runs.
+  Jobs report ``estimated_peak_mb`` next to ``peak_rss_mb`` so the per-pixel
+  constants below can be checked against reality.
+"""
+
+from __future__ import annotations
+
+import threading
+
+from core.geo import bbox_dimensions, pixel_dimensions
+from core.logging_config import get_logger
+from core.memory import current_rss_bytes, physical_memory_bytes
+from models.map_request import MapGenerationRequest
+from services.data_sources.aws_terrain_client import (
+    TILE_SIZE,
+    lat_lon_to_tile,
+    zoom_for_resolution,
+)
+
+logger = get_logger(__name__)
+
+_MB = 1024 * 1024
+
+#: Interpreter, libraries and per-job bookkeeping.
+_BASE_BYTES = 96 * _MB
+
+#: Raw DEM (float32), cleaned copy (float32), nodata mask and the int64 index
+#: pair of the nearest-valid fill.
+_DEM_BYTES_PER_PIXEL = 28
+
+#: Resampling buffer (float32), the uint16 heightmap, the .ter grids and the
+#: slope/curvature planes of material painting.
+_HEIGHTMAP_BYTES_PER_PIXEL = 24
+
+#: RGB imagery, four class masks, and the float64 distance transform that
+#: measures road widths.
+_IMAGERY_BYTES_PER_PIXEL = 16
+
+#: Ground resolution the pipeline requests imagery at, in metres.
+_IMAGERY_RESOLUTION_M = 10
+
+#: Share of physical memory used as the budget when none is configured.
+_DEFAULT_BUDGET_FRACTION = 0.5
+
+#: Budget when neither a setting nor the machine's memory size is available.
+_FALLBACK_BUDGET_BYTES = 4096 * _MB
+
+
+def estimate_peak_bytes(request: MapGenerationRequest) -> int:
+    """Predicted peak memory of generating ``request``, in bytes."""
+    bbox = request.bbox.to_list()
+    dimensions = bbox_dimensions(*bbox)
+
+    grid_pixels = (dimensions.width_meters / request.resolution) * (
+        dimensions.height_meters / request.resolution
+    )
+    dem_pixels = max(grid_pixels, _mosaic_pixels(bbox, request.resolution))
+
+    total = _BASE_BYTES
+    total += int(dem_pixels * _DEM_BYTES_PER_PIXEL)
+    total += request.heightmap_size**2 * _HEIGHTMAP_BYTES_PER_PIXEL
+    if request.use_ai_segmentation:
+        width, height = pixel_dimensions(bbox, _IMAGERY_RESOLUTION_M)
+        total += width * height * _IMAGERY_BYTES_PER_PIXEL
+    return total
+
+
+def _mosaic_pixels(bbox: list[float], resolution: float) -> int:
+    """Pixels in the tile mosaic a tiled DEM source downloads for ``bbox``."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    zoom = zoom_for_resolution(bbox, resolution)
+    x_min, y_max = lat_lon_to_tile(min_lat, min_lon, zoom)
+    x_max, y_min = lat_lon_to_tile(max_lat, max_lon, zoom)
+    tiles = (x_max - x_min + 1) * (y_max - y_min + 1)
+    return tiles * TILE_SIZE * TILE_SIZE
+
+
+def resolve_budget(budget_mb: int) -> int:
+    """The admission budget in bytes; ``0`` means half the machine's RAM."""
+    if budget_mb > 0:
+        return budget_mb * _MB
+    physical = physical_memory_bytes()
+    if physical is None:
+        logger.warning(
+            "Cannot determine physical memory; set MEMORY_BUDGET_MB. Using %d MB.",
+            _FALLBACK_BUDGET_BYTES // _MB,
+        )
+        return _FALLBACK_BUDGET_BYTES
+    return int(physical * _DEFAULT_BUDGET_FRACTION)
+
+
+class AdmissionController:
+    """
+    Tracks the estimated memory of running jobs against a budget.
+
+    Not synchronised on its own: the scheduler calls it under its lock, so that
+    checking and admitting cannot interleave with another worker's.
+    """
+
+    def __init__(self, budget_bytes: int) -> None:
+        self.budget_bytes = budget_bytes
+        self._admitted: dict[str, int] = {}
+
+    @property
+    def in_use(self) -> int:
+        """Estimated bytes held by admitted jobs."""
+        return sum(self._admitted.values())
+
+    def fits(self, estimate: int) -> bool:
+        """Whether a job of ``estimate`` bytes may start now."""
+        # An oversized job runs once nothing else is running; refusing it
+        # outright would leave it queued forever.
+        return not self._admitted or self.in_use + estimate <= self.budget_bytes
+
+    def admit(self, job_id: str, estimate: int) -> None:
+        self._admitted[job_id] = estimate
+
+    def release(self, job_id: str) -> None:
+        self._admitted.pop(job_id, None)
+
+
+class PeakRssSampler:
+    """
+    Samples the process's resident set on a background thread.
+
+    The figure is process-wide: while other jobs run concurrently it includes
+    their memory too. Jobs therefore also report ``start_rss_mb``: the growth
+    from it is what calibration wants, and is most trustworthy for jobs that
+    ran alone.
+    """
+
+    def __init__(self, interval_seconds: float = 0.25) -> None:
+        self.interval_seconds = interval_seconds
+        self.start_bytes: int | None = None
+        self.peak_bytes: int | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> PeakRssSampler:
+        self.start_bytes = self.peak_bytes = current_rss_bytes()
+        if self.start_bytes is not None:
+            self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *_exc: object) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._observe()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            self._observe()
+
+    def _observe(self) -> None:
+        current = current_rss_bytes()
+        if current is not None and (self.peak_bytes is None or current > self.peak_bytes):
+            self.peak_bytes = current
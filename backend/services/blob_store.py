@@ -0,0 +1,232 @@
+"""
+Content-addressed artefact storage.
+
+Every job used to keep its own copy of its preview and archive. Regenerating a
+map from identical input produces identical bytes (the exporter is
+deterministic), so ten runs of the same region kept ten identical archives on
+disk until retention cleanup caught up with them.
+
+Artefacts are now stored once under the SHA-256 of their content:
+
+* :meth:`BlobStore.put` hashes a file and moves (or hard-links) it to
+  ``<root>/<aa>/<digest><suffix>``. If that blob already exists the new copy
+  is dropped and the existing file is shared.
+* Each ``put`` takes a reference and each :meth:`BlobStore.release` gives one
+  back. The job store takes and releases references as artefacts are attached
+  to jobs and as jobs expire, so a blob is deleted when the last job that uses
+  it is removed.
+
+A *label* names a set of blobs that belong together, such as a map's last
+archive and its manifest, so a later job can find them by something other
+than their content. Labels take no references: a blob is deleted when its last
+job goes, labelled or not, and a label whose blobs are gone is pruned.
+
+Reference counts are kept in memory. Jobs reloaded from the job database take
+theirs again with :meth:`BlobStore.retain`; a blob left over from a previous
+process that no job claims has no references, and :meth:`BlobStore.prune`
+removes it once it is older than the retention window.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+#: Label names are used as file names.
+_LABEL_NAME = re.compile(r"[A-Za-z0-9_-]{1,128}")
+
+
+class BlobStore:
+    """Reference-counted files keyed by the SHA-256 of their content."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = Path(root)
+        self._refs: dict[Path, int] = {}
+        self._lock = threading.Lock()
+
+    def put(self, source: Path, *, keep_source: bool = False) -> Path:
+        """
+        Store ``source`` and take a reference to the resulting blob.
+
+        Args:
+            source: File to store. Its suffix is kept on the blob so anything
+                serving it by extension still sees ``.zip`` or ``.png``.
+            keep_source: Leave ``source`` in place. The blob is then a hard link
+                where the filesystem allows it, so the two share one copy on
+                disk until ``source`` is replaced.
+
+        Returns:
+            The blob's path. Call :meth:`release` with it when done.
+        """
+        source = Path(source)
+        with source.open("rb") as stream:
+            digest = hashlib.file_digest(stream, "sha256").hexdigest()
+        blob = self.root / digest[:2] / f"{digest}{source.suffix.lower()}"
+
+        # Hashing happens outside the lock, but the check-and-place must not
+        # interleave with prune() or with a concurrent put of the same content.
+        with self._lock:
+            if blob.exists():
+                if not keep_source:
+                    source.unlink(missing_ok=True)
+                logger.debug("Artefact %s deduplicated into %s", source.name, blob.name)
+            else:
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                self._place(source, blob, keep_source=keep_source)
+            self._refs[blob] = self._refs.get(blob, 0) + 1
+        return blob
+
+    def retain(self, blob: Path) -> None:
+        """Take another reference to an existing blob."""
+        with self._lock:
+            blob = Path(blob)
+            self._refs[blob] = self._refs.get(blob, 0) + 1
+
+    def release(self, blob: Path, *, delete: bool = True) -> bool:
+        """
+        Give back a reference, deleting the blob when none remain.
+
+        Args:
+            delete: ``False`` keeps the file even when this was the last
+                reference; it is then left for :meth:`prune`.
+
+        Returns:
+            ``True`` if the blob was deleted.
+        """
+        blob = Path(blob)
+        with self._lock:
+            remaining = self._refs.get(blob, 0) - 1
+            if remaining > 0:
+                self._refs[blob] = remaining
+                return False
+            self._refs.pop(blob, None)
+            if not delete:
+                return False
+            try:
+                blob.unlink(missing_ok=True)
+            except OSError as exc:  # pragma: no cover - platform dependent
+                logger.warning("Could not delete artefact %s: %s", blob, exc)
+                return False
+            return True
+
+    def label(self, name: str, blobs: dict[str, Path]) -> None:
+        """Point the label ``name`` at ``blobs``, by role, replacing what it held."""
+        target = self._label_path(name)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        payload = {role: Path(blob).relative_to(self.root).as_posix() for role, blob in blobs.items()}
+        staging = target.with_name(f".{uuid.uuid4().hex}.partial")
+        try:
+            staging.write_text(json.dumps(payload, sort_keys=True), encoding="utf-8")
+            os.replace(staging, target)
+        except BaseException:
+            staging.unlink(missing_ok=True)
+            raise
+
+    def labelled(self, name: str) -> dict[str, Path] | None:
+        """
+        The blobs the label ``name`` points at, each with a reference taken.
+
+        Call :meth:`release` on each when done. ``None`` if there is no such
+        label or any of its blobs has been deleted.
+        """
+        try:
+            payload = json.loads(self._label_path(name).read_text(encoding="utf-8"))
+            blobs = {role: self.root / relative for role, relative in payload.items()}
+        except (OSError, ValueError, TypeError, AttributeError):
+            return None
+        with self._lock:
+            if not all(self.owns(blob) and blob.is_file() for blob in blobs.values()):
+                return None
+            for blob in blobs.values():
+                self._refs[blob] = self._refs.get(blob, 0) + 1
+        return blobs
+
+    def references(self, blob: Path) -> int:
+        """Number of live references to ``blob``."""
+        with self._lock:
+            return self._refs.get(Path(blob), 0)
+
+    def owns(self, path: Path) -> bool:
+        """True if ``path`` is a blob in this store rather than a plain file."""
+        return Path(path).parent.parent == self.root
+
+    @staticmethod
+    def digest(blob: Path) -> str:
+        """The SHA-256 a blob is named by, as hex."""
+        return Path(blob).name.partition(".")[0]
+
+    def prune(self, *, max_age_seconds: float, now: float | None = None) -> int:
+        """
+        Delete unreferenced blobs older than ``max_age_seconds``, and labels
+        left pointing at deleted blobs.
+
+        Returns:
+            Number of blobs removed.
+        """
+        if not self.root.is_dir():
+            return 0
+        cutoff = (time.time() if now is None else now) - max_age_seconds
+        removed = 0
+        with self._lock:
+            for blob in self.root.glob("??/*"):
+                if blob in self._refs or blob.name.startswith("."):
+                    continue
+                try:
+                    if blob.stat().st_mtime <= cutoff:
+                        blob.unlink()
+                        removed += 1
+                except OSError:  # pragma: no cover - vanished or locked
+                    continue
+            for label in self.root.glob("labels/*.json"):
+                try:
+                    targets = json.loads(label.read_text(encoding="utf-8")).values()
+                    if all((self.root / target).is_file() for target in targets):
+                        continue
+                    label.unlink()
+                except (OSError, ValueError, AttributeError):  # pragma: no cover - raced
+                    continue
+        if removed:
+            logger.info("Pruned %d unreferenced artefact blob(s)", removed)
+        return removed
+
+    def _label_path(self, name: str) -> Path:
+        if not _LABEL_NAME.fullmatch(name):
+            raise ValueError(f"invalid blob label {name!r}")
+        return self.root / "labels" / f"{name}.json"
+
+    @staticmethod
+    def _place(source: Path, blob: Path, *, keep_source: bool) -> None:
+        """Move or link ``source`` to ``blob`` without exposing a partial file."""
+        if not keep_source:
+            try:
+                os.replace(source, blob)
+                return
+            except OSError:
+                pass  # different filesystem: copy below, then drop the source
+        else:
+            try:
+                os.link(source, blob)
+                return
+            except OSError:
+                pass  # no hard links here: fall back to a copy
+
+        staging = blob.with_name(f".{uuid.uuid4().hex}.partial")
+        try:
+            shutil.copyfile(source, staging)
+            os.replace(staging, blob)
+        except BaseException:
+            staging.unlink(missing_ok=True)
+            raise
+        if not keep_source:
+            source.unlink(missing_ok=True)
@@ -0,0 +1,133 @@
+"""
+Stage checkpoints for the generation pipeline.
+
+A job that failed while packaging - or a retry after Ollama timed out - used to
+start again from the DEM download, repeating minutes of network and resampling
+work whose result was already known. Each expensive stage now persists its
+output, and a rerun of the same map resumes from whatever is still valid.
+
+A checkpoint is a directory under the map's work dir::
+
+    checkpoints/<stage>-<key>/
+        <name>.npy        one per array, written with np.save
+        meta.json         JSON metadata; written last, so its presence
+                          marks the checkpoint complete
+
+``key`` is a hash of the stage's inputs: the source name and bbox for the DEM,
+the DEM's key for the terrain, and so on. A changed input therefore misses
+rather than restoring stale data. Each stage keeps only its newest checkpoint,
+and checkpoints older than the job retention window are ignored, so a provider
+that updates its data is eventually picked up again.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from core.logging_config import get_logger
+from core.version import APP_VERSION
+
+logger = get_logger(__name__)
+
+#: Name of the file that completes a checkpoint.
+_META = "meta.json"
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    """A restored stage output."""
+
+    arrays: dict[str, np.ndarray] = field(default_factory=dict)
+    metadata: dict[str, Any] = field(default_factory=dict)
+
+
+class CheckpointStore:
+    """Saves and restores stage outputs under one work directory."""
+
+    def __init__(self, root: Path, *, max_age_seconds: float) -> None:
+        self.root = Path(root)
+        self.max_age_seconds = max_age_seconds
+
+    @staticmethod
+    def key(stage: str, *inputs: Any) -> str:
+        """Hash a stage's inputs (JSON-serialisable) into a checkpoint key."""
+        canonical = json.dumps([stage, APP_VERSION, *inputs], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:24]
+
+    def load(self, stage: str, key: str) -> Checkpoint | None:
+        """
+        Return the checkpoint for ``stage`` and ``key``, or ``None``.
+
+        Anything unreadable - a half-written directory from a killed process,
+        a truncated array, an expired or foreign checkpoint - is treated as a
+        miss rather than an error: the stage simply runs again.
+        """
+        directory = self.root / f"{stage}-{key}"
+        try:
+            meta = json.loads((directory / _META).read_text(encoding="utf-8"))
+            if meta.get("key") != key:
+                return None
+            if time.time() - float(meta["created_at"]) > self.max_age_seconds:
+                logger.info("Checkpoint for %s has expired; recomputing", stage)
+                return None
+            arrays = {
+                name: np.load(directory / f"{name}.npy", allow_pickle=False)
+                for name in meta["arrays"]
+            }
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        logger.info("Restored %s from checkpoint %s", stage, directory.name)
+        return Checkpoint(arrays=arrays, metadata=meta.get("metadata", {}))
+
+    def save(
+        self,
+        stage: str,
+        key: str,
+        arrays: dict[str, np.ndarray] | None = None,
+        metadata: dict[str, Any] | None = None,
+    ) -> None:
+        """
+        Persist a stage's output, replacing any older checkpoint of that stage.
+
+        Failures are logged and swallowed: a full disk, or an array or metadata
+        value that cannot be stored, must not fail a job that has already
+        computed its result.
+        """
+        arrays = arrays or {}
+        final = self.root / f"{stage}-{key}"
+        staging = self.root / f".{stage}-{uuid.uuid4().hex}.partial"
+        try:
+            staging.mkdir(parents=True)
+            for name, array in arrays.items():
+                np.save(staging / f"{name}.npy", np.ascontiguousarray(array), allow_pickle=False)
+            meta = {
+                "key": key,
+                "stage": stage,
+                "created_at": time.time(),
+                "arrays": sorted(arrays),
+                # Provider metadata may hold objects JSON cannot represent
+                # (transforms, CRS); their string form is all a resume needs.
+                "metadata": metadata or {},
+            }
+            (staging / _META).write_text(json.dumps(meta, default=str), encoding="utf-8")
+
+            shutil.rmtree(final, ignore_errors=True)
+            os.replace(staging, final)
+        except (OSError, ValueError, TypeError) as exc:
+            logger.warning("Could not checkpoint %s: %s", stage, exc)
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+
+        for stale in self.root.glob(f"{stage}-*"):
+            if stale != final:
+                shutil.rmtree(stale, ignore_errors=True)
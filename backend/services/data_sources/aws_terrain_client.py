@@ -28,6 +28,7 @@ from io import BytesIO
 import numpy as np
 import requests
 
+from core.cancellation import check_cancelled
 from core.logging_config import get_logger
 
 from .base import (
@@ -237,17 +238,23 @@ class AWSTerrainDataSource(DataSourceInterface):
         # Tiles are independent GETs of ~150 KB; fetching them serially makes a
         # 16-tile region take 16 round trips. The pool is small because this
         # already runs inside a worker thread of a bounded pipeline.
-        with ThreadPoolExecutor(max_workers=8) as pool:
+        pool = ThreadPoolExecutor(max_workers=8)
+        try:
             results = pool.map(lambda coord: (coord, self._download_tile(*coord, zoom)), coordinates)
 
             missing = 0
             for (x, y), tile in results:
+                check_cancelled()
                 if tile is None:
                     missing += 1
                     continue
                 row_start = (y - y_min) * TILE_SIZE
                 column_start = (x - x_min) * TILE_SIZE
                 mosaic[row_start : row_start + TILE_SIZE, column_start : column_start + TILE_SIZE] = tile
+        finally:
+            # After a cancellation or a failed tile, tiles not yet started are
+            # dropped instead of downloaded for nothing.
+            pool.shutdown(cancel_futures=True)
 
         if missing:
             logger.info("%d of %d tiles had no data (ocean or gap)", missing, len(coordinates))
@@ -17,6 +17,7 @@ import numpy as np
 import requests
 from PIL import Image
 
+from core.cancellation import check_cancelled
 from core.logging_config import get_logger
 
 from .base import Capability, DataSourceInterface
@@ -255,6 +256,7 @@ class AzureMapsDataSource(DataSourceInterface):
         
         # Download and place tiles
         for x, y in tiles:
+            check_cancelled()
             try:
                 tile_image = self._download_tile(x, y, zoom)
                 
@@ -4,13 +4,43 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 from enum import StrEnum
+from typing import Any
 
 import numpy as np
+import requests
 
+from core.cancellation import check_cancelled
 from core.logging_config import get_logger
 
 logger = get_logger(__name__)
 
+#: Bytes read between cancellation checks by :func:`stream_request`.
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+
+def stream_request(method: str, url: str, **kwargs: Any) -> requests.Response:
+    """
+    ``requests.request``, reading the body in chunks with cancellation points.
+
+    The pipeline abandons a download when its job is cancelled, but the thread
+    still running it would go on reading a DEM or an image nobody will use.
+    Here that thread stops at the next chunk and closes the connection.
+
+    Returns the response with its body read, so ``content`` works as usual.
+
+    Raises:
+        requests.RequestException: As ``requests.request`` does.
+    """
+    check_cancelled()
+    with requests.request(method, url, stream=True, **kwargs) as response:
+        chunks = []
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+            check_cancelled()
+            chunks.append(chunk)
+        # What Response.content would have stored had it read the body itself.
+        response._content = b"".join(chunks)
+    return response
+
 
 class DataSourceType(StrEnum):
     """Available data source types."""
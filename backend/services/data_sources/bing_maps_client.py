@@ -16,6 +16,7 @@ import numpy as np
 import requests
 from PIL import Image
 
+from core.cancellation import check_cancelled
 from core.logging_config import get_logger
 
 from .base import Capability, DataSourceInterface
@@ -264,6 +265,7 @@ class BingMapsDataSource(DataSourceInterface):
         
         # Download and place tiles
         for x, y in tiles:
+            check_cancelled()
             try:
                 tile_image = self._download_tile(x, y, zoom)
                 
@@ -21,6 +21,7 @@ from .base import (
     DataSourceError,
     DataSourceInterface,
     DataSourceUnavailableError,
+    stream_request,
 )
 
 logger = get_logger(__name__)
@@ -101,7 +102,8 @@ class OpenTopographyDataSource(DataSourceInterface):
         last_error: Exception | None = None
         for dataset in self._dataset_candidates(resolution):
             try:
-                response = requests.get(
+                response = stream_request(
+                    "GET",
                     self.BASE_URL,
                     params={
                         'demtype': dataset,
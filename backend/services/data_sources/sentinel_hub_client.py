@@ -19,7 +19,7 @@ from PIL import Image
 from core.geo import pixel_dimensions
 from core.logging_config import get_logger
 
-from .base import Capability, DataSourceInterface
+from .base import Capability, DataSourceInterface, stream_request
 
 logger = get_logger(__name__)
 
@@ -157,7 +157,9 @@ class SentinelHubDataSource(DataSourceInterface):
             "evalscript": evalscript
         }
         
-        response = requests.post(url, json=payload, headers=headers, timeout=_REQUEST_TIMEOUT)
+        response = stream_request(
+            "POST", url, json=payload, headers=headers, timeout=_REQUEST_TIMEOUT
+        )
         response.raise_for_status()
         
         # Parse GeoTIFF response
@@ -256,7 +258,9 @@ class SentinelHubDataSource(DataSourceInterface):
             "evalscript": evalscript
         }
         
-        response = requests.post(url, json=payload, headers=headers, timeout=_REQUEST_TIMEOUT)
+        response = stream_request(
+            "POST", url, json=payload, headers=headers, timeout=_REQUEST_TIMEOUT
+        )
         response.raise_for_status()
         
         # Parse PNG response
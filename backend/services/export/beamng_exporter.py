@@ -24,7 +24,7 @@ from __future__ import annotations
 
 import json
 import shutil
-import zipfile
+import tempfile
 from datetime import UTC, datetime
 from pathlib import Path
 
@@ -33,6 +33,9 @@ from core.logging_config import get_logger
 from core.paths import is_valid_map_name, safe_join
 from models.terrain import TerrainData
 
+from .terrain_materials import DEFAULT_LAYERS, DEFAULT_MATERIALS, LandCoverMask
+from .zip_writer import Build, write_zip
+
 logger = get_logger(__name__)
 
 #: Fallback horizontal scale when the real bbox is unknown (metres per pixel).
@@ -42,9 +45,17 @@ DEFAULT_SQUARE_SIZE = 2.0
 class BeamNGExporter:
     """Packages generated terrain into a BeamNG.drive mod archive."""
 
-    def __init__(self, output_dir: Path) -> None:
+    def __init__(self, output_dir: Path, *, compression_workers: int | None = None) -> None:
+        """
+        Args:
+            output_dir: Where finished archives are written.
+            compression_workers: Threads used to deflate the archive. ``None``
+                or ``0`` uses one per core; the archive bytes do not depend on
+                the value.
+        """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.compression_workers = compression_workers or None
 
     def create_map_structure(
         self,
@@ -60,6 +71,9 @@ class BeamNGExporter:
         decal_roads: dict | None = None,
         building_items: list | None = None,
         mesh_files: list | None = None,
+        land_cover: dict[str, LandCoverMask] | None = None,
+        previous_build: Build | None = None,
+        manifest: Path | None = None,
     ) -> Path:
         """
         Build the mod directory tree and zip it.
@@ -80,6 +94,13 @@ class BeamNGExporter:
             decal_roads: Optional decal road definitions.
             building_items: Optional level items for buildings.
             mesh_files: Optional building mesh files to copy in.
+            land_cover: Optional segmentation masks (``water``, ``forest``)
+                used to paint terrain materials.
+            previous_build: An earlier archive of the same map, under any
+                name, and its manifest. Unchanged entries are copied from it
+                instead of compressed again.
+            manifest: Where to record the archive's manifest, so a later
+                export can be handed this one as its ``previous_build``.
 
         Returns:
             Path to the created ZIP archive.
@@ -94,9 +115,11 @@ class BeamNGExporter:
         logger.info("Packaging BeamNG mod for %r", map_name)
 
         square_size = self._square_size(bbox, heightmap_path)
-        staging = safe_join(self.output_dir, ".staging", map_name)
-        if staging.exists():
-            shutil.rmtree(staging)
+        # Unique per export, so two jobs packaging the same name concurrently
+        # do not share a tree.
+        staging_root = safe_join(self.output_dir, ".staging")
+        staging_root.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=f"{map_name}-", dir=staging_root))
 
         try:
             level_dir = staging / "levels" / map_name
@@ -109,7 +132,14 @@ class BeamNGExporter:
             # is only what the World Editor's import command reads. Writing both
             # means the level has a chance of loading as-is, while the PNG keeps
             # the manual import path open if the binary is rejected.
-            self._write_terrain_file(terrain_dir / "main_terrain.ter", heightmap_path)
+            self._write_terrain_file(
+                terrain_dir / "main_terrain.ter",
+                heightmap_path,
+                terrain=terrain,
+                square_size=square_size,
+                bbox=bbox,
+                land_cover=land_cover,
+            )
 
             if preview_path and Path(preview_path).exists():
                 shutil.copy2(preview_path, level_dir / "preview.png")
@@ -159,7 +189,13 @@ class BeamNGExporter:
             )
 
             archive_path = safe_join(self.output_dir, f"{map_name}.zip")
-            self._create_zip(staging, archive_path)
+            self._create_zip(
+                staging,
+                archive_path,
+                workers=self.compression_workers,
+                previous=previous_build,
+                manifest=manifest,
+            )
         finally:
             shutil.rmtree(staging, ignore_errors=True)
 
@@ -169,9 +205,20 @@ class BeamNGExporter:
         return archive_path
 
     @staticmethod
-    def _write_terrain_file(destination: Path, heightmap_path: Path) -> None:
+    def _write_terrain_file(
+        destination: Path,
+        heightmap_path: Path,
+        *,
+        terrain: TerrainData | None = None,
+        square_size: float = DEFAULT_SQUARE_SIZE,
+        bbox: list[float] | None = None,
+        land_cover: dict[str, LandCoverMask] | None = None,
+    ) -> None:
         """
-        Convert the heightmap PNG into a binary ``.ter``.
+        Convert the heightmap PNG into a binary ``.ter``, with materials painted.
+
+        The material index grid is classified from the same rules written to
+        ``layers.json`` and streamed into the file block by block.
 
         Non-fatal: if the conversion fails, the archive still ships the PNG and
         the WORLDFORGE notes explain how to import it by hand. Losing the whole
@@ -182,11 +229,25 @@ class BeamNGExporter:
             from PIL import Image
 
             from .terrain_file import write_ter
+            from .terrain_materials import MaterialClassifier
 
             with Image.open(heightmap_path) as image:
-                heights = np.array(image)
-
-            write_ter(destination, heights.astype(np.uint16))
+                heights = np.asarray(image, dtype=np.uint16)
+
+            classifier = MaterialClassifier(
+                heights,
+                min_elevation=terrain.min_elevation if terrain else 0.0,
+                elevation_range=terrain.elevation_range if terrain else 100.0,
+                square_size=square_size,
+                bbox=bbox,
+                land_cover=land_cover,
+            )
+            write_ter(
+                destination,
+                heights,
+                material_names=classifier.material_names,
+                material_indices=classifier.block,
+            )
         except Exception as exc:  # noqa: BLE001 - optional artefact
             logger.warning("Could not write .ter terrain file (%s); PNG only", exc)
 
@@ -273,35 +334,16 @@ class BeamNGExporter:
 
     @staticmethod
     def _terrain_layers() -> dict:
-        """Default terrain material set."""
-        materials = [
-            ("grass", "grass_green"),
-            ("dirt", "dirt_brown"),
-            ("rock", "rock_grey"),
-        ]
+        """
+        Terrain material set and the rules that paint it.
+
+        The same tables drive the ``.ter`` index grid, so what this file
+        declares is what the terrain actually shows.
+        """
         return {
             "version": 1,
-            "materials": [
-                {
-                    "name": name,
-                    "internalName": name,
-                    "diffuseMap": f"art/terrains/{asset}_d.dds",
-                    "normalMap": f"art/terrains/{asset}_n.dds",
-                    "detailMap": f"art/terrains/{asset}_d.dds",
-                    "detailSize": 4.0,
-                }
-                for name, asset in materials
-            ],
-            "layers": [
-                {
-                    "name": "base_layer",
-                    "material": "grass",
-                    "minHeight": -1000,
-                    "maxHeight": 9000,
-                    "minSlope": 0,
-                    "maxSlope": 90,
-                }
-            ],
+            "materials": [material.to_json() for material in DEFAULT_MATERIALS],
+            "layers": [layer.to_json() for layer in DEFAULT_LAYERS],
         }
 
     @staticmethod
@@ -379,14 +421,31 @@ class BeamNGExporter:
         path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
 
     @staticmethod
-    def _create_zip(source_dir: Path, output_zip: Path) -> None:
-        """Zip ``source_dir`` with deterministic ordering."""
-        output_zip.parent.mkdir(parents=True, exist_ok=True)
+    def _create_zip(
+        source_dir: Path,
+        output_zip: Path,
+        *,
+        workers: int | None = None,
+        previous: Build | None = None,
+        manifest: Path | None = None,
+    ) -> None:
+        """
+        Zip ``source_dir`` deterministically, compressing on ``workers`` threads.
 
+        The ``.ter`` and heightmap of a large map dominate packaging time, so
+        entries are deflated in parallel chunks; see :mod:`.zip_writer`. A
+        re-export handed its ``previous`` build only recompresses the entries
+        whose content changed.
+        """
         # Sorted so repeated runs over identical input produce byte-comparable
         # archives, which makes "did anything actually change?" answerable.
         files = sorted(p for p in source_dir.rglob("*") if p.is_file())
 
-        with zipfile.ZipFile(output_zip, "w", zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
-            for file_path in files:
-                archive.write(file_path, file_path.relative_to(source_dir).as_posix())
+        write_zip(
+            output_zip,
+            ((file_path.relative_to(source_dir).as_posix(), file_path) for file_path in files),
+            compresslevel=6,
+            workers=workers,
+            previous=previous,
+            manifest=manifest,
+        )
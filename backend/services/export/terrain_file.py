@@ -28,6 +28,7 @@ Layout, little-endian throughout::
 from __future__ import annotations
 
 import struct
+from collections.abc import Callable
 from pathlib import Path
 
 import numpy as np
@@ -42,6 +43,9 @@ TER_VERSION = 8
 #: Terrain must be square and power-of-two, same constraint as the heightmap.
 MIN_SIZE = 64
 
+#: Approximate size of each row block streamed to disk by :func:`write_ter`.
+BLOCK_BYTES = 4 * 1024 * 1024
+
 
 class TerrainFileError(ValueError):
     """Raised when terrain data cannot be written as a ``.ter`` file."""
@@ -51,18 +55,27 @@ def write_ter(
     path: Path,
     heightmap: np.ndarray,
     material_names: list[str] | None = None,
-    material_indices: np.ndarray | None = None,
+    material_indices: np.ndarray | Callable[[int, int], np.ndarray] | None = None,
 ) -> Path:
     """
     Write a ``.ter`` terrain file.
 
+    The grids are streamed to disk in row blocks of :data:`BLOCK_BYTES`, so
+    writing never materialises a full-size ``bytes`` copy. That used to mean an
+    extra 128 MB for the heights and 64 MB for a zero-filled index grid on an
+    8192 terrain, on top of the heightmap itself. Either grid may be a
+    ``np.memmap``; it is read one block at a time.
+
     Args:
         path: Destination file.
         heightmap: Square ``uint16`` heightmap, north-west origin.
         material_names: Terrain materials, in index order. Defaults to a single
             grass layer.
         material_indices: Per-cell material index. Defaults to all zeros, i.e.
-            the first material everywhere.
+            the first material everywhere. May also be a callable taking
+            ``(start, stop)`` and returning the index rows ``start:stop``, so
+            the grid can be computed block by block as it is written - see
+            :class:`~services.export.terrain_materials.MaterialClassifier`.
 
     Returns:
         The path written to.
@@ -92,31 +105,50 @@ def write_ter(
             raise TerrainFileError(f"material name length must be 1-255: {name!r}")
 
     if material_indices is None:
-        indices = np.zeros((size, size), dtype=np.uint8)
+        zeros = np.zeros((_block_rows(size), size), dtype=np.uint8)
+
+        def index_rows(start: int, stop: int) -> np.ndarray:
+            return zeros[: stop - start]
+
+    elif callable(material_indices):
+        index_rows = material_indices
     else:
-        indices = np.asarray(material_indices, dtype=np.uint8)
-        if indices.shape != heights.shape:
+        grid = np.asarray(material_indices)
+        if grid.shape != heights.shape:
             raise TerrainFileError(
-                f"material index grid {indices.shape} does not match heightmap {heights.shape}"
+                f"material index grid {grid.shape} does not match heightmap {heights.shape}"
             )
-        if int(indices.max(initial=0)) >= len(materials):
-            raise TerrainFileError("material index refers to a material that was not declared")
+
+        def index_rows(start: int, stop: int) -> np.ndarray:
+            return grid[start:stop]
 
     path = Path(path)
     path.parent.mkdir(parents=True, exist_ok=True)
-
-    with path.open("wb") as handle:
-        handle.write(struct.pack("<B", TER_VERSION))
-        handle.write(struct.pack("<I", size))
-        # `astype` with an explicit little-endian dtype keeps the output
-        # identical on big-endian hosts.
-        handle.write(heights.astype("<u2").tobytes(order="C"))
-        handle.write(indices.astype(np.uint8).tobytes(order="C"))
-        handle.write(struct.pack("<I", len(materials)))
-        for name in materials:
-            encoded = name.encode("ascii")
-            handle.write(struct.pack("<B", len(encoded)))
-            handle.write(encoded)
+    rows = _block_rows(size)
+
+    try:
+        with path.open("wb") as handle:
+            handle.write(struct.pack("<B", TER_VERSION))
+            handle.write(struct.pack("<I", size))
+            for start in range(0, size, rows):
+                # An explicit little-endian dtype keeps the output identical on
+                # big-endian hosts; it is a no-op view for native uint16 input.
+                block = np.ascontiguousarray(heights[start : start + rows], dtype="<u2")
+                handle.write(block.data)
+            for start in range(0, size, rows):
+                stop = min(size, start + rows)
+                block = _checked_indices(index_rows(start, stop), (stop - start, size), len(materials))
+                handle.write(block.data)
+            handle.write(struct.pack("<I", len(materials)))
+            for name in materials:
+                encoded = name.encode("ascii")
+                handle.write(struct.pack("<B", len(encoded)))
+                handle.write(encoded)
+    except BaseException:
+        # Half a terrain is worse than none: the exporter treats a missing
+        # .ter as "PNG only", but a truncated one would ship.
+        path.unlink(missing_ok=True)
+        raise
 
     logger.info("Wrote terrain file: %s (%d x %d)", path, size, size)
     return path
@@ -129,36 +161,65 @@ def read_ter(path: Path) -> tuple[np.ndarray, np.ndarray, list[str]]:
     Exists so the writer can be verified by round-trip rather than by
     inspection - the one property that can be checked without the game.
 
+    The grids are returned as read-only ``np.memmap`` views into the file, so
+    verifying an 8192 terrain costs page cache rather than three full copies in
+    RAM. Call ``np.array`` on them if a writable or detached copy is needed.
+
     Returns:
         ``(heights, material indices, material names)``.
-    """
-    data = Path(path).read_bytes()
-    offset = 0
-
-    (version,) = struct.unpack_from("<B", data, offset)
-    offset += 1
-    if version != TER_VERSION:
-        raise TerrainFileError(f"unsupported .ter version {version}")
-
-    (size,) = struct.unpack_from("<I", data, offset)
-    offset += 4
-
-    cells = size * size
-
-    heights = np.frombuffer(data, dtype="<u2", count=cells, offset=offset).reshape(size, size)
-    offset += cells * 2
-
-    indices = np.frombuffer(data, dtype=np.uint8, count=cells, offset=offset).reshape(size, size)
-    offset += cells
-
-    (material_count,) = struct.unpack_from("<I", data, offset)
-    offset += 4
 
+    Raises:
+        TerrainFileError: On an unknown version or a truncated file.
+    """
+    path = Path(path)
+    file_size = path.stat().st_size
+
+    with path.open("rb") as handle:
+        header = handle.read(5)
+        if len(header) < 5:
+            raise TerrainFileError(f"truncated .ter file: {path}")
+        version, size = struct.unpack("<BI", header)
+        if version != TER_VERSION:
+            raise TerrainFileError(f"unsupported .ter version {version}")
+
+        cells = size * size
+        heights_offset = 5
+        indices_offset = heights_offset + cells * 2
+        materials_offset = indices_offset + cells
+        if file_size < materials_offset + 4:
+            raise TerrainFileError(f"truncated .ter file: {path}")
+
+        handle.seek(materials_offset)
+        tail = handle.read()
+
+    (material_count,) = struct.unpack_from("<I", tail, 0)
+    offset = 4
     materials = []
     for _ in range(material_count):
-        (length,) = struct.unpack_from("<B", data, offset)
+        (length,) = struct.unpack_from("<B", tail, offset)
         offset += 1
-        materials.append(data[offset : offset + length].decode("ascii"))
+        materials.append(tail[offset : offset + length].decode("ascii"))
         offset += length
 
-    return heights.copy(), indices.copy(), materials
+    heights = np.memmap(path, dtype="<u2", mode="r", offset=heights_offset, shape=(size, size))
+    indices = np.memmap(path, dtype=np.uint8, mode="r", offset=indices_offset, shape=(size, size))
+    return heights, indices, materials
+
+
+def _checked_indices(block: np.ndarray, shape: tuple[int, int], material_count: int) -> np.ndarray:
+    """Validate one block of material indices and return it as contiguous ``uint8``."""
+    block = np.asarray(block)
+    if block.shape != shape:
+        raise TerrainFileError(
+            f"material index block {block.shape} does not match heightmap rows {shape}"
+        )
+    # Checked on the caller's dtype, before the uint8 cast could wrap an
+    # out-of-range value into a valid-looking one.
+    if block.size and (int(block.max()) >= material_count or int(block.min()) < 0):
+        raise TerrainFileError("material index refers to a material that was not declared")
+    return np.ascontiguousarray(block, dtype=np.uint8)
+
+
+def _block_rows(size: int) -> int:
+    """Rows per streamed block, so each block stays near :data:`BLOCK_BYTES`."""
+    return max(1, min(size, BLOCK_BYTES // (size * 2)))
@@ -0,0 +1,399 @@
+"""
+Paint terrain materials into the ``.ter`` index grid.
+
+``layers.json`` has always declared height and slope rules, but nothing
+evaluated them: every exported level was a single grass layer from shore to
+summit. :class:`MaterialClassifier` evaluates those rules per cell, so cliffs
+come out as rock, steep banks as dirt, and - when AI segmentation ran - lakes
+and forests as sand and forest floor.
+
+**Rules.** Layers are applied in order and a later match overwrites an earlier
+one, so the table reads from general to specific. Each layer may bound:
+
+* height, in metres above sea level;
+* slope, in degrees, from the heightmap gradient;
+* curvature, the Laplacian of elevation in 1/m - negative on ridges and
+  convex breaks, positive in gullies and valley floors;
+* a land-cover mask from segmentation (``"water"``, ``"forest"``). A layer
+  whose mask was not produced is skipped.
+
+**Cost.** Everything is a handful of NumPy array expressions per row block, and
+thresholds are converted into raw heightmap units and squared tangents up front
+so no cell ever goes through ``arctan`` or a metre conversion. Blocks carry a
+one-row halo, which makes the gradient and Laplacian of a block identical to
+those of the whole grid, so the result does not depend on the block size and
+an 8192 terrain is classified without a full-size float array in memory.
+"""
+
+from __future__ import annotations
+
+import math
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+import numpy as np
+
+from core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class TerrainMaterial:
+    """A terrain material and the texture set it is drawn with."""
+
+    name: str
+    asset: str
+
+    def to_json(self) -> dict:
+        return {
+            "name": self.name,
+            "internalName": self.name,
+            "diffuseMap": f"art/terrains/{self.asset}_d.dds",
+            "normalMap": f"art/terrains/{self.asset}_n.dds",
+            "detailMap": f"art/terrains/{self.asset}_d.dds",
+            "detailSize": 4.0,
+        }
+
+
+@dataclass(frozen=True)
+class MaterialLayer:
+    """One painting rule. Unset bounds do not constrain."""
+
+    name: str
+    material: str
+    min_height: float = -1000.0
+    max_height: float = 9000.0
+    min_slope: float = 0.0
+    max_slope: float = 90.0
+    min_curvature: float | None = None
+    max_curvature: float | None = None
+    mask: str | None = None
+
+    def to_json(self) -> dict:
+        payload: dict = {
+            "name": self.name,
+            "material": self.material,
+            "minHeight": self.min_height,
+            "maxHeight": self.max_height,
+            "minSlope": self.min_slope,
+            "maxSlope": self.max_slope,
+        }
+        if self.min_curvature is not None:
+            payload["minCurvature"] = self.min_curvature
+        if self.max_curvature is not None:
+            payload["maxCurvature"] = self.max_curvature
+        if self.mask is not None:
+            payload["mask"] = self.mask
+        return payload
+
+
+#: Materials in ``.ter`` index order. Grass first: it is index 0, the material
+#: a cell gets when no rule matches.
+DEFAULT_MATERIALS: tuple[TerrainMaterial, ...] = (
+    TerrainMaterial("grass", "grass_green"),
+    TerrainMaterial("dirt", "dirt_brown"),
+    TerrainMaterial("rock", "rock_grey"),
+    TerrainMaterial("sand", "sand_beige"),
+    TerrainMaterial("forest", "forest_floor"),
+)
+
+#: Painting rules, general to specific.
+DEFAULT_LAYERS: tuple[MaterialLayer, ...] = (
+    MaterialLayer("base_layer", "grass"),
+    MaterialLayer("forest", "forest", max_slope=35.0, mask="forest"),
+    MaterialLayer("slopes", "dirt", min_slope=22.0),
+    MaterialLayer("ridges", "rock", max_curvature=-0.08),
+    MaterialLayer("cliffs", "rock", min_slope=38.0),
+    MaterialLayer("high_alpine", "rock", min_height=3200.0),
+    MaterialLayer("water", "sand", max_slope=20.0, mask="water"),
+)
+
+#: Approximate input bytes per classified row block.
+BLOCK_BYTES = 4 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class LandCoverMask:
+    """
+    A segmentation mask and the region it was drawn over.
+
+    Masks are rasterised over the requested bbox at imagery resolution, while
+    the terrain covers the square-cropped bbox at heightmap resolution, so the
+    region is needed to line the two up.
+    """
+
+    mask: np.ndarray
+    bbox: list[float] | None = None
+
+
+@dataclass(frozen=True)
+class _Rule:
+    """A :class:`MaterialLayer` compiled against one heightmap: raw-unit bounds."""
+
+    index: int
+    height_low: float | None = None
+    height_high: float | None = None
+    slope_low: float | None = None
+    slope_high: float | None = None
+    curvature_low: float | None = None
+    curvature_high: float | None = None
+    mask: str | None = None
+
+
+class MaterialClassifier:
+    """Evaluates :class:`MaterialLayer` rules over a heightmap."""
+
+    def __init__(
+        self,
+        heightmap: np.ndarray,
+        *,
+        min_elevation: float,
+        elevation_range: float,
+        square_size: float,
+        bbox: list[float] | None = None,
+        land_cover: Mapping[str, LandCoverMask] | None = None,
+        materials: tuple[TerrainMaterial, ...] = DEFAULT_MATERIALS,
+        layers: tuple[MaterialLayer, ...] = DEFAULT_LAYERS,
+    ) -> None:
+        """
+        Args:
+            heightmap: Square normalised ``uint16`` heightmap (may be a memmap).
+            min_elevation: Metres represented by heightmap value 0.
+            elevation_range: Metres spanned by the full 16-bit range.
+            square_size: Metres per heightmap pixel.
+            bbox: Region the heightmap covers, used to align land-cover masks.
+            land_cover: Segmentation masks by class name.
+            materials: Material table; a layer's index is its position here.
+            layers: Painting rules, applied in order.
+
+        Raises:
+            ValueError: If a layer names a material that is not in ``materials``.
+        """
+        if heightmap.ndim != 2:
+            raise ValueError(f"heightmap must be 2D, got shape {heightmap.shape}")
+
+        self.heightmap = heightmap
+        self.materials = materials
+        self.layers = layers
+        self._square_size = float(square_size) if square_size > 0 else 1.0
+
+        self._max_value = float(np.iinfo(heightmap.dtype).max) if heightmap.dtype.kind in "ui" else 1.0
+        self._metres_per_unit = max(float(elevation_range), 0.0) / self._max_value
+        self._min_elevation = float(min_elevation)
+
+        index = {material.name: position for position, material in enumerate(materials)}
+        unknown = sorted({layer.material for layer in layers} - index.keys())
+        if unknown:
+            raise ValueError(f"layers reference undeclared materials: {unknown}")
+        self._material_index = index
+
+        self._masks = {
+            name: self._align(cover, bbox, heightmap.shape)
+            for name, cover in (land_cover or {}).items()
+        }
+        compiled = (
+            self._compile(layer)
+            for layer in layers
+            if layer.mask is None or layer.mask in self._masks
+        )
+        self._rules = [rule for rule in compiled if rule is not None]
+        self._needs_height = any(
+            rule.height_low is not None or rule.height_high is not None for rule in self._rules
+        )
+        self._needs_slope = any(
+            rule.slope_low is not None or rule.slope_high is not None for rule in self._rules
+        )
+        self._needs_curvature = any(
+            rule.curvature_low is not None or rule.curvature_high is not None
+            for rule in self._rules
+        )
+
+    @property
+    def material_names(self) -> list[str]:
+        """Material names in index order, as the ``.ter`` file lists them."""
+        return [material.name for material in self.materials]
+
+    def classify(self) -> np.ndarray:
+        """Classify the whole heightmap into a ``uint8`` index grid."""
+        rows, cols = self.heightmap.shape
+        indices = np.empty((rows, cols), dtype=np.uint8)
+        step = self.block_rows()
+        for start in range(0, rows, step):
+            indices[start : start + step] = self.block(start, min(rows, start + step))
+        return indices
+
+    def block_rows(self) -> int:
+        """Rows per block that keeps each float32 working array near :data:`BLOCK_BYTES`."""
+        return max(1, BLOCK_BYTES // (self.heightmap.shape[1] * 4))
+
+    def block(self, start: int, stop: int) -> np.ndarray:
+        """
+        Classify heightmap rows ``start:stop``.
+
+        Suitable as the ``material_indices`` callable of
+        :func:`~services.export.terrain_file.write_ter`, which streams the
+        grid to disk without ever holding all of it.
+        """
+        out = np.zeros((stop - start, self.heightmap.shape[1]), dtype=np.uint8)
+        if not self._rules:
+            return out
+
+        units = padded = None
+        if self._needs_height:
+            units = np.asarray(self.heightmap[start:stop])
+        if self._needs_slope or self._needs_curvature:
+            padded = self._padded(start, stop)
+
+        # Both derivatives stay in raw heightmap units: the rules' thresholds
+        # were converted once, so no per-cell scaling is needed.
+        slope_sq = curvature = None
+        if self._needs_slope:
+            d_col = padded[1:-1, 2:] - padded[1:-1, :-2]
+            d_row = padded[2:, 1:-1] - padded[:-2, 1:-1]
+            slope_sq = d_col * d_col
+            slope_sq += d_row * d_row
+        if self._needs_curvature:
+            curvature = padded[:-2, 1:-1] + padded[2:, 1:-1]
+            curvature += padded[1:-1, :-2]
+            curvature += padded[1:-1, 2:]
+            curvature -= 4.0 * padded[1:-1, 1:-1]
+
+        for rule in self._rules:
+            match: np.ndarray | None = None
+            for values, low, high in (
+                (units, rule.height_low, rule.height_high),
+                (slope_sq, rule.slope_low, rule.slope_high),
+                (curvature, rule.curvature_low, rule.curvature_high),
+            ):
+                if low is not None:
+                    match = values >= low if match is None else match & (values >= low)
+                if high is not None:
+                    match = values <= high if match is None else match & (values <= high)
+            if rule.mask is not None:
+                mask, row_index, col_index, row_inside, col_inside = self._masks[rule.mask]
+                covered = mask[row_index[start:stop]][:, col_index] > 0
+                if row_inside is not None:
+                    covered &= row_inside[start:stop, None]
+                    covered &= col_inside
+                match = covered if match is None else match & covered
+
+            if match is None:
+                out[:] = rule.index
+            else:
+                out[match] = rule.index
+        return out
+
+    # -- internals ------------------------------------------------------------
+
+    def _padded(self, start: int, stop: int) -> np.ndarray:
+        """
+        Rows ``start:stop`` as float32, with a one-cell border on every side.
+
+        The border is the neighbouring row or column where there is one and a
+        copy of the edge where there is not, so a block's derivatives are
+        exactly the whole grid's and the terrain edge has no artificial cliff.
+        """
+        rows, cols = self.heightmap.shape
+        row_index = np.clip(np.arange(start - 1, stop + 1), 0, rows - 1)
+        padded = np.empty((len(row_index), cols + 2), dtype=np.float32)
+        padded[:, 1:-1] = self.heightmap[row_index[0] : row_index[-1] + 1][row_index - row_index[0]]
+        padded[:, 0] = padded[:, 1]
+        padded[:, -1] = padded[:, -2]
+        return padded
+
+    def _compile(self, layer: MaterialLayer) -> _Rule | None:
+        """
+        Translate a layer's bounds into raw-unit thresholds.
+
+        Returns ``None`` for a layer that cannot match anything on this terrain,
+        and leaves a bound unset where it cannot exclude anything.
+        """
+        unit = self._metres_per_unit
+        # A central difference spans two cells; the Laplacian, one cell squared.
+        slope_scale = (unit / (2.0 * self._square_size)) ** 2
+        curvature_scale = unit / self._square_size**2
+        top = self._min_elevation + unit * self._max_value
+
+        def bound(threshold: float, scale: float, lower: bool) -> float | None | bool:
+            """Threshold in raw units; ``True``/``False`` when flat ground decides it."""
+            if scale > 0:
+                return threshold / scale
+            return (threshold <= 0.0) if lower else (threshold >= 0.0)
+
+        height_low = height_high = None
+        if layer.min_height > self._min_elevation:
+            if unit <= 0 or layer.min_height > top:
+                return None
+            height_low = (layer.min_height - self._min_elevation) / unit
+        if layer.max_height < top:
+            if layer.max_height < self._min_elevation:
+                return None
+            height_high = (layer.max_height - self._min_elevation) / unit if unit > 0 else None
+
+        limits: dict[str, float | None] = {}
+        for key, threshold, scale, lower, active in (
+            ("slope_low", _tan_squared(layer.min_slope), slope_scale, True, layer.min_slope > 0),
+            ("slope_high", _tan_squared(layer.max_slope), slope_scale, False, layer.max_slope < 90),
+            ("curvature_low", layer.min_curvature, curvature_scale, True, layer.min_curvature is not None),
+            ("curvature_high", layer.max_curvature, curvature_scale, False, layer.max_curvature is not None),
+        ):
+            limits[key] = None
+            if not active:
+                continue
+            value = bound(threshold, scale, lower)
+            if value is False:
+                return None
+            if value is not True:
+                limits[key] = value
+
+        return _Rule(
+            index=self._material_index[layer.material],
+            height_low=height_low,
+            height_high=height_high,
+            mask=layer.mask,
+            **limits,
+        )
+
+    @staticmethod
+    def _align(
+        cover: LandCoverMask, bbox: list[float] | None, shape: tuple[int, int]
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray | None, np.ndarray | None]:
+        """
+        Nearest-neighbour lookup from heightmap cells into a mask.
+
+        The projection is equirectangular, so the mapping separates into one
+        index vector per axis and a block is a single fancy-index gather.
+
+        Cells outside the mask's region are not covered by it, so a masked
+        layer leaves them to the layers below, the default material if no
+        other applies. The last two vectors flag, per axis, the cells inside
+        the region; both are ``None`` when every cell is.
+        """
+        mask = np.asarray(cover.mask)
+        mask_rows, mask_cols = mask.shape[:2]
+        rows, cols = shape
+
+        # Cell centres as fractions of the terrain extent.
+        v = (np.arange(rows) + 0.5) / rows
+        u = (np.arange(cols) + 0.5) / cols
+
+        if bbox is not None and cover.bbox is not None:
+            t_min_lon, t_min_lat, t_max_lon, t_max_lat = bbox
+            s_min_lon, s_min_lat, s_max_lon, s_max_lat = cover.bbox
+            lon = t_min_lon + u * (t_max_lon - t_min_lon)
+            lat = t_max_lat - v * (t_max_lat - t_min_lat)
+            u = (lon - s_min_lon) / ((s_max_lon - s_min_lon) or 1.0)
+            v = (s_max_lat - lat) / ((s_max_lat - s_min_lat) or 1.0)
+
+        row_inside = (v >= 0.0) & (v < 1.0)
+        col_inside = (u >= 0.0) & (u < 1.0)
+        row_index = np.clip((v * mask_rows).astype(np.intp), 0, mask_rows - 1)
+        col_index = np.clip((u * mask_cols).astype(np.intp), 0, mask_cols - 1)
+        if row_inside.all() and col_inside.all():
+            return mask, row_index, col_index, None, None
+        return mask, row_index, col_index, row_inside, col_inside
+
+
+def _tan_squared(degrees: float) -> float:
+    return math.tan(math.radians(degrees)) ** 2
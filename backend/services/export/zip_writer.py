@@ -0,0 +1,545 @@
+"""
+Deterministic, multi-threaded ZIP writer for mod archives.
+
+**Why not ``zipfile``.** ``ZipFile.write`` deflates each entry on the calling
+thread, one after another. For an 8192 terrain the archive holds a ~200 MB
+``.ter`` plus a ~100 MB heightmap, and packaging spent most of its time on a
+single core inside zlib. ``zipfile`` has no way to accept data that was
+compressed elsewhere, so the container is written here instead - it is a small
+format, and only the subset BeamNG needs is produced: deflated entries, no
+encryption, no ZIP64.
+
+**How the work is split.** Entries are cut into fixed-size chunks and each chunk
+is deflated independently on a thread pool, the same technique ``pigz`` uses:
+
+* every chunk but the last ends with a *sync flush*, which byte-aligns the
+  stream without setting the final-block bit, so concatenated chunks form one
+  valid deflate stream that any unzip tool reads;
+* each chunk is primed with the previous 32 KiB of input as its dictionary, so
+  matches across chunk boundaries are not lost and the ratio stays within a
+  fraction of a percent of a single-stream deflate.
+
+Threads rather than processes: ``zlib`` releases the GIL while it compresses,
+so the pool scales across cores without pickling hundreds of megabytes.
+
+**Determinism.** Chunk boundaries depend only on the chunk size - never on the
+worker count - and every entry carries the same fixed timestamp. Identical input
+therefore yields a byte-identical archive on any machine, with any number of
+threads. ``zipfile`` stamped each entry with the staging file's mtime, so two
+exports of the same map never compared equal.
+
+**Incremental rebuilds.** With a ``manifest`` path, a manifest of each entry's
+SHA-256 is written alongside the archive. A later write handed that archive
+and manifest as its ``previous`` :class:`Build` copies every unchanged entry's
+compressed bytes verbatim and deflates only what changed - so renaming a map
+or re-running segmentation no longer recompresses a 200 MB terrain. Entries
+are matched by content, not by name: renaming a map renames its level
+directory and every entry in it. Because the output is deterministic, a copied
+entry is exactly the bytes a fresh compression would have produced, and an
+incremental rebuild is byte-identical to a full one.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+import uuid
+import zipfile
+import zlib
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from core.cancellation import check_cancelled
+from core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+#: Input bytes per independently deflated chunk. Large enough that the per-chunk
+#: flush overhead (a handful of bytes) is negligible, small enough that a
+#: 100 MB entry spreads across every core.
+CHUNK_SIZE = 1024 * 1024
+
+#: Deflate's maximum back-reference distance; the dictionary handed to each chunk.
+WINDOW_SIZE = 32 * 1024
+
+#: DOS date/time for 1980-01-01 00:00, the earliest a ZIP can express. Fixed so
+#: archive bytes do not depend on when the staging files were written.
+DOS_DATE = (0 << 9) | (1 << 5) | 1
+DOS_TIME = 0
+
+#: Anything at or beyond this needs ZIP64, which is deliberately not written.
+#: The largest terrain the API produces is far below it.
+ZIP32_LIMIT = 0xFFFFFFFF
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END_OF_CENTRAL_DIRECTORY = struct.Struct("<IHHHHIIH")
+
+_VERSION_NEEDED = 20  # 2.0: deflate
+_VERSION_MADE_BY = (3 << 8) | 20  # Unix, 2.0 - so the permission bits are honoured
+_EXTERNAL_ATTR = 0o100644 << 16  # regular file, rw-r--r--
+_FLAG_UTF8 = 1 << 11
+
+#: Bumped whenever the bytes written for a given input change, which makes
+#: every existing manifest stale rather than letting it vouch for the wrong data.
+MANIFEST_VERSION = 1
+
+#: Bytes copied per read when carrying an entry over from a previous archive.
+_COPY_SIZE = 1024 * 1024
+
+
+class ZipWriteError(ValueError):
+    """Raised when entries cannot be written as a standard (non-ZIP64) archive."""
+
+
+@dataclass
+class _Entry:
+    """Bookkeeping for one archive member while it is being written."""
+
+    name: bytes
+    flags: int
+    offset: int
+    crc: int = 0
+    compressed_size: int = 0
+    size: int = 0
+
+
+@dataclass(frozen=True)
+class _Chunk:
+    """
+    One piece of an entry.
+
+    Normally ``data`` is input still to be deflated. For an entry carried over
+    from a previous archive it is already-compressed bytes (``raw``), and the
+    last piece carries the entry's known CRC and size.
+    """
+
+    entry_index: int
+    first: bool
+    last: bool
+    data: bytes
+    raw: bool = False
+    crc: int = 0
+    size: int = 0
+
+
+@dataclass(frozen=True)
+class Build:
+    """A finished archive and the manifest written with it, to rebuild from."""
+
+    archive: Path
+    manifest: Path
+
+
+@dataclass(frozen=True)
+class _Reusable:
+    """Where an unchanged entry's compressed bytes sit in the previous archive."""
+
+    data_offset: int
+    compressed_size: int
+    crc: int
+    size: int
+
+
+def default_workers() -> int:
+    """Worker threads used when the caller does not choose: one per core, capped."""
+    return max(1, min(8, os.cpu_count() or 1))
+
+
+def deflate_chunk(data: bytes, dictionary: bytes | None, last: bool, level: int) -> bytes:
+    """
+    Raw-deflate ``data`` as one piece of a larger stream.
+
+    Args:
+        data: The chunk's input bytes.
+        dictionary: The input bytes immediately preceding this chunk (up to
+            32 KiB), or ``None`` for the first chunk of an entry.
+        last: Whether this chunk ends the entry. Only the last chunk sets the
+            final-block bit; the others end on a byte-aligned sync flush.
+        level: zlib compression level.
+    """
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+    )
+
+
+def write_zip(
+    destination: Path,
+    files: Iterable[tuple[str, Path]],
+    *,
+    compresslevel: int = 6,
+    workers: int | None = None,
+    chunk_size: int = CHUNK_SIZE,
+    previous: Build | None = None,
+    manifest: Path | None = None,
+) -> Path:
+    """
+    Write ``files`` into a deflate-compressed ZIP archive.
+
+    The archive is assembled in a uniquely named file next to ``destination``
+    and moved into place once complete, so a reader never sees a half-written
+    file, a failed export leaves any previous archive untouched, and two
+    writes of the same archive do not write over each other.
+
+    Args:
+        destination: Archive path to create or replace.
+        files: ``(archive name, source file)`` pairs, written in the given order.
+        compresslevel: zlib level, 0-9.
+        workers: Compression threads. ``None`` picks one per core; ``1`` runs
+            everything on the calling thread.
+        chunk_size: Input bytes per independently compressed chunk. Part of the
+            output format: changing it changes the archive bytes.
+        previous: An earlier archive and its manifest. Entries whose content
+            is unchanged are copied from it instead of compressed again.
+        manifest: Where to record this archive's manifest, so a later write
+            can rebuild from it.
+
+    Returns:
+        ``destination``.
+
+    Raises:
+        ZipWriteError: If an entry or the archive would need ZIP64.
+    """
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    members = [(name, Path(source)) for name, source in files]
+    if len(members) >= 0xFFFF:
+        raise ZipWriteError(f"too many archive entries ({len(members)}) for a non-ZIP64 archive")
+    for name, source in members:
+        if source.stat().st_size >= ZIP32_LIMIT:
+            raise ZipWriteError(f"{name} is too large for a non-ZIP64 archive")
+
+    workers = default_workers() if workers is None else max(1, workers)
+    settings = {"version": MANIFEST_VERSION, "compresslevel": compresslevel, "chunk_size": chunk_size}
+
+    digests: dict[str, str] = {}
+    reuse: dict[int, _Reusable] = {}
+    if previous is not None or manifest is not None:
+        digests = {name: _digest(source) for name, source in members}
+    if previous is not None:
+        reuse = _reusable_entries(previous, members, digests, settings)
+
+    partial = _partial_path(destination)
+    try:
+        with partial.open("wb") as handle:
+            pieces = _read_chunks(members, chunk_size, previous, reuse)
+            if workers == 1:
+                entries = _write_entries(handle, members, _serial(pieces, compresslevel))
+            else:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="zip") as pool:
+                    chunks = _parallel(pool, pieces, compresslevel, window=workers * 4)
+                    entries = _write_entries(handle, members, chunks)
+            _write_central_directory(handle, entries)
+        os.replace(partial, destination)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+
+    if manifest is not None:
+        _write_manifest(Path(manifest), members, entries, digests, settings)
+    if previous is not None:
+        reused_bytes = sum(item.size for item in reuse.values())
+        logger.info(
+            "Archive %s: %d of %d entries unchanged (%.1f MB copied without recompressing)",
+            destination.name,
+            len(reuse),
+            len(members),
+            reused_bytes / (1024 * 1024),
+        )
+
+    logger.debug("Wrote %d archive entries to %s using %d thread(s)", len(members), destination, workers)
+    return destination
+
+
+# -- incremental rebuilds -------------------------------------------------------
+
+
+def _digest(source: Path) -> str:
+    with source.open("rb") as stream:
+        return hashlib.file_digest(stream, "sha256").hexdigest()
+
+
+def _reusable_entries(
+    previous: Build,
+    members: list[tuple[str, Path]],
+    digests: dict[str, str],
+    settings: dict,
+) -> dict[int, _Reusable]:
+    """
+    Entries of ``members`` whose compressed bytes can be copied from ``previous``.
+
+    An entry qualifies only if the manifest was written with the same
+    compression settings, records an entry with the same content hash, and
+    still agrees with the archive's own central directory about that entry's
+    CRC and sizes. The entry may have had another name. Anything that does not
+    line up - a missing or unreadable manifest, an archive replaced behind its
+    back - simply means that entry is compressed afresh.
+    """
+    archive = Path(previous.archive)
+    try:
+        manifest = json.loads(Path(previous.manifest).read_text(encoding="utf-8"))
+        if not archive.is_file() or {key: manifest.get(key) for key in settings} != settings:
+            return {}
+        recorded: dict = manifest["entries"]
+        by_content = {entry.get("sha256"): name for name, entry in recorded.items()}
+
+        reuse: dict[int, _Reusable] = {}
+        with zipfile.ZipFile(archive) as zip_file, archive.open("rb") as handle:
+            infos = {info.filename: info for info in zip_file.infolist()}
+            for index, (name, _) in enumerate(members):
+                previous_name = by_content.get(digests[name])
+                info = infos.get(previous_name)
+                entry = recorded.get(previous_name)
+                if (
+                    info is None
+                    or entry is None
+                    or info.compress_type != zipfile.ZIP_DEFLATED
+                    or (info.CRC, info.file_size, info.compress_size)
+                    != (entry.get("crc"), entry.get("size"), entry.get("compressed_size"))
+                ):
+                    continue
+                handle.seek(info.header_offset)
+                header = handle.read(_LOCAL_HEADER.size)
+                name_length, extra_length = _LOCAL_HEADER.unpack(header)[-2:]
+                reuse[index] = _Reusable(
+                    data_offset=info.header_offset + _LOCAL_HEADER.size + name_length + extra_length,
+                    compressed_size=info.compress_size,
+                    crc=info.CRC,
+                    size=info.file_size,
+                )
+        return reuse
+    except (OSError, ValueError, KeyError, TypeError, AttributeError, zipfile.BadZipFile, struct.error):
+        return {}
+
+
+def _write_manifest(
+    target: Path,
+    members: list[tuple[str, Path]],
+    entries: list[_Entry],
+    digests: dict[str, str],
+    settings: dict,
+) -> None:
+    manifest = {
+        **settings,
+        "entries": {
+            name: {
+                "sha256": digests[name],
+                "crc": entry.crc,
+                "size": entry.size,
+                "compressed_size": entry.compressed_size,
+            }
+            for (name, _), entry in zip(members, entries, strict=True)
+        },
+    }
+    target.parent.mkdir(parents=True, exist_ok=True)
+    partial = _partial_path(target)
+    try:
+        partial.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding="utf-8")
+        os.replace(partial, target)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+
+
+def _partial_path(target: Path) -> Path:
+    """A file beside ``target`` to write into first, unique to this write."""
+    return target.with_name(f".{target.name}.{uuid.uuid4().hex}.partial")
+
+
+# -- chunk production -----------------------------------------------------------
+
+
+def _read_chunks(
+    members: list[tuple[str, Path]],
+    chunk_size: int,
+    previous: Build | None,
+    reuse: dict[int, _Reusable],
+) -> Iterator[tuple[_Chunk, bytes | None]]:
+    """
+    Yield every chunk of every member in archive order, with its dictionary.
+
+    Each chunk is a cancellation point; the partial archive is removed by
+    :func:`write_zip` as for any other failure.
+    """
+    for index, (_, source) in enumerate(members):
+        if previous is not None and index in reuse:
+            yield from _copied_chunks(index, Path(previous.archive), reuse[index])
+            continue
+
+        dictionary: bytes | None = None
+        with source.open("rb") as stream:
+            data = stream.read(chunk_size)
+            while True:
+                following = stream.read(chunk_size) if data else b""
+                last = not following
+                check_cancelled()
+                yield _Chunk(index, dictionary is None, last, data), dictionary
+                if last:
+                    break
+                dictionary = data[-WINDOW_SIZE:]
+                data = following
+
+
+def _copied_chunks(index: int, archive: Path, source: _Reusable) -> Iterator[tuple[_Chunk, None]]:
+    """An unchanged entry's compressed bytes, read from the previous archive."""
+    remaining = source.compressed_size
+    first = True
+    with archive.open("rb") as handle:
+        handle.seek(source.data_offset)
+        while True:
+            data = handle.read(min(_COPY_SIZE, remaining))
+            remaining -= len(data)
+            if remaining > 0 and not data:
+                raise ZipWriteError(f"previous archive {archive} is truncated")
+            last = remaining <= 0
+            check_cancelled()
+            yield _Chunk(index, first, last, data, raw=True, crc=source.crc, size=source.size), None
+            if last:
+                return
+            first = False
+
+
+def _serial(
+    pieces: Iterator[tuple[_Chunk, bytes | None]], level: int
+) -> Iterator[tuple[_Chunk, bytes]]:
+    for chunk, dictionary in pieces:
+        if chunk.raw:
+            yield chunk, chunk.data
+        else:
+            yield chunk, deflate_chunk(chunk.data, dictionary, chunk.last, level)
+
+
+def _parallel(
+    pool: ThreadPoolExecutor,
+    pieces: Iterator[tuple[_Chunk, bytes | None]],
+    level: int,
+    *,
+    window: int,
+) -> Iterator[tuple[_Chunk, bytes]]:
+    """
+    Compress chunks on ``pool`` and yield them back in submission order.
+
+    At most ``window`` chunks are in flight, which bounds memory to a few
+    megabytes per worker regardless of entry size.
+    """
+    pending: deque[tuple[_Chunk, Future[bytes]]] = deque()
+    for chunk, dictionary in pieces:
+        if chunk.raw:
+            future: Future[bytes] = Future()
+            future.set_result(chunk.data)
+        else:
+            future = pool.submit(deflate_chunk, chunk.data, dictionary, chunk.last, level)
+        pending.append((chunk, future))
+        if len(pending) >= window:
+            done, future = pending.popleft()
+            yield done, future.result()
+    while pending:
+        done, future = pending.popleft()
+        yield done, future.result()
+
+
+# -- container ------------------------------------------------------------------
+
+
+def _write_entries(
+    handle, members: list[tuple[str, Path]], chunks: Iterator[tuple[_Chunk, bytes]]
+) -> list[_Entry]:
+    """
+    Write local headers and compressed data, patching sizes in afterwards.
+
+    Sizes and CRC are only known once the last chunk is done, so each local
+    header is written with placeholders and rewritten in place - the output is
+    a regular file, so seeking back is cheap and avoids data descriptors.
+    """
+    entries: list[_Entry] = []
+    current: _Entry | None = None
+
+    for chunk, compressed in chunks:
+        if chunk.first:
+            name = members[chunk.entry_index][0]
+            encoded = name.encode("utf-8")
+            flags = 0 if name.isascii() else _FLAG_UTF8
+            current = _Entry(name=encoded, flags=flags, offset=handle.tell())
+            handle.write(_local_header(current))
+            handle.write(encoded)
+            entries.append(current)
+
+        assert current is not None
+        if chunk.raw:
+            current.crc = chunk.crc
+            current.size = chunk.size
+        else:
+            current.crc = zlib.crc32(chunk.data, current.crc)
+            current.size += len(chunk.data)
+        current.compressed_size += len(compressed)
+        handle.write(compressed)
+
+        if chunk.last:
+            if current.compressed_size >= ZIP32_LIMIT or handle.tell() >= ZIP32_LIMIT:
+                raise ZipWriteError("archive is too large for a non-ZIP64 archive")
+            end = handle.tell()
+            handle.seek(current.offset)
+            handle.write(_local_header(current))
+            handle.seek(end)
+
+    return entries
+
+
+def _local_header(entry: _Entry) -> bytes:
+    return _LOCAL_HEADER.pack(
+        0x04034B50,
+        _VERSION_NEEDED,
+        entry.flags,
+        zlib.DEFLATED,
+        DOS_TIME,
+        DOS_DATE,
+        entry.crc,
+        entry.compressed_size,
+        entry.size,
+        len(entry.name),
+        0,
+    )
+
+
+def _write_central_directory(handle, entries: list[_Entry]) -> None:
+    start = handle.tell()
+    for entry in entries:
+        handle.write(
+            _CENTRAL_HEADER.pack(
+                0x02014B50,
+                _VERSION_MADE_BY,
+                _VERSION_NEEDED,
+                entry.flags,
+                zlib.DEFLATED,
+                DOS_TIME,
+                DOS_DATE,
+                entry.crc,
+                entry.compressed_size,
+                entry.size,
+                len(entry.name),
+                0,  # extra field length
+                0,  # comment length
+                0,  # disk number start
+                0,  # internal attributes
+                _EXTERNAL_ATTR,
+                entry.offset,
+            )
+        )
+        handle.write(entry.name)
+    size = handle.tell() - start
+    if handle.tell() >= ZIP32_LIMIT:
+        raise ZipWriteError("archive is too large for a non-ZIP64 archive")
+    handle.write(
+        _END_OF_CENTRAL_DIRECTORY.pack(
+            0x06054B50, 0, 0, len(entries), len(entries), size, start, 0
+        )
+    )
@@ -0,0 +1,102 @@
+"""
+Job progress pushed to watching clients.
+
+The frontend used to poll ``/api/status/{id}`` every two seconds: each poll
+took the job store's lock and serialised the job, and a progress change waited
+up to a full interval to be seen. :class:`JobEvents` lets the store publish
+each change instead, and ``/api/status/{id}/events`` streams it out as
+Server-Sent Events.
+
+Publishing is cheap and never blocks the pipeline thread that reports
+progress. The job is serialised once, whatever the number of watchers, and
+each :class:`JobWatch` keeps only the latest state it has not sent. A burst of
+updates between two sends therefore collapses into one event carrying the
+newest state, and a slow client never queues up stale ones.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import threading
+from collections import defaultdict
+
+
+class JobWatch:
+    """
+    One client's subscription to one job.
+
+    Filled from any thread by :meth:`JobEvents.publish`, read on the event loop
+    the watch was created for.
+    """
+
+    def __init__(self, job_id: str, loop: asyncio.AbstractEventLoop) -> None:
+        self.job_id = job_id
+        self._loop = loop
+        self._ready = asyncio.Event()
+        self._lock = threading.Lock()
+        self._pending = False
+        self._latest: str | None = None
+
+    def offer(self, payload: str | None) -> None:
+        """Replace the unsent state with ``payload`` (``None``: the job is gone)."""
+        with self._lock:
+            self._latest = payload
+            if self._pending:
+                return
+            self._pending = True
+        # A closed loop means the client is gone.
+        with contextlib.suppress(RuntimeError):
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait for a state to send; ``False`` if ``timeout`` seconds pass first."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    def take(self) -> str | None:
+        """The newest unsent state, as JSON; ``None`` if the job was removed."""
+        with self._lock:
+            self._ready.clear()
+            self._pending = False
+            return self._latest
+
+
+class JobEvents:
+    """Fans job changes out to the watches subscribed to them."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._watches: defaultdict[str, set[JobWatch]] = defaultdict(set)
+
+    def subscribe(self, job_id: str, loop: asyncio.AbstractEventLoop) -> JobWatch:
+        watch = JobWatch(job_id, loop)
+        with self._lock:
+            self._watches[job_id].add(watch)
+        return watch
+
+    def unsubscribe(self, watch: JobWatch) -> None:
+        with self._lock:
+            watches = self._watches.get(watch.job_id)
+            if watches is not None:
+                watches.discard(watch)
+                if not watches:
+                    del self._watches[watch.job_id]
+
+    def watched(self, job_id: str) -> bool:
+        """Whether anyone watches ``job_id``; publishers skip serialising if not."""
+        return job_id in self._watches
+
+    def publish(self, job_id: str, payload: str | None) -> None:
+        """Hand ``payload`` to every watch of ``job_id``."""
+        with self._lock:
+            watches = list(self._watches.get(job_id, ()))
+        for watch in watches:
+            watch.offer(payload)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(watches) for watches in self._watches.values())
@@ -0,0 +1,79 @@
+"""
+Distributed worker mode.
+
+By default generations run on :class:`~services.scheduler.JobScheduler` threads
+inside the API process, so one process has to hold every DEM, mesh and archive
+in flight. A single machine's RAM and cores then cap throughput, and
+restarting the API interrupts every running job.
+
+With ``QUEUE_URL`` set, the API only records and enqueues jobs. Separate
+``python worker.py`` processes, on this machine or others, claim them from a
+shared :class:`~services.job_queue.base.JobBackend` and run
+:meth:`~services.pipeline.MapGenerationPipeline.run`:
+
+* **Shared state.** :class:`~services.jobs.JobStore` writes every job through
+  to the backend and reads it back from there, so a worker's progress
+  updates and artefact paths are what the API serves. Artefacts themselves are
+  files: ``OUTPUT_DIR`` and ``TEMP_DIR`` must be the same volume for the API
+  and its workers.
+* **Leases.** A claimed job is leased to its worker, which renews the lease
+  every second. If the worker dies the lease runs out and another worker takes
+  the job over, resuming from its stage checkpoints.
+* **Cancellation.** Cancelling a running job flags it in the backend; the
+  worker sees the flag at its next renewal and cancels the job's token.
+
+Backends:
+
+* ``sqlite:///temp/queue.db`` - one SQLite file; workers on the same machine.
+  A relative path is resolved against the data directory; four slashes make
+  it absolute.
+* ``redis://host:6379/0`` - Redis or a compatible server; workers anywhere.
+  Needs ``pip install redis``.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from services.job_queue.base import (
+    LEASE_SECONDS,
+    CancelOutcome,
+    ClaimedJob,
+    JobBackend,
+    Lease,
+    QueueBackendError,
+)
+
+__all__ = [
+    "LEASE_SECONDS",
+    "CancelOutcome",
+    "ClaimedJob",
+    "JobBackend",
+    "Lease",
+    "QueueBackendError",
+    "open_backend",
+]
+
+
+def open_backend(url: str, *, base_dir: Path) -> JobBackend:
+    """
+    Open the backend ``url`` names.
+
+    Args:
+        base_dir: What a relative ``sqlite:///`` path is resolved against.
+
+    Raises:
+        QueueBackendError: The scheme is unknown or the backend is unusable.
+    """
+    scheme = urlsplit(url).scheme
+    if scheme == "sqlite" and url.startswith("sqlite:///"):
+        from services.job_queue.sqlite_backend import SqliteJobBackend
+
+        path = Path(url.removeprefix("sqlite:///"))
+        return SqliteJobBackend(path if path.is_absolute() else base_dir / path)
+    if scheme in ("redis", "rediss"):
+        from services.job_queue.redis_backend import RedisJobBackend
+
+        return RedisJobBackend(url)
+    raise QueueBackendError(f"Unsupported QUEUE_URL {url!r}: use sqlite:///<path> or redis://<host>")
@@ -0,0 +1,166 @@
+"""Interface shared by every job queue backend."""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import Any
+
+#: Seconds a claimed job stays leased to its worker without a renewal. A worker
+#: that dies stops renewing, and its job is handed to another worker after this.
+LEASE_SECONDS = 60.0
+
+
+class QueueBackendError(RuntimeError):
+    """Raised when a queue backend cannot be opened or reached."""
+
+
+class CancelOutcome(StrEnum):
+    """What :meth:`JobBackend.cancel` did."""
+
+    #: The job was waiting and has been taken out of the queue.
+    DEQUEUED = "dequeued"
+    #: The job is running; its worker will see the request and stop it.
+    SIGNALLED = "signalled"
+    #: The job is neither queued nor running.
+    NOT_FOUND = "not_found"
+
+
+class Lease(StrEnum):
+    """What :meth:`JobBackend.renew` found."""
+
+    #: The worker still holds the job and should carry on.
+    HELD = "held"
+    #: The job was cancelled or deleted; the worker should stop it.
+    CANCELLED = "cancelled"
+    #: The lease ran out and another worker took the job over; this worker
+    #: should stop without touching the job's record.
+    LOST = "lost"
+
+
+@dataclass(frozen=True)
+class ClaimedJob:
+    """A job leased to one worker."""
+
+    job_id: str
+    #: The request as JSON, for ``MapGenerationRequest.model_validate``.
+    request: dict[str, Any]
+    #: How many times the job has been claimed, this claim included. Above 1,
+    #: earlier workers died or lost their lease while running it.
+    attempt: int
+    #: Cancellation was requested while an earlier worker ran the job.
+    cancelled: bool = False
+
+
+class JobBackend(ABC):
+    """
+    Job records and a work queue, shared by API replicas and workers.
+
+    Records are the serialised :class:`~services.jobs.GenerationJob` of every
+    job, so any replica can answer a status poll. The queue holds the jobs that
+    have not finished, in submission order. A worker *claims* one, which leases
+    it for ``lease_seconds``, renews the lease while it runs, and *completes* it
+    at the end. A lease that runs out returns the job to the queue, so a job
+    survives the worker that ran it.
+
+    Implementations must be safe to use from several threads and from several
+    processes at once.
+
+    The record half on its own is also how a single process persists its jobs
+    across restarts (see :meth:`~services.jobs.JobStore.open_database`).
+    """
+
+    # -- job records ----------------------------------------------------------
+
+    @abstractmethod
+    def save_job(self, record: dict[str, Any]) -> None:
+        """Insert or replace the record of ``record["job_id"]``."""
+
+    def save_jobs(self, records: list[dict[str, Any]]) -> None:
+        """Save several records; backends write them in one round trip."""
+        for record in records:
+            self.save_job(record)
+
+    @abstractmethod
+    def finish_job(self, record: dict[str, Any]) -> bool:
+        """
+        Save the terminal ``record`` unless the job has already finished.
+
+        Check and write are one atomic step. Returns ``False``, and changes
+        nothing, if the stored record is terminal or missing.
+        """
+
+    @abstractmethod
+    def load_job(self, job_id: str) -> dict[str, Any] | None:
+        """The record of ``job_id``, or ``None``."""
+
+    @abstractmethod
+    def delete_job(self, job_id: str) -> None:
+        """Forget ``job_id``, queued or not. Idempotent."""
+
+    @abstractmethod
+    def list_jobs(self, *, status: str | None = None) -> list[dict[str, Any]]:
+        """Every record, or those with ``status``, newest first."""
+
+    @abstractmethod
+    def count_jobs(self) -> dict[str, int]:
+        """Number of records in each status, counted without reading them."""
+
+    @abstractmethod
+    def page_jobs(
+        self,
+        *,
+        limit: int,
+        before: tuple[float, str] | None = None,
+        status: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Up to ``limit`` records, or those with ``status``, newest first.
+
+        Records are ordered by ``(created_at, job_id)``; only those ordered
+        before ``before`` are returned, so the last one of a page is where the
+        next page starts.
+        """
+
+    @abstractmethod
+    def expired_jobs(self, finished_before: float) -> list[str]:
+        """Ids of the jobs that finished at or before ``finished_before``."""
+
+    @abstractmethod
+    def find_result(self, result_key: str) -> dict[str, Any] | None:
+        """The most recently created record with ``result_key``, or ``None``."""
+
+    # -- queue ----------------------------------------------------------------
+
+    @abstractmethod
+    def enqueue(self, job_id: str, request: dict[str, Any]) -> int:
+        """Queue ``job_id``; returns its position (1 = next)."""
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> ClaimedJob | None:
+        """
+        Lease the next job to ``worker_id``.
+
+        The next job is the oldest one that is waiting or whose lease has run
+        out. Returns ``None`` when there is none.
+        """
+
+    @abstractmethod
+    def renew(self, job_id: str, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Lease:
+        """Extend ``worker_id``'s lease on ``job_id``, unless it should stop."""
+
+    @abstractmethod
+    def complete(self, job_id: str, worker_id: str) -> None:
+        """Take a finished job, whatever its outcome, off the queue, if ``worker_id`` holds it."""
+
+    @abstractmethod
+    def cancel(self, job_id: str) -> CancelOutcome:
+        """Dequeue ``job_id`` if it is waiting, or ask its worker to stop it."""
+
+    @abstractmethod
+    def waiting(self) -> list[str]:
+        """Ids of the jobs waiting to be claimed, next first."""
+
+    def close(self) -> None:  # noqa: B027 - optional hook
+        """Release connections."""
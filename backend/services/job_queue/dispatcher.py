@@ -0,0 +1,110 @@
+"""The API side of worker mode: enqueue jobs for worker processes to run."""
+
+from __future__ import annotations
+
+import time
+
+from core.cancellation import POLL_INTERVAL_SECONDS
+from core.logging_config import get_logger
+from models.map_request import MapGenerationRequest
+from services.job_queue.base import CancelOutcome, JobBackend
+from services.jobs import JobStatus, JobStore
+from services.scheduler import QueueFullError
+
+logger = get_logger(__name__)
+
+
+def publish_positions(backend: JobBackend, job_store: JobStore) -> None:
+    """Record each waiting job's ``queue_position`` (1 = next) on the job."""
+    for index, job_id in enumerate(backend.waiting(), start=1):
+        job_store.update(job_id, queue_position=index, message=f"Queued - position {index}")
+
+
+class QueueDispatcher:
+    """
+    Stands in for :class:`~services.scheduler.JobScheduler` when ``QUEUE_URL``
+    is set.
+
+    It has the scheduler's interface, so the routes do not care which one they
+    have, but runs nothing itself: jobs go into the shared backend and worker
+    processes (``python worker.py``) claim them. Queued jobs are already
+    durable there, so :meth:`restore` has nothing to do.
+    """
+
+    def __init__(self, backend: JobBackend, job_store: JobStore, *, max_queued: int = 32) -> None:
+        self.backend = backend
+        self.job_store = job_store
+        self.max_queued = max_queued
+
+    def submit(self, job_id: str, request: MapGenerationRequest) -> int | None:
+        """
+        Queue ``job_id`` for a worker.
+
+        Returns:
+            The job's queue position (1 = next to run) at submission.
+
+        Raises:
+            QueueFullError: ``max_queued`` jobs are already waiting.
+        """
+        if len(self.backend.waiting()) >= self.max_queued:
+            raise QueueFullError(
+                f"The generation queue is full ({self.max_queued} jobs waiting). "
+                f"Try again in a few minutes."
+            )
+        position = self.backend.enqueue(job_id, request.model_dump(mode="json"))
+        self.job_store.update(job_id, queue_position=position, message=f"Queued - position {position}")
+        return position
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job.
+
+        A queued job is removed and marked cancelled at once. A running job's
+        worker is told to stop at its next lease renewal, about a second away;
+        :meth:`wait_stopped` waits for it.
+
+        Returns:
+            ``False`` if the job is neither queued nor running.
+        """
+        outcome = self.backend.cancel(job_id)
+        if outcome is CancelOutcome.DEQUEUED:
+            self.job_store.update(job_id, status=JobStatus.CANCELLED, message="Cancelled")
+            publish_positions(self.backend, self.job_store)
+            logger.info("Job %s removed from the queue", job_id)
+        elif outcome is CancelOutcome.SIGNALLED:
+            logger.info("Job %s asked to stop", job_id)
+        return outcome is not CancelOutcome.NOT_FOUND
+
+    def wait_stopped(self, job_id: str, timeout: float | None = None) -> bool:
+        """
+        Wait until ``job_id`` has finished or been deleted.
+
+        The worker is in another process, so this polls the job's record.
+
+        Returns:
+            ``False`` if ``timeout`` elapsed first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.job_store.get(job_id)
+            if job is None or job.status.is_terminal:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL_SECONDS)
+
+    def position(self, job_id: str) -> int | None:
+        """1-based queue position of ``job_id``, or ``None`` if it is not queued."""
+        waiting = self.backend.waiting()
+        return waiting.index(job_id) + 1 if job_id in waiting else None
+
+    def __len__(self) -> int:
+        """Number of jobs waiting to be claimed."""
+        return len(self.backend.waiting())
+
+    def restore(self) -> int:
+        """Nothing to requeue: the backend outlives this process."""
+        return 0
+
+    def shutdown(self, *, wait: bool = True) -> None:
+        """Nothing to stop: running jobs belong to the workers."""
@@ -0,0 +1,325 @@
+"""Job queue on a Redis-compatible server, for workers on other machines."""
+
+from __future__ import annotations
+
+import json
+import time
+from typing import Any
+
+from services.job_queue.base import (
+    LEASE_SECONDS,
+    CancelOutcome,
+    ClaimedJob,
+    JobBackend,
+    Lease,
+    QueueBackendError,
+)
+
+# Queue transitions read and write several keys; as Lua scripts they run
+# atomically on the server, which is what stops two workers claiming one job,
+# or a worker that lost its job overwriting the outcome of the one that has it.
+
+_CLAIM = """
+local now = tonumber(ARGV[2])
+for _, job_id in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    local key = ARGV[1] .. ':queue:' .. job_id
+    local worker = redis.call('HGET', key, 'worker')
+    local lease = tonumber(redis.call('HGET', key, 'lease_until') or '0')
+    if (not worker) or lease < now then
+        redis.call('HSET', key, 'worker', ARGV[3], 'lease_until', ARGV[4])
+        local attempts = redis.call('HINCRBY', key, 'attempts', 1)
+        return {job_id, redis.call('HGET', key, 'request'), attempts,
+                redis.call('HGET', key, 'cancelled') or '0'}
+    end
+end
+return false
+"""
+
+_RENEW = """
+local key = ARGV[1] .. ':queue:' .. ARGV[2]
+if redis.call('EXISTS', key) == 0 or redis.call('HGET', key, 'cancelled') == '1' then
+    return 'cancelled'
+end
+if redis.call('HGET', key, 'worker') ~= ARGV[3] then
+    return 'lost'
+end
+redis.call('HSET', key, 'lease_until', ARGV[4])
+return 'held'
+"""
+
+_COMPLETE = """
+local key = ARGV[1] .. ':queue:' .. ARGV[2]
+if redis.call('HGET', key, 'worker') == ARGV[3] then
+    redis.call('DEL', key)
+    redis.call('ZREM', KEYS[1], ARGV[2])
+end
+"""
+
+# Keeps the listing indexes in step with a record's status: a counter per
+# status, and the job ids by creation time, overall and per status.
+_INDEX = """
+local function index(prefix, job_id, status, created_at)
+    local previous = redis.call('HGET', prefix .. ':status', job_id)
+    if previous == status then
+        return
+    end
+    if previous then
+        redis.call('HINCRBY', prefix .. ':counts', previous, -1)
+        redis.call('ZREM', prefix .. ':created:' .. previous, job_id)
+    end
+    redis.call('HSET', prefix .. ':status', job_id, status)
+    redis.call('HINCRBY', prefix .. ':counts', status, 1)
+    redis.call('ZADD', prefix .. ':created:' .. status, created_at, job_id)
+    redis.call('ZADD', prefix .. ':created', created_at, job_id)
+end
+"""
+
+_SAVE = _INDEX + """
+redis.call('SET', KEYS[1], ARGV[3])
+index(ARGV[1], ARGV[2], ARGV[4], ARGV[5])
+"""
+
+_REINDEX = _INDEX + """
+index(ARGV[1], ARGV[2], ARGV[3], ARGV[4])
+"""
+
+_UNINDEX = """
+local previous = redis.call('HGET', ARGV[1] .. ':status', ARGV[2])
+if previous then
+    redis.call('HINCRBY', ARGV[1] .. ':counts', previous, -1)
+    redis.call('ZREM', ARGV[1] .. ':created:' .. previous, ARGV[2])
+    redis.call('HDEL', ARGV[1] .. ':status', ARGV[2])
+end
+redis.call('ZREM', ARGV[1] .. ':created', ARGV[2])
+"""
+
+_FINISH = _INDEX + """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    return 0
+end
+local finished = cjson.decode(current)['finished_at']
+if finished ~= nil and finished ~= cjson.null then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[3])
+index(ARGV[4], ARGV[3], ARGV[5], ARGV[6])
+return 1
+"""
+
+_CANCEL = """
+local key = ARGV[1] .. ':queue:' .. ARGV[2]
+if redis.call('EXISTS', key) == 0 then
+    return 'not_found'
+end
+if not redis.call('HGET', key, 'worker') then
+    redis.call('DEL', key)
+    redis.call('ZREM', KEYS[1], ARGV[2])
+    return 'dequeued'
+end
+redis.call('HSET', key, 'cancelled', '1')
+return 'signalled'
+"""
+
+
+class RedisJobBackend(JobBackend):
+    """
+    :class:`JobBackend` on Redis, or anything speaking its protocol.
+
+    Keys, all under ``prefix``:
+
+    * ``{prefix}:job:{id}`` - the job record, as JSON.
+    * ``{prefix}:result:{result_key}`` - id of the latest job with that key.
+    * ``{prefix}:finished`` - sorted set of finished job ids by finish time.
+    * ``{prefix}:created`` - sorted set of every job id by creation time, and
+      ``{prefix}:created:{status}`` the same for the jobs in one status.
+    * ``{prefix}:status`` - hash of each job's status, and ``{prefix}:counts``
+      the number of jobs in each one.
+    * ``{prefix}:queue`` - sorted set of unfinished job ids by submission order.
+    * ``{prefix}:queue:{id}`` - hash of a queued job's request and lease.
+    * ``{prefix}:queue:sequence`` - the submission counter.
+
+    Requires the ``redis`` package, which is not a default dependency.
+    """
+
+    def __init__(self, url: str, *, prefix: str = "worldforge") -> None:
+        try:
+            import redis
+        except ImportError as exc:
+            raise QueueBackendError(
+                "A redis:// QUEUE_URL needs the 'redis' package: pip install redis"
+            ) from exc
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+        self._queue = f"{prefix}:queue"
+        self._finished = f"{prefix}:finished"
+        self._claim = self._client.register_script(_CLAIM)
+        self._renew = self._client.register_script(_RENEW)
+        self._complete = self._client.register_script(_COMPLETE)
+        self._cancel = self._client.register_script(_CANCEL)
+        self._finish = self._client.register_script(_FINISH)
+        self._save = self._client.register_script(_SAVE)
+        self._reindex = self._client.register_script(_REINDEX)
+        self._unindex = self._client.register_script(_UNINDEX)
+        try:
+            self._client.ping()
+            if not self._client.exists(f"{prefix}:created"):
+                self._index_existing()
+        except redis.RedisError as exc:
+            raise QueueBackendError(f"Cannot reach the job queue at {url}: {exc}") from exc
+
+    # -- job records ----------------------------------------------------------
+
+    def save_job(self, record: dict[str, Any]) -> None:
+        self.save_jobs([record])
+
+    def save_jobs(self, records: list[dict[str, Any]]) -> None:
+        pipe = self._client.pipeline()
+        for record in records:
+            job_id = record["job_id"]
+            self._save(
+                keys=[self._job_key(job_id)],
+                args=[
+                    self.prefix, job_id, json.dumps(record), record["status"], record["created_at"]
+                ],
+                client=pipe,
+            )
+            if record.get("result_key"):
+                pipe.set(f"{self.prefix}:result:{record['result_key']}", job_id)
+            if record.get("finished_at") is not None:
+                pipe.zadd(self._finished, {job_id: record["finished_at"]})
+            else:
+                pipe.zrem(self._finished, job_id)
+        pipe.execute()
+
+    def finish_job(self, record: dict[str, Any]) -> bool:
+        job_id = record["job_id"]
+        finished = self._finish(
+            keys=[self._job_key(job_id), self._finished],
+            args=[
+                json.dumps(record),
+                record["finished_at"],
+                job_id,
+                self.prefix,
+                record["status"],
+                record["created_at"],
+            ],
+        )
+        return bool(finished)
+
+    def load_job(self, job_id: str) -> dict[str, Any] | None:
+        payload = self._client.get(self._job_key(job_id))
+        return json.loads(payload) if payload else None
+
+    def delete_job(self, job_id: str) -> None:
+        pipe = self._client.pipeline()
+        pipe.delete(self._job_key(job_id), f"{self._queue}:{job_id}")
+        pipe.zrem(self._queue, job_id)
+        pipe.zrem(self._finished, job_id)
+        self._unindex(args=[self.prefix, job_id], client=pipe)
+        pipe.execute()
+
+    def list_jobs(self, *, status: str | None = None) -> list[dict[str, Any]]:
+        keys = list(self._client.scan_iter(match=self._job_key("*"), count=500))
+        if not keys:
+            return []
+        records = [json.loads(payload) for payload in self._client.mget(keys) if payload]
+        if status is not None:
+            records = [record for record in records if record["status"] == status]
+        return sorted(records, key=lambda record: record["created_at"], reverse=True)
+
+    def count_jobs(self) -> dict[str, int]:
+        counts = self._client.hgetall(f"{self.prefix}:counts")
+        return {status: int(count) for status, count in counts.items() if int(count) > 0}
+
+    def page_jobs(
+        self,
+        *,
+        limit: int,
+        before: tuple[float, str] | None = None,
+        status: str | None = None,
+    ) -> list[dict[str, Any]]:
+        index = f"{self.prefix}:created" if status is None else f"{self.prefix}:created:{status}"
+        # Equal scores come back by id, descending, which is the listing order;
+        # ids tied with ``before`` on time but not older than it are skipped.
+        top = "+inf" if before is None else before[0]
+        job_ids: list[str] = []
+        offset = 0
+        while len(job_ids) < limit:
+            batch = self._client.zrevrangebyscore(
+                index, top, "-inf", start=offset, num=limit, withscores=True
+            )
+            if not batch:
+                break
+            offset += len(batch)
+            job_ids += [
+                job_id for job_id, created in batch if before is None or (created, job_id) < before
+            ]
+        if not job_ids:
+            return []
+        payloads = self._client.mget([self._job_key(job_id) for job_id in job_ids[:limit]])
+        return [json.loads(payload) for payload in payloads if payload]
+
+    def expired_jobs(self, finished_before: float) -> list[str]:
+        return list(self._client.zrangebyscore(self._finished, "-inf", finished_before))
+
+    def find_result(self, result_key: str) -> dict[str, Any] | None:
+        job_id = self._client.get(f"{self.prefix}:result:{result_key}")
+        return self.load_job(job_id) if job_id else None
+
+    # -- queue ----------------------------------------------------------------
+
+    def enqueue(self, job_id: str, request: dict[str, Any]) -> int:
+        sequence = self._client.incr(f"{self._queue}:sequence")
+        pipe = self._client.pipeline()
+        pipe.hset(f"{self._queue}:{job_id}", mapping={"request": json.dumps(request), "attempts": 0})
+        pipe.zadd(self._queue, {job_id: sequence}, nx=True)
+        pipe.execute()
+        return self.waiting().index(job_id) + 1
+
+    def claim(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> ClaimedJob | None:
+        now = time.time()
+        result = self._claim(keys=[self._queue], args=[self.prefix, now, worker_id, now + lease_seconds])
+        if not result:
+            return None
+        job_id, request, attempts, cancelled = result
+        return ClaimedJob(job_id, json.loads(request), int(attempts), cancelled == "1")
+
+    def renew(self, job_id: str, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Lease:
+        state = self._renew(
+            keys=[self._queue], args=[self.prefix, job_id, worker_id, time.time() + lease_seconds]
+        )
+        return Lease(state)
+
+    def complete(self, job_id: str, worker_id: str) -> None:
+        self._complete(keys=[self._queue], args=[self.prefix, job_id, worker_id])
+
+    def cancel(self, job_id: str) -> CancelOutcome:
+        return CancelOutcome(self._cancel(keys=[self._queue], args=[self.prefix, job_id]))
+
+    def waiting(self) -> list[str]:
+        job_ids = self._client.zrange(self._queue, 0, -1)
+        if not job_ids:
+            return []
+        pipe = self._client.pipeline()
+        for job_id in job_ids:
+            pipe.hexists(f"{self._queue}:{job_id}", "worker")
+        claimed = pipe.execute()
+        return [job_id for job_id, taken in zip(job_ids, claimed, strict=True) if not taken]
+
+    def close(self) -> None:
+        self._client.close()
+
+    def _index_existing(self) -> None:
+        """Index the records saved before the listing indexes existed."""
+        pipe = self._client.pipeline()
+        for record in self.list_jobs():
+            self._reindex(
+                args=[self.prefix, record["job_id"], record["status"], record["created_at"]],
+                client=pipe,
+            )
+        pipe.execute()
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
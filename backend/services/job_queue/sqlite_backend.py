@@ -0,0 +1,291 @@
+"""Job records and queue in a local SQLite database."""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+from services.job_queue.base import (
+    LEASE_SECONDS,
+    CancelOutcome,
+    ClaimedJob,
+    JobBackend,
+    Lease,
+    QueueBackendError,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id      TEXT PRIMARY KEY,
+    status      TEXT NOT NULL,
+    result_key  TEXT,
+    created_at  REAL NOT NULL,
+    finished_at REAL,
+    record      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_result ON jobs (result_key, created_at);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_by_created ON jobs (created_at);
+CREATE INDEX IF NOT EXISTS jobs_by_finish ON jobs (finished_at) WHERE finished_at IS NOT NULL;
+CREATE TABLE IF NOT EXISTS queue (
+    sequence    INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id      TEXT NOT NULL UNIQUE,
+    request     TEXT NOT NULL,
+    worker_id   TEXT,
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    cancelled   INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_SAVE = (
+    "INSERT OR REPLACE INTO jobs (job_id, status, result_key, created_at, finished_at, record) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+# A job has finished once it has a finish time; see JobStore.update.
+_FINISH = (
+    "UPDATE jobs SET status = ?, result_key = ?, created_at = ?, finished_at = ?, record = ? "
+    "WHERE job_id = ? AND finished_at IS NULL"
+)
+
+#: How long a connection waits for another process's write lock, in seconds.
+_BUSY_TIMEOUT_SECONDS = 30.0
+
+
+def _row(record: dict[str, Any]) -> tuple[Any, ...]:
+    return (
+        record["job_id"],
+        record["status"],
+        record.get("result_key"),
+        record["created_at"],
+        record.get("finished_at"),
+        json.dumps(record),
+    )
+
+
+class SqliteJobBackend(JobBackend):
+    """
+    :class:`JobBackend` on one SQLite file.
+
+    Records keep their status, creation and finish times in indexed columns
+    beside the JSON, so listing by status and finding expired jobs are index
+    scans rather than a decode of every record.
+
+    The database runs in WAL mode, so status polls read while a worker writes.
+    Every queue transition is a ``BEGIN IMMEDIATE`` transaction: it takes the
+    write lock before reading, so two workers can never claim the same job.
+    Each thread gets its own connection, as :mod:`sqlite3` requires.
+
+    The file must be on a local disk: SQLite's locking is unreliable over
+    network filesystems. Workers on other machines need the Redis backend.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = self._connection()
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+        except (OSError, sqlite3.Error) as exc:
+            raise QueueBackendError(f"Cannot open job database {self.path}: {exc}") from exc
+
+    # -- job records ----------------------------------------------------------
+
+    def save_job(self, record: dict[str, Any]) -> None:
+        self._connection().execute(_SAVE, _row(record))
+
+    def save_jobs(self, records: list[dict[str, Any]]) -> None:
+        # One transaction, so one commit for the whole batch.
+        with self._transaction() as connection:
+            connection.executemany(_SAVE, [_row(record) for record in records])
+
+    def finish_job(self, record: dict[str, Any]) -> bool:
+        job_id, *columns = _row(record)
+        cursor = self._connection().execute(_FINISH, (*columns, job_id))
+        return cursor.rowcount == 1
+
+    def load_job(self, job_id: str) -> dict[str, Any] | None:
+        row = self._connection().execute(
+            "SELECT record FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_job(self, job_id: str) -> None:
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            connection.execute("DELETE FROM queue WHERE job_id = ?", (job_id,))
+
+    def list_jobs(self, *, status: str | None = None) -> list[dict[str, Any]]:
+        if status is None:
+            rows = self._connection().execute(
+                "SELECT record FROM jobs ORDER BY created_at DESC"
+            ).fetchall()
+        else:
+            rows = self._connection().execute(
+                "SELECT record FROM jobs WHERE status = ? ORDER BY created_at DESC", (status,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count_jobs(self) -> dict[str, int]:
+        # Answered from the status index alone.
+        rows = self._connection().execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+        ).fetchall()
+        return dict(rows)
+
+    def page_jobs(
+        self,
+        *,
+        limit: int,
+        before: tuple[float, str] | None = None,
+        status: str | None = None,
+    ) -> list[dict[str, Any]]:
+        clauses: list[str] = []
+        params: list[Any] = []
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if before is not None:
+            clauses.append("(created_at, job_id) < (?, ?)")
+            params.extend(before)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        rows = self._connection().execute(
+            f"SELECT record FROM jobs {where}ORDER BY created_at DESC, job_id DESC LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def expired_jobs(self, finished_before: float) -> list[str]:
+        rows = self._connection().execute(
+            "SELECT job_id FROM jobs WHERE finished_at IS NOT NULL AND finished_at <= ?",
+            (finished_before,),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def find_result(self, result_key: str) -> dict[str, Any] | None:
+        row = self._connection().execute(
+            "SELECT record FROM jobs WHERE result_key = ? ORDER BY created_at DESC LIMIT 1",
+            (result_key,),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # -- queue ----------------------------------------------------------------
+
+    def enqueue(self, job_id: str, request: dict[str, Any]) -> int:
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO queue (job_id, request) VALUES (?, ?)",
+                (job_id, json.dumps(request)),
+            )
+            (position,) = connection.execute(
+                "SELECT COUNT(*) FROM queue WHERE worker_id IS NULL AND sequence <= "
+                "(SELECT sequence FROM queue WHERE job_id = ?)",
+                (job_id,),
+            ).fetchone()
+        return position
+
+    def claim(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> ClaimedJob | None:
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT job_id, request, attempts, cancelled FROM queue "
+                "WHERE worker_id IS NULL OR lease_until < ? ORDER BY sequence LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, request, attempts, cancelled = row
+            connection.execute(
+                "UPDATE queue SET worker_id = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE job_id = ?",
+                (worker_id, now + lease_seconds, job_id),
+            )
+        return ClaimedJob(job_id, json.loads(request), attempts + 1, bool(cancelled))
+
+    def renew(self, job_id: str, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Lease:
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT worker_id, cancelled FROM queue WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None or row[1]:
+                return Lease.CANCELLED
+            if row[0] != worker_id:
+                return Lease.LOST
+            connection.execute(
+                "UPDATE queue SET lease_until = ? WHERE job_id = ?",
+                (time.time() + lease_seconds, job_id),
+            )
+        return Lease.HELD
+
+    def complete(self, job_id: str, worker_id: str) -> None:
+        self._connection().execute(
+            "DELETE FROM queue WHERE job_id = ? AND worker_id = ?", (job_id, worker_id)
+        )
+
+    def cancel(self, job_id: str) -> CancelOutcome:
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT worker_id FROM queue WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return CancelOutcome.NOT_FOUND
+            if row[0] is None:
+                connection.execute("DELETE FROM queue WHERE job_id = ?", (job_id,))
+                return CancelOutcome.DEQUEUED
+            connection.execute("UPDATE queue SET cancelled = 1 WHERE job_id = ?", (job_id,))
+        return CancelOutcome.SIGNALLED
+
+    def waiting(self) -> list[str]:
+        rows = self._connection().execute(
+            "SELECT job_id FROM queue WHERE worker_id IS NULL ORDER BY sequence"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    # -- connections ----------------------------------------------------------
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit: single statements commit on their own, and
+            # _transaction() opens explicit transactions where several must
+            # happen together.
+            connection = sqlite3.connect(
+                self.path,
+                timeout=_BUSY_TIMEOUT_SECONDS,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
@@ -0,0 +1,196 @@
+"""The worker side of worker mode: claim queued jobs and run them."""
+
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+from collections.abc import Callable
+
+from pydantic import ValidationError
+
+from core.cancellation import CancellationToken, JobCancelledError, cancellation_scope
+from core.logging_config import get_logger
+from models.map_request import MapGenerationRequest
+from services.admission import PeakRssSampler
+from services.job_queue.base import LEASE_SECONDS, ClaimedJob, JobBackend, Lease
+from services.job_queue.dispatcher import publish_positions
+from services.jobs import JobStatus, JobStore
+
+logger = get_logger(__name__)
+
+#: Claims of one job after which it is failed instead of run again. Each
+#: earlier claim ended with its worker dying, most likely of the job itself.
+MAX_ATTEMPTS = 3
+
+_MB = 1024 * 1024
+
+
+def default_worker_id() -> str:
+    """``host-pid``: unique among live workers, readable in logs."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class QueueWorker:
+    """
+    Runs jobs from a shared backend on a fixed set of threads.
+
+    Each thread claims one job at a time, runs it in a cancellation scope and
+    renews its lease every ``heartbeat_seconds`` while it runs. A renewal that
+    reports the job cancelled cancels its token; one that reports the lease
+    lost supersedes it, which stops the job without recording anything, as
+    another worker owns it now. A renewal that raises is retried on the next
+    beat; once ``lease_seconds`` pass without one succeeding, the lease is
+    treated as lost. With no work the threads poll the backend
+    every ``poll_seconds``.
+    """
+
+    def __init__(
+        self,
+        backend: JobBackend,
+        run: Callable[[str, MapGenerationRequest], None],
+        job_store: JobStore,
+        *,
+        concurrency: int = 1,
+        worker_id: str | None = None,
+        lease_seconds: float = LEASE_SECONDS,
+        heartbeat_seconds: float = 1.0,
+        poll_seconds: float = 1.0,
+    ) -> None:
+        self.backend = backend
+        self._run = run
+        self.job_store = job_store
+        self.concurrency = concurrency
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_seconds = poll_seconds
+        self._stopping = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        for index in range(self.concurrency):
+            thread = threading.Thread(target=self._work, name=f"queue-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Worker %s running %d job(s) at a time", self.worker_id, self.concurrency)
+
+    def stop(self, *, wait: bool = True) -> None:
+        """
+        Stop claiming jobs.
+
+        Jobs already running finish first when ``wait`` is set. Without it,
+        they are abandoned and their leases run out, so another worker takes
+        them over.
+        """
+        self._stopping.set()
+        threads, self._threads = self._threads, []
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def run_once(self) -> bool:
+        """Claim and run one job on the calling thread; ``False`` if none was waiting."""
+        claimed = self.backend.claim(self.worker_id, self.lease_seconds)
+        if claimed is None:
+            return False
+        self._execute(claimed)
+        return True
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception:  # noqa: BLE001 - the worker must survive
+                logger.exception("Worker %s could not take a job", self.worker_id)
+            self._stopping.wait(self.poll_seconds)
+
+    def _execute(self, claimed: ClaimedJob) -> None:
+        job_id = claimed.job_id
+        try:
+            job = self.job_store.get(job_id)
+            if job is None or job.status.is_terminal:
+                # Deleted, or finished by a worker that died before completing.
+                return
+            if claimed.cancelled:
+                self.job_store.update(job_id, status=JobStatus.CANCELLED, message="Cancelled")
+                return
+            if claimed.attempt > MAX_ATTEMPTS:
+                self.job_store.update(
+                    job_id,
+                    status=JobStatus.FAILED,
+                    message="Failed",
+                    error=f"The job stopped its worker {MAX_ATTEMPTS} times and was given up",
+                )
+                return
+            try:
+                request = MapGenerationRequest.model_validate(claimed.request)
+            except ValidationError as exc:
+                self.job_store.update(
+                    job_id, status=JobStatus.FAILED, message="Failed", error=f"Invalid request: {exc}"
+                )
+                return
+            self._run_leased(job_id, request)
+        finally:
+            self.backend.complete(job_id, self.worker_id)
+
+    def _run_leased(self, job_id: str, request: MapGenerationRequest) -> None:
+        token = CancellationToken()
+        finished = threading.Event()
+
+        def heartbeat() -> None:
+            held_until = time.monotonic() + self.lease_seconds
+            while not finished.wait(self.heartbeat_seconds):
+                try:
+                    lease = self.backend.renew(job_id, self.worker_id, self.lease_seconds)
+                except Exception:  # noqa: BLE001 - a blip must not end the heartbeat
+                    logger.exception(
+                        "Worker %s could not renew its lease on job %s", self.worker_id, job_id
+                    )
+                    if time.monotonic() < held_until:
+                        continue
+                    # The lease has run out by now, and another worker may
+                    # already have claimed the job.
+                    lease = Lease.LOST
+                if lease is Lease.HELD:
+                    held_until = time.monotonic() + self.lease_seconds
+                    continue
+                if lease is Lease.LOST:
+                    # Stop duplicating the new owner's work, and leave its
+                    # record alone: the job store drops whatever this run
+                    # still writes, its outcome included.
+                    token.supersede()
+                else:
+                    token.cancel()
+                return
+
+        self.job_store.update(job_id, status=JobStatus.PROCESSING, message="Starting")
+        publish_positions(self.backend, self.job_store)
+        logger.info("Worker %s started job %s", self.worker_id, job_id)
+        renewer = threading.Thread(target=heartbeat, name=f"lease-{job_id[:8]}", daemon=True)
+        renewer.start()
+        sampler = PeakRssSampler()
+        try:
+            # The pipeline records its own failures on the job; this guard
+            # only keeps a defect there from killing the worker thread.
+            with sampler, cancellation_scope(token):
+                self._run(job_id, request)
+        except JobCancelledError:
+            if not token.superseded:
+                self.job_store.update(job_id, status=JobStatus.CANCELLED, message="Cancelled")
+        except Exception:  # noqa: BLE001 - the worker must survive
+            logger.exception("Job %s escaped the pipeline's error handling", job_id)
+        finally:
+            finished.set()
+            renewer.join()
+        if token.superseded:
+            logger.warning("Worker %s lost its lease on job %s to another worker", self.worker_id, job_id)
+            return
+        if sampler.peak_bytes is not None and sampler.start_bytes is not None:
+            stats = {
+                "peak_rss_mb": round(sampler.peak_bytes / _MB, 1),
+                "start_rss_mb": round(sampler.start_bytes / _MB, 1),
+            }
+            self.job_store.update(job_id, stats=stats)
@@ -13,10 +13,43 @@ background tasks. That had three problems:
    typo in a key silently produced ``None``.
 
 This module replaces it with a typed, lock-guarded store with TTL cleanup.
+Artefacts can live in a shared :class:`~services.blob_store.BlobStore`, in
+which case identical outputs of different jobs are one file on disk and each
+job holds a reference to it.
+
+Jobs used to live only in memory, so a restart forgot every finished map even
+though its archive was still in ``output/``. A store can now be backed by a
+:class:`~services.job_queue.base.JobBackend`, in one of two ways:
+
+* **Persistent** (:meth:`JobStore.open_database`): memory stays authoritative
+  and every change is written behind to a job database, from which the next
+  process reloads its jobs. Progress-only updates are batched: the pipeline
+  reports progress many times per stage, and they reach the database at most
+  every :data:`PROGRESS_FLUSH_SECONDS`, all pending jobs in one transaction.
+  Status changes, artefacts and deletions are written at once.
+* **Shared** (:attr:`JobStore.shared`, distributed worker mode): every job is
+  written through to the backend and read back from it, so the API process
+  sees what worker processes record. An outcome is only written if the job
+  has not finished meanwhile, so a worker that lost its job to another
+  cannot overwrite what that one recorded.
+
+Either way, TTL cleanup asks the backend for expired jobs, an indexed query,
+instead of walking every job.
+
+Every change is also published to :attr:`JobStore.events`, which pushes it to
+clients streaming the job's progress (see :mod:`services.job_events`).
+
+Listing used to copy every job out under the lock, sort them all and
+serialise them all, on every call. The store now keeps its jobs ordered by
+creation time, so :meth:`JobStore.page` walks back from a cursor and stops
+after one page, and a :attr:`JobStore.version` that changes with every job
+lets an unchanged listing be answered without reading any job.
 """
 
 from __future__ import annotations
 
+import bisect
+import json
 import threading
 import time
 import uuid
@@ -24,12 +57,21 @@ from collections.abc import Iterator
 from dataclasses import dataclass, field
 from enum import StrEnum
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
+from core.cancellation import is_superseded
 from core.logging_config import get_logger
+from services.blob_store import BlobStore
+from services.job_events import JobEvents
+
+if TYPE_CHECKING:
+    from services.job_queue.base import JobBackend
 
 logger = get_logger(__name__)
 
+#: How often progress-only updates are written to a job database, in seconds.
+PROGRESS_FLUSH_SECONDS = 2.0
+
 
 class JobStatus(StrEnum):
     """Lifecycle states of a generation job."""
@@ -47,7 +89,13 @@ class JobStatus(StrEnum):
 
 @dataclass
 class GenerationJob:
-    """State of a single map generation."""
+    """
+    State of a single map generation.
+
+    A job handed out by :class:`JobStore` is a snapshot: the store never
+    changes it, and each update replaces it with a new one. Read the job again
+    to see later changes.
+    """
 
     job_id: str
     map_name: str
@@ -64,9 +112,21 @@ class GenerationJob:
     #: so cleanup knows exactly what to delete.
     artifacts: dict[str, Path] = field(default_factory=dict)
 
+    #: Pipeline stages running right now and those already finished. Stages on
+    #: independent branches overlap, so one percentage cannot say which is which.
+    active_stages: list[str] = field(default_factory=list)
+    completed_stages: list[str] = field(default_factory=list)
+
     #: Free-form extras surfaced to the UI (feature counts, source name, ...).
     stats: dict[str, Any] = field(default_factory=dict)
 
+    #: Identity of the output this job produces (see
+    #: :meth:`JobStore.create_or_reuse`); ``None`` if it is not shareable.
+    result_key: str | None = None
+
+    #: Place in the scheduler's queue (1 = next to start) while queued.
+    queue_position: int | None = None
+
     def to_dict(self) -> dict[str, Any]:
         """Serialise for the HTTP API."""
         payload: dict[str, Any] = {
@@ -81,33 +141,254 @@ class GenerationJob:
         }
         if self.stats:
             payload["stats"] = self.stats
+        if self.queue_position is not None:
+            payload["queue_position"] = self.queue_position
+        if self.active_stages or self.completed_stages:
+            payload["active_stages"] = list(self.active_stages)
+            payload["completed_stages"] = list(self.completed_stages)
         if self.status is JobStatus.COMPLETED:
             if "archive" in self.artifacts:
                 payload["download_url"] = f"/api/download/{self.job_id}"
             if "preview" in self.artifacts:
                 payload["preview_url"] = f"/api/preview/{self.job_id}"
+        # A profile is most wanted for a job that failed or was cancelled.
+        if self.status.is_terminal and "profile" in self.artifacts:
+            payload["profile_url"] = f"/api/profile/{self.job_id}"
         return payload
 
+    def to_record(self) -> dict[str, Any]:
+        """Serialise everything, for a shared :class:`~services.job_queue.base.JobBackend`."""
+        return {
+            "job_id": self.job_id,
+            "map_name": self.map_name,
+            "status": self.status.value,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "finished_at": self.finished_at,
+            "artifacts": {role: str(path) for role, path in self.artifacts.items()},
+            "active_stages": list(self.active_stages),
+            "completed_stages": list(self.completed_stages),
+            "stats": self.stats,
+            "result_key": self.result_key,
+            "queue_position": self.queue_position,
+        }
 
-class JobStore:
-    """Thread-safe in-memory job registry with TTL-based cleanup."""
+    def evolve(self, **changes: Any) -> GenerationJob:
+        """
+        A copy with ``changes`` applied, leaving this job untouched.
 
-    def __init__(self, retention_seconds: int = 24 * 60 * 60) -> None:
+        The store's copy-on-write update. Unchanged fields are shared with
+        this job, so a change to a list or dict field must bring a new one.
+        Faster than :func:`dataclasses.replace`, which re-runs ``__init__``.
+        """
+        job = object.__new__(GenerationJob)
+        job.__dict__ = {**self.__dict__, **changes}
+        return job
+
+    @property
+    def order_key(self) -> tuple[float, str]:
+        """Position in listings: by creation time, ties broken by id."""
+        return (self.created_at, self.job_id)
+
+    @classmethod
+    def from_record(cls, record: dict[str, Any]) -> GenerationJob:
+        """Inverse of :meth:`to_record`."""
+        return cls(
+            **{
+                **record,
+                "status": JobStatus(record["status"]),
+                "artifacts": {role: Path(path) for role, path in record["artifacts"].items()},
+            }
+        )
+
+
+@dataclass(frozen=True)
+class JobPage:
+    """One page of :meth:`JobStore.page`, newest job first."""
+
+    jobs: list[GenerationJob]
+    #: :attr:`GenerationJob.order_key` of the last job, to pass as ``before``
+    #: for the next page; ``None`` on the last page.
+    next_before: tuple[float, str] | None
+    #: :attr:`JobStore.version` the page was read at.
+    version: str | None
+
+
+class JobStore:
+    """
+    Thread-safe job registry with TTL-based cleanup.
+
+    Jobs live in memory, written behind to :attr:`database` if one is open.
+    With :attr:`shared` set the backend holds the authoritative copy instead:
+    each read reloads the job from it and each change is written back, and the
+    in-memory dict is only a cache. Blob storage is per-process reference
+    counting, so it is not used with a shared store.
+
+    Locking used to be one ``RLock`` around everything, so status polls queued
+    behind every pipeline's progress update. Now:
+
+    * **Jobs are copy-on-write.** The store never changes a job it has handed
+      out; an update builds a new :class:`GenerationJob` and swaps it in. Reads
+      (:meth:`get`, :meth:`get_artifact`, ``len``) take no lock at all and
+      always see a consistent job.
+    * **Writers lock per job.** Updates to one job are serialised by that job's
+      lock, so read-modify-writes such as merging ``stats`` lose nothing, while
+      different jobs update in parallel. The locks are striped: a fixed pool,
+      chosen by the job id's hash.
+    * **The store lock is short.** ``_lock`` guards only the bookkeeping around
+      a swap (the index, result keys, counters, the dirty set). Serialising,
+      publishing and database writes happen outside it.
+    * **Counters are maintained.** Jobs per status are counted as they change,
+      so :meth:`active_count` and :meth:`status_counts` never scan. A shared
+      backend counts and pages through its own indexes instead.
+
+    Locks are always taken in the order job lock, then ``_flush_lock``, then
+    ``_lock``; nothing waits for another lock while holding ``_lock``.
+    """
+
+    #: Number of job lock stripes. Two jobs share a lock one time in this many.
+    LOCK_STRIPES = 64
+
+    def __init__(
+        self, retention_seconds: int = 24 * 60 * 60, *, blobs: BlobStore | None = None
+    ) -> None:
         self._jobs: dict[str, GenerationJob] = {}
         self._lock = threading.RLock()
+        self._job_locks = [threading.RLock() for _ in range(self.LOCK_STRIPES)]
+        #: Serialises database writes, so a batch never overwrites a newer one.
+        self._flush_lock = threading.Lock()
         self.retention_seconds = retention_seconds
+        #: Where :meth:`store_artifact` keeps content-addressed artefacts.
+        #: ``None`` stores artefacts in place, as :meth:`attach_artifact` does.
+        self.blobs = blobs
+        #: Result key -> the job producing or holding that result.
+        self._results: dict[str, str] = {}
+        #: Backend shared with other processes; ``None`` keeps jobs in memory.
+        self.shared: JobBackend | None = None
+        #: Where this process's jobs are persisted; see :meth:`open_database`.
+        self.database: JobBackend | None = None
+        #: Jobs changed since the database was last written.
+        self._dirty: set[str] = set()
+        self._flushed_at = 0.0
+        #: Subscribers to job changes made in this process.
+        self.events = JobEvents()
+        #: Order keys of every job, oldest first; see :meth:`page`.
+        self._order: list[tuple[float, str]] = []
+        #: Jobs per status. Every status has a key, so reading never races a
+        #: new key being added.
+        self._counts = dict.fromkeys(JobStatus, 0)
+        #: Bumped by every change to any job; see :attr:`version`.
+        self._changes = 0
+        self._epoch = uuid.uuid4().hex[:12]
+
+    def open_database(self, database: JobBackend) -> int:
+        """
+        Persist jobs in ``database``, first loading the ones it holds.
+
+        Jobs come back as they were recorded, artefacts included, so finished
+        maps stay downloadable after a restart. Loaded blob artefacts take
+        their references in :attr:`blobs` again. Jobs that were still queued
+        or running are the scheduler's to requeue or fail
+        (:meth:`~services.scheduler.JobScheduler.restore`).
 
-    def create(self, map_name: str) -> GenerationJob:
-        """Register a new job and return it."""
-        job = GenerationJob(job_id=str(uuid.uuid4()), map_name=map_name)
+        Returns:
+            Number of jobs loaded.
+        """
+        records = database.list_jobs()
         with self._lock:
-            self._jobs[job.job_id] = job
+            # Oldest first, so the newest job with a result key owns it.
+            for record in reversed(records):
+                job = GenerationJob.from_record(record)
+                self._insert(job)
+                if self.blobs is not None:
+                    for path in job.artifacts.values():
+                        if self.blobs.owns(path) and path.exists():
+                            self.blobs.retain(path)
+            self.database = database
+        if records:
+            logger.info("Loaded %d job(s) from the job database", len(records))
+        return len(records)
+
+    def close_database(self) -> None:
+        """Write pending progress, stop persisting and close the database."""
+        self._flush()
+        with self._flush_lock, self._lock:
+            database, self.database = self.database, None
+        if database is not None:
+            database.close()
+
+    def flush(self) -> None:
+        """Write batched progress updates to the database now."""
+        self._flush()
+
+    def create(
+        self, map_name: str, *, job_id: str | None = None, result_key: str | None = None
+    ) -> GenerationJob:
+        """
+        Register a new job and return it.
+
+        Args:
+            job_id: Reuse a known id, as when the scheduler restores a queued
+                job after a restart. A fresh UUID by default.
+            result_key: Identity of the output, for :meth:`create_or_reuse`.
+        """
+        job = GenerationJob(job_id=job_id or str(uuid.uuid4()), map_name=map_name, result_key=result_key)
+        with self._job_lock(job.job_id):
+            with self._lock:
+                self._insert(job)
+            self._push(job)
         logger.info("Job %s created for map %r", job.job_id, map_name)
         return job
 
+    def create_or_reuse(self, map_name: str, result_key: str | None) -> tuple[GenerationJob, bool]:
+        """
+        Return the job for an identical request, or register a new one.
+
+        A request is identical when its ``result_key`` matches. If that job is
+        still running, or finished with its archive still on disk, it is
+        returned instead of starting a second generation. Double-clicks, retries
+        and shared links then cost nothing. Failed and cancelled jobs are never
+        reused, so a retry after a failure really does retry.
+
+        Returns:
+            ``(job, reused)``.
+        """
+        if result_key is None:
+            return self.create(map_name), False
+
+        job = GenerationJob(job_id=str(uuid.uuid4()), map_name=map_name, result_key=result_key)
+        with self._job_lock(job.job_id):
+            # Looking up and registering under one hold of the store lock, so
+            # two identical requests cannot both start a generation.
+            with self._lock:
+                existing = self._find_result(result_key)
+                if existing is not None and self._serves_result(existing):
+                    logger.info("Job %s reused for an identical %r request", existing.job_id, map_name)
+                    return existing, True
+                self._insert(job)
+            self._push(job)
+        logger.info("Job %s created for map %r", job.job_id, map_name)
+        return job, False
+
+    def _find_result(self, result_key: str) -> GenerationJob | None:
+        if self.shared is None:
+            return self._jobs.get(self._results.get(result_key, ""))
+        record = self.shared.find_result(result_key)
+        return self._cache(record) if record is not None else None
+
+    @staticmethod
+    def _serves_result(job: GenerationJob) -> bool:
+        if not job.status.is_terminal:
+            return True
+        archive = job.artifacts.get("archive")
+        return job.status is JobStatus.COMPLETED and archive is not None and archive.exists()
+
     def get(self, job_id: str) -> GenerationJob | None:
-        with self._lock:
-            return self._jobs.get(job_id)
+        """The job's current state. Takes no lock: jobs are never changed in place."""
+        return self._pull(job_id)
 
     def update(
         self,
@@ -118,62 +399,223 @@ class JobStore:
         message: str | None = None,
         error: str | None = None,
         stats: dict[str, Any] | None = None,
+        active_stages: list[str] | None = None,
+        completed_stages: list[str] | None = None,
+        queue_position: int | None = None,
     ) -> GenerationJob | None:
         """
         Apply a partial update to a job.
 
         Returns the updated job, or ``None`` if it no longer exists (it may
-        have been cleaned up while a long generation was running).
+        have been cleaned up while a long generation was running). A run that
+        another worker has taken over (see
+        :meth:`~core.cancellation.CancellationToken.supersede`) changes
+        nothing and gets ``None`` too. In a shared store a job's outcome is
+        final: changing the status of a job that has already finished leaves
+        it as it is and returns it.
         """
-        with self._lock:
-            job = self._jobs.get(job_id)
+        if is_superseded():
+            return None
+        with self._job_lock(job_id):
+            job = self._pull(job_id)
             if job is None:
                 return None
 
+            changes: dict[str, Any] = {"updated_at": time.time()}
+            if active_stages is not None:
+                changes["active_stages"] = list(active_stages)
+            if completed_stages is not None:
+                changes["completed_stages"] = list(completed_stages)
+            if queue_position is not None:
+                changes["queue_position"] = queue_position
             if status is not None:
-                job.status = status
-                if status.is_terminal:
-                    job.finished_at = time.time()
+                changes["status"] = status
+                if status is not JobStatus.QUEUED:
+                    changes["queue_position"] = None
+                changes["finished_at"] = time.time() if status.is_terminal else None
+                if status is JobStatus.COMPLETED:
+                    changes["active_stages"] = []
             if progress is not None:
-                job.progress = max(0, min(100, progress))
+                changes["progress"] = max(0, min(100, progress))
             if message is not None:
-                job.message = message
+                changes["message"] = message
             if error is not None:
-                job.error = error
+                changes["error"] = error
             if stats:
-                job.stats.update(stats)
+                changes["stats"] = {**job.stats, **stats}
 
-            job.updated_at = time.time()
-            return job
+            updated = job.evolve(**changes)
+            if not self._swap(job, updated):
+                return None
+            # Progress within a state can wait for the next batch; a change of
+            # state is written at once.
+            deferrable = (status is None or status is job.status) and error is None
+            finishing = status is not None and status.is_terminal
+            if not self._push(updated, deferrable=deferrable, finishing=finishing):
+                return self._pull(job_id)
+            return updated
 
     def attach_artifact(self, job_id: str, role: str, path: Path) -> None:
         """Record a file produced by the job so it can be served and cleaned up."""
-        with self._lock:
-            job = self._jobs.get(job_id)
-            if job is not None:
-                job.artifacts[role] = Path(path)
+        if is_superseded():
+            return
+        with self._job_lock(job_id):
+            job = self._pull(job_id)
+            if job is None:
+                return
+            previous = job.artifacts.get(role)
+            updated = job.evolve(artifacts={**job.artifacts, role: Path(path)})
+            if not self._swap(job, updated):
+                return
+            self._push(updated)
+        # A replaced blob loses this job's reference; a replaced plain file is
+        # left alone, as it always was.
+        if (
+            previous is not None
+            and previous != Path(path)
+            and self.blobs is not None
+            and self.blobs.owns(previous)
+        ):
+            self.blobs.release(previous)
+
+    def store_artifact(self, job_id: str, role: str, path: Path, *, keep_source: bool = False) -> Path:
+        """
+        Move a job's output into the blob store and record it.
+
+        Identical content produced by several jobs is stored once; the blob is
+        deleted when the last job referencing it is cleaned up. Without a blob
+        store this is :meth:`attach_artifact`.
+
+        Args:
+            keep_source: Leave ``path`` where it is (the blob hard-links it).
+
+        Returns:
+            Where the artefact now lives.
+        """
+        if self.blobs is None:
+            self.attach_artifact(job_id, role, path)
+            return Path(path)
+
+        blob = self.blobs.put(path, keep_source=keep_source)
+        with self._job_lock(job_id):
+            if is_superseded() or self._pull(job_id) is None:
+                # Cleaned up while the job was still finishing, or taken over:
+                # nothing will ever release this reference, so give it back now.
+                self.blobs.release(blob)
+                return blob
+            self.attach_artifact(job_id, role, blob)
+        return blob
 
     def get_artifact(self, job_id: str, role: str) -> Path | None:
         """Return a job artefact path, or ``None`` if absent."""
-        with self._lock:
-            job = self._jobs.get(job_id)
-            if job is None:
-                return None
-            return job.artifacts.get(role)
+        job = self._pull(job_id)
+        if job is None:
+            return None
+        return job.artifacts.get(role)
 
     def active_count(self) -> int:
         """Number of jobs that have not reached a terminal state."""
-        with self._lock:
-            return sum(1 for job in self._jobs.values() if not job.status.is_terminal)
+        return sum(count for status, count in self.status_counts().items() if not status.is_terminal)
+
+    def status_counts(self) -> dict[JobStatus, int]:
+        """Number of jobs in each state."""
+        if self.shared is not None:
+            counts = dict.fromkeys(JobStatus, 0)
+            for status, count in self.shared.count_jobs().items():
+                counts[JobStatus(status)] = count
+            return counts
+        # Counters, not a scan. Every key exists from the start, so copying
+        # needs no lock.
+        return dict(self._counts)
 
     def __len__(self) -> int:
-        with self._lock:
-            return len(self._jobs)
+        if self.shared is not None:
+            return sum(self.shared.count_jobs().values())
+        return len(self._jobs)
 
     def __iter__(self) -> Iterator[GenerationJob]:
         with self._lock:
+            self._pull_all()
             return iter(list(self._jobs.values()))
 
+    @property
+    def version(self) -> str | None:
+        """
+        A tag that changes whenever any job changes, and differs between runs.
+
+        Equal tags mean the same jobs in the same state, so a listing read at
+        one tag can be reused for as long as the tag holds. ``None`` with a
+        shared store: other processes change jobs without this one knowing.
+        """
+        if self.shared is not None:
+            return None
+        return f"{self._epoch}-{self._changes}"
+
+    def page(
+        self,
+        *,
+        limit: int,
+        before: tuple[float, str] | None = None,
+        status: JobStatus | None = None,
+        name: str | None = None,
+    ) -> JobPage:
+        """
+        Up to ``limit`` jobs, newest first.
+
+        Only the jobs walked to fill the page are read: the walk starts just
+        older than ``before`` and stops once the page is full.
+
+        Args:
+            before: Start after this :attr:`GenerationJob.order_key`, as
+                returned in :attr:`JobPage.next_before`. The newest job if
+                ``None``.
+            status: Only jobs in this state.
+            name: Only maps whose name contains this, ignoring case.
+        """
+        needle = name.casefold() if name else None
+
+        def wanted(job: GenerationJob) -> bool:
+            return (status is None or job.status is status) and (
+                needle is None or needle in job.map_name.casefold()
+            )
+
+        with self._lock:
+            if self.shared is not None:
+                candidates: Iterator[GenerationJob] = self._walk_shared(
+                    batch=limit + 1, before=before, status=status
+                )
+            else:
+                end = len(self._order) if before is None else bisect.bisect_left(self._order, before)
+                candidates = (
+                    self._jobs[self._order[index][1]] for index in range(end - 1, -1, -1)
+                )
+            jobs: list[GenerationJob] = []
+            for job in candidates:
+                if not wanted(job):
+                    continue
+                if len(jobs) == limit:
+                    return JobPage(jobs, jobs[-1].order_key, self.version)
+                jobs.append(job)
+            return JobPage(jobs, None, self.version)
+
+    def discard(self, job_id: str) -> GenerationJob | None:
+        """
+        Remove a job now, whatever its age, releasing its artefacts.
+
+        Returns:
+            The removed job, or ``None`` if it did not exist.
+        """
+        with self._job_lock(job_id):
+            self._pull(job_id)
+            with self._lock:
+                job = self._remove(job_id)
+            if job is None:
+                return None
+            self._forget(job_id)
+        for path in job.artifacts.values():
+            self._release(path, delete_files=True)
+        return job
+
     def cleanup_expired(self, *, now: float | None = None, delete_files: bool = True) -> int:
         """
         Remove finished jobs older than the retention window.
@@ -188,30 +630,202 @@ class JobStore:
         current = time.time() if now is None else now
         removed: list[GenerationJob] = []
 
-        with self._lock:
-            for job_id, job in list(self._jobs.items()):
-                if not job.status.is_terminal:
-                    continue
-                reference = job.finished_at or job.updated_at
-                if current - reference >= self.retention_seconds:
-                    removed.append(self._jobs.pop(job_id))
-
-        if delete_files:
-            for job in removed:
-                for role, path in job.artifacts.items():
-                    try:
-                        Path(path).unlink(missing_ok=True)
-                    except OSError as exc:  # pragma: no cover - platform dependent
-                        logger.warning("Could not delete %s artefact %s: %s", role, path, exc)
+        # Expired jobs are finished, so nothing updates them any more; a late
+        # update finds the job gone and does nothing.
+        for expired in self._expired(current - self.retention_seconds):
+            with self._lock:
+                job = self._remove(expired.job_id)
+            if job is not None:
+                removed.append(job)
+                self._forget(job.job_id)
+
+        for job in removed:
+            for path in job.artifacts.values():
+                self._release(path, delete_files=delete_files)
+
+        if self.blobs is not None:
+            self.blobs.prune(max_age_seconds=self.retention_seconds, now=current)
 
         if removed:
             logger.info("Cleaned up %d expired job(s)", len(removed))
         return len(removed)
 
+    def _expired(self, finished_before: float) -> list[GenerationJob]:
+        """Jobs that finished at or before ``finished_before``."""
+        backend = self.shared or self.database
+        if backend is None:
+            with self._lock:
+                jobs = list(self._jobs.values())
+            return [
+                job
+                for job in jobs
+                if job.status.is_terminal and (job.finished_at or job.updated_at) <= finished_before
+            ]
+        self._flush()
+        found = (self._pull(job_id) for job_id in backend.expired_jobs(finished_before))
+        return [job for job in found if job is not None]
+
+    # -- bookkeeping (caller holds _lock) -------------------------------------
+
+    def _insert(self, job: GenerationJob) -> None:
+        replaced = self._jobs.get(job.job_id)
+        if replaced is not None:
+            self._unindex(replaced)
+        self._jobs[job.job_id] = job
+        bisect.insort(self._order, job.order_key)
+        self._counts[job.status] += 1
+        if job.result_key is not None:
+            self._results[job.result_key] = job.job_id
+        self._changes += 1
+
+    def _remove(self, job_id: str) -> GenerationJob | None:
+        job = self._jobs.pop(job_id, None)
+        if job is None:
+            return None
+        self._unindex(job)
+        if self._results.get(job.result_key) == job_id:
+            del self._results[job.result_key]
+        self._changes += 1
+        return job
+
+    def _unindex(self, job: GenerationJob) -> None:
+        index = bisect.bisect_left(self._order, job.order_key)
+        if index < len(self._order) and self._order[index] == job.order_key:
+            del self._order[index]
+            self._counts[job.status] -= 1
+
+    # -- per-job writes (caller holds the job's lock) ---------------------------
+
+    def _job_lock(self, job_id: str) -> threading.RLock:
+        return self._job_locks[hash(job_id) % self.LOCK_STRIPES]
+
+    def _swap(self, job: GenerationJob, updated: GenerationJob) -> bool:
+        """Replace ``job`` by ``updated``; ``False`` if it was removed meanwhile."""
+        if self.shared is not None:
+            self._jobs[updated.job_id] = updated
+            return True
+        with self._lock:
+            if self._jobs.get(job.job_id) is not job:
+                return False
+            self._jobs[job.job_id] = updated
+            self._counts[job.status] -= 1
+            self._counts[updated.status] += 1
+            self._changes += 1
+        return True
+
+    def _push(
+        self, job: GenerationJob, *, deferrable: bool = False, finishing: bool = False
+    ) -> bool:
+        """
+        Write a job's new state to the backend, if any, and publish it.
+
+        A ``finishing`` write to a shared backend only lands if the job has not
+        finished meanwhile: a worker that lost its lease must not overwrite the
+        outcome the new owner recorded. Returns ``False`` if it did not land.
+        """
+        if self.shared is not None:
+            record = job.to_record()
+            if finishing:
+                if not self.shared.finish_job(record):
+                    return False
+            else:
+                self.shared.save_job(record)
+        if self.events.watched(job.job_id):
+            # Serialised once here, however many clients watch.
+            self.events.publish(job.job_id, json.dumps(job.to_dict()))
+        if self.shared is not None or self.database is None:
+            return True
+        with self._lock:
+            self._dirty.add(job.job_id)
+            due = not deferrable or time.monotonic() - self._flushed_at >= PROGRESS_FLUSH_SECONDS
+        if due:
+            self._flush()
+        return True
+
+    def _flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                database = self.database
+                if database is None or not self._dirty:
+                    return
+                jobs = [self._jobs[job_id] for job_id in self._dirty if job_id in self._jobs]
+                self._dirty.clear()
+                self._flushed_at = time.monotonic()
+            # Snapshots never change, so they are serialised outside the lock.
+            if jobs:
+                database.save_jobs([job.to_record() for job in jobs])
+
+    def _forget(self, job_id: str) -> None:
+        # Under the flush lock, so a batch already being written cannot put
+        # the job back after it is deleted.
+        with self._flush_lock:
+            with self._lock:
+                self._dirty.discard(job_id)
+            backend = self.shared or self.database
+            if backend is not None:
+                backend.delete_job(job_id)
+        self.events.publish(job_id, None)
+
+    # -- shared backend -------------------------------------------------------
+
+    def _pull(self, job_id: str) -> GenerationJob | None:
+        """The current state of ``job_id``, reloaded from the shared backend if any."""
+        if self.shared is None:
+            return self._jobs.get(job_id)
+        record = self.shared.load_job(job_id)
+        if record is None:
+            self._jobs.pop(job_id, None)
+            return None
+        return self._cache(record)
+
+    def _pull_all(self) -> None:
+        if self.shared is not None:
+            self._jobs = {}
+            for record in self.shared.list_jobs():
+                self._cache(record)
+
+    def _walk_shared(
+        self, *, batch: int, before: tuple[float, str] | None, status: JobStatus | None
+    ) -> Iterator[GenerationJob]:
+        """Shared jobs older than ``before``, newest first, read a batch at a time."""
+        while True:
+            records = self.shared.page_jobs(
+                limit=batch, before=before, status=status.value if status else None
+            )
+            for record in records:
+                job = GenerationJob.from_record(record)
+                before = job.order_key
+                yield job
+            if len(records) < batch:
+                return
+
+    def _cache(self, record: dict[str, Any]) -> GenerationJob:
+        job = GenerationJob.from_record(record)
+        self._jobs[job.job_id] = job
+        return job
+
+    def _release(self, path: Path, *, delete_files: bool) -> None:
+        """Drop a job's claim on an artefact: a blob reference, or the file itself."""
+        if self.blobs is not None and self.blobs.owns(path):
+            # Possibly shared with other jobs: the store decides when it goes.
+            self.blobs.release(path, delete=delete_files)
+            return
+        if not delete_files:
+            return
+        try:
+            Path(path).unlink(missing_ok=True)
+        except OSError as exc:  # pragma: no cover - platform dependent
+            logger.warning("Could not delete artefact %s: %s", path, exc)
+
     def clear(self) -> None:
         """Drop every job (tests only)."""
         with self._lock:
             self._jobs.clear()
+            self._results.clear()
+            self._dirty.clear()
+            self._order.clear()
+            self._counts = dict.fromkeys(JobStatus, 0)
+            self._changes += 1
 
 
 #: Process-wide job registry. Replaced wholesale in tests.
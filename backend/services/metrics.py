@@ -0,0 +1,229 @@
+"""
+Per-stage resource metrics.
+
+:class:`~services.pipeline.ProgressReporter` knew where each stage began and
+ended but recorded nothing about what it cost. Each stage is now measured
+with a :class:`StageRun`:
+
+* **Wall time** and **CPU time** (``time.process_time``).
+* **Peak RSS growth**: the highest resident set seen during the stage, less
+  the resident set when it started.
+* **Bytes read and written** at the system call, so a download counts as
+  bytes read.
+
+The figures go into the job's ``stats["stage_metrics"]`` and into the
+process-wide :data:`stage_metrics` histograms, which ``/api/metrics`` exposes
+in the Prometheus text format.
+
+CPU, memory and I/O are process-wide counters, so while jobs run at the same
+time each stage's figures include the others' work, as with the job-level
+``peak_rss_mb``. Stages run in worker processes (``PROCESS_WORKERS``) add
+their wall time but not their CPU or I/O.
+
+The cost is a handful of system calls per stage, plus one resident-set read
+every :data:`RSS_SAMPLE_SECONDS` on a single thread, and only while a stage
+is running. That is cheap enough to leave on in production, so there is no
+switch.
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+import weakref
+from collections.abc import Iterable
+
+from core.memory import current_rss_bytes, io_bytes
+
+#: How often the resident set is sampled while any stage is running, in seconds.
+RSS_SAMPLE_SECONDS = 0.25
+
+_MB = 1024 * 1024
+
+#: Histogram bucket upper bounds. Stages range from milliseconds (validation)
+#: to many minutes (an 8192 AI job), so the buckets are roughly logarithmic.
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+BYTES_BUCKETS = tuple(size * _MB for size in (1, 4, 16, 64, 256, 1024, 4096, 16384))
+
+
+class _RssWatch:
+    """
+    One thread that raises the peak of every stage in flight.
+
+    Stages are held weakly: a stage that never finishes, because its job
+    failed, drops out once its job's reporter is gone. The thread exits when
+    nothing is left to watch and starts again with the next stage.
+    """
+
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval_seconds = interval_seconds
+        self._runs: weakref.WeakSet[StageRun] = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def add(self, run: StageRun) -> None:
+        with self._lock:
+            self._runs.add(run)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name="stage-rss", daemon=True)
+                self._thread.start()
+
+    def discard(self, run: StageRun) -> None:
+        with self._lock:
+            self._runs.discard(run)
+
+    def _sample(self) -> None:
+        while True:
+            time.sleep(self.interval_seconds)
+            with self._lock:
+                runs = list(self._runs)
+                if not runs:
+                    self._thread = None
+                    return
+            rss = current_rss_bytes()
+            for run in runs:
+                run.observe(rss)
+
+
+_watch = _RssWatch(RSS_SAMPLE_SECONDS)
+
+
+class StageRun:
+    """The resources one stage has used so far; :meth:`finish` to read them."""
+
+    def __init__(self, stage: str) -> None:
+        self.stage = stage
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._io = io_bytes()
+        self._start_rss = self._peak_rss = current_rss_bytes()
+        _watch.add(self)
+
+    def observe(self, rss: int | None) -> None:
+        """Raise the peak to ``rss`` if it is higher."""
+        if rss is not None and self._peak_rss is not None and rss > self._peak_rss:
+            self._peak_rss = rss
+
+    def finish(self) -> dict[str, float | int]:
+        """
+        Stop measuring and return the figures, for ``stats["stage_metrics"]``.
+
+        Keys are ``wall_seconds`` and ``cpu_seconds``, and where the platform
+        reports them ``peak_rss_delta_mb``, ``read_bytes`` and
+        ``written_bytes``.
+        """
+        _watch.discard(self)
+        self.observe(current_rss_bytes())
+        figures: dict[str, float | int] = {
+            "wall_seconds": round(time.perf_counter() - self._wall, 3),
+            "cpu_seconds": round(time.process_time() - self._cpu, 3),
+        }
+        if self._start_rss is not None and self._peak_rss is not None:
+            figures["peak_rss_delta_mb"] = round((self._peak_rss - self._start_rss) / _MB, 1)
+        io = io_bytes()
+        if self._io is not None and io is not None:
+            figures["read_bytes"] = io[0] - self._io[0]
+            figures["written_bytes"] = io[1] - self._io[1]
+        return figures
+
+
+class Histogram:
+    """Cumulative-bucket histogram of one value, per stage."""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        #: Stage -> (count per bucket, the last for +Inf; sum; count).
+        self._series: dict[str, tuple[list[int], float, int]] = {}
+
+    def observe(self, stage: str, value: float) -> None:
+        counts, total, count = self._series.get(stage) or ([0] * (len(self.buckets) + 1), 0.0, 0)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._series[stage] = (counts, total + value, count + 1)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for stage, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts, strict=True):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}'
+            yield f'{self.name}_sum{{stage="{stage}"}} {total:g}'
+            yield f'{self.name}_count{{stage="{stage}"}} {count}'
+
+
+class Counter:
+    """Monotonic total, per stage."""
+
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help_text = help_text
+        self._totals: dict[str, float] = {}
+
+    def add(self, stage: str, value: float) -> None:
+        self._totals[stage] = self._totals.get(stage, 0) + value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        for stage, total in sorted(self._totals.items()):
+            yield f'{self.name}{{stage="{stage}"}} {total:g}'
+
+
+class StageMetrics:
+    """Process-wide aggregates of finished stages, in Prometheus form."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.wall = Histogram(
+            "worldforge_stage_duration_seconds", "Wall time of finished pipeline stages.", SECONDS_BUCKETS
+        )
+        self.cpu = Histogram(
+            "worldforge_stage_cpu_seconds", "Process CPU time during pipeline stages.", SECONDS_BUCKETS
+        )
+        self.rss = Histogram(
+            "worldforge_stage_peak_rss_growth_bytes",
+            "Peak resident set during a stage, less the resident set at its start.",
+            BYTES_BUCKETS,
+        )
+        self.read = Counter(
+            "worldforge_stage_read_bytes_total", "Bytes read during pipeline stages, network included."
+        )
+        self.written = Counter(
+            "worldforge_stage_written_bytes_total", "Bytes written during pipeline stages."
+        )
+
+    def observe(self, stage: str, figures: dict[str, float | int]) -> None:
+        """Add one finished stage, as returned by :meth:`StageRun.finish`."""
+        with self._lock:
+            self.wall.observe(stage, figures["wall_seconds"])
+            self.cpu.observe(stage, figures["cpu_seconds"])
+            if "peak_rss_delta_mb" in figures:
+                self.rss.observe(stage, max(0.0, figures["peak_rss_delta_mb"]) * _MB)
+            if "read_bytes" in figures:
+                self.read.add(stage, figures["read_bytes"])
+                self.written.add(stage, figures["written_bytes"])
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                line
+                for metric in (self.wall, self.cpu, self.rss, self.read, self.written)
+                for line in metric.render()
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def render_gauge(name: str, help_text: str, label: str, values: dict[str, float]) -> str:
+    """One labelled gauge in the Prometheus text format."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    lines += [f'{name}{{{label}="{key}"}} {value:g}' for key, value in sorted(values.items())]
+    return "\n".join(lines) + "\n"
+
+
+#: Process-wide stage metrics, served by ``/api/metrics``.
+stage_metrics = StageMetrics()
@@ -23,27 +23,47 @@ so the reported percentage always matches the stages actually executed.
 from __future__ import annotations
 
 import asyncio
+import contextvars
+import hashlib
 import json
+import shutil
 import threading
 from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 from dataclasses import dataclass, field
 from pathlib import Path
 
 import numpy as np
 
+from core.cancellation import (
+    CancellationToken,
+    JobCancelledError,
+    await_cancellable,
+    cancellation_scope,
+    check_cancelled,
+    current_token,
+    run_abandonable,
+)
 from core.config import Settings, get_settings
 from core.geo import bbox_dimensions
 from core.logging_config import get_logger
 from core.paths import safe_join
 from core.projection import LocalProjection, TerrainSampler
+from core.version import APP_VERSION
 from models.map_request import MapGenerationRequest
 from models.terrain import HeightmapConfig, TerrainData
+from services.checkpoints import CheckpointStore
 from services.data_sources import DataSourceFactory, DataSourceType
 from services.data_sources.base import Capability, DataSourceInterface
 from services.data_sources.factory import NoDataSourceAvailableError
 from services.export.beamng_exporter import BeamNGExporter
+from services.export.terrain_materials import LandCoverMask
+from services.export.zip_writer import Build
 from services.jobs import JobStatus, JobStore
+from services.metrics import StageRun, stage_metrics
+from services.process_pool import StageRunner
+from services.profiling import SamplingProfiler, sampled
 from services.terrain.processor import TerrainProcessor
 
 logger = get_logger(__name__)
@@ -69,6 +89,18 @@ class LevelContent:
     stats: dict[str, int] = field(default_factory=dict)
 
 
+@dataclass
+class _TerrainOutputs:
+    """What the terrain branch hands to level building and packaging."""
+
+    terrain: TerrainData
+    bbox: list[float]
+    heightmap: np.ndarray
+    heightmap_path: Path
+    preview_path: Path
+    dem_metadata: dict
+
+
 @dataclass(frozen=True)
 class Stage:
     """One step of the pipeline, with the share of total progress it covers."""
@@ -88,6 +120,9 @@ BASE_STAGES: tuple[Stage, ...] = (
     Stage("package", "Packaging BeamNG mod", 15),
 )
 
+#: Segmentation classes that paint terrain materials rather than placing objects.
+LAND_COVER_CLASSES = ("water", "forest")
+
 #: Extra stages inserted when AI segmentation is enabled.
 AI_STAGES: tuple[Stage, ...] = (
     Stage("fetch_imagery", "Downloading satellite imagery", 15),
@@ -105,24 +140,79 @@ class ProgressReporter:
     hardcoded its own percentage.
     """
 
-    def __init__(self, stages: tuple[Stage, ...], on_update: Callable[[int, str], None]) -> None:
+    def __init__(
+        self,
+        stages: tuple[Stage, ...],
+        on_update: Callable[[int, str], None],
+        on_metrics: Callable[[str, dict[str, float | int]], None] | None = None,
+    ) -> None:
         self._stages = stages
         self._on_update = on_update
+        # Given ``on_metrics``, each stage is measured from start to finish and
+        # its figures handed over (see :mod:`services.metrics`).
+        self._on_metrics = on_metrics
+        self._runs: dict[str, StageRun] = {}
         self._total_weight = sum(stage.weight for stage in stages) or 1
         self._completed_weight = 0
+        # Branches of the pipeline run concurrently and report through the same
+        # reporter, so the running totals and the set of active stages are
+        # shared state.
+        self._active: dict[str, str] = {}
+        self._completed: list[str] = []
+        self._closed = False
+        # Re-entrant: ``on_update`` runs under it and may read the stage lists.
+        self._lock = threading.RLock()
+
+    @property
+    def active_stages(self) -> list[str]:
+        """Keys of the stages currently running, in the order they started."""
+        with self._lock:
+            return list(self._active)
+
+    @property
+    def completed_stages(self) -> list[str]:
+        """Keys of the stages finished so far, in completion order."""
+        with self._lock:
+            return list(self._completed)
 
     def start(self, key: str) -> None:
-        """Report that a stage has begun."""
+        """
+        Report that a stage has begun.
+
+        Also a cancellation point: a cancelled job stops here instead of
+        starting the stage.
+        """
+        check_cancelled()
         stage = self._stage(key)
-        percent = int(self._completed_weight / self._total_weight * 100)
-        self._on_update(percent, stage.label)
+        with self._lock:
+            self._active[key] = stage.label
+            if self._on_metrics is not None:
+                self._runs[key] = StageRun(key)
+            percent = int(self._completed_weight / self._total_weight * 100)
+            # With two branches in flight, say what both are doing.
+            self._report(percent, " + ".join(self._active.values()))
 
     def finish(self, key: str, message: str | None = None) -> None:
         """Report that a stage is complete."""
         stage = self._stage(key)
-        self._completed_weight += stage.weight
-        percent = int(self._completed_weight / self._total_weight * 100)
-        self._on_update(min(percent, 99), message or f"{stage.label} - done")
+        with self._lock:
+            self._active.pop(key, None)
+            self._completed.append(key)
+            run = self._runs.pop(key, None)
+            if run is not None:
+                self._on_metrics(key, run.finish())
+            self._completed_weight += stage.weight
+            percent = int(self._completed_weight / self._total_weight * 100)
+            self._report(min(percent, 99), message or f"{stage.label} - done")
+
+    def close(self) -> None:
+        """Stop reporting: the job's outcome is being recorded elsewhere."""
+        with self._lock:
+            self._closed = True
+
+    def _report(self, percent: int, message: str) -> None:
+        if not self._closed:
+            self._on_update(percent, message)
 
     def _stage(self, key: str) -> Stage:
         for stage in self._stages:
@@ -145,10 +235,10 @@ class MapGenerationPipeline:
         self.settings = settings or get_settings()
         self.terrain = terrain_processor or TerrainProcessor()
 
-        # Bounds how many generations run at once. Each holds a full DEM plus
-        # its resampled heightmap in memory, so unbounded concurrency is a
-        # straightforward way to OOM the server.
-        self._slots = threading.Semaphore(self.settings.max_concurrent_jobs)
+        # Terrain processing, vector extraction and packaging hold the GIL for
+        # much of their run time; with PROCESS_WORKERS set they run in worker
+        # processes shared by all jobs instead of taking turns on one core.
+        self._runner = StageRunner(self.settings.process_workers)
 
     # -- entry point ----------------------------------------------------------
 
@@ -156,43 +246,126 @@ class MapGenerationPipeline:
         """
         Execute the pipeline for ``job_id``.
 
-        Synchronous by design: FastAPI runs sync background tasks in a worker
-        thread, which keeps the event loop free to answer status polls.
-        Never raises - failures are recorded on the job.
+        Synchronous by design: it runs on a :class:`~services.scheduler.JobScheduler`
+        worker thread, which keeps the event loop free to answer status polls.
+        How many run at once is the scheduler's concern. Never raises -
+        failures and cancellation are recorded on the job.
+
+        A job asked to be profiled (``request.profile`` or ``PROFILE_JOBS``) is
+        sampled throughout; see :mod:`services.profiling`.
         """
-        acquired = self._slots.acquire(timeout=self.settings.http_timeout_seconds)
-        if not acquired:
-            self._fail(job_id, "Server is busy with other generations. Try again shortly.")
+        if not (request.profile or self.settings.profile_jobs):
+            self._run_recorded(job_id, request)
             return
 
+        profiler = SamplingProfiler()
+        with profiler.sampling():
+            self._run_recorded(job_id, request)
+        self._save_profile(job_id, profiler)
+
+    def _run_recorded(self, job_id: str, request: MapGenerationRequest) -> None:
         try:
             self._run_stages(job_id, request)
+        except JobCancelledError:
+            logger.info("Job %s cancelled", job_id)
+            self.job_store.update(job_id, status=JobStatus.CANCELLED, message="Cancelled")
         except PipelineError as exc:
             logger.warning("Job %s failed: %s", job_id, exc)
             self._fail(job_id, str(exc))
         except Exception as exc:  # noqa: BLE001 - background task must not die silently
             logger.exception("Job %s failed unexpectedly", job_id)
             self._fail(job_id, f"Unexpected error: {exc}")
-        finally:
-            self._slots.release()
+
+    def _save_profile(self, job_id: str, profiler: SamplingProfiler) -> None:
+        # Kept beside the archives and registered as an artefact, so retention
+        # cleanup removes it with the rest of the job.
+        path = self.settings.output_dir / "profiles" / f"{job_id}.folded"
+        try:
+            profiler.write_folded(path)
+        except OSError as exc:
+            logger.warning("Could not save the profile of job %s: %s", job_id, exc)
+            return
+        self.job_store.attach_artifact(job_id, "profile", path)
+        logger.info("Job %s profiled: %d samples in %s", job_id, profiler.samples, path)
+
+    def close(self) -> None:
+        """Stop the stage worker processes. Called on application shutdown."""
+        self._runner.shutdown()
+
+    def result_key(self, request: MapGenerationRequest) -> str | None:
+        """
+        Identify the archive ``request`` would produce, for result reuse.
+
+        Generation is deterministic given the request, the sources that serve
+        it and the code version, so those make up the key. Sources are keyed as
+        requested, ``"auto"`` included, and not resolved: resolving probes
+        providers over the network, and the key is made on the event loop for
+        every submission. A request that cannot be served fails, and failed
+        jobs are never reused. Returns ``None`` for a profiled request: the
+        point of it is a fresh run to measure.
+        """
+        if request.profile:
+            return None
+
+        identity: dict[str, object] = {
+            "request": request.model_dump(mode="json"),
+            "version": APP_VERSION,
+        }
+        if request.use_ai_segmentation:
+            identity["vision_model"] = self.settings.ollama_vl_model
+
+        canonical = json.dumps(identity, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _build_key(request: MapGenerationRequest) -> str:
+        """
+        Identify the map an archive is a build of, for incremental packaging.
+
+        The request without its name: renaming a map changes its metadata but
+        not its terrain, so the previous archive still holds most of the bytes.
+        """
+        identity = request.model_dump(mode="json", exclude={"name", "profile"})
+        canonical = json.dumps(identity, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
 
     # -- stages ---------------------------------------------------------------
 
     def _run_stages(self, job_id: str, request: MapGenerationRequest) -> None:
         stages = BASE_STAGES
         if request.use_ai_segmentation:
-            # Imagery stages run between DEM download and terrain processing.
+            # Imagery stages run alongside the terrain branch; they are listed
+            # after the DEM download only for their share of the progress bar.
             stages = BASE_STAGES[:2] + AI_STAGES + BASE_STAGES[2:]
 
+        measured: dict[str, dict[str, float | int]] = {}
+
+        def record_metrics(key: str, figures: dict[str, float | int]) -> None:
+            measured[key] = figures
+            stage_metrics.observe(key, figures)
+            self.job_store.update(job_id, stats={"stage_metrics": dict(measured)})
+
         progress = ProgressReporter(
             stages,
             lambda percent, message: self.job_store.update(
-                job_id, status=JobStatus.PROCESSING, progress=percent, message=message
+                job_id,
+                status=JobStatus.PROCESSING,
+                progress=percent,
+                message=message,
+                active_stages=progress.active_stages,
+                completed_stages=progress.completed_stages,
             ),
+            record_metrics,
         )
 
         work_dir = safe_join(self.settings.temp_dir, request.name)
         work_dir.mkdir(parents=True, exist_ok=True)
+        # Reruns of this map resume from the last stage whose inputs are
+        # unchanged, instead of downloading and resampling everything again.
+        checkpoints = CheckpointStore(
+            work_dir / "checkpoints", max_age_seconds=self.settings.job_retention_seconds
+        )
+        resumed: list[str] = []
 
         # -- validate ---------------------------------------------------------
         progress.start("validate")
@@ -200,50 +373,64 @@ class MapGenerationPipeline:
         self.job_store.update(job_id, stats={"data_source": source.get_source_name()})
         progress.finish("validate", f"Using {source.get_source_name()}")
 
-        # -- DEM --------------------------------------------------------------
-        progress.start("fetch_dem")
+        # -- terrain and AI branches ------------------------------------------
+        # The DEM chain and the imagery/AI chain share nothing until level
+        # content is built, so the AI stages run on a second thread while the
+        # DEM is downloaded and resampled: an AI job takes about as long as the
+        # slower of the two instead of their sum.
         bbox = request.bbox.to_list()
-        try:
-            dem_data, dem_metadata = source.get_dem_data(bbox=bbox, resolution=request.resolution)
-        except NotImplementedError as exc:
-            raise PipelineError(
-                f"{source.get_source_name()} does not provide elevation data. "
-                f"Choose a different data source."
-            ) from exc
-        except Exception as exc:  # noqa: BLE001 - surfaced to the user verbatim
-            raise PipelineError(f"Could not download elevation data: {exc}") from exc
-        progress.finish("fetch_dem", f"Elevation data downloaded ({dem_data.shape[1]}x{dem_data.shape[0]})")
-
-        # -- optional AI ------------------------------------------------------
         vector_data: dict[str, list] | None = None
-        if request.use_ai_segmentation:
-            vector_data = self._run_ai_stages(job_id, request, bbox, work_dir, progress)
-
-        # -- terrain ----------------------------------------------------------
-        progress.start("process_terrain")
-        terrain = self.terrain.process_dem(dem_data)
-        # BeamNG terrain blocks are square. Crop before resampling so the
-        # exported map is not stretched along its shorter axis.
-        terrain, effective_bbox = self.terrain.crop_to_square(terrain, bbox)
-        self.job_store.update(job_id, stats={"terrain": terrain.summary()})
-        progress.finish("process_terrain")
-
-        # -- heightmap --------------------------------------------------------
-        progress.start("heightmap")
-        heightmap = self.terrain.generate_heightmap(
-            terrain,
-            HeightmapConfig(size=request.heightmap_size, bit_depth=16),
-        )
-        heightmap_path = self.terrain.save_heightmap(
-            heightmap, work_dir / "heightmap.png", bit_depth=16
-        )
-        progress.finish("heightmap")
+        land_cover: dict[str, LandCoverMask] = {}
+        ai_resumed: list[str] = []
+        # The branch has a token of its own, so a failed terrain branch can
+        # stop it; it still stops with the job.
+        branch_token = CancellationToken(parent=current_token())
+
+        def run_ai_branch() -> tuple[dict[str, list] | None, dict[str, LandCoverMask]]:
+            with cancellation_scope(branch_token):
+                return self._run_ai_stages(
+                    job_id,
+                    request,
+                    bbox,
+                    work_dir,
+                    progress,
+                    checkpoints=checkpoints,
+                    resumed=ai_resumed,
+                )
 
-        # -- preview ----------------------------------------------------------
-        progress.start("preview")
-        preview_path = self.terrain.generate_preview(heightmap, work_dir / "preview.png")
-        self.job_store.attach_artifact(job_id, "preview", preview_path)
-        progress.finish("preview")
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline-ai") as branch:
+            ai_branch = (
+                # In a copy of this context, so the branch sees the job's
+                # profiler.
+                branch.submit(contextvars.copy_context().run, sampled(run_ai_branch))
+                if request.use_ai_segmentation
+                else None
+            )
+            try:
+                terrain_outputs = self._run_terrain_stages(
+                    job_id, request, source, bbox, work_dir, progress, checkpoints, resumed
+                )
+            except BaseException:
+                # The failure is recorded once this block exits, which waits
+                # for the AI branch. Cancel it, so the job does not hold its
+                # slot through an LLM call whose result would be thrown away,
+                # and silence its progress meanwhile, or it would report the
+                # job as processing again.
+                branch_token.cancel()
+                progress.close()
+                raise
+            if ai_branch is not None:
+                vector_data, land_cover = ai_branch.result()
+
+        terrain = terrain_outputs.terrain
+        effective_bbox = terrain_outputs.bbox
+        heightmap = terrain_outputs.heightmap
+        heightmap_path = terrain_outputs.heightmap_path
+        preview_path = terrain_outputs.preview_path
+        dem_metadata = terrain_outputs.dem_metadata
+        resumed += ai_resumed
+        if resumed:
+            self.job_store.update(job_id, stats={"resumed_stages": resumed})
 
         # -- level content ----------------------------------------------------
         # Detected roads and buildings only become level content once the
@@ -257,9 +444,9 @@ class MapGenerationPipeline:
 
         # -- package ----------------------------------------------------------
         progress.start("package")
-        exporter = BeamNGExporter(output_dir=self.settings.output_dir)
-        archive_path = exporter.create_map_structure(
-            map_name=request.name,
+        archive_path = self._package(
+            job_id,
+            request,
             heightmap_path=heightmap_path,
             preview_path=preview_path,
             terrain=terrain,
@@ -269,8 +456,11 @@ class MapGenerationPipeline:
             decal_roads=level_content.decal_roads,
             building_items=level_content.building_items,
             mesh_files=level_content.mesh_files,
+            land_cover=land_cover,
         )
-        self.job_store.attach_artifact(job_id, "archive", archive_path)
+        # Served from the content-addressed store, so regenerating the same map
+        # does not keep another copy of identical bytes.
+        self.job_store.store_artifact(job_id, "preview", preview_path)
         progress.finish("package")
 
         size_mb = archive_path.stat().st_size / (1024 * 1024)
@@ -278,7 +468,7 @@ class MapGenerationPipeline:
             job_id,
             status=JobStatus.COMPLETED,
             progress=100,
-            message=f"Done - {archive_path.name} ({size_mb:.1f} MB)",
+            message=f"Done - {request.name}.zip ({size_mb:.1f} MB)",
             stats={
                 "archive_size_mb": round(size_mb, 2),
                 "dem_resolution_m": dem_metadata.get("resolution", request.resolution),
@@ -286,6 +476,149 @@ class MapGenerationPipeline:
         )
         logger.info("Job %s completed: %s (%.1f MB)", job_id, archive_path, size_mb)
 
+    def _package(self, job_id: str, request: MapGenerationRequest, **layout: object) -> Path:
+        """
+        Write the mod archive and store it as the job's ``archive``.
+
+        With a blob store the archive is written in a directory of the job's
+        own and moved into the store, together with its manifest, and both
+        are labelled with :meth:`_build_key`. The next export of the same map,
+        under any name, rebuilds from them and compresses only what changed.
+        Without a blob store the archive is written to ``output_dir`` and
+        served from there, and every export is a full build.
+
+        Returns:
+            Where the archive is served from.
+        """
+        blobs = self.job_store.blobs
+        if blobs is None:
+            archive = self._runner.run(
+                _package,
+                self.settings.output_dir,
+                self.settings.export_workers,
+                map_name=request.name,
+                **layout,
+            )
+            return self.job_store.store_artifact(job_id, "archive", archive)
+
+        build_key = self._build_key(request)
+        package_dir = safe_join(self.settings.output_dir, ".packaging", job_id)
+        manifest = package_dir / "manifest.json"
+        previous = blobs.labelled(build_key)
+        try:
+            archive = self._runner.run(
+                _package,
+                package_dir,
+                self.settings.export_workers,
+                map_name=request.name,
+                previous_build=Build(previous["archive"], previous["manifest"]) if previous else None,
+                manifest=manifest,
+                **layout,
+            )
+            stored = {
+                "archive": self.job_store.store_artifact(job_id, "archive", archive),
+                "manifest": self.job_store.store_artifact(job_id, "manifest", manifest),
+            }
+        finally:
+            # The previous build is held only while it is read.
+            for blob in (previous or {}).values():
+                blobs.release(blob)
+            shutil.rmtree(package_dir, ignore_errors=True)
+        blobs.label(build_key, stored)
+        return stored["archive"]
+
+    def _run_terrain_stages(
+        self,
+        job_id: str,
+        request: MapGenerationRequest,
+        source: DataSourceInterface,
+        bbox: list[float],
+        work_dir: Path,
+        progress: ProgressReporter,
+        checkpoints: CheckpointStore,
+        resumed: list[str],
+    ) -> _TerrainOutputs:
+        """DEM download through preview: the branch every job runs."""
+        # -- DEM --------------------------------------------------------------
+        progress.start("fetch_dem")
+        dem_key = checkpoints.key("fetch_dem", source.get_source_name(), bbox, request.resolution)
+        restored = checkpoints.load("fetch_dem", dem_key)
+        if restored is not None:
+            dem_data, dem_metadata = restored.arrays["dem"], restored.metadata
+            resumed.append("fetch_dem")
+        else:
+            try:
+                dem_data, dem_metadata = run_abandonable(
+                    source.get_dem_data, bbox=bbox, resolution=request.resolution
+                )
+            except NotImplementedError as exc:
+                raise PipelineError(
+                    f"{source.get_source_name()} does not provide elevation data. "
+                    f"Choose a different data source."
+                ) from exc
+            except Exception as exc:  # noqa: BLE001 - surfaced to the user verbatim
+                raise PipelineError(f"Could not download elevation data: {exc}") from exc
+            checkpoints.save("fetch_dem", dem_key, {"dem": dem_data}, dem_metadata)
+        verb = "restored" if restored is not None else "downloaded"
+        progress.finish("fetch_dem", f"Elevation data {verb} ({dem_data.shape[1]}x{dem_data.shape[0]})")
+
+        # -- terrain ----------------------------------------------------------
+        progress.start("process_terrain")
+        terrain_key = checkpoints.key("process_terrain", dem_key)
+        restored = checkpoints.load("process_terrain", terrain_key)
+        if restored is not None:
+            terrain = TerrainData(
+                restored.arrays["elevation"], nodata_fraction=restored.metadata["nodata_fraction"]
+            )
+            effective_bbox = restored.metadata["bbox"]
+            resumed.append("process_terrain")
+        else:
+            terrain, effective_bbox = self._runner.run(_process_terrain, self.terrain, dem_data, bbox)
+            checkpoints.save(
+                "process_terrain",
+                terrain_key,
+                {"elevation": terrain.elevation},
+                {"nodata_fraction": terrain.nodata_fraction, "bbox": list(effective_bbox)},
+            )
+        del dem_data  # the processed terrain supersedes it
+        self.job_store.update(job_id, stats={"terrain": terrain.summary()})
+        progress.finish("process_terrain")
+
+        # -- heightmap --------------------------------------------------------
+        progress.start("heightmap")
+        heightmap_key = checkpoints.key("heightmap", terrain_key, request.heightmap_size)
+        restored = checkpoints.load("heightmap", heightmap_key)
+        if restored is not None:
+            heightmap = restored.arrays["heightmap"]
+            resumed.append("heightmap")
+        else:
+            heightmap = self._runner.run(
+                _generate_heightmap,
+                self.terrain,
+                terrain,
+                HeightmapConfig(size=request.heightmap_size, bit_depth=16),
+            )
+            checkpoints.save("heightmap", heightmap_key, {"heightmap": heightmap})
+        heightmap_path = self.terrain.save_heightmap(
+            heightmap, work_dir / "heightmap.png", bit_depth=16
+        )
+        progress.finish("heightmap")
+
+        # -- preview ----------------------------------------------------------
+        progress.start("preview")
+        preview_path = self.terrain.generate_preview(heightmap, work_dir / "preview.png")
+        self.job_store.attach_artifact(job_id, "preview", preview_path)
+        progress.finish("preview")
+
+        return _TerrainOutputs(
+            terrain=terrain,
+            bbox=list(effective_bbox),
+            heightmap=heightmap,
+            heightmap_path=heightmap_path,
+            preview_path=preview_path,
+            dem_metadata=dem_metadata,
+        )
+
     # -- level content --------------------------------------------------------
 
     def _build_level_content(
@@ -335,6 +668,7 @@ class MapGenerationPipeline:
             placeable: list[dict] = []
             mesh_paths: list[str] = []
             for index, building in enumerate(buildings, start=1):
+                check_cancelled()
                 collada = mesh_builder.build_mesh(building, index)
                 if collada is None:
                     continue
@@ -365,12 +699,18 @@ class MapGenerationPipeline:
         bbox: list[float],
         work_dir: Path,
         progress: ProgressReporter,
-    ) -> dict[str, list] | None:
+        *,
+        checkpoints: CheckpointStore,
+        resumed: list[str],
+    ) -> tuple[dict[str, list] | None, dict[str, LandCoverMask]]:
         """
         Fetch imagery and run AI segmentation.
 
-        Returns ``None`` on failure: AI features are strictly additive, so a
-        missing Ollama install degrades the result rather than failing the job.
+        Returns the vector data plus the land-cover masks (water, forest) that
+        paint terrain materials. Vector data is ``None`` on failure: AI features
+        are strictly additive, so a missing Ollama install degrades the result
+        rather than failing the job. Only successful runs are checkpointed, so a
+        retry after a failure asks the model again.
         The failure is still reported on the job's stats so the UI can say why
         no roads were detected, instead of silently showing zero - which is
         what happened before, because a ``temp_dir`` NameError in this block
@@ -380,7 +720,24 @@ class MapGenerationPipeline:
         try:
             progress.start("fetch_imagery")
             imagery_source = DataSourceFactory.get_imagery_source()
-            rgb_image, _ = imagery_source.get_satellite_image(bbox=bbox, resolution=10)
+            ai_key = checkpoints.key(
+                "segment", imagery_source.get_source_name(), bbox, self.settings.ollama_vl_model
+            )
+            restored = checkpoints.load("segment", ai_key)
+            if restored is not None:
+                vector_data = restored.metadata["vectors"]
+                land_cover = {
+                    name: LandCoverMask(mask, bbox) for name, mask in restored.arrays.items()
+                }
+                for stage in AI_STAGES:
+                    progress.finish(stage.key)
+                resumed.extend(stage.key for stage in AI_STAGES)
+                self._record_ai_stats(job_id, vector_data)
+                return vector_data, land_cover
+
+            rgb_image, _ = run_abandonable(
+                imagery_source.get_satellite_image, bbox=bbox, resolution=10
+            )
             progress.finish("fetch_imagery", f"Imagery from {imagery_source.get_source_name()}")
 
             progress.start("segment")
@@ -393,15 +750,19 @@ class MapGenerationPipeline:
             )
             progress.finish("vectorize")
 
-            self.job_store.update(
-                job_id,
-                stats={
-                    "ai_enabled": True,
-                    "roads": len(vector_data.get("roads", [])),
-                    "buildings": len(vector_data.get("buildings", [])),
-                },
+            self._record_ai_stats(job_id, vector_data)
+            land_cover = {
+                name: LandCoverMask(masks[name], bbox)
+                for name in LAND_COVER_CLASSES
+                if name in masks and masks[name].any()
+            }
+            checkpoints.save(
+                "segment",
+                ai_key,
+                {name: mask.mask for name, mask in land_cover.items()},
+                {"vectors": vector_data},
             )
-            return vector_data
+            return vector_data, land_cover
 
         except _PROGRAMMING_ERRORS:
             # A NameError or TypeError here is a bug in this file, not a missing
@@ -420,7 +781,17 @@ class MapGenerationPipeline:
             for stage in AI_STAGES:
                 with suppress(KeyError):  # pragma: no cover - stage table mismatch
                     progress.finish(stage.key)
-            return None
+            return None, {}
+
+    def _record_ai_stats(self, job_id: str, vector_data: dict[str, list]) -> None:
+        self.job_store.update(
+            job_id,
+            stats={
+                "ai_enabled": True,
+                "roads": len(vector_data.get("roads", [])),
+                "buildings": len(vector_data.get("buildings", [])),
+            },
+        )
 
     def _segment(
         self, rgb_image: np.ndarray, bbox: list[float], work_dir: Path
@@ -439,8 +810,13 @@ class MapGenerationPipeline:
         try:
             # The pipeline runs in a worker thread with no event loop of its
             # own, so an isolated loop is created for the async client here.
+            # Cancelling the job cancels the request to Ollama with it.
             segmentation = asyncio.run(
-                segmentor.segment_image(image=rgb_image, tasks=["roads", "buildings", "water", "forest"])
+                await_cancellable(
+                    segmentor.segment_image(
+                        image=rgb_image, tasks=["roads", "buildings", "water", "forest"]
+                    )
+                )
             )
             counts = segmentor.get_statistics(segmentation)
         finally:
@@ -467,42 +843,15 @@ class MapGenerationPipeline:
         detections: dict[str, list] | None = None,
     ) -> dict[str, list]:
         """Convert masks into GeoJSON feature collections on disk."""
-        from services.vector_extraction.contour_extractor import ContourExtractor
-        from services.vector_extraction.vectorizer import Vectorizer
-
-        extractor = ContourExtractor()
-        vectorizer = Vectorizer(bbox=bbox, image_size=image_size)
-
-        vector_data: dict[str, list] = {}
-
-        if "roads" in masks:
-            centerlines = extractor.extract_centerlines(masks["roads"])
-            # Widths measured from the mask, not a fixed pixel guess: the guess
-            # turned a 9 m road into a 60 m one on a 6 km tile.
-            widths = extractor.measure_widths(masks["roads"], centerlines)
-            vector_data["roads"] = vectorizer.vectorize_road_network(
-                centerlines, widths, source_features=(detections or {}).get("roads")
-            )
-
-        if "buildings" in masks:
-            contours = extractor.extract_contours(masks["buildings"])
-            polygons = extractor.contours_to_polygons(contours)
-            # Height is not recoverable from a binary mask, so it is inherited
-            # from the detection that produced each footprint.
-            vector_data["buildings"] = vectorizer.vectorize_buildings(
-                polygons,
-                source_features=(detections or {}).get("buildings"),
-            )
-
-        geojson_dir = work_dir / "vectors"
-        geojson_dir.mkdir(parents=True, exist_ok=True)
-        for feature_type, features in vector_data.items():
-            geojson = vectorizer.create_geojson(features, feature_type)
-            (geojson_dir / f"{feature_type}.geojson").write_text(
-                json.dumps(geojson, indent=2), encoding="utf-8"
-            )
-
-        return vector_data
+        return self._runner.run(
+            _extract_vectors,
+            masks,
+            bbox,
+            image_size,
+            work_dir,
+            detections,
+            self.settings.vector_tile_size,
+        )
 
     # -- helpers --------------------------------------------------------------
 
@@ -548,6 +897,77 @@ class MapGenerationPipeline:
         )
 
 
+# -- stage functions ------------------------------------------------------------
+# Module-level so StageRunner can hand them to a worker process by reference.
+
+
+def _process_terrain(
+    processor: TerrainProcessor, dem_data: np.ndarray, bbox: list[float]
+) -> tuple[TerrainData, list[float]]:
+    terrain = processor.process_dem(dem_data)
+    # BeamNG terrain blocks are square. Crop before resampling so the exported
+    # map is not stretched along its shorter axis.
+    terrain, effective_bbox = processor.crop_to_square(terrain, bbox)
+    return terrain, list(effective_bbox)
+
+
+def _generate_heightmap(
+    processor: TerrainProcessor, terrain: TerrainData, config: HeightmapConfig
+) -> np.ndarray:
+    return processor.generate_heightmap(terrain, config)
+
+
+def _extract_vectors(
+    masks: dict[str, np.ndarray],
+    bbox: list[float],
+    image_size: tuple[int, int],
+    work_dir: Path,
+    detections: dict[str, list] | None,
+    tile_size: int,
+) -> dict[str, list]:
+    from services.vector_extraction.contour_extractor import ContourExtractor
+    from services.vector_extraction.vectorizer import Vectorizer
+
+    extractor = ContourExtractor(tile_size=tile_size)
+    vectorizer = Vectorizer(bbox=bbox, image_size=image_size)
+
+    vector_data: dict[str, list] = {}
+
+    if "roads" in masks:
+        centerlines = extractor.extract_centerlines(masks["roads"])
+        # Widths measured from the mask, not a fixed pixel guess: the guess
+        # turned a 9 m road into a 60 m one on a 6 km tile.
+        widths = extractor.measure_widths(masks["roads"], centerlines)
+        vector_data["roads"] = vectorizer.vectorize_road_network(
+            centerlines, widths, source_features=(detections or {}).get("roads")
+        )
+
+    if "buildings" in masks:
+        contours = extractor.extract_contours(masks["buildings"])
+        polygons = extractor.contours_to_polygons(contours)
+        # Height is not recoverable from a binary mask, so it is inherited
+        # from the detection that produced each footprint.
+        vector_data["buildings"] = vectorizer.vectorize_buildings(
+            polygons,
+            source_features=(detections or {}).get("buildings"),
+        )
+
+    geojson_dir = work_dir / "vectors"
+    geojson_dir.mkdir(parents=True, exist_ok=True)
+    for feature_type, features in vector_data.items():
+        geojson = vectorizer.create_geojson(features, feature_type)
+        (geojson_dir / f"{feature_type}.geojson").write_text(
+            json.dumps(geojson, indent=2), encoding="utf-8"
+        )
+
+    return vector_data
+
+
+def _package(output_dir: Path, compression_workers: int, **layout: object) -> Path:
+    exporter = BeamNGExporter(output_dir=output_dir, compression_workers=compression_workers)
+    return exporter.create_map_structure(**layout)
+
+
 def get_pipeline(job_store: JobStore) -> MapGenerationPipeline:
     """Build a pipeline bound to a job store."""
     return MapGenerationPipeline(job_store=job_store)
@@ -0,0 +1,318 @@
+"""
+Process-pool execution for CPU-heavy pipeline stages.
+
+Generations run in Starlette's worker threads. That is fine for the numerical
+kernels that release the GIL, but much of a stage is pure Python that does
+not: skeleton tracing, building COLLADA XML, serialising level JSON. Two
+concurrent jobs therefore took turns on one core for those parts.
+
+:class:`StageRunner` runs a stage function either on the calling thread (the
+default, ``PROCESS_WORKERS=0``) or in a pool of worker processes. Large arrays
+never travel through pickle in either direction. Before a call, every array
+of at least :data:`SHARE_THRESHOLD` bytes in the arguments - including those
+inside dataclasses such as :class:`~models.terrain.TerrainData`, and inside
+lists, tuples and dicts - is copied into a ``multiprocessing.shared_memory``
+block and replaced by a small :class:`SharedArray` handle. Results come back
+the same way. Each side does one ``memcpy`` where pickling would serialise,
+pipe and rebuild a 32 MB heightmap.
+
+Workers are started with ``spawn``: forking a process that runs uvicorn and
+several job threads risks inheriting a lock held by another thread.
+
+A worker that dies (the OOM killer, a segfault in a native library) breaks
+its ``ProcessPoolExecutor`` for good. The runner then drops that pool and
+starts a fresh one for the next stage. Only the stages that were running on
+the broken pool fail.
+
+A cancelled job stops waiting for its stage within
+:data:`~core.cancellation.POLL_INTERVAL_SECONDS`. The worker cannot see the
+job's token, which lives in the parent, so each call also gets a one-byte
+shared-memory flag. A thread in the worker watches it and cancels a token of
+the worker's own, and the stage stops at its next ``check_cancelled()``
+instead of holding the worker until it is done.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import multiprocessing
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import suppress
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, TypeVar
+
+import numpy as np
+
+from core.cancellation import (
+    POLL_INTERVAL_SECONDS,
+    CancellationToken,
+    JobCancelledError,
+    cancellation_scope,
+    current_token,
+)
+from core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+#: Arrays smaller than this are pickled: a shared-memory block costs a couple of
+#: system calls, which is more than pickling a few kilobytes.
+SHARE_THRESHOLD = 1024 * 1024
+
+
+class WorkerCrashedError(RuntimeError):
+    """Raised when the worker process running a stage died before it finished."""
+
+
+@dataclass(frozen=True)
+class SharedArray:
+    """Picklable reference to an array held in a shared-memory block."""
+
+    name: str
+    shape: tuple[int, ...]
+    dtype: str
+
+
+class StageRunner:
+    """Runs stage functions in-thread or in a pool of worker processes."""
+
+    def __init__(self, workers: int = 0) -> None:
+        self.workers = workers
+        self._pool: ProcessPoolExecutor | None = None
+        #: Guards starting and dropping the pool; jobs call :meth:`run` from
+        #: several threads.
+        self._pool_lock = threading.Lock()
+
+    @property
+    def in_process(self) -> bool:
+        """True when stages run on the calling thread."""
+        return self.workers <= 0
+
+    def run(self, function: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Call ``function(*args, **kwargs)`` and return its result.
+
+        With a pool, ``function`` must be importable at module level, and its
+        arguments and result must be picklable apart from the arrays, which
+        are shared.
+
+        Raises:
+            WorkerCrashedError: The worker process died while running it.
+            JobCancelledError: The current job was cancelled while it ran.
+        """
+        if self.in_process:
+            return function(*args, **kwargs)
+
+        token = current_token()
+        if token is not None:
+            token.raise_if_cancelled()
+        blocks: list[SharedMemory] = []
+        pool = self._executor()
+        try:
+            packed_args = _pack(args, blocks)
+            packed_kwargs = _pack(kwargs, blocks)
+            cancel_flag = None
+            if token is not None:
+                cancel_flag = SharedMemory(create=True, size=1)
+                blocks.append(cancel_flag)
+                cancel_flag.buf[0] = 0
+            future = pool.submit(
+                _call_in_worker,
+                function,
+                packed_args,
+                packed_kwargs,
+                cancel_flag.name if cancel_flag is not None else None,
+            )
+            packed_result = _wait(future, token, cancel_flag)
+        except BrokenProcessPool as exc:
+            self._discard(pool)
+            raise WorkerCrashedError(
+                f"The worker process running {function.__name__} died; it may have run out "
+                "of memory"
+            ) from exc
+        finally:
+            _release(blocks)
+
+        # The worker created the result's blocks; this side copies out of
+        # them and is responsible for removing them.
+        result_blocks: list[SharedMemory] = []
+        try:
+            return _unpack(packed_result, result_blocks, copy=True)
+        finally:
+            _release(result_blocks)
+
+    def shutdown(self) -> None:
+        """Stop the worker processes, if any were started."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Under the lock, or two jobs starting at once would each start a pool
+        # and one of them would never be shut down.
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+                logger.info("Started %d stage worker process(es)", self.workers)
+            return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor) -> None:
+        """Drop a broken ``pool``, so the next stage starts a fresh one."""
+        with self._pool_lock:
+            # Another stage that saw the same breakage may have replaced it.
+            if self._pool is not pool:
+                return
+            self._pool = None
+        logger.warning("A stage worker process died; starting a fresh pool for the next stage")
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _wait(
+    future: Future, token: CancellationToken | None, cancel_flag: SharedMemory | None
+) -> Any:
+    """The result of ``future``, giving up on it once ``token`` is cancelled."""
+    if token is None or cancel_flag is None:
+        return future.result()
+    while True:
+        try:
+            return future.result(timeout=POLL_INTERVAL_SECONDS)
+        except TimeoutError:
+            pass
+        if token.cancelled:
+            cancel_flag.buf[0] = 1
+            if not future.cancel():
+                # Already running: nobody will copy out of the blocks of a
+                # result it still returns, so remove them when it does.
+                future.add_done_callback(_discard_result)
+            raise JobCancelledError("Job was cancelled")
+
+
+def _discard_result(future: Future) -> None:
+    if future.cancelled() or future.exception() is not None:
+        return
+    blocks: list[SharedMemory] = []
+    try:
+        _unpack(future.result(), blocks, copy=True)
+    finally:
+        _release(blocks)
+
+
+# -- worker side ----------------------------------------------------------------
+
+
+def _call_in_worker(
+    function: Callable[..., Any], args: Any, kwargs: Any, cancel_flag: str | None = None
+) -> Any:
+    if cancel_flag is None:
+        return _run_in_worker(function, args, kwargs)
+    try:
+        flag = SharedMemory(name=cancel_flag)
+    except FileNotFoundError:
+        # The parent removes the flag once it stops waiting: the job was
+        # cancelled before this call even started.
+        raise JobCancelledError("Job was cancelled") from None
+    token = CancellationToken()
+    stop = threading.Event()
+    watcher = threading.Thread(
+        target=_watch_cancel_flag, args=(flag, token, stop), name="cancel-watcher", daemon=True
+    )
+    watcher.start()
+    try:
+        with cancellation_scope(token):
+            return _run_in_worker(function, args, kwargs)
+    finally:
+        stop.set()
+        watcher.join()
+        flag.close()
+
+
+def _watch_cancel_flag(flag: SharedMemory, token: CancellationToken, stop: threading.Event) -> None:
+    while not stop.wait(POLL_INTERVAL_SECONDS):
+        if flag.buf[0]:
+            token.cancel()
+            return
+
+
+def _run_in_worker(function: Callable[..., Any], args: Any, kwargs: Any) -> Any:
+    attached: list[SharedMemory] = []
+    result_blocks: list[SharedMemory] = []
+    try:
+        # Views straight onto the parent's blocks: the inputs are not copied.
+        result = function(*_unpack(args, attached, copy=False), **_unpack(kwargs, attached, copy=False))
+        packed = _pack(result, result_blocks)
+    except BaseException:
+        _release(result_blocks)
+        raise
+    finally:
+        for block in attached:
+            block.close()
+    # Close this side's mapping of the results but leave the blocks for the
+    # parent to copy out of and unlink.
+    for block in result_blocks:
+        block.close()
+    return packed
+
+
+# -- packing --------------------------------------------------------------------
+
+
+def _pack(value: Any, blocks: list[SharedMemory]) -> Any:
+    """Replace large arrays in ``value`` with :class:`SharedArray` handles."""
+    if isinstance(value, np.ndarray):
+        if value.nbytes < SHARE_THRESHOLD or value.dtype.hasobject:
+            return value
+        block = SharedMemory(create=True, size=value.nbytes)
+        blocks.append(block)
+        np.ndarray(value.shape, dtype=value.dtype, buffer=block.buf)[...] = value
+        return SharedArray(block.name, value.shape, value.dtype.str)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        fields = {field.name: getattr(value, field.name) for field in dataclasses.fields(value)}
+        packed = {name: _pack(item, blocks) for name, item in fields.items()}
+        if all(packed[name] is fields[name] for name in fields):
+            return value
+        return _PackedDataclass(type(value), packed)
+    if isinstance(value, dict):
+        return {key: _pack(item, blocks) for key, item in value.items()}
+    if isinstance(value, list | tuple):
+        return type(value)(_pack(item, blocks) for item in value)
+    return value
+
+
+def _unpack(value: Any, blocks: list[SharedMemory], *, copy: bool) -> Any:
+    """Inverse of :func:`_pack`; ``copy=False`` yields views onto the blocks."""
+    if isinstance(value, SharedArray):
+        block = SharedMemory(name=value.name)
+        blocks.append(block)
+        view = np.ndarray(value.shape, dtype=np.dtype(value.dtype), buffer=block.buf)
+        return view.copy() if copy else view
+    if isinstance(value, _PackedDataclass):
+        fields = {name: _unpack(item, blocks, copy=copy) for name, item in value.fields.items()}
+        return value.cls(**fields)
+    if isinstance(value, dict):
+        return {key: _unpack(item, blocks, copy=copy) for key, item in value.items()}
+    if isinstance(value, list | tuple):
+        return type(value)(_unpack(item, blocks, copy=copy) for item in value)
+    return value
+
+
+def _release(blocks: list[SharedMemory]) -> None:
+    for block in blocks:
+        block.close()
+        with suppress(FileNotFoundError):  # pragma: no cover - already removed
+            block.unlink()
+
+
+@dataclass(frozen=True)
+class _PackedDataclass:
+    """A dataclass instance whose array fields have been replaced by handles."""
+
+    cls: type
+    fields: dict[str, Any]
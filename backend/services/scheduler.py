@@ -0,0 +1,448 @@
+"""
+Generation job scheduler.
+
+``POST /api/generate`` used to hand :meth:`MapGenerationPipeline.run` to
+FastAPI's ``BackgroundTasks``. Every submission then took a Starlette worker
+thread and parked it on a semaphore until a generation slot freed up; after
+``HTTP_TIMEOUT_SECONDS`` of waiting the job failed with "Server is busy". The
+queue had no order, no bound and no visibility, and a 256 px preview could sit
+behind two 8192 px AI jobs for ten minutes before giving up.
+
+:class:`JobScheduler` replaces that with an explicit queue:
+
+* **Bounded.** At most ``MAX_QUEUED_JOBS`` jobs wait; beyond that
+  :meth:`~JobScheduler.submit` raises :class:`QueueFullError` and the API
+  answers 503 instead of accepting work it will not get to.
+* **Ordered.** Jobs run first-in first-out within a lane. Small jobs - no AI
+  and a heightmap of at most ``FAST_LANE_MAX_HEIGHTMAP`` - are in the fast lane
+  and run before standard jobs. A standard job that has waited
+  :data:`PROMOTE_AFTER_SECONDS` ranks alongside the fast lane, so a steady
+  stream of small jobs cannot starve it.
+* **Fast lane workers.** ``MAX_CONCURRENT_JOBS`` workers take any job.
+  ``FAST_LANE_WORKERS`` more take only fast-lane jobs, so a quick preview does
+  not wait for a long generation to finish. Small jobs hold little memory,
+  which is what the concurrency limit protects.
+* **Memory-aware.** With an :class:`~services.admission.AdmissionController`,
+  a job starts only when its estimated peak memory fits in what running jobs
+  leave of the budget. The next job in line that does not fit waits while
+  smaller ones behind it start, unless it has waited long enough to be
+  promoted: then nothing overtakes it, so memory frees up for it.
+* **Visible.** Each queued job's ``queue_position`` (1 = next) is kept current
+  on the job.
+* **Cancellable.** :meth:`~JobScheduler.cancel` drops a queued job, or
+  cancels the token a running job checks at its cancellation points (see
+  :mod:`core.cancellation`); its slot and memory are released once it stops.
+* **Durable.** Queued and running jobs are written to a small JSON file. After
+  a restart, :meth:`~JobScheduler.restore` re-registers them under their
+  original ids, or picks up the records a persistent job store reloaded, and
+  queues them again. Interrupted jobs resume from their stage checkpoints.
+
+Workers are a fixed set of threads that sleep on a condition variable when the
+queue is empty. No thread is tied up by a job that is only waiting.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from enum import IntEnum
+from pathlib import Path
+from typing import Any
+
+from pydantic import ValidationError
+
+from core.cancellation import CancellationToken, JobCancelledError, cancellation_scope
+from core.logging_config import get_logger
+from models.map_request import MapGenerationRequest
+from services.admission import AdmissionController, PeakRssSampler, estimate_peak_bytes
+from services.jobs import JobStatus, JobStore
+
+logger = get_logger(__name__)
+
+#: How long a standard job waits before it ranks alongside the fast lane.
+PROMOTE_AFTER_SECONDS = 10 * 60
+
+#: Version of the persisted queue file; a mismatch means start empty.
+_STATE_VERSION = 1
+
+_MB = 1024 * 1024
+
+
+class QueueFullError(RuntimeError):
+    """Raised by :meth:`JobScheduler.submit` when no more jobs may wait."""
+
+
+class Lane(IntEnum):
+    """Scheduling lanes; lower runs first."""
+
+    FAST = 0
+    STANDARD = 1
+
+
+def lane_for(request: MapGenerationRequest, *, fast_max_heightmap: int) -> Lane:
+    """The lane a request is scheduled in."""
+    if not request.use_ai_segmentation and request.heightmap_size <= fast_max_heightmap:
+        return Lane.FAST
+    return Lane.STANDARD
+
+
+@dataclass
+class _Entry:
+    job_id: str
+    request: MapGenerationRequest
+    lane: Lane
+    enqueued_at: float
+    sequence: int
+    #: Estimated peak memory in bytes, for admission.
+    estimate: int
+    token: CancellationToken = field(default_factory=CancellationToken)
+
+    def promoted(self, now: float) -> bool:
+        return now - self.enqueued_at >= PROMOTE_AFTER_SECONDS
+
+    def rank(self, now: float) -> tuple[int, int]:
+        return (Lane.FAST if self.promoted(now) else self.lane, self.sequence)
+
+
+class JobScheduler:
+    """Bounded priority queue feeding a fixed set of worker threads."""
+
+    def __init__(
+        self,
+        run: Callable[[str, MapGenerationRequest], None],
+        job_store: JobStore,
+        *,
+        workers: int,
+        fast_lane_workers: int = 0,
+        max_queued: int = 32,
+        fast_max_heightmap: int = 1024,
+        admission: AdmissionController | None = None,
+        state_path: Path | None = None,
+    ) -> None:
+        self._run = run
+        self.job_store = job_store
+        self.workers = workers
+        self.fast_lane_workers = fast_lane_workers
+        self.max_queued = max_queued
+        self.fast_max_heightmap = fast_max_heightmap
+        self.admission = admission
+        self.state_path = Path(state_path) if state_path is not None else None
+
+        self._queue: list[_Entry] = []
+        self._running: dict[str, _Entry] = {}
+        self._sequence = 0
+        self._stopping = False
+        self._threads: list[threading.Thread] = []
+        self._condition = threading.Condition()
+
+    # -- public API -----------------------------------------------------------
+
+    def submit(self, job_id: str, request: MapGenerationRequest) -> int | None:
+        """
+        Queue ``job_id`` for execution.
+
+        Returns:
+            The job's queue position (1 = next to run) at submission.
+
+        Raises:
+            QueueFullError: ``max_queued`` jobs are already waiting.
+        """
+        lane = lane_for(request, fast_max_heightmap=self.fast_max_heightmap)
+        with self._condition:
+            if len(self._queue) >= self.max_queued:
+                raise QueueFullError(
+                    f"The generation queue is full ({self.max_queued} jobs waiting). "
+                    f"Try again in a few minutes."
+                )
+            self._enqueue(job_id, request, lane, time.time())
+            self._start_workers()
+            self._publish_positions()
+            self._persist()
+            self._condition.notify_all()
+            return self._position(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job.
+
+        A queued job is removed and marked cancelled at once. A running job is
+        asked to stop: it is marked cancelled when it reaches its next
+        cancellation point, normally well within a second, and
+        :meth:`wait_stopped` waits for that.
+
+        Returns:
+            ``False`` if the job is neither queued nor running.
+        """
+        with self._condition:
+            running = self._running.get(job_id)
+            if running is not None:
+                running.token.cancel()
+                logger.info("Job %s asked to stop", job_id)
+                return True
+            entry = next((entry for entry in self._queue if entry.job_id == job_id), None)
+            if entry is None:
+                return False
+            self._queue.remove(entry)
+            self.job_store.update(job_id, status=JobStatus.CANCELLED, message="Cancelled")
+            self._publish_positions()
+            self._persist()
+            self._condition.notify_all()
+        logger.info("Job %s removed from the queue", job_id)
+        return True
+
+    def wait_stopped(self, job_id: str, timeout: float | None = None) -> bool:
+        """
+        Wait until ``job_id`` is no longer running.
+
+        Returns:
+            ``False`` if ``timeout`` elapsed first.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: job_id not in self._running, timeout=timeout)
+
+    def position(self, job_id: str) -> int | None:
+        """1-based queue position of ``job_id``, or ``None`` if it is not queued."""
+        with self._condition:
+            return self._position(job_id)
+
+    def __len__(self) -> int:
+        """Number of jobs waiting to start."""
+        with self._condition:
+            return len(self._queue)
+
+    def restore(self) -> int:
+        """
+        Requeue the jobs recorded by a previous process.
+
+        Jobs that were running when it stopped are recorded first and keep
+        their place within their lane. A missing, unreadable or outdated file
+        restores nothing.
+
+        A job the store reloaded from its database is requeued under the same
+        record. One the store still shows as queued or running but that the
+        file does not list cannot be resumed, and is failed rather than left
+        "processing" forever. Call this once, at startup.
+
+        Returns:
+            Number of jobs restored.
+        """
+        records = self._read_state()
+        restored = 0
+        with self._condition:
+            for record in records:
+                try:
+                    request = MapGenerationRequest.model_validate(record["request"])
+                    job_id = record["job_id"]
+                    enqueued_at = float(record["enqueued_at"])
+                except (KeyError, TypeError, ValueError, ValidationError) as exc:
+                    logger.warning("Dropping unrestorable queued job: %s", exc)
+                    continue
+                job = self.job_store.get(job_id)
+                if job is None:
+                    self.job_store.create(
+                        request.name, job_id=job_id, result_key=record.get("result_key")
+                    )
+                elif job.status.is_terminal or self._tracks(job_id):
+                    continue
+                else:
+                    self.job_store.update(job_id, status=JobStatus.QUEUED, message="Queued")
+                lane = lane_for(request, fast_max_heightmap=self.fast_max_heightmap)
+                self._enqueue(job_id, request, lane, enqueued_at)
+                restored += 1
+            if restored:
+                self._start_workers()
+                self._publish_positions()
+                self._persist()
+                self._condition.notify_all()
+            interrupted = self._fail_untracked()
+        if restored:
+            logger.info("Restored %d queued job(s) from %s", restored, self.state_path)
+        if interrupted:
+            logger.warning("%d unfinished job(s) could not be resumed after a restart", interrupted)
+        return restored
+
+    def _read_state(self) -> list[Any]:
+        """The job records of the queue file; empty if there is none to use."""
+        if self.state_path is None:
+            return []
+        try:
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+            if state.get("version") != _STATE_VERSION:
+                return []
+            return list(state["jobs"])
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            logger.warning("Ignoring unreadable job queue %s: %s", self.state_path, exc)
+            return []
+
+    def _fail_untracked(self) -> int:
+        """Fail unfinished jobs that are neither queued nor running. Caller holds the lock."""
+        interrupted = 0
+        for job in self.job_store:
+            if not job.status.is_terminal and not self._tracks(job.job_id):
+                self.job_store.update(
+                    job.job_id,
+                    status=JobStatus.FAILED,
+                    message="Map generation failed",
+                    error="Interrupted by a server restart",
+                )
+                interrupted += 1
+        return interrupted
+
+    def drain(self, timeout: float | None = None) -> bool:
+        """
+        Wait until no job is queued or running.
+
+        Returns:
+            ``False`` if ``timeout`` elapsed first.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._queue and not self._running, timeout=timeout
+            )
+
+    def shutdown(self, *, wait: bool = True) -> None:
+        """
+        Stop taking jobs from the queue.
+
+        Jobs already running finish first when ``wait`` is set. Jobs still
+        queued stay in the state file for the next process to restore.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            threads, self._threads = self._threads, []
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    # -- workers --------------------------------------------------------------
+
+    def _start_workers(self) -> None:
+        if self._threads or self._stopping:
+            return
+        for index in range(self.workers + self.fast_lane_workers):
+            fast_only = index >= self.workers
+            name = f"generation-{'fast' if fast_only else 'worker'}-{index}"
+            thread = threading.Thread(target=self._work, args=(fast_only,), name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self, fast_only: bool) -> None:
+        while True:
+            with self._condition:
+                entry = self._take(fast_only)
+                while entry is None and not self._stopping:
+                    self._condition.wait()
+                    entry = self._take(fast_only)
+                if entry is None:
+                    return
+                self._running[entry.job_id] = entry
+                if self.admission is not None:
+                    self.admission.admit(entry.job_id, entry.estimate)
+                self.job_store.update(entry.job_id, status=JobStatus.PROCESSING, message="Starting")
+                self._publish_positions()
+                self._persist()
+
+            sampler = PeakRssSampler()
+            try:
+                # The pipeline records its own failures on the job; this guard
+                # only keeps a defect there from killing the worker thread.
+                with sampler, cancellation_scope(entry.token):
+                    self._run(entry.job_id, entry.request)
+            except JobCancelledError:
+                self.job_store.update(entry.job_id, status=JobStatus.CANCELLED, message="Cancelled")
+            except Exception:  # noqa: BLE001 - the worker must survive
+                logger.exception("Job %s escaped the pipeline's error handling", entry.job_id)
+            finally:
+                with self._condition:
+                    self._running.pop(entry.job_id, None)
+                    if self.admission is not None:
+                        self.admission.release(entry.job_id)
+                    self._persist()
+                    # Freed memory may admit a job another worker passed over.
+                    self._condition.notify_all()
+                self._record_memory(entry, sampler)
+
+    def _take(self, fast_only: bool) -> _Entry | None:
+        """Pop the next job this worker may run, or ``None``. Caller holds the lock."""
+        if self._stopping:
+            return None
+        now = time.time()
+        for entry in self._ordered():
+            fits = self.admission is None or self.admission.fits(entry.estimate)
+            if fits and not (fast_only and entry.lane is not Lane.FAST):
+                self._queue.remove(entry)
+                return entry
+            if not fits and entry.promoted(now):
+                # Hold the line: letting smaller jobs keep starting in front
+                # of it could keep the memory it needs in use indefinitely.
+                return None
+        return None
+
+    def _record_memory(self, entry: _Entry, sampler: PeakRssSampler) -> None:
+        """Put the estimate beside the measured peak, for calibration."""
+        stats: dict[str, float] = {"estimated_peak_mb": round(entry.estimate / _MB, 1)}
+        if sampler.peak_bytes is not None and sampler.start_bytes is not None:
+            stats["peak_rss_mb"] = round(sampler.peak_bytes / _MB, 1)
+            stats["start_rss_mb"] = round(sampler.start_bytes / _MB, 1)
+        self.job_store.update(entry.job_id, stats=stats)
+
+    # -- bookkeeping (caller holds the lock) ----------------------------------
+
+    def _enqueue(self, job_id: str, request: MapGenerationRequest, lane: Lane, enqueued_at: float) -> None:
+        self._sequence += 1
+        self._queue.append(
+            _Entry(job_id, request, lane, enqueued_at, self._sequence, estimate_peak_bytes(request))
+        )
+
+    def _ordered(self) -> list[_Entry]:
+        now = time.time()
+        return sorted(self._queue, key=lambda entry: entry.rank(now))
+
+    def _tracks(self, job_id: str) -> bool:
+        return job_id in self._running or any(entry.job_id == job_id for entry in self._queue)
+
+    def _position(self, job_id: str) -> int | None:
+        for index, entry in enumerate(self._ordered(), start=1):
+            if entry.job_id == job_id:
+                return index
+        return None
+
+    def _publish_positions(self) -> None:
+        for index, entry in enumerate(self._ordered(), start=1):
+            self.job_store.update(
+                entry.job_id, queue_position=index, message=f"Queued - position {index}"
+            )
+
+    def _persist(self) -> None:
+        """Record queued and running jobs; failures only cost durability."""
+        if self.state_path is None:
+            return
+        # Running jobs first, then the queue in the order it would run: the
+        # file's order is the order a restart queues them in.
+        running = sorted(self._running.values(), key=lambda entry: entry.sequence)
+        jobs: list[dict[str, Any]] = []
+        for entry in [*running, *self._ordered()]:
+            job = self.job_store.get(entry.job_id)
+            jobs.append(
+                {
+                    "job_id": entry.job_id,
+                    "request": entry.request.model_dump(mode="json"),
+                    "result_key": job.result_key if job is not None else None,
+                    "enqueued_at": entry.enqueued_at,
+                }
+            )
+        staging = self.state_path.with_name(f".{self.state_path.name}.partial")
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            staging.write_text(json.dumps({"version": _STATE_VERSION, "jobs": jobs}), encoding="utf-8")
+            os.replace(staging, self.state_path)
+        except OSError as exc:
+            logger.warning("Could not record the job queue: %s", exc)
+
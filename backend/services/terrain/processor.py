@@ -2,12 +2,14 @@
 
 from __future__ import annotations
 
+import warnings
 from pathlib import Path
 
 import numpy as np
 from PIL import Image
 from scipy import ndimage
 
+from core.cancellation import check_cancelled
 from core.geo import bbox_dimensions
 from core.logging_config import get_logger
 from models.terrain import HeightmapConfig, TerrainData
@@ -17,6 +19,16 @@ logger = get_logger(__name__)
 #: scipy.ndimage.zoom spline order for each interpolation mode.
 _INTERPOLATION_ORDER = {"nearest": 0, "bilinear": 1, "bicubic": 3}
 
+#: Output rows resampled per band: how often a resample checks for cancellation.
+_RESAMPLE_BAND_ROWS = 256
+
+# A diagonal matrix given as 1-D takes scipy's zoom code path, which is what
+# keeps the banded resample identical to ``ndimage.zoom`` and as fast. scipy
+# warns about a behaviour change in 0.18 on every such call.
+warnings.filterwarnings(
+    "ignore", message="The behavior of affine_transform", category=UserWarning, module=__name__
+)
+
 #: Elevation values below this are treated as sentinel nodata markers. DEM
 #: products commonly encode "no measurement" as -32768 (SRTM), -9999 (ASTER)
 #: or -32767. Real terrain never goes below the Dead Sea shore (-430 m), so a
@@ -294,11 +306,45 @@ class TerrainProcessor:
 
     @staticmethod
     def _resize_elevation(elevation: np.ndarray, size: int, method: str) -> np.ndarray:
-        """Resample an elevation grid to ``size`` x ``size``."""
+        """
+        Resample an elevation grid to ``size`` x ``size``.
+
+        Equivalent to ``ndimage.zoom``, bit for bit and at the same speed, but
+        computed in bands of output rows. A single ``zoom`` call on an 8192 px
+        heightmap ran for tens of seconds with no way to stop it; between bands
+        the job can be cancelled.
+        """
         order = _INTERPOLATION_ORDER.get(method, 1)
         zoom_factors = (size / elevation.shape[0], size / elevation.shape[1])
+        output_shape = tuple(
+            round(length * factor) for length, factor in zip(elevation.shape, zoom_factors, strict=True)
+        )
 
-        resized = ndimage.zoom(elevation, zoom_factors, order=order)
+        # The spline prefilter runs once over the whole input, as zoom does;
+        # only the interpolation is split.
+        source = (
+            ndimage.spline_filter(elevation, order, output=np.float64, mode="constant")
+            if order > 1
+            else elevation
+        )
+        # zoom's coordinate mapping: output corners land on input corners.
+        row_step, column_step = (
+            (length - 1) / (target - 1) if target > 1 else 1.0
+            for length, target in zip(elevation.shape, output_shape, strict=True)
+        )
+
+        resized = np.empty(output_shape, dtype=elevation.dtype)
+        for start in range(0, output_shape[0], _RESAMPLE_BAND_ROWS):
+            check_cancelled()
+            stop = min(start + _RESAMPLE_BAND_ROWS, output_shape[0])
+            ndimage.affine_transform(
+                source,
+                np.array([row_step, column_step]),
+                offset=(start * row_step, 0.0),
+                output=resized[start:stop],
+                order=order,
+                prefilter=False,
+            )
 
         # ndimage.zoom rounds the output shape, so a non-integer zoom factor can
         # land one pixel short or long. BeamNG requires the exact square size,
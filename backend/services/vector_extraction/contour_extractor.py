@@ -1,32 +1,50 @@
 """Extract contours from segmentation masks"""
 
+from collections.abc import Sequence
 from typing import Any
 
 import cv2
 import numpy as np
 
+from .skeleton import simplify_polylines, stack_polylines, trace_skeleton
+from .tiling import find_contours_tiled, skeletonize_tiled
 
-def _polyline_length(points: list[tuple[int, int]]) -> float:
-    """Total length of a polyline in pixels."""
-    return float(
-        sum(
-            np.hypot(b[0] - a[0], b[1] - a[1])
-            for a, b in zip(points, points[1:], strict=False)
-        )
-    )
+
+def _polyline_lengths(points: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Length in pixels of each polyline stacked by :func:`stack_polylines`."""
+    count = len(offsets) - 1
+    if len(points) < 2:
+        return np.zeros(count)
+    steps = np.diff(points.astype(np.float64), axis=0)
+    segment = np.hypot(steps[:, 0], steps[:, 1])
+    # Step i joins points i and i + 1; it belongs to a polyline unless i + 1
+    # starts the next one.
+    owner = np.repeat(np.arange(count), np.diff(offsets))[:-1]
+    starts = offsets[1:-1]
+    inside = np.ones(len(segment), dtype=bool)
+    inside[starts[(starts > 0) & (starts < len(points))] - 1] = False
+    return np.bincount(owner[inside], weights=segment[inside], minlength=count)
 
 
 class ContourExtractor:
     """Extract vector contours from binary masks"""
     
-    def __init__(self, simplify_tolerance: float = 2.0):
+    def __init__(
+        self, simplify_tolerance: float = 2.0, tile_size: int = 0, workers: int | None = None
+    ):
         """
         Initialize contour extractor
         
         Args:
             simplify_tolerance: Douglas-Peucker simplification tolerance
+            tile_size: Skeletonise and trace contours of masks larger than
+                this in tiles on a thread pool; ``0`` never tiles. The result
+                is identical either way (see :mod:`.tiling`).
+            workers: Threads for tiled masks; ``None`` for one per CPU core.
         """
         self.simplify_tolerance = simplify_tolerance
+        self.tile_size = tile_size
+        self.workers = workers
         print(f"📐 Contour Extractor initialized (tolerance: {simplify_tolerance})")
     
     def extract_contours(
@@ -50,11 +68,14 @@ class ContourExtractor:
         if mask.dtype != np.uint8:
             mask = (mask > 0).astype(np.uint8) * 255
 
-        contours, hierarchy = cv2.findContours(
-            mask,
-            cv2.RETR_EXTERNAL,  # Only external contours
-            cv2.CHAIN_APPROX_SIMPLE  # Compress horizontal/vertical segments
-        )
+        if self._tiled(mask):
+            contours = find_contours_tiled(mask, self.tile_size, self.workers)
+        else:
+            contours, hierarchy = cv2.findContours(
+                mask,
+                cv2.RETR_EXTERNAL,  # Only external contours
+                cv2.CHAIN_APPROX_SIMPLE  # Compress horizontal/vertical segments
+            )
         
         # Filter by area and simplify
         valid_contours = []
@@ -119,29 +140,31 @@ class ContourExtractor:
         """
         from skimage.morphology import skeletonize
 
-        from .skeleton import simplify_polyline, trace_skeleton
-
-        skeleton = skeletonize(np.asarray(mask) > 0)
-
-        centerlines = []
-        for path in trace_skeleton(skeleton):
-            if _polyline_length(path) < min_length:
-                # Skeletons are locally two pixels wide at corners, which leaves
-                # short stubs at every junction. They are noise, not roads.
-                continue
+        mask = np.asarray(mask) > 0
+        if self._tiled(mask):
+            skeleton = skeletonize_tiled(mask, self.tile_size, self.workers)
+        else:
+            skeleton = skeletonize(mask)
 
-            simplified = simplify_polyline(path, self.simplify_tolerance)
-            if len(simplified) < 2:
-                continue
+        # Skeletons are locally two pixels wide at corners, which leaves short
+        # stubs at every junction. They are noise, not roads.
+        paths = trace_skeleton(skeleton)
+        lengths = _polyline_lengths(*stack_polylines(paths))
+        paths = [path for path, length in zip(paths, lengths, strict=True) if length >= min_length]
 
-            centerlines.append(np.array(simplified, dtype=np.int32).reshape(-1, 1, 2))
+        return [
+            simplified.reshape(-1, 1, 2)
+            for simplified in simplify_polylines(paths, self.simplify_tolerance)
+            if len(simplified) >= 2
+        ]
 
-        return centerlines
+    def _tiled(self, mask: np.ndarray) -> bool:
+        return 0 < self.tile_size < max(mask.shape)
 
     def measure_widths(
         self,
         mask: np.ndarray,
-        polylines: list[np.ndarray]
+        polylines: Sequence[np.ndarray]
     ) -> list[float]:
         """
         Measure the width of the masked feature under each polyline, in pixels.
@@ -166,20 +189,30 @@ class ContourExtractor:
         """
         binary = (np.asarray(mask) > 0).astype(np.uint8)
         distances = cv2.distanceTransform(binary, cv2.DIST_L2, 5)
+        if not len(polylines):
+            return []
 
+        # Every polyline at once: one gather from the distance transform, then
+        # a median per polyline from a single sort by (polyline, distance).
+        points, offsets = stack_polylines(polylines)
         rows, cols = distances.shape
-        widths = []
+        samples = distances[
+            np.clip(points[:, 1], 0, rows - 1), np.clip(points[:, 0], 0, cols - 1)
+        ]
+        counts = np.diff(offsets)
+        owner = np.repeat(np.arange(len(counts)), counts)
+        ordered = samples[np.lexsort((samples, owner))]
 
-        for polyline in polylines:
-            points = np.asarray(polyline).reshape(-1, 2)
-            samples = [
-                distances[int(np.clip(y, 0, rows - 1)), int(np.clip(x, 0, cols - 1))]
-                for x, y in points
-            ]
-            # Half-width at the centre, doubled; never below one pixel.
-            widths.append(max(float(np.median(samples)) * 2.0, 1.0))
+        # The middle sample, or the mean of the middle two, as np.median.
+        measured = counts > 0
+        starts = offsets[:-1][measured]
+        lower = ordered[starts + (counts[measured] - 1) // 2]
+        upper = ordered[starts + counts[measured] // 2]
+        half_widths = np.zeros(len(counts))
+        half_widths[measured] = (lower + upper) / np.float32(2)
 
-        return widths
+        # Half-width at the centre, doubled; never below one pixel.
+        return np.maximum(half_widths * 2.0, 1.0).tolist()
 
     def extract_rectangles(
         self,
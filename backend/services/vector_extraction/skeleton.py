@@ -21,30 +21,36 @@ one polyline per branch.
 
 from __future__ import annotations
 
+from collections.abc import Sequence
+from itertools import chain
+
 import numpy as np
+from scipy import ndimage
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import breadth_first_order, connected_components
 
-#: Relative offsets of the eight neighbours of a pixel.
+#: Relative offsets of the eight neighbours of a pixel. Where a walk could go
+#: two ways, the first in this order wins.
 _NEIGHBOURS = (
     (-1, -1), (-1, 0), (-1, 1),
     (0, -1),           (0, 1),
     (1, -1),  (1, 0),  (1, 1),
 )
 
-
-def _neighbours(pixels: set[tuple[int, int]], point: tuple[int, int]) -> list[tuple[int, int]]:
-    """Skeleton pixels adjacent to ``point``."""
-    row, column = point
-    return [
-        (row + dr, column + dc)
-        for dr, dc in _NEIGHBOURS
-        if (row + dr, column + dc) in pixels
-    ]
+#: Convolved with the mask, counts each pixel's 8-connected neighbours.
+_DEGREE_KERNEL = np.array([[1, 1, 1], [1, 0, 1], [1, 1, 1]], dtype=np.uint8)
 
 
 def trace_skeleton(skeleton: np.ndarray, min_length: int = 2) -> list[list[tuple[int, int]]]:
     """
     Walk a skeleton image into polylines.
 
+    Pixels are numbered in row-major order and the graph is held in arrays
+    indexed by that number. Degrees come from a 3x3 convolution. The runs of
+    degree-2 pixels between endpoints and junctions are labelled and put in
+    walking order in one breadth-first pass, so Python only loops over branch
+    ends, not over pixels.
+
     Args:
         skeleton: 2D array; any non-zero value is a skeleton pixel.
         min_length: Discard polylines with fewer points than this.
@@ -57,73 +63,150 @@ def trace_skeleton(skeleton: np.ndarray, min_length: int = 2) -> list[list[tuple
     if mask.ndim != 2:
         raise ValueError(f"skeleton must be 2D, got shape {mask.shape}")
 
-    pixels = {(int(row), int(column)) for row, column in zip(*np.nonzero(mask), strict=True)}
-    if not pixels:
+    # A one-pixel border keeps every neighbour's flat index in range and
+    # stops an offset wrapping onto the next row.
+    padded = np.pad(mask, 1)
+    nodes = np.flatnonzero(padded)
+    if nodes.size == 0:
         return []
 
-    degree = {point: len(_neighbours(pixels, point)) for point in pixels}
+    counts = ndimage.convolve(padded.view(np.uint8), _DEGREE_KERNEL, mode="constant")
+    degree = counts.ravel()[nodes]
+    table = _neighbour_table(padded, nodes)
+    rows, columns = np.divmod(nodes, padded.shape[1])
+    points = list(zip((columns - 1).tolist(), (rows - 1).tolist(), strict=True))
 
-    # Endpoints first, then junctions: starting a walk in the middle of a
-    # through-path would split one road into two halves.
-    endpoints = sorted(point for point, count in degree.items() if count == 1)
-    junctions = sorted(point for point, count in degree.items() if count >= 3)
-
-    visited_edges: set[frozenset[tuple[int, int]]] = set()
+    runs = _Runs(degree, table)
+    walked = [False] * runs.count
+    visited_edges: set[tuple[int, int]] = set()
     polylines: list[list[tuple[int, int]]] = []
 
-    for start in endpoints + junctions:
-        for neighbour in _neighbours(pixels, start):
-            edge = frozenset((start, neighbour))
-            if edge in visited_edges:
+    # Endpoints first, then junctions: starting a walk in the middle of a
+    # through-path would split one road into two halves.
+    starts = np.concatenate([np.flatnonzero(degree == 1), np.flatnonzero(degree >= 3)])
+    for start in starts.tolist():
+        for neighbour in table[start].tolist():
+            if neighbour < 0:
                 continue
-            path = _walk(pixels, degree, visited_edges, start, neighbour)
+            run = runs.label[neighbour]
+            if run < 0:
+                # Two branch ends side by side: a branch of one step.
+                edge = (start, neighbour) if start < neighbour else (neighbour, start)
+                if edge in visited_edges:
+                    continue
+                visited_edges.add(edge)
+                path = [start, neighbour]
+            else:
+                # A run is entered at one end and followed to the other, so
+                # it is walked whole, once, from whichever end comes first.
+                if walked[run]:
+                    continue
+                walked[run] = True
+                path = runs.nodes(run)
+                if path[0] != neighbour:
+                    path.reverse()
+                before = path[-2] if len(path) > 1 else start
+                after = next(n for n in table[path[-1]].tolist() if n >= 0 and n != before)
+                path = [start, *path, after]
             if len(path) >= min_length:
-                polylines.append([(column, row) for row, column in path])
+                polylines.append([points[node] for node in path])
 
     # Closed loops have no endpoint and no junction, so nothing above starts
-    # them. Pick any unvisited pixel and walk the ring.
-    for start in sorted(pixels):
-        for neighbour in _neighbours(pixels, start):
-            if frozenset((start, neighbour)) in visited_edges:
-                continue
-            path = _walk(pixels, degree, visited_edges, start, neighbour)
-            if len(path) >= min_length:
-                polylines.append([(column, row) for row, column in path])
+    # them. Each ring is walked from its first pixel back round to it.
+    for run in runs.rings:
+        path = runs.nodes(run)
+        path.append(path[0])
+        if len(path) >= min_length:
+            polylines.append([points[node] for node in path])
 
     return polylines
 
 
-def _walk(
-    pixels: set[tuple[int, int]],
-    degree: dict[tuple[int, int], int],
-    visited_edges: set[frozenset[tuple[int, int]]],
-    start: tuple[int, int],
-    first_step: tuple[int, int],
-) -> list[tuple[int, int]]:
-    """Follow a branch from ``start`` until it reaches an endpoint or junction."""
-    path = [start, first_step]
-    visited_edges.add(frozenset((start, first_step)))
-
-    previous, current = start, first_step
-
-    while degree.get(current, 0) == 2:
-        options = [
-            candidate
-            for candidate in _neighbours(pixels, current)
-            if candidate != previous and frozenset((current, candidate)) not in visited_edges
-        ]
-        if not options:
-            break
+def _neighbour_table(padded: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+    """Node number of each node's neighbours, in ``_NEIGHBOURS`` order; -1 for none."""
+    width = padded.shape[1]
+    occupied = padded.ravel()
+    table = np.full((nodes.size, len(_NEIGHBOURS)), -1, dtype=np.int32)
+    for column, (dr, dc) in enumerate(_NEIGHBOURS):
+        target = nodes + (dr * width + dc)
+        hit = occupied[target]
+        table[hit, column] = np.searchsorted(nodes, target[hit])
+    return table
 
-        following = options[0]
-        visited_edges.add(frozenset((current, following)))
-        path.append(following)
-        previous, current = current, following
 
-        if current == start:  # closed the loop
-            break
+class _Runs:
+    """
+    The connected runs of degree-2 nodes, each in walking order.
 
-    return path
+    A run that touches an endpoint or junction is a path, ordered from one of
+    its two ends. A run that touches neither is a ring, ordered from its
+    first node towards that node's first neighbour - where the walk would go.
+    """
+
+    def __init__(self, degree: np.ndarray, table: np.ndarray) -> None:
+        inner = np.flatnonzero(degree == 2)
+        size = inner.size
+        #: Run of each node; -1 for endpoints, junctions and isolated pixels.
+        self.label: list[int] = [-1] * degree.size
+        self.count = 0
+        self.rings: list[int] = []
+        self._order: list[int] = []
+        self._bounds: list[int] = [0]
+        if size == 0:
+            return
+
+        local = np.full(degree.size, -1, dtype=np.int64)
+        local[inner] = np.arange(size)
+        # Every degree-2 node has exactly two neighbours: take them in order.
+        pairs = table[inner]
+        present = pairs >= 0
+        index = np.arange(size)
+        first = local[pairs[index, present.argmax(axis=1)]]
+        second = local[pairs[index, len(_NEIGHBOURS) - 1 - present[:, ::-1].argmax(axis=1)]]
+
+        source = np.concatenate([index, index])
+        target = np.concatenate([first, second])
+        linked = target >= 0
+        source, target = source[linked], target[linked]
+        adjacency = csr_matrix((np.ones(source.size, np.int8), (source, target)), (size, size))
+        count, labels = connected_components(adjacency, directed=False)
+
+        # Ends are nodes with fewer than two neighbours inside the run.
+        ends = np.flatnonzero((first < 0) | (second < 0))
+        start = np.full(count, size, dtype=np.int64)
+        np.minimum.at(start, labels[ends], ends)
+        ring = start == size
+        np.minimum.at(start, labels, np.where(ring[labels], index, size))
+
+        # Cut each ring between its start and the start's second neighbour,
+        # so the breadth-first pass goes round it the way the walk would.
+        cut = np.zeros(size, dtype=bool)
+        cut[start[ring]] = True
+        kept = ~(
+            (cut[source] & (target == second[source])) | (cut[target] & (source == second[target]))
+        )
+
+        # One breadth-first pass from a virtual node linked to every run's
+        # start numbers the nodes of each run in walking order.
+        source = np.concatenate([source[kept], np.full(count, size)])
+        target = np.concatenate([target[kept], start])
+        graph = csr_matrix((np.ones(source.size, np.int8), (source, target)), (size + 1, size + 1))
+        visit = breadth_first_order(graph, size, directed=True, return_predecessors=False)
+        position = np.empty(size + 1, dtype=np.int64)
+        position[visit] = np.arange(visit.size)
+        order = np.lexsort((position[:size], labels))
+
+        label = np.full(degree.size, -1, dtype=np.int64)
+        label[inner] = labels
+        self.label = label.tolist()
+        self.count = count
+        self.rings = sorted(np.flatnonzero(ring).tolist(), key=lambda run: int(start[run]))
+        self._order = inner[order].tolist()
+        self._bounds = np.searchsorted(labels[order], np.arange(count + 1)).tolist()
+
+    def nodes(self, run: int) -> list[int]:
+        """A fresh list of the run's nodes in walking order."""
+        return self._order[self._bounds[run] : self._bounds[run + 1]]
 
 
 def simplify_polyline(
@@ -134,39 +217,123 @@ def simplify_polyline(
 
     Applied per branch rather than to a closed contour, which is what
     ``cv2.approxPolyDP(..., closed=False)`` did over the retraced outline - it
-    simplified a shape that should never have been a shape.
+    simplified a shape that should never have been a shape. For many
+    polylines, :func:`simplify_polylines` does them all in one pass.
     """
     if len(points) <= 2 or tolerance <= 0:
         return list(points)
+    (kept,) = simplify_polylines([points], tolerance)
+    return [(int(x), int(y)) for x, y in kept]
+
+
+def simplify_polylines(
+    polylines: Sequence[np.ndarray | list[tuple[int, int]]], tolerance: float = 2.0
+) -> list[np.ndarray]:
+    """
+    Douglas-Peucker over many polylines at once.
 
-    start, end = points[0], points[-1]
-    max_distance = 0.0
-    index = 0
+    Rather than recursing, it keeps a stack of spans still to split, for every
+    polyline together. Each round measures every point of every open span
+    against its chord in one NumPy pass, splits the spans whose farthest point
+    is beyond ``tolerance`` at that point and drops the rest. There are as many
+    rounds as the deepest recursion would have had levels, and nothing to hit
+    the recursion limit on a long road. The points kept are the ones
+    :func:`simplify_polyline` always kept.
 
-    for position in range(1, len(points) - 1):
-        distance = _perpendicular_distance(points[position], start, end)
-        if distance > max_distance:
-            max_distance = distance
-            index = position
+    Args:
+        polylines: ``(N, 2)`` integer points per polyline.
+        tolerance: Largest distance, in pixels, a dropped point may lie from
+            the simplified line.
 
-    if max_distance <= tolerance:
-        return [start, end]
+    Returns:
+        The points kept from each polyline, as ``(M, 2)`` int32 arrays.
+    """
+    if not polylines:
+        return []
+    points, offsets = stack_polylines(polylines)
+    lengths = np.diff(offsets)
+    if tolerance <= 0:
+        return np.split(points, offsets[1:-1])
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[offsets[:-1][lengths > 0]] = True
+    keep[offsets[1:][lengths > 0] - 1] = True
+
+    # Spans run from a kept point to the next; only those with points between
+    # their ends have anything to decide.
+    low, high = offsets[:-1], offsets[1:] - 1
+    x, y = points[:, 0].astype(np.int64), points[:, 1].astype(np.int64)
+    while True:
+        open_spans = high - low > 1
+        low, high = low[open_spans], high[open_spans]
+        if low.size == 0:
+            break
 
-    left = simplify_polyline(points[: index + 1], tolerance)
-    right = simplify_polyline(points[index:], tolerance)
-    return left[:-1] + right
+        inner = high - low - 1
+        span = np.repeat(np.arange(low.size), inner)
+        first = np.concatenate([[0], np.cumsum(inner)[:-1]])
+        index = np.arange(span.size) - first[span] + low[span] + 1
 
+        distance = _distance_to_chord(x, y, index, low[span], high[span])
+        farthest = np.maximum.reduceat(distance, first)
+        # The first point at the greatest distance, as the recursion chose.
+        at_max = np.flatnonzero(distance == farthest[span])
+        spans_at_max, first_at_max = np.unique(span[at_max], return_index=True)
+        split = np.empty(low.size, dtype=np.int64)
+        split[spans_at_max] = index[at_max[first_at_max]]
 
-def _perpendicular_distance(
-    point: tuple[int, int], start: tuple[int, int], end: tuple[int, int]
-) -> float:
-    """Distance from ``point`` to the segment ``start``-``end``."""
-    x, y = point
-    x0, y0 = start
-    x1, y1 = end
+        divide = farthest > tolerance
+        keep[split[divide]] = True
+        low = np.concatenate([low[divide], split[divide]])
+        high = np.concatenate([split[divide], high[divide]])
 
-    dx, dy = x1 - x0, y1 - y0
-    if dx == 0 and dy == 0:
-        return float(np.hypot(x - x0, y - y0))
+    kept_before = np.concatenate([[0], np.cumsum(keep)])
+    return np.split(points[keep], kept_before[offsets[1:-1]])
+
+
+def stack_polylines(
+    polylines: Sequence[np.ndarray | list[tuple[int, int]]],
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Every point of ``polylines`` in one array, for working on all of them at once.
+
+    Args:
+        polylines: Points per polyline: lists of ``(x, y)`` or arrays shaped
+            ``(N, 2)`` or ``(N, 1, 2)``.
 
-    return abs(dy * x - dx * y + x1 * y0 - y1 * x0) / float(np.hypot(dx, dy))
+    Returns:
+        ``(points, offsets)``: an ``(N, 2)`` int32 array, and where each
+        polyline starts in it followed by the total, so polyline ``i`` is
+        ``points[offsets[i]:offsets[i + 1]]``.
+    """
+    lengths = np.array([len(line) for line in polylines], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    if any(isinstance(line, np.ndarray) for line in polylines):
+        arrays = [np.asarray(line, dtype=np.int32).reshape(-1, 2) for line in polylines]
+        return np.concatenate(arrays), offsets
+    # Lists of tuples: one flat read of every coordinate, not an array per line.
+    coordinates = chain.from_iterable(chain.from_iterable(polylines))
+    points = np.fromiter(coordinates, dtype=np.int32, count=2 * int(offsets[-1]))
+    return points.reshape(-1, 2), offsets
+
+
+def _distance_to_chord(
+    x: np.ndarray, y: np.ndarray, index: np.ndarray, start: np.ndarray, end: np.ndarray
+) -> np.ndarray:
+    """
+    Distance from each point ``index`` to the line through ``start`` and ``end``.
+
+    The cross product is exact in int64. Where the two ends coincide it is the
+    distance to that point.
+    """
+    x0, y0, x1, y1 = x[start], y[start], x[end], y[end]
+    px, py = x[index], y[index]
+    dx, dy = x1 - x0, y1 - y0
+    chord = np.hypot(dx, dy)
+    cross = np.abs(dy * px - dx * py + x1 * y0 - y1 * x0)
+    degenerate = chord == 0
+    return np.where(
+        degenerate,
+        np.hypot(px - x0, py - y0),
+        cross / np.where(degenerate, 1.0, chord),
+    )
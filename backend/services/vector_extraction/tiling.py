@@ -0,0 +1,248 @@
+"""
+Tiled skeletons and contours for large masks.
+
+``skeletonize`` and ``cv2.findContours`` each run over the whole mask on one
+core; at 4096 px and above they dominate vector extraction. Both release the
+GIL, so the mask is cut into tiles, each tile is processed on a thread pool
+together with a margin (the *halo*) of its neighbours, and the results are
+joined. Joined output is identical to the untiled call, not merely close:
+
+* **Skeletons.** Zhang-Suen thinning decides each pixel from its 3x3
+  neighbourhood, once per sub-iteration, so a change travels one pixel per
+  sub-iteration. For ordinary shapes the sub-iterations are bounded by the
+  thickness of the widest shape (the *thinning depth*, estimated from the
+  city-block distance transform, which is never below the Euclidean one and
+  is several times quicker to compute). Each tile reads twice that depth
+  around its core. Only the cores are kept; a tile's result for the ring of
+  one depth beyond its core must then agree with its neighbours' cores. If
+  any ring disagrees, thinning carried further than the depth (a solid area
+  pierced by pinholes can cascade across the whole mask) and the mask is
+  thinned whole instead. The joined skeleton is traced as one image, so no
+  road is ever split at a seam.
+* **Contours.** Outer contours are found on the mask with its holes filled,
+  which leaves the outer boundaries alone and drops what
+  ``RETR_EXTERNAL`` would have dropped: shapes inside another shape's hole.
+  A shape belongs to the tile holding its first pixel in raster order, which
+  is where OpenCV starts its contour. The tile keeps the contour if the shape
+  lies inside its window. A shape too big for the window is traced on its
+  own, from a labelling of the whole mask. Contours are returned in OpenCV's
+  order.
+
+When the halo would be larger than a tile, tiling cannot help and the whole
+mask is processed at once.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TypeVar
+
+import cv2
+import numpy as np
+
+from services.profiling import sampled
+
+T = TypeVar("T")
+
+#: Halo for contours: shapes whose extent from their first pixel exceeds
+#: this are traced separately. Buildings are far smaller.
+CONTOUR_HALO = 128
+
+#: Added to the thinning depth on top of the thickness bound, for safety.
+SKELETON_DEPTH_MARGIN = 4
+
+
+@dataclass(frozen=True)
+class Tile:
+    """One tile: the ``core`` it is responsible for and the ``window`` it reads."""
+
+    core: tuple[slice, slice]
+    window: tuple[slice, slice]
+
+    @property
+    def inner(self) -> tuple[slice, slice]:
+        """The core, relative to the window."""
+        return self.relative(self.core)
+
+    def relative(self, region: tuple[slice, slice]) -> tuple[slice, slice]:
+        """``region``, which must lie within the window, relative to the window."""
+        return tuple(
+            slice(part.start - window.start, part.stop - window.start)
+            for part, window in zip(region, self.window, strict=True)
+        )
+
+    def grown(self, margin: int, shape: tuple[int, int]) -> tuple[slice, slice]:
+        """The core with ``margin`` pixels around it, within ``shape`` and the window."""
+        return tuple(
+            slice(
+                max(core.start - margin, window.start, 0),
+                min(core.stop + margin, window.stop, size),
+            )
+            for core, window, size in zip(self.core, self.window, shape, strict=True)
+        )
+
+
+def tiles(shape: tuple[int, int], tile_size: int, halo: int) -> Iterator[Tile]:
+    """Tiles covering ``shape`` in raster order, each with ``halo`` pixels of margin."""
+    rows, columns = shape
+    for top in range(0, rows, tile_size):
+        for left in range(0, columns, tile_size):
+            bottom, right = min(top + tile_size, rows), min(left + tile_size, columns)
+            yield Tile(
+                core=(slice(top, bottom), slice(left, right)),
+                window=(
+                    slice(max(0, top - halo), min(rows, bottom + halo)),
+                    slice(max(0, left - halo), min(columns, right + halo)),
+                ),
+            )
+
+
+def thinning_depth(mask: np.ndarray) -> int:
+    """How far thinning normally carries; see the module docstring."""
+    distances = cv2.distanceTransform(mask.view(np.uint8), cv2.DIST_L1, 3)
+    return 2 * math.ceil(float(distances.max(initial=0))) + SKELETON_DEPTH_MARGIN
+
+
+def skeletonize_tiled(mask: np.ndarray, tile_size: int, workers: int | None = None) -> np.ndarray:
+    """``skimage.morphology.skeletonize(mask)``, computed tile by tile."""
+    from skimage.morphology import skeletonize
+
+    mask = np.ascontiguousarray(np.asarray(mask) > 0)
+    depth = thinning_depth(mask)
+    halo = 2 * depth
+    if halo > tile_size or max(mask.shape) <= tile_size:
+        return skeletonize(mask)
+
+    skeleton = np.zeros_like(mask)
+
+    def thin(tile: Tile) -> np.ndarray:
+        window = skeletonize(mask[tile.window])
+        # Cores do not overlap, so the threads write disjoint regions.
+        skeleton[tile.core] = window[tile.inner]
+        return window
+
+    work = list(tiles(mask.shape, tile_size, halo))
+    for tile, window in zip(work, _run_all(thin, work, workers), strict=True):
+        # Each tile's ring beyond its core must match what its neighbours
+        # made of it. If it does not, thinning carried further than the halo.
+        ring = tile.grown(depth, mask.shape)
+        if not np.array_equal(window[tile.relative(ring)], skeleton[ring]):
+            return skeletonize(mask)
+    return skeleton
+
+
+def find_contours_tiled(
+    mask: np.ndarray, tile_size: int, workers: int | None = None
+) -> list[np.ndarray]:
+    """
+    ``cv2.findContours(mask, RETR_EXTERNAL, CHAIN_APPROX_SIMPLE)``, tile by tile.
+
+    Args:
+        mask: Single-channel uint8 mask; any non-zero value is foreground.
+        tile_size: Edge length of a tile's core, in pixels.
+        workers: Threads; ``None`` for one per core.
+
+    Returns:
+        The contours, in the order ``findContours`` returns them.
+    """
+    filled = fill_holes(mask)
+    rows, columns = filled.shape
+    if tile_size < CONTOUR_HALO or max(rows, columns) <= tile_size:
+        contours, _ = cv2.findContours(filled, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        return list(contours)
+
+    def trace(tile: Tile) -> tuple[list[np.ndarray], list[tuple[int, int]]]:
+        window_rows, window_columns = tile.window
+        (core_top, core_bottom), (core_left, core_right) = (
+            (part.start, part.stop) for part in tile.inner
+        )
+        # An edge of the window that is not an edge of the mask may cut a shape.
+        cut_top, cut_left = window_rows.start > 0, window_columns.start > 0
+        cut_bottom, cut_right = window_rows.stop < rows, window_columns.stop < columns
+        height = window_rows.stop - window_rows.start
+        width = window_columns.stop - window_columns.start
+        offset = np.array([window_columns.start, window_rows.start], dtype=np.int32)
+
+        contours, _ = cv2.findContours(
+            filled[tile.window], cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        )
+        kept: list[np.ndarray] = []
+        oversized: list[tuple[int, int]] = []
+        for contour in contours:
+            x, y = _start(contour)
+            if not (core_left <= x < core_right and core_top <= y < core_bottom):
+                continue  # another tile's shape
+            left, top, w, h = cv2.boundingRect(contour)
+            if (
+                (cut_left and left == 0)
+                or (cut_top and top == 0)
+                or (cut_right and left + w == width)
+                or (cut_bottom and top + h == height)
+            ):
+                oversized.append((x + window_columns.start, y + window_rows.start))
+            else:
+                kept.append(contour + offset)
+        return kept, oversized
+
+    results = _run_all(trace, list(tiles(filled.shape, tile_size, CONTOUR_HALO)), workers)
+    contours = [contour for kept, _ in results for contour in kept]
+    oversized = [point for _, points in results for point in points]
+    if oversized:
+        # A cut-off piece of a shape looks like a shape of its own to the tile
+        # holding its first pixel, so the same shape may be reported by several
+        # tiles, and even by one that kept it whole.
+        whole = {_start(contour) for contour in contours}
+        contours += [
+            contour
+            for contour in _trace_components(filled, oversized)
+            if _start(contour) not in whole
+        ]
+
+    # findContours returns the shape starting last in raster order first.
+    contours.sort(key=lambda contour: _start(contour)[::-1], reverse=True)
+    return contours
+
+
+def fill_holes(mask: np.ndarray) -> np.ndarray:
+    """
+    ``mask`` as 0/255 uint8, with every hole filled.
+
+    The background reachable from outside the mask through 4-connected
+    background pixels stays background, the complement of OpenCV's
+    8-connected foreground. Everything else is foreground.
+    """
+    padded = np.pad((np.asarray(mask) > 0).view(np.uint8), 1)
+    cv2.floodFill(padded, None, (0, 0), 2, flags=4)
+    return np.where(padded[1:-1, 1:-1] == 2, 0, 255).astype(np.uint8)
+
+
+def _trace_components(filled: np.ndarray, starts: list[tuple[int, int]]) -> list[np.ndarray]:
+    """Outer contours of the shapes containing ``starts``, each traced once, in its box."""
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(filled, connectivity=8)
+    traced = []
+    for label in sorted({int(labels[y, x]) for x, y in starts}):
+        left, top, width, height = stats[label, :4].tolist()
+        crop = labels[top : top + height, left : left + width] == label
+        (contour,), _ = cv2.findContours(
+            crop.view(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        )
+        traced.append(contour + np.array([left, top], dtype=np.int32))
+    return traced
+
+
+def _start(contour: np.ndarray) -> tuple[int, int]:
+    """A contour's first point, ``(x, y)``: its shape's first pixel in raster order."""
+    return int(contour[0, 0, 0]), int(contour[0, 0, 1])
+
+
+def _run_all(function: Callable[[Tile], T], work: list[Tile], workers: int | None) -> list[T]:
+    """``function`` over ``work`` in order, on up to ``workers`` threads."""
+    workers = min(len(work), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        return [function(tile) for tile in work]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vector-tile") as pool:
+        return list(pool.map(sampled(function), work))
@@ -0,0 +1,91 @@
+"""
+BeamNG.WorldForge - generation worker.
+
+Runs the map generations the API queues when ``QUEUE_URL`` is set. Start one
+or more next to the API, with the same ``QUEUE_URL`` and the same output and
+temp directories::
+
+    QUEUE_URL=sqlite:///temp/queue.db python worker.py --jobs 2
+
+Stop a worker with Ctrl+C or SIGTERM: it stops claiming jobs and finishes the
+ones it is running. A second signal abandons them; their leases run out and
+another worker resumes them from their checkpoints.
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import signal
+import threading
+
+from core.config import DATA_ROOT, get_settings
+from core.logging_config import configure_logging, get_logger
+from core.version import APP_VERSION
+from services.job_queue import QueueBackendError, open_backend
+from services.job_queue.worker import QueueWorker, default_worker_id
+from services.jobs import job_store
+from services.pipeline import MapGenerationPipeline
+
+logger = get_logger(__name__)
+
+
+def main(argv: list[str] | None = None) -> int:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Run queued BeamNG.WorldForge map generations.")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=settings.max_concurrent_jobs,
+        help="generations to run at once (default: MAX_CONCURRENT_JOBS)",
+    )
+    parser.add_argument(
+        "--worker-id", default=default_worker_id(), help="name in leases and logs (default: host-pid)"
+    )
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if not settings.queue_url:
+        parser.error("QUEUE_URL is not set; the API runs generations itself without it")
+
+    configure_logging(settings.log_level)
+    settings.ensure_directories()
+    try:
+        backend = open_backend(settings.queue_url, base_dir=DATA_ROOT)
+    except QueueBackendError as exc:
+        logger.error("%s", exc)
+        return 1
+    job_store.retention_seconds = settings.job_retention_seconds
+    job_store.shared = backend
+
+    pipeline = MapGenerationPipeline(job_store=job_store)
+    worker = QueueWorker(backend, pipeline.run, job_store, concurrency=args.jobs, worker_id=args.worker_id)
+
+    stop = threading.Event()
+
+    def request_stop(signum: int, _frame: object) -> None:
+        if stop.is_set():
+            raise SystemExit(f"Abandoning running jobs on signal {signum}")
+        logger.info("Finishing running jobs; signal again to abandon them")
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    logger.info("BeamNG.WorldForge %s worker %s, queue %s", APP_VERSION, args.worker_id, settings.queue_url)
+    worker.start()
+    try:
+        # A timed wait keeps the main thread responsive to signals.
+        while not stop.wait(1.0):
+            pass
+        worker.stop()
+    finally:
+        pipeline.close()
+        backend.close()
+    return 0
+
+
+if __name__ == "__main__":
+    # Stage worker processes (PROCESS_WORKERS) re-run this module when bundled.
+    multiprocessing.freeze_support()
+    raise SystemExit(main())
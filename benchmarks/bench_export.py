@@ -0,0 +1,88 @@
+"""Packaging: the terrain file, the mod archive and building meshes."""
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from synthetic import BBOX, SOURCE_SIZE, synthetic_buildings, synthetic_dem
+
+from core.projection import LocalProjection
+from models.terrain import HeightmapConfig
+from services.beamng_integration.mesh_builder import MeshBuilder
+from services.export.beamng_exporter import BeamNGExporter
+from services.export.terrain_file import read_ter, write_ter
+from services.export.terrain_materials import LandCoverMask, MaterialClassifier
+from services.terrain.processor import TerrainProcessor
+
+
+@pytest.fixture
+def heightmap(size):
+    processor = TerrainProcessor()
+    terrain = processor.process_dem(synthetic_dem(SOURCE_SIZE))
+    return processor.generate_heightmap(terrain, HeightmapConfig(size=size))
+
+
+def test_write_ter(bench, size, heightmap, tmp_path):
+    path = bench(lambda: write_ter(tmp_path / "terrain.ter", heightmap))
+    assert path.stat().st_size > size * size * 3
+
+
+def test_ter_round_trip(bench, size, tmp_path):
+    """Write a ``.ter`` from a memory-mapped heightmap and read it back, as a job verifies it."""
+    source = np.memmap(tmp_path / "source.u16", dtype="<u2", mode="w+", shape=(size, size))
+    source[:] = np.arange(size, dtype=np.uint16)[:, None]
+    source.flush()
+
+    def round_trip() -> tuple[np.ndarray, np.ndarray, list[str]]:
+        return read_ter(write_ter(tmp_path / "terrain.ter", source))
+
+    heights, _, materials = bench(round_trip)
+    assert heights[size - 1, 0] == size - 1
+    assert materials == ["grass"]
+
+
+def test_classify_materials(bench, size, heightmap):
+    """Paint every layer, a water mask included, as the export stage does."""
+    water = LandCoverMask(np.eye(512, dtype=np.uint8), BBOX)
+    classifier = MaterialClassifier(
+        heightmap,
+        min_elevation=0.0,
+        elevation_range=1000.0,
+        square_size=2.0,
+        bbox=BBOX,
+        land_cover={"water": water},
+    )
+    indices = bench(classifier.classify)
+    assert len(np.unique(indices)) >= 3
+
+
+def test_create_map_structure(bench, size, heightmap, tmp_path):
+    processor = TerrainProcessor()
+    terrain = processor.process_dem(synthetic_dem(SOURCE_SIZE))
+    heightmap_path = processor.save_heightmap(heightmap, tmp_path / "heightmap.png")
+    preview_path = processor.generate_preview(heightmap, tmp_path / "preview.png")
+    exporter = BeamNGExporter(tmp_path / "output")
+
+    archive = bench(
+        lambda: exporter.create_map_structure(
+            "bench_map",
+            heightmap_path,
+            preview_path,
+            terrain=terrain,
+            bbox=BBOX,
+            source_name="Synthetic",
+        )
+    )
+    assert archive.suffix == ".zip"
+
+
+@pytest.mark.parametrize("count", [100, 1000])
+def test_mesh_builder(bench, count):
+    builder = MeshBuilder(LocalProjection.from_bbox(BBOX))
+    buildings = synthetic_buildings(count, BBOX)
+
+    def build_all() -> list[str | None]:
+        return [builder.build_mesh(building, index) for index, building in enumerate(buildings)]
+
+    meshes = bench(build_all)
+    assert sum(mesh is not None for mesh in meshes) > count // 2
@@ -0,0 +1,47 @@
+"""The job store under contention: pipelines reporting progress while clients poll."""
+
+from __future__ import annotations
+
+import threading
+
+from services.jobs import JobStatus, JobStore
+
+#: Eight pipelines, each reporting progress on its own job, and sixteen pollers.
+WRITERS, READERS = 8, 16
+#: Work per thread is fixed, so every round does the same amount of it.
+UPDATES, POLLS = 1000, 250
+
+
+def running_jobs() -> tuple[JobStore, list[str]]:
+    store = JobStore()
+    job_ids = [store.create(f"job_{index}").job_id for index in range(WRITERS)]
+    for job_id in job_ids:
+        store.update(job_id, status=JobStatus.PROCESSING)
+    return store, job_ids
+
+
+def report_progress_under_polling(store: JobStore, job_ids: list[str]) -> None:
+    start = threading.Barrier(WRITERS + READERS)
+
+    def write(job_id: str) -> None:
+        start.wait()
+        for step in range(UPDATES):
+            store.update(job_id, progress=step * 100 // UPDATES, stats={f"step_{step % 50}": step})
+
+    def read() -> None:
+        start.wait()
+        for _ in range(POLLS):
+            for job_id in job_ids:
+                store.get(job_id)
+            store.active_count()
+
+    writers = [threading.Thread(target=write, args=(job_id,)) for job_id in job_ids]
+    readers = [threading.Thread(target=read) for _ in range(READERS)]
+    for thread in writers + readers:
+        thread.start()
+    for thread in writers + readers:
+        thread.join()
+
+
+def test_job_store_contention(bench):
+    bench(report_progress_under_polling, setup=running_jobs)
@@ -0,0 +1,62 @@
+"""A whole job, from tile download to archive."""
+
+from __future__ import annotations
+
+import itertools
+
+import pytest
+from synthetic import BBOX
+
+from models.map_request import MapGenerationRequest
+from services.data_sources.aws_terrain_client import AWSTerrainDataSource
+from services.jobs import JobStatus, JobStore
+from services.pipeline import MapGenerationPipeline
+
+
+class LocalTilesPipeline(MapGenerationPipeline):
+    """The real pipeline, downloading from the local tile server."""
+
+    def __init__(self, job_store: JobStore, base_url: str) -> None:
+        super().__init__(job_store)
+        self._source = AWSTerrainDataSource({"base_url": base_url})
+
+    def _resolve_dem_source(self, _source_id: str) -> AWSTerrainDataSource:
+        return self._source
+
+
+#: The largest heightmap a request may ask for (``MapGenerationRequest``).
+MAX_REQUEST_SIZE = 4096
+
+
+def test_map_generation_pipeline_run(bench, size, tile_server):
+    if size > MAX_REQUEST_SIZE:
+        pytest.skip(f"requests are limited to {MAX_REQUEST_SIZE}")
+    job_store = JobStore()
+    pipeline = LocalTilesPipeline(job_store, tile_server)
+    # A fresh name per round, or the run would resume from the last one's
+    # checkpoints and reuse its archive entries.
+    names = (f"bench_pipeline_{index}" for index in itertools.count())
+
+    def submit() -> tuple[str, MapGenerationRequest]:
+        request = MapGenerationRequest(
+            name=next(names),
+            bbox=dict(zip(("min_lon", "min_lat", "max_lon", "max_lat"), BBOX, strict=True)),
+            resolution=30,
+            heightmap_size=size,
+            data_source="aws_terrain",
+        )
+        return job_store.create(request.name).job_id, request
+
+    finished: list[str] = []
+
+    def run(job_id: str, request: MapGenerationRequest) -> None:
+        pipeline.run(job_id, request)
+        finished.append(job_id)
+
+    try:
+        bench(run, setup=submit)
+    finally:
+        pipeline.close()
+    for job_id in finished:
+        job = job_store.get(job_id)
+        assert job.status is JobStatus.COMPLETED, job.error
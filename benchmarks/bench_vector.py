@@ -0,0 +1,47 @@
+"""Vector extraction: walking road skeletons into polylines, simplifying and measuring them."""
+
+from __future__ import annotations
+
+import cv2
+import numpy as np
+from synthetic import synthetic_road_skeleton
+
+from services.vector_extraction.contour_extractor import ContourExtractor
+from services.vector_extraction.skeleton import simplify_polylines, trace_skeleton
+
+
+def test_trace_skeleton(bench, size):
+    skeleton = synthetic_road_skeleton(size)
+    polylines = bench(lambda: trace_skeleton(skeleton))
+    assert sum(len(line) for line in polylines) >= int(skeleton.sum()) // 2
+
+
+def test_simplify_polylines(bench, size):
+    polylines = trace_skeleton(synthetic_road_skeleton(size))
+    simplified = bench(lambda: simplify_polylines(polylines, 2.0))
+    assert len(simplified) == len(polylines)
+
+
+def test_measure_widths(bench, size):
+    skeleton = synthetic_road_skeleton(size)
+    mask = cv2.dilate(skeleton.astype(np.uint8), np.ones((5, 5), np.uint8))
+    polylines = [np.array(line, np.int32).reshape(-1, 1, 2) for line in trace_skeleton(skeleton)]
+    extractor = ContourExtractor()
+    widths = bench(lambda: extractor.measure_widths(mask, polylines))
+    assert len(widths) == len(polylines)
+
+
+def road_mask(size: int) -> np.ndarray:
+    return cv2.dilate(synthetic_road_skeleton(size).astype(np.uint8) * 255, np.ones((7, 7), np.uint8))
+
+
+def test_extract_centerlines(bench, size):
+    mask = road_mask(size)
+    extractor = ContourExtractor()
+    assert bench(lambda: extractor.extract_centerlines(mask, min_length=20))
+
+
+def test_extract_centerlines_tiled(bench, size):
+    mask = road_mask(size)
+    extractor = ContourExtractor(tile_size=512)
+    assert bench(lambda: extractor.extract_centerlines(mask, min_length=20))
@@ -0,0 +1,253 @@
+"""
+Benchmark harness.
+
+The test suite says whether the pipeline is right; this says whether a change
+made it slower. Run it from the repository root::
+
+    pytest benchmarks                               # sizes up to 2048
+    pytest benchmarks --benchmark-max-size 8192     # the full range
+    pytest benchmarks --benchmark-update            # re-record the baselines
+
+Each benchmark times a callable over a few rounds and keeps the median. The
+median is compared with ``baselines.json``. A result more than
+``--benchmark-tolerance`` (25% by default) over its baseline fails the test.
+A result with no baseline yet passes and is listed as new in the summary.
+Baselines are machine-specific: record them on the machine that will compare
+against them, from a quiet system.
+
+Nothing here touches the network. DEMs are synthetic and deterministic, and
+the end-to-end benchmark downloads its tiles from a local stand-in for the AWS
+Terrain Tiles bucket (:func:`tile_server`).
+"""
+
+from __future__ import annotations
+
+import json
+import platform
+import statistics
+import sys
+import threading
+import time
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from synthetic import tile_bytes  # noqa: E402 - needs the path set up above
+
+BASELINES = Path(__file__).resolve().parent / "baselines.json"
+
+#: Heightmap sizes every size-dependent benchmark is run at.
+SIZES = (256, 1024, 2048, 4096, 8192)
+
+#: Rounds are repeated until they add up to this, so quick steps are not
+#: judged on a single noisy sample...
+TARGET_SECONDS = 1.0
+#: ...within these bounds. Slow steps run once more than the warm-up.
+MIN_ROUNDS, MAX_ROUNDS = 1, 20
+
+#: Differences below this are timer and scheduler noise, whatever the ratio.
+NOISE_FLOOR_SECONDS = 0.005
+
+#: Median seconds per benchmark, collected for the summary and for --benchmark-update.
+_results: dict[str, float] = {}
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    group = parser.getgroup("benchmarks")
+    group.addoption(
+        "--benchmark-max-size",
+        type=int,
+        default=2048,
+        help="Skip benchmarks above this heightmap size (default 2048; up to 8192).",
+    )
+    group.addoption(
+        "--benchmark-tolerance",
+        type=float,
+        default=0.25,
+        help="Fail a benchmark this much slower than its baseline (default 0.25 = 25%%).",
+    )
+    group.addoption(
+        "--benchmark-update",
+        action="store_true",
+        help="Record this run's results as the new baselines instead of comparing.",
+    )
+
+
+def _load_baselines() -> dict[str, float]:
+    if not BASELINES.exists():
+        return {}
+    return json.loads(BASELINES.read_text(encoding="utf-8"))["results"]
+
+
+class Bench:
+    """The ``bench`` fixture: times a callable and checks it against its baseline."""
+
+    def __init__(self, name: str, baseline: float | None, tolerance: float, update: bool) -> None:
+        self.name = name
+        self.baseline = baseline
+        self.tolerance = tolerance
+        self.update = update
+
+    def __call__(
+        self, function: Callable[..., object], *, setup: Callable[[], tuple] = tuple
+    ) -> object:
+        """
+        Time ``function(*setup())`` and return the result of the last round.
+
+        ``setup`` runs before every round, untimed: use it when a round must not
+        see what the previous one left behind (a checkpoint, a reused archive).
+        """
+        result = function(*setup())  # warm-up: imports, caches, page faults
+        timings: list[float] = []
+        while len(timings) < MIN_ROUNDS or (
+            sum(timings) < TARGET_SECONDS and len(timings) < MAX_ROUNDS
+        ):
+            arguments = setup()
+            started = time.perf_counter()
+            result = function(*arguments)
+            timings.append(time.perf_counter() - started)
+
+        median = statistics.median(timings)
+        _results[self.name] = median
+        if self.baseline is not None and not self.update:
+            limit = max(self.baseline * (1 + self.tolerance), self.baseline + NOISE_FLOOR_SECONDS)
+            if median > limit:
+                pytest.fail(
+                    f"{self.name} took {median:.4f}s, {median / self.baseline - 1:+.0%} on its "
+                    f"baseline of {self.baseline:.4f}s (tolerance {self.tolerance:.0%})",
+                    pytrace=False,
+                )
+        return result
+
+
+@pytest.fixture
+def bench(request: pytest.FixtureRequest) -> Bench:
+    module = Path(request.node.fspath).stem.removeprefix("bench_")
+    name = f"{module}.{request.node.name.removeprefix('test_')}"
+    return Bench(
+        name,
+        _load_baselines().get(name),
+        request.config.getoption("--benchmark-tolerance"),
+        request.config.getoption("--benchmark-update"),
+    )
+
+
+@pytest.fixture(params=SIZES, ids=str)
+def size(request: pytest.FixtureRequest) -> int:
+    """Heightmap size; sizes above ``--benchmark-max-size`` are deselected."""
+    return request.param
+
+
+def pytest_collection_modifyitems(config: pytest.Config, items: list[pytest.Item]) -> None:
+    limit = config.getoption("--benchmark-max-size")
+    oversized = [
+        item
+        for item in items
+        if hasattr(item, "callspec") and item.callspec.params.get("size", 0) > limit
+    ]
+    if oversized:
+        config.hook.pytest_deselected(items=oversized)
+        items[:] = [item for item in items if item not in oversized]
+
+
+def pytest_sessionfinish(session: pytest.Session) -> None:
+    if not session.config.getoption("--benchmark-update", default=False) or not _results:
+        return
+    recorded = _load_baselines()
+    recorded.update({name: round(seconds, 5) for name, seconds in _results.items()})
+    payload = {
+        "machine": {
+            "platform": platform.platform(terse=True),
+            "processor": platform.machine(),
+            "python": platform.python_version(),
+        },
+        "results": dict(sorted(recorded.items())),
+    }
+    BASELINES.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+
+
+def pytest_terminal_summary(terminalreporter, config: pytest.Config) -> None:
+    if not _results:
+        return
+    baselines = _load_baselines()
+    terminalreporter.section("benchmarks")
+    width = max(len(name) for name in _results)
+    for name, seconds in sorted(_results.items()):
+        baseline = baselines.get(name)
+        if config.getoption("--benchmark-update"):
+            change = "recorded"
+        elif baseline is None:
+            change = "new"
+        else:
+            change = f"{seconds / baseline - 1:+.0%}"
+        terminalreporter.write_line(f"{name:<{width}}  {seconds:10.4f}s  {change}")
+
+
+# -- environment -------------------------------------------------------------------
+
+
+@pytest.fixture(scope="session", autouse=True)
+def isolated_environment(tmp_path_factory: pytest.TempPathFactory):
+    """Point the output, temp and config directories at a scratch directory."""
+    from core import config as config_module
+
+    root = tmp_path_factory.mktemp("data")
+    with pytest.MonkeyPatch.context() as patch:
+        for name in ("OUTPUT_DIR", "TEMP_DIR", "CONFIG_DIR"):
+            patch.setenv(name, str(root / name.lower().replace("_dir", "")))
+        patch.delenv("QUEUE_URL", raising=False)
+        config_module.get_settings.cache_clear()
+        settings = config_module.get_settings()
+        settings.ensure_directories()
+        yield settings
+    config_module.get_settings.cache_clear()
+
+
+# -- local tile server -------------------------------------------------------------
+
+
+class _TileHandler(BaseHTTPRequestHandler):
+    """Serves ``/{z}/{x}/{y}.tif`` like the AWS Terrain Tiles bucket."""
+
+    def do_GET(self) -> None:  # noqa: N802 - http.server's naming
+        self._respond(body=True)
+
+    def do_HEAD(self) -> None:  # noqa: N802
+        self._respond(body=False)
+
+    def _respond(self, *, body: bool) -> None:
+        try:
+            parts = self.path.strip("/").removesuffix(".tif").split("/")
+            zoom, x, y = (int(part) for part in parts)
+        except ValueError:
+            self.send_error(404)
+            return
+        payload = tile_bytes(zoom, x, y)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/tiff")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if body:
+            self.wfile.write(payload)
+
+    def log_message(self, *_args: object) -> None:
+        pass
+
+
+@pytest.fixture(scope="session")
+def tile_server() -> str:
+    """Base URL of a local Terrain Tiles stand-in, for ``AWSTerrainDataSource``."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _TileHandler)
+    thread = threading.Thread(target=server.serve_forever, name="tile-server", daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
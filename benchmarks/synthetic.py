@@ -0,0 +1,102 @@
+"""
+Synthetic, deterministic inputs for the benchmarks.
+
+Sized like real jobs and shaped like real data where it affects the timing,
+so a benchmark exercises the same paths a generated map would.
+"""
+
+from __future__ import annotations
+
+import math
+from functools import cache, lru_cache
+
+import numpy as np
+
+#: The region every benchmark maps: ~2.6 x 3.3 km over San Francisco, as
+#: ``[min_lon, min_lat, max_lon, max_lat]``.
+BBOX = [-122.4294, 37.7749, -122.3994, 37.8049]
+
+#: A real DEM is coarser than the heightmap it becomes, and never aligned to
+#: it: 30 m data over a few kilometres is a few hundred pixels, then upsampled.
+SOURCE_SIZE = 317
+
+
+@lru_cache(maxsize=2)
+def synthetic_dem(size: int) -> np.ndarray:
+    """
+    A ``size`` x ``size`` DEM that resembles real terrain where it matters.
+
+    Ridges at a few scales plus noise, so compression and resampling see
+    realistic entropy rather than a flat or periodic field, and 0.5% voids
+    so nodata filling has work to do. Deterministic per size.
+    """
+    rng = np.random.default_rng(size)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    elevation = 400.0 + 300.0 * np.sin(3.1 * x + 1.3) * np.cos(2.3 * y)
+    elevation += 60.0 * np.sin(17.0 * x + 29.0 * y) + 15.0 * np.cos(53.0 * x - 41.0 * y)
+    elevation += rng.normal(0.0, 2.0, (size, size)).astype(np.float32)
+    elevation[rng.random((size, size)) < 0.005] = np.nan
+    return elevation.astype(np.float32)
+
+
+def synthetic_road_skeleton(size: int, spacing: int = 32) -> np.ndarray:
+    """A one-pixel street grid with a diagonal avenue, as skeletonisation leaves it."""
+    skeleton = np.zeros((size, size), dtype=np.uint8)
+    skeleton[spacing // 2 :: spacing, :] = 1
+    skeleton[:, spacing // 2 :: spacing] = 1
+    diagonal = np.arange(size)
+    skeleton[diagonal, diagonal] = 1
+    return skeleton
+
+
+def synthetic_buildings(count: int, bbox: list[float]) -> list[dict]:
+    """Detected-building records with noisy, many-vertex footprints inside ``bbox``."""
+    rng = np.random.default_rng(count)
+    min_lon, min_lat, max_lon, max_lat = bbox
+    buildings = []
+    for _ in range(count):
+        lat = rng.uniform(min_lat, max_lat)
+        lon = rng.uniform(min_lon, max_lon)
+        vertices = int(rng.integers(4, 60))
+        angles = np.linspace(0, 2 * math.pi, vertices, endpoint=False)
+        radius = 0.0001 * (1 + 0.1 * rng.random(vertices))
+        buildings.append(
+            {
+                "footprint": [
+                    [lat + r * math.sin(a), lon + r * math.cos(a)]
+                    for a, r in zip(angles, radius, strict=True)
+                ],
+                "height": float(rng.uniform(4, 40)),
+            }
+        )
+    return buildings
+
+
+def _tile_elevation(zoom: int, x: int, y: int) -> np.ndarray:
+    """Elevation for one 512 px tile, continuous across tile edges."""
+    from services.data_sources.aws_terrain_client import TILE_SIZE
+
+    span = 2.0**zoom * TILE_SIZE
+    rows, columns = np.mgrid[0:TILE_SIZE, 0:TILE_SIZE].astype(np.float64)
+    u = (x * TILE_SIZE + columns) / span * 4000.0
+    v = (y * TILE_SIZE + rows) / span * 4000.0
+    elevation = 300.0 + 250.0 * np.sin(u) * np.cos(v) + 40.0 * np.sin(7.0 * u + 3.0 * v)
+    return elevation.astype(np.int16)
+
+
+@cache
+def tile_bytes(zoom: int, x: int, y: int) -> bytes:
+    from rasterio.io import MemoryFile
+
+    data = _tile_elevation(zoom, x, y)
+    with MemoryFile() as memfile:
+        with memfile.open(
+            driver="GTiff",
+            width=data.shape[1],
+            height=data.shape[0],
+            count=1,
+            dtype="int16",
+            nodata=-32768,
+        ) as dataset:
+            dataset.write(data, 1)
+        return memfile.read()
@@ -6,6 +6,7 @@ import { useGenerationJob } from '../hooks/useGenerationJob'
 import { computeStageProgress } from '../lib/stages'
 import { getDataSources } from '../services/api'
 import type { BoundingBox, DataSource, DataSourceId, GenerationStatus } from '../types'
+import { isTerminal } from '../types'
 import { PreviewPanel } from './PreviewPanel'
 import { ProgressIndicator } from './ProgressIndicator'
 
@@ -44,7 +45,7 @@ export default function GenerationPanel({ selectedBBox, onStatusChange }: Genera
   const [showPreview, setShowPreview] = useState(false)
   const [validationError, setValidationError] = useState<string | null>(null)
 
-  const { status, error, isBusy, start, reset } = useGenerationJob()
+  const { status, error, isBusy, start, cancel, reset } = useGenerationJob()
 
   useEffect(() => {
     onStatusChange?.(status)
@@ -81,8 +82,12 @@ export default function GenerationPanel({ selectedBBox, onStatusChange }: Genera
   const areaTooLarge = selectedArea > MAX_AREA_KM2
 
   const steps = useMemo(
-    () => computeStageProgress(status?.progress ?? 0, useAI, status?.status === 'failed'),
-    [status?.progress, status?.status, useAI],
+    () =>
+      computeStageProgress(status?.progress ?? 0, useAI, status?.status === 'failed', {
+        active: status?.active_stages,
+        completed: status?.completed_stages,
+      }),
+    [status?.progress, status?.status, status?.active_stages, status?.completed_stages, useAI],
   )
 
   const handleGenerate = async () => {
@@ -319,7 +324,18 @@ export default function GenerationPanel({ selectedBBox, onStatusChange }: Genera
             </div>
           )}
 
-          {(isCompleted || status.status === 'failed') && (
+          {!isTerminal(status.status) && (
+            <button
+              type="button"
+              onClick={() => void cancel()}
+              className="w-full flex items-center justify-center gap-2 px-4 py-2 text-sm text-red-300 hover:text-red-200 transition-colors"
+            >
+              <XCircle className="w-4 h-4" />
+              {t('generation.cancel')}
+            </button>
+          )}
+
+          {isTerminal(status.status) && (
             <button
               type="button"
               onClick={reset}
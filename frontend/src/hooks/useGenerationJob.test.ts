@@ -1,6 +1,6 @@
 import { act, renderHook, waitFor } from '@testing-library/react'
 import MockAdapter from 'axios-mock-adapter'
-import { afterEach, beforeEach, describe, expect, it } from 'vitest'
+import { afterEach, beforeEach, describe, expect, it, vi } from 'vitest'
 
 import { api } from '../services/api'
 import type { MapGenerationRequest } from '../types'
@@ -14,8 +14,38 @@ beforeEach(() => {
 
 afterEach(() => {
   mock.restore()
+  vi.unstubAllGlobals()
 })
 
+/** Stands in for the browser's EventSource, which jsdom does not provide. */
+class FakeEventSource {
+  static readonly CLOSED = 2
+  static instances: FakeEventSource[] = []
+
+  readonly url: string
+  readyState = 1
+  onmessage: ((event: MessageEvent<string>) => void) | null = null
+  onerror: (() => void) | null = null
+
+  constructor(url: string) {
+    this.url = url
+    FakeEventSource.instances.push(this)
+  }
+
+  emit(payload: Record<string, unknown>) {
+    this.onmessage?.(new MessageEvent('message', { data: JSON.stringify(payload) }))
+  }
+
+  fail() {
+    this.readyState = FakeEventSource.CLOSED
+    this.onerror?.()
+  }
+
+  close() {
+    this.readyState = FakeEventSource.CLOSED
+  }
+}
+
 const REQUEST: MapGenerationRequest = {
   name: 'test_map',
   bbox: { min_lat: 37.77, max_lat: 37.8, min_lon: -122.43, max_lon: -122.4 },
@@ -123,6 +153,55 @@ describe('useGenerationJob', () => {
     expect(result.current.error).toBeNull()
   })
 
+  it('cancels the running job and goes idle once the server confirms', async () => {
+    mock.onPost('/generate').reply(202, { success: true, map_id: 'job-1', message: 'ok' })
+    mock.onPost('/jobs/job-1/cancel').reply(202, statusPayload())
+    let cancelled = false
+    mock
+      .onGet('/status/job-1')
+      .reply(() => [200, statusPayload(cancelled ? { status: 'cancelled', message: 'Cancelled' } : {})])
+
+    const { result } = renderHook(() => useGenerationJob())
+
+    await act(async () => {
+      await result.current.start(REQUEST)
+    })
+    await act(async () => {
+      await result.current.cancel()
+      cancelled = true
+    })
+
+    expect(mock.history.post.some((call) => call.url === '/jobs/job-1/cancel')).toBe(true)
+    await waitFor(() => expect(result.current.status?.status).toBe('cancelled'), { timeout: 4000 })
+    expect(result.current.isBusy).toBe(false)
+    expect(result.current.error).toBeNull()
+  })
+
+  it('goes idle as soon as a queued job is cancelled', async () => {
+    mock.onPost('/generate').reply(202, { success: true, map_id: 'job-1', message: 'ok' })
+    let cancelled = false
+    mock
+      .onGet('/status/job-1')
+      .reply(() => [200, statusPayload(cancelled ? { status: 'cancelled' } : { status: 'queued' })])
+    mock.onPost('/jobs/job-1/cancel').reply(() => {
+      cancelled = true
+      return [202, statusPayload({ status: 'cancelled', progress: 0, message: 'Cancelled' })]
+    })
+
+    const { result } = renderHook(() => useGenerationJob())
+
+    await act(async () => {
+      await result.current.start(REQUEST)
+    })
+    await act(async () => {
+      await result.current.cancel()
+    })
+
+    expect(result.current.status?.status).toBe('cancelled')
+    expect(result.current.isBusy).toBe(false)
+    expect(result.current.error).toBeNull()
+  })
+
   it('reports a start failure and stays idle', async () => {
     mock.onPost('/generate').reply(422, { detail: 'name: too short' })
 
@@ -185,4 +264,41 @@ describe('useGenerationJob', () => {
 
     expect(mock.history.get.length).toBe(callsAtUnmount)
   })
+
+  it('follows pushed status events instead of polling', async () => {
+    FakeEventSource.instances = []
+    vi.stubGlobal('EventSource', FakeEventSource)
+    mock.onPost('/generate').reply(202, { success: true, map_id: 'job-1', message: 'ok' })
+
+    const { result } = renderHook(() => useGenerationJob())
+    await act(async () => {
+      await result.current.start(REQUEST)
+    })
+
+    const [source] = FakeEventSource.instances
+    expect(source.url).toBe('/api/status/job-1/events')
+    act(() => source.emit(statusPayload({ progress: 70 })))
+    expect(result.current.status?.progress).toBe(70)
+
+    act(() => source.emit(statusPayload({ status: 'completed', progress: 100 })))
+    expect(result.current.isBusy).toBe(false)
+    expect(source.readyState).toBe(FakeEventSource.CLOSED)
+    expect(mock.history.get).toHaveLength(0)
+  })
+
+  it('falls back to polling when the status stream is refused', async () => {
+    FakeEventSource.instances = []
+    vi.stubGlobal('EventSource', FakeEventSource)
+    mock.onPost('/generate').reply(202, { success: true, map_id: 'job-1', message: 'ok' })
+    mock.onGet('/status/job-1').reply(200, statusPayload({ progress: 55 }))
+
+    const { result } = renderHook(() => useGenerationJob())
+    await act(async () => {
+      await result.current.start(REQUEST)
+    })
+
+    act(() => FakeEventSource.instances[0].fail())
+
+    await waitFor(() => expect(result.current.status?.progress).toBe(55))
+  })
 })
@@ -1,10 +1,16 @@
 import { useCallback, useEffect, useRef, useState } from 'react'
 
-import { ApiError, generateMap, getGenerationStatus } from '../services/api'
+import {
+  ApiError,
+  cancelJob,
+  generateMap,
+  getGenerationStatus,
+  watchGenerationStatus,
+} from '../services/api'
 import type { GenerationStatus, MapGenerationRequest } from '../types'
 import { isTerminal } from '../types'
 
-/** How often to poll a running job. */
+/** How often to poll a running job when its status cannot be streamed. */
 const POLL_INTERVAL_MS = 2000
 
 /**
@@ -21,6 +27,7 @@ export interface UseGenerationJob {
   error: string | null
   isBusy: boolean
   start: (request: MapGenerationRequest) => Promise<void>
+  cancel: () => Promise<void>
   reset: () => void
 }
 
@@ -37,6 +44,10 @@ export interface UseGenerationJob {
  *    polling effect, so if polling never started (or the component re-rendered
  *    through a different path) the Generate button stayed disabled until a
  *    page reload. Busy state is now derived from the job status itself.
+ *
+ * Progress is streamed from `/api/status/{id}/events` where the browser
+ * supports it, so updates appear as they happen. If the stream cannot be
+ * opened the hook falls back to polling.
  */
 export function useGenerationJob(): UseGenerationJob {
   const [status, setStatus] = useState<GenerationStatus | null>(null)
@@ -77,6 +88,28 @@ export function useGenerationJob(): UseGenerationJob {
     }
   }, [])
 
+  // A queued job is cancelled at once and the response says so. A running one
+  // stops at its next cancellation point, and the status stream (or polling)
+  // picks up the `cancelled` status then.
+  const cancel = useCallback(async () => {
+    const id = jobIdRef.current
+    if (!id) {
+      return
+    }
+    try {
+      const confirmed = await cancelJob(id)
+      if (jobIdRef.current === id && isTerminal(confirmed.status)) {
+        setStatus((previous) => ({
+          ...previous,
+          ...confirmed,
+          map_name: confirmed.map_name ?? previous?.map_name,
+        }))
+      }
+    } catch (caught) {
+      setError(caught instanceof Error ? caught.message : 'Failed to cancel map generation')
+    }
+  }, [])
+
   const reset = useCallback(() => {
     jobIdRef.current = null
     setJobId(null)
@@ -91,6 +124,24 @@ export function useGenerationJob(): UseGenerationJob {
 
     let cancelled = false
     let consecutiveErrors = 0
+    let timer: number | undefined
+    let source: EventSource | null = null
+
+    /** Apply a status update; returns whether the job has finished. */
+    const apply = (next: GenerationStatus): boolean => {
+      // Merge rather than replace: the slug returned when the job was
+      // created must survive updates, otherwise the UI loses the map name if
+      // a status response ever omits it.
+      setStatus((previous) => ({ ...previous, ...next, map_name: next.map_name ?? previous?.map_name }))
+
+      if (!isTerminal(next.status)) {
+        return false
+      }
+      if (next.status === 'failed') {
+        setError(next.error ?? 'Map generation failed')
+      }
+      return true
+    }
 
     const poll = async () => {
       try {
@@ -100,16 +151,8 @@ export function useGenerationJob(): UseGenerationJob {
         }
 
         consecutiveErrors = 0
-        // Merge rather than replace: the slug returned when the job was
-        // created must survive polls, otherwise the UI loses the map name if a
-        // status response ever omits it.
-        setStatus((previous) => ({ ...previous, ...next, map_name: next.map_name ?? previous?.map_name }))
-
-        if (isTerminal(next.status)) {
+        if (apply(next)) {
           window.clearInterval(timer)
-          if (next.status === 'failed') {
-            setError(next.error ?? 'Map generation failed')
-          }
         }
       } catch (caught) {
         if (cancelled) {
@@ -128,16 +171,39 @@ export function useGenerationJob(): UseGenerationJob {
       }
     }
 
-    const timer = window.setInterval(poll, POLL_INTERVAL_MS)
-    void poll() // Poll immediately so short jobs do not wait a full interval.
+    const startPolling = () => {
+      timer = window.setInterval(poll, POLL_INTERVAL_MS)
+      void poll() // Poll immediately so short jobs do not wait a full interval.
+    }
+
+    source = watchGenerationStatus(jobId)
+    if (source) {
+      source.onmessage = (event: MessageEvent<string>) => {
+        if (!cancelled && apply(JSON.parse(event.data) as GenerationStatus)) {
+          source?.close()
+        }
+      }
+      // The browser reconnects a dropped stream by itself; only a stream it
+      // has given up on (a 404, a proxy without SSE) falls back to polling,
+      // which also reports why.
+      source.onerror = () => {
+        if (!cancelled && source?.readyState === EventSource.CLOSED) {
+          source = null
+          startPolling()
+        }
+      }
+    } else {
+      startPolling()
+    }
 
     return () => {
       cancelled = true
+      source?.close()
       window.clearInterval(timer)
     }
   }, [jobId])
 
   const isBusy = isStarting || (status !== null && !isTerminal(status.status))
 
-  return { status, error, isBusy, start, reset }
+  return { status, error, isBusy, start, cancel, reset }
 }
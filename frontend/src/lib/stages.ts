@@ -36,7 +36,10 @@ const BASE_STAGES: readonly StageDefinition[] = [
   { key: 'package', labelKey: 'packaging', weight: 15 },
 ]
 
-/** Inserted after the DEM download when AI segmentation is on. Mirrors `AI_STAGES`. */
+/**
+ * Listed after the DEM download when AI segmentation is on, though the backend
+ * runs them alongside the terrain stages. Mirrors `AI_STAGES`.
+ */
 const AI_STAGES: readonly StageDefinition[] = [
   { key: 'fetch_imagery', labelKey: 'downloadingImagery', weight: 15 },
   { key: 'segment', labelKey: 'aiSegmentation', weight: 20 },
@@ -54,6 +57,12 @@ export function stagesFor(useAI: boolean): readonly StageDefinition[] {
   return [...BASE_STAGES.slice(0, 2), ...AI_STAGES, ...BASE_STAGES.slice(2)]
 }
 
+/** Per-stage state reported by the backend (`active_stages`, `completed_stages`). */
+export interface ReportedStages {
+  active?: readonly string[]
+  completed?: readonly string[]
+}
+
 /**
  * Split an overall 0-100 percentage into per-stage state.
  *
@@ -61,13 +70,33 @@ export function stagesFor(useAI: boolean): readonly StageDefinition[] {
  * is 'active' (carrying its own 0-100 completion), and the rest are 'pending'.
  * When `failed` is set the active stage becomes 'error' instead, so the
  * checklist shows where the run stopped rather than a stalled spinner.
+ *
+ * The AI stages run alongside the terrain stages, so a single percentage
+ * cannot say which of them are done. When the backend reports its stage lists,
+ * those are used instead, and several stages can be active at once.
  */
 export function computeStageProgress(
   percent: number,
   useAI: boolean,
   failed = false,
+  reported?: ReportedStages,
 ): StageProgress[] {
   const stages = stagesFor(useAI)
+  if (reported?.active?.length || reported?.completed?.length) {
+    const active = new Set(reported.active ?? [])
+    const completed = new Set(reported.completed ?? [])
+    return stages.map((stage): StageProgress => {
+      const base = { key: stage.key, labelKey: stage.labelKey }
+      if (completed.has(stage.key)) {
+        return { ...base, status: 'completed' }
+      }
+      if (active.has(stage.key)) {
+        return { ...base, status: failed ? 'error' : 'active' }
+      }
+      return { ...base, status: 'pending' }
+    })
+  }
+
   const totalWeight = stages.reduce((sum, stage) => sum + stage.weight, 0) || 1
   const overall = Math.min(Math.max(Number.isFinite(percent) ? percent : 0, 0), 100)
 
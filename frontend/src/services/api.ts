@@ -83,12 +83,36 @@ export function getGenerationStatus(jobId: string): Promise<GenerationStatus> {
   return request(() => api.get<GenerationStatus>(`/status/${jobId}`))
 }
 
+/**
+ * Subscribe to a job's status as Server-Sent Events.
+ *
+ * Each message carries the body {@link getGenerationStatus} would return,
+ * pushed as soon as the job changes. Returns `null` where the browser has no
+ * `EventSource`; poll instead.
+ */
+export function watchGenerationStatus(jobId: string): EventSource | null {
+  if (typeof EventSource === 'undefined') {
+    return null
+  }
+  return new EventSource(`${api.defaults.baseURL}/status/${jobId}/events`)
+}
+
 /** List the data sources the server knows about, with availability. */
 export function getDataSources(): Promise<DataSourcesResponse> {
   return request(() => api.get<DataSourcesResponse>('/data-sources'))
 }
 
-/** Delete a finished job and the files it produced. */
+/**
+ * Ask the server to stop a queued or running job.
+ *
+ * Resolves once the request is accepted; a running job reports `cancelled`
+ * on a later poll, normally within a second.
+ */
+export function cancelJob(jobId: string): Promise<GenerationStatus> {
+  return request(() => api.post<GenerationStatus>(`/jobs/${jobId}/cancel`))
+}
+
+/** Delete a job and the files it produced, cancelling it first if it is still running. */
 export function deleteJob(jobId: string): Promise<void> {
   return request(() => api.delete(`/jobs/${jobId}`)).then(() => undefined)
 }
@@ -28,6 +28,8 @@ export interface MapGenerationRequest {
   heightmap_size?: number
   data_source?: DataSourceId
   use_ai_segmentation?: boolean
+  /** Keep a sampling profile of the job, served at `/api/profile/{job_id}`. */
+  profile?: boolean
 }
 
 export interface MapGenerationResponse {
@@ -39,6 +41,10 @@ export interface MapGenerationResponse {
   download_url?: string
   preview_url?: string
   error?: string
+  /** True when an identical request's running or finished job was returned. */
+  reused?: boolean
+  /** Place in the generation queue when accepted (1 = next to start). */
+  queue_position?: number | null
 }
 
 /**
@@ -64,6 +70,10 @@ export interface JobStats {
   buildings?: number
   archive_size_mb?: number
   dem_resolution_m?: number
+  /** Admission estimate of the job's peak memory, and the measured process RSS. */
+  estimated_peak_mb?: number
+  peak_rss_mb?: number
+  start_rss_mb?: number
   terrain?: {
     width: number
     height: number
@@ -83,7 +93,14 @@ export interface GenerationStatus {
   error?: string | null
   download_url?: string
   preview_url?: string
+  /** Set once a profiled job has finished, whatever the outcome. */
+  profile_url?: string
   stats?: JobStats | null
+  /** Stage keys running now; more than one while independent branches overlap. */
+  active_stages?: string[]
+  completed_stages?: string[]
+  /** Current place in the generation queue while `queued` (1 = next to start). */
+  queue_position?: number | null
   created_at?: number
   updated_at?: number
 }
@@ -38,6 +38,8 @@ def isolated_environment(tmp_path, monkeypatch):
         "GEE_PROJECT_ID",
     ):
         monkeypatch.delenv(name, raising=False)
+    # Nor may a developer's worker-mode queue: jobs would go to their workers.
+    monkeypatch.delenv("QUEUE_URL", raising=False)
 
     config_module.get_settings.cache_clear()
     settings = config_module.get_settings()
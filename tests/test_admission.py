@@ -0,0 +1,104 @@
+"""Admission control: peak-memory estimates, the budget, RSS sampling."""
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from core.memory import current_rss_bytes, io_bytes, physical_memory_bytes
+from models.map_request import MapGenerationRequest
+from services.admission import (
+    AdmissionController,
+    PeakRssSampler,
+    estimate_peak_bytes,
+    resolve_budget,
+)
+
+MB = 1024 * 1024
+
+SMALL_BBOX = {"min_lat": 37.7749, "max_lat": 37.7849, "min_lon": -122.4294, "max_lon": -122.4194}
+LARGE_BBOX = {"min_lat": 37.0, "max_lat": 37.17, "min_lon": -122.6, "max_lon": -122.39}
+
+
+def make_request(**overrides) -> MapGenerationRequest:
+    payload = {
+        "name": "admitted_map",
+        "bbox": SMALL_BBOX,
+        "resolution": 30,
+        "heightmap_size": 256,
+        "data_source": "auto",
+        "use_ai_segmentation": False,
+    }
+    payload.update(overrides)
+    return MapGenerationRequest(**payload)
+
+
+def test_large_ai_jobs_are_estimated_far_above_small_ones():
+    small = estimate_peak_bytes(make_request())
+    large = estimate_peak_bytes(
+        make_request(bbox=LARGE_BBOX, resolution=10, heightmap_size=4096, use_ai_segmentation=True)
+    )
+
+    assert small < 256 * MB
+    assert large > 512 * MB
+    assert large > 5 * small
+
+
+@pytest.mark.parametrize(
+    "overrides",
+    [{"heightmap_size": 2048}, {"use_ai_segmentation": True}, {"bbox": LARGE_BBOX}],
+)
+def test_every_input_that_adds_pixels_raises_the_estimate(overrides):
+    assert estimate_peak_bytes(make_request(**overrides)) > estimate_peak_bytes(make_request())
+
+
+def test_finer_resolution_costs_more_once_the_region_spans_several_tiles():
+    coarse = estimate_peak_bytes(make_request(bbox=LARGE_BBOX, resolution=30))
+    assert estimate_peak_bytes(make_request(bbox=LARGE_BBOX, resolution=10)) > coarse
+
+
+def test_a_tiny_region_still_costs_at_least_one_dem_tile():
+    # 512x512 float pixels at the DEM's per-pixel cost, whatever the area.
+    assert estimate_peak_bytes(make_request()) >= 512 * 512 * 20
+
+
+def test_jobs_are_admitted_while_their_estimates_fit():
+    controller = AdmissionController(budget_bytes=100)
+    controller.admit("a", 60)
+
+    assert controller.fits(40)
+    assert not controller.fits(41)
+
+    controller.release("a")
+    assert controller.in_use == 0
+
+
+def test_a_job_larger_than_the_budget_runs_alone():
+    controller = AdmissionController(budget_bytes=100)
+
+    assert controller.fits(500)
+    controller.admit("huge", 500)
+    assert not controller.fits(1)
+
+
+def test_budget_setting_wins_over_the_machine_default():
+    assert resolve_budget(512) == 512 * MB
+    if physical_memory_bytes() is not None:
+        assert resolve_budget(0) == physical_memory_bytes() // 2
+
+
+@pytest.mark.skipif(current_rss_bytes() is None, reason="RSS not available on this platform")
+def test_sampler_sees_memory_allocated_during_the_job():
+    with PeakRssSampler(interval_seconds=0.01) as sampler:
+        block = np.ones(64 * MB, dtype=np.uint8)
+
+    assert block.sum() == 64 * MB
+    assert sampler.peak_bytes - sampler.start_bytes >= 48 * MB
+
+
+@pytest.mark.skipif(io_bytes() is None, reason="I/O counters not available on this platform")
+def test_io_counters_see_a_file_being_written(tmp_path):
+    _read, written_before = io_bytes()
+    (tmp_path / "block.bin").write_bytes(bytes(MB))
+
+    assert io_bytes()[1] - written_before >= MB
@@ -101,7 +101,7 @@ def dem_source(sample_dem):
 def run_pipeline(settings, dem_source, monkeypatch):
     """Run the pipeline with the model reply and both data sources stubbed."""
 
-    def runner(reply: str = MODEL_REPLY, **request_overrides):
+    def runner(reply: str = MODEL_REPLY, *, generate=None, **request_overrides):
         async def fake_generate(self, model, prompt, images=None, stream=False, options=None):
             return {"response": reply}
 
@@ -114,7 +114,7 @@ def run_pipeline(settings, dem_source, monkeypatch):
         request = make_request(**request_overrides)
         job = store.create(request.name)
 
-        with patch("services.ollama.client.OllamaClient.generate", fake_generate), patch(
+        with patch("services.ollama.client.OllamaClient.generate", generate or fake_generate), patch(
             "services.data_sources.factory.DataSourceFactory.get_imagery_source",
             staticmethod(lambda: FakeImagerySource()),
         ):
@@ -189,6 +189,28 @@ def test_meshes_referenced_by_items_are_packaged(run_pipeline):
         assert item["shapeName"] in entries
 
 
+def test_detected_water_is_painted_into_the_terrain(run_pipeline, tmp_path):
+    """Land-cover masks reach the .ter index grid, in the right place."""
+    reply = json.loads(MODEL_REPLY)
+    # The northern half of the request is a lake.
+    reply["water"] = [
+        {"polygon": [[37.91, -122.62], [37.94, -122.62], [37.94, -122.55], [37.91, -122.55]]}
+    ]
+
+    entries = archive_entries(run_pipeline(reply=json.dumps(reply)))
+    ter = tmp_path / "t.ter"
+    ter.write_bytes(entries["levels/ai_map/art/terrains/main_terrain/main_terrain.ter"])
+
+    from services.export.terrain_file import read_ter
+
+    _, indices, materials = read_ter(ter)
+    sand = materials.index("sand")
+    north, south = indices[: len(indices) // 3], indices[-len(indices) // 3 :]
+
+    assert (north == sand).mean() > 0.9
+    assert not (south == sand).any()
+
+
 # -- degradation ----------------------------------------------------------------
 
 
@@ -269,3 +291,92 @@ def test_a_bug_in_the_ai_stage_is_not_swallowed(run_pipeline, monkeypatch):
 
     assert job.status is JobStatus.FAILED
     assert "segmentation" in (job.error or "")
+
+
+def test_a_rerun_reuses_the_checkpointed_detections(run_pipeline, monkeypatch):
+    first = run_pipeline()
+    assert first.stats["roads"] == 1
+
+    def no_model(*_args, **_kwargs):
+        raise AssertionError("segmentation should have been restored from its checkpoint")
+
+    monkeypatch.setattr(MapGenerationPipeline, "_segment", no_model)
+    second = run_pipeline(reply="not consulted")
+
+    assert second.status is JobStatus.COMPLETED, second.error
+    assert second.stats["roads"] == 1
+    assert "segment" in second.stats["resumed_stages"]
+
+
+# -- concurrency ----------------------------------------------------------------
+
+
+def test_imagery_and_dem_are_fetched_concurrently(run_pipeline, dem_source, monkeypatch):
+    """
+    Both downloads wait for each other at a barrier.
+
+    Run in sequence, the first would time out waiting for a second that has not
+    started, and the job would fail.
+    """
+    import threading
+
+    rendezvous = threading.Barrier(2, timeout=10)
+    fetch_dem = dem_source.get_dem_data
+    fetch_imagery = FakeImagerySource.get_satellite_image
+
+    def dem_after_rendezvous(*args, **kwargs):
+        rendezvous.wait()
+        return fetch_dem(*args, **kwargs)
+
+    def imagery_after_rendezvous(self, *args, **kwargs):
+        rendezvous.wait()
+        return fetch_imagery(self, *args, **kwargs)
+
+    monkeypatch.setattr(dem_source, "get_dem_data", dem_after_rendezvous)
+    monkeypatch.setattr(FakeImagerySource, "get_satellite_image", imagery_after_rendezvous)
+
+    job = run_pipeline()
+
+    assert job.status is JobStatus.COMPLETED, job.error
+    assert job.stats["roads"] == 1
+
+
+def test_a_terrain_failure_is_not_overwritten_by_the_ai_branch(run_pipeline, dem_source, monkeypatch):
+    def no_dem(*_args, **_kwargs):
+        raise ConnectionError("provider down")
+
+    monkeypatch.setattr(dem_source, "get_dem_data", no_dem)
+
+    job = run_pipeline()
+
+    assert job.status is JobStatus.FAILED
+    assert "provider down" in job.error
+    assert job.message == "Map generation failed"
+
+
+def test_a_terrain_failure_does_not_wait_for_the_model(run_pipeline, dem_source, monkeypatch):
+    """The AI branch is cancelled, so the job does not hold its slot through an LLM call."""
+    import asyncio
+    import threading
+    import time
+
+    asked = threading.Event()
+
+    async def slow_model(self, *args, **kwargs):
+        asked.set()
+        await asyncio.sleep(30)
+        return {"response": MODEL_REPLY}
+
+    def no_dem(*_args, **_kwargs):
+        asked.wait(timeout=10)
+        raise ConnectionError("provider down")
+
+    monkeypatch.setattr(dem_source, "get_dem_data", no_dem)
+
+    started = time.perf_counter()
+    job = run_pipeline(generate=slow_model)
+
+    assert asked.is_set()
+    assert time.perf_counter() - started < 10
+    assert job.status is JobStatus.FAILED
+    assert "provider down" in job.error
@@ -2,6 +2,11 @@
 
 from __future__ import annotations
 
+import hashlib
+import json
+import threading
+import time
+
 import numpy as np
 import pytest
 from fastapi.testclient import TestClient
@@ -56,6 +61,24 @@ def stub_source(monkeypatch, sample_dem):
     return FakeSource
 
 
+@pytest.fixture
+def stalled_source(monkeypatch, stub_source):
+    """Like ``stub_source``, but the DEM download hangs until the test ends."""
+    release = threading.Event()
+
+    class StalledSource(stub_source):
+        def get_dem_data(self, bbox, resolution=30):
+            release.wait(30)
+            return super().get_dem_data(bbox, resolution)
+
+    monkeypatch.setattr(
+        "services.pipeline.MapGenerationPipeline._resolve_dem_source",
+        staticmethod(lambda _source_id: StalledSource()),
+    )
+    yield StalledSource
+    release.set()
+
+
 # -- health and routing ---------------------------------------------------------
 
 
@@ -71,6 +94,21 @@ def test_health_endpoint_is_reachable(client):
     assert response.json()["status"] == "healthy"
 
 
+def test_metrics_are_served_in_the_prometheus_text_format(client):
+    from services.metrics import stage_metrics
+
+    stage_metrics.observe("validate", {"wall_seconds": 0.2, "cpu_seconds": 0.1})
+
+    response = client.get("/api/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert "# TYPE worldforge_stage_duration_seconds histogram" in lines
+    assert 'worldforge_stage_duration_seconds_bucket{stage="validate",le="+Inf"}' in response.text
+    assert 'worldforge_jobs{status="queued"} 0' in lines
+
+
 def test_unknown_api_path_returns_json_404_not_the_spa_shell(client):
     response = client.get("/api/definitely-not-a-real-endpoint")
 
@@ -103,6 +141,25 @@ def _payload(**overrides):
     return body
 
 
+def _finished(client, job_id: str, timeout: float = 60.0) -> dict:
+    """Poll a job's status until it reaches a terminal state, as the UI does."""
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client.get(f"/api/status/{job_id}").json()
+        if status["status"] in ("completed", "failed", "cancelled"):
+            return status
+        assert time.monotonic() < deadline, f"job still {status['status']} after {timeout}s"
+        time.sleep(0.05)
+
+
+def _running(client, job_id: str, timeout: float = 10.0) -> None:
+    """Wait until a job has left the queue."""
+    deadline = time.monotonic() + timeout
+    while client.get(f"/api/status/{job_id}").json()["status"] == "queued":
+        assert time.monotonic() < deadline, "job never started"
+        time.sleep(0.02)
+
+
 @pytest.mark.parametrize("name", ["..", "ab", "  ", "///", "../..", "...."])
 def test_unusable_names_are_rejected(client, name):
     response = client.post("/api/generate", json=_payload(name=name))
@@ -188,9 +245,7 @@ def test_generate_runs_to_completion(client, stub_source):
 
     job_id = response.json()["map_id"]
 
-    # TestClient runs background tasks synchronously before returning, so the
-    # job has already finished by the time we poll.
-    status = client.get(f"/api/status/{job_id}").json()
+    status = _finished(client, job_id)
 
     assert status["status"] == "completed", status.get("error")
     assert status["progress"] == 100
@@ -199,6 +254,7 @@ def test_generate_runs_to_completion(client, stub_source):
 
 def test_download_serves_a_real_zip(client, stub_source):
     job_id = client.post("/api/generate", json=_payload(name="zip_map")).json()["map_id"]
+    _finished(client, job_id)
 
     response = client.get(f"/api/download/{job_id}")
 
@@ -209,6 +265,7 @@ def test_download_serves_a_real_zip(client, stub_source):
 
 def test_preview_is_served_as_png(client, stub_source):
     job_id = client.post("/api/generate", json=_payload(name="preview_map")).json()["map_id"]
+    _finished(client, job_id)
 
     response = client.get(f"/api/preview/{job_id}")
 
@@ -216,10 +273,165 @@ def test_preview_is_served_as_png(client, stub_source):
     assert response.headers["content-type"] == "image/png"
 
 
+def test_an_interrupted_download_resumes_where_it_stopped(client, stub_source):
+    job_id = client.post("/api/generate", json=_payload(name="resumed_map")).json()["map_id"]
+    _finished(client, job_id)
+    full = client.get(f"/api/download/{job_id}")
+    etag = full.headers["etag"]
+    assert etag == f'"{hashlib.sha256(full.content).hexdigest()}"'
+
+    resumed = client.get(f"/api/download/{job_id}", headers={"Range": "bytes=100-", "If-Range": etag})
+    assert resumed.status_code == 206
+    assert resumed.headers["content-range"] == f"bytes 100-{len(full.content) - 1}/{len(full.content)}"
+    assert resumed.content == full.content[100:]
+
+    # Different bytes behind the same URL: start again rather than splice.
+    restarted = client.get(f"/api/download/{job_id}", headers={"Range": "bytes=100-", "If-Range": '"other"'})
+    assert restarted.status_code == 200
+    assert restarted.content == full.content
+
+
+def test_a_range_validated_only_by_date_gets_the_whole_file(client, stub_source):
+    job_id = client.post("/api/generate", json=_payload(name="dated_map")).json()["map_id"]
+    _finished(client, job_id)
+    full = client.get(f"/api/download/{job_id}")
+
+    # The date would satisfy a plain FileResponse; only the content ETag may.
+    dated = client.get(
+        f"/api/download/{job_id}",
+        headers={"Range": "bytes=100-", "If-Range": full.headers["last-modified"]},
+    )
+    assert dated.status_code == 200
+    assert dated.content == full.content
+
+
+def test_previews_are_served_from_the_browser_cache(client, stub_source):
+    job_id = client.post("/api/generate", json=_payload(name="cached_preview")).json()["map_id"]
+    _finished(client, job_id)
+    preview = client.get(f"/api/preview/{job_id}")
+
+    assert "immutable" in preview.headers["cache-control"]
+    revalidated = client.get(f"/api/preview/{job_id}", headers={"If-None-Match": preview.headers["etag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+
+
+def test_artefacts_outside_the_blob_store_are_hashed_and_can_be_sent_zero_copy(tmp_path):
+    import asyncio
+
+    from api.artifact_response import ArtifactResponse, content_digest
+
+    archive = tmp_path / "plain.zip"
+    archive.write_bytes(b"PK" + bytes(5000))
+    digest = content_digest(archive)
+    assert digest == hashlib.sha256(archive.read_bytes()).hexdigest()
+
+    sent: list[dict] = []
+
+    async def send(message: dict) -> None:
+        sent.append(message)
+
+    response = ArtifactResponse(archive, digest=digest, immutable=False, media_type="application/zip")
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [],
+        "extensions": {"http.response.pathsend": {}},
+    }
+    asyncio.run(response(scope, None, send))
+
+    assert [message["type"] for message in sent] == ["http.response.start", "http.response.pathsend"]
+    assert sent[1]["path"] == str(archive)
+    assert (b"cache-control", b"no-cache") in sent[0]["headers"]
+
+
+def test_resubmitting_a_finished_request_returns_the_same_job(client, stub_source):
+    first = client.post("/api/generate", json=_payload(name="repeat_map")).json()
+    _finished(client, first["map_id"])
+
+    again = client.post("/api/generate", json=_payload(name="repeat_map"))
+
+    assert again.status_code == 202
+    body = again.json()
+    assert body["reused"] is True and first["reused"] is False
+    assert body["map_id"] == first["map_id"]
+    assert body["download_url"] == f"/api/download/{first['map_id']}"
+    assert client.get("/api/jobs").json()["count"] == 1
+
+
+def test_a_different_request_is_not_reused(client, stub_source):
+    first = client.post("/api/generate", json=_payload(name="repeat_map")).json()
+    other = client.post("/api/generate", json=_payload(name="repeat_map", heightmap_size=256)).json()
+
+    assert other["reused"] is False
+    assert other["map_id"] != first["map_id"]
+
+
+def test_a_full_queue_refuses_the_request_without_recording_a_job(client, stub_source, monkeypatch):
+    from api.routes import map_generation
+
+    monkeypatch.setattr(map_generation.get_scheduler(), "max_queued", 0)
+
+    response = client.post("/api/generate", json=_payload(name="overflow_map"))
+
+    assert response.status_code == 503
+    assert "queue is full" in response.json()["detail"]
+    assert int(response.headers["retry-after"]) > 0
+    assert client.get("/api/jobs").json()["count"] == 0
+
+
 def test_status_of_unknown_job_is_404(client):
     assert client.get("/api/status/00000000-0000-0000-0000-000000000000").status_code == 404
 
 
+def test_status_stream_pushes_progress_until_the_job_finishes(client, stub_source):
+    job_id = client.post("/api/generate", json=_payload(name="streamed_map")).json()["map_id"]
+
+    with client.stream("GET", f"/api/status/{job_id}/events") as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [
+            json.loads(line.removeprefix("data: "))
+            for line in response.iter_lines()
+            if line.startswith("data: ")
+        ]
+
+    progress = [event["progress"] for event in events]
+    assert progress == sorted(progress)
+    assert events[-1]["status"] == "completed"
+    assert events[-1]["download_url"] == f"/api/download/{job_id}"
+
+
+def test_status_stream_of_unknown_job_is_404(client):
+    assert client.get("/api/status/nope/events").status_code == 404
+
+
+def test_a_failed_profiled_job_still_serves_its_profile(client, monkeypatch):
+    from services.pipeline import PipelineError
+
+    def explode(_source_id):
+        raise PipelineError("No elevation source")
+
+    monkeypatch.setattr(
+        "services.pipeline.MapGenerationPipeline._resolve_dem_source", staticmethod(explode)
+    )
+    response = client.post("/api/generate", json=_payload(name="profiled_map", profile=True))
+    job_id = response.json()["map_id"]
+    status = _finished(client, job_id)
+    deadline = time.monotonic() + 5
+    while "profile_url" not in status:
+        assert time.monotonic() < deadline, "the profile was never attached"
+        time.sleep(0.02)
+        status = client.get(f"/api/status/{job_id}").json()
+
+    response = client.get(status["profile_url"])
+
+    assert status["status"] == "failed"
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert response.headers["content-disposition"].endswith('profiled_map.folded"')
+    assert client.get(f"/api/download/{job_id}").status_code == 409
+
+
 def test_download_of_unknown_job_is_404(client):
     assert client.get("/api/download/nope").status_code == 404
 
@@ -235,7 +447,7 @@ def test_failed_job_reports_the_reason(client, monkeypatch):
     )
 
     job_id = client.post("/api/generate", json=_payload(name="failing_map")).json()["map_id"]
-    status = client.get(f"/api/status/{job_id}").json()
+    status = _finished(client, job_id)
 
     assert status["status"] == "failed"
     assert "not configured" in status["error"]
@@ -247,6 +459,7 @@ def test_failed_job_reports_the_reason(client, monkeypatch):
 
 def test_jobs_can_be_listed_and_deleted(client, stub_source):
     job_id = client.post("/api/generate", json=_payload(name="deletable")).json()["map_id"]
+    _finished(client, job_id)
 
     assert any(job["job_id"] == job_id for job in client.get("/api/jobs").json()["jobs"])
 
@@ -254,6 +467,104 @@ def test_jobs_can_be_listed_and_deleted(client, stub_source):
     assert client.get(f"/api/status/{job_id}").status_code == 404
 
 
+def test_job_listing_pages_with_a_cursor_and_filters(client):
+    from services.jobs import JobStatus, job_store
+
+    for index in range(3):
+        job_store.create(f"listed_{index}")
+    job_store.update(job_store.create("broken").job_id, status=JobStatus.FAILED)
+
+    first = client.get("/api/jobs", params={"limit": 2}).json()
+    rest = client.get("/api/jobs", params={"limit": 2, "cursor": first["next_cursor"]}).json()
+
+    assert [job["map_name"] for job in first["jobs"] + rest["jobs"]] == [
+        "broken",
+        "listed_2",
+        "listed_1",
+        "listed_0",
+    ]
+    assert rest["next_cursor"] is None
+    failed = client.get("/api/jobs", params={"status": "failed"}).json()
+    assert [job["map_name"] for job in failed["jobs"]] == ["broken"]
+    assert client.get("/api/jobs", params={"name": "LISTED_1"}).json()["count"] == 1
+    assert client.get("/api/jobs", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_an_unchanged_job_listing_answers_304(client):
+    from services.jobs import job_store
+
+    job = job_store.create("cached")
+    listing = client.get("/api/jobs")
+    etag = listing.headers["etag"]
+
+    unchanged = client.get("/api/jobs", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+
+    job_store.update(job.job_id, progress=50)
+    changed = client.get("/api/jobs", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+
+
+def test_a_listing_etag_belongs_to_its_query(client):
+    from services.jobs import JobStatus, job_store
+
+    job_store.create("older")
+    job_store.update(job_store.create("newer").job_id, status=JobStatus.FAILED)
+    first = client.get("/api/jobs", params={"limit": 1})
+    etag = first.headers["etag"]
+
+    for params in (
+        {"limit": 2},
+        {"limit": 1, "cursor": first.json()["next_cursor"]},
+        {"limit": 1, "status": "failed"},
+        {"limit": 1, "name": "older"},
+    ):
+        other = client.get("/api/jobs", params=params, headers={"If-None-Match": etag})
+        assert other.status_code == 200, params
+        assert other.headers["etag"] != etag
+    same = client.get("/api/jobs", params={"limit": 1}, headers={"If-None-Match": etag})
+    assert same.status_code == 304
+
+
+def test_a_running_job_can_be_cancelled(client, stalled_source):
+    job_id = client.post("/api/generate", json=_payload(name="cancelled_map")).json()["map_id"]
+    _running(client, job_id)
+
+    response = client.post(f"/api/jobs/{job_id}/cancel")
+
+    assert response.status_code == 202
+    assert _finished(client, job_id, timeout=2)["status"] == "cancelled"
+    assert client.post(f"/api/jobs/{job_id}/cancel").status_code == 409
+
+
+def test_cancelling_a_queued_job_answers_with_it_cancelled(client, settings, stalled_source):
+    # One more job than there are workers, all stalled: at least one waits.
+    job_ids = [
+        client.post("/api/generate", json=_payload(name=f"waiting_{index}")).json()["map_id"]
+        for index in range(settings.max_concurrent_jobs + settings.fast_lane_workers + 1)
+    ]
+    _running(client, job_ids[0])
+    queued = next(
+        job_id
+        for job_id in job_ids
+        if client.get(f"/api/status/{job_id}").json()["status"] == "queued"
+    )
+
+    response = client.post(f"/api/jobs/{queued}/cancel")
+
+    assert response.status_code == 202
+    assert response.json()["status"] == "cancelled"
+
+
+def test_deleting_a_running_job_cancels_it_first(client, stalled_source):
+    job_id = client.post("/api/generate", json=_payload(name="deleted_map")).json()["map_id"]
+    _running(client, job_id)
+
+    assert client.delete(f"/api/jobs/{job_id}").status_code == 200
+    assert client.get(f"/api/status/{job_id}").status_code == 404
+
+
 # -- data sources ---------------------------------------------------------------
 
 
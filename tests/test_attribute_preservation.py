@@ -65,6 +65,30 @@ def test_measure_widths_distinguishes_a_wide_road_from_a_narrow_one():
     assert wide_width > narrow_width * 3
 
 
+def test_widths_of_many_polylines_are_measured_in_one_pass():
+    """Each polyline gets the median of its own samples, whatever its neighbours."""
+    extractor = ContourExtractor()
+    mask = np.zeros((40, 40), np.uint8)
+    mask[5:12, :] = 255  # 7 px band
+    mask[20:23, :] = 255  # 3 px band
+
+    polylines = [
+        np.array([[x, 8] for x in range(5, 35)]).reshape(-1, 1, 2),
+        np.array([[x, 21] for x in range(5, 35)]),
+        np.array([[60, -5]]),  # off the image: clamped to the edge
+        np.array([[10, 8], [10, 21]]),  # even count: the mean of both
+    ]
+    widths = extractor.measure_widths(mask, polylines)
+
+    assert widths == [
+        extractor.measure_widths(mask, [polyline])[0] for polyline in polylines
+    ]
+    assert widths[0] > widths[1] * 1.5
+    assert widths[2] == 1.0
+    assert widths[3] == pytest.approx((widths[0] + widths[1]) / 2, abs=0.5)
+    assert extractor.measure_widths(mask, []) == []
+
+
 def test_measured_width_beats_a_fixed_guess(tools):
     """
     The regression.
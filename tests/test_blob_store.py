@@ -0,0 +1,134 @@
+"""Content-addressed artefact store: deduplication, reference counting, pruning."""
+
+from __future__ import annotations
+
+import os
+import time
+
+import pytest
+
+from services.blob_store import BlobStore
+from services.jobs import JobStatus, JobStore
+
+
+@pytest.fixture
+def blobs(tmp_path):
+    return BlobStore(tmp_path / "blobs")
+
+
+def write(path, payload: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(payload)
+    return path
+
+
+def test_identical_content_is_stored_once(tmp_path, blobs):
+    first = blobs.put(write(tmp_path / "a" / "map.zip", b"same bytes"))
+    second = blobs.put(write(tmp_path / "b" / "other.ZIP", b"same bytes"))
+
+    assert first == second
+    assert first.suffix == ".zip"
+    assert first.read_bytes() == b"same bytes"
+    assert blobs.references(first) == 2
+    assert not (tmp_path / "a" / "map.zip").exists()
+    assert not (tmp_path / "b" / "other.ZIP").exists()
+
+
+def test_blob_is_deleted_with_its_last_reference(tmp_path, blobs):
+    blob = blobs.put(write(tmp_path / "1.png", b"png"))
+    blobs.put(write(tmp_path / "2.png", b"png"))
+
+    assert not blobs.release(blob)
+    assert blob.exists()
+    assert blobs.release(blob)
+    assert not blob.exists()
+
+
+def test_keep_source_leaves_the_original_in_place(tmp_path, blobs):
+    source = write(tmp_path / "out" / "map.zip", b"archive")
+
+    blob = blobs.put(source, keep_source=True)
+    # The exporter replaces its copy atomically; the blob must not follow.
+    replacement = write(tmp_path / "out" / "next.zip", b"changed")
+    os.replace(replacement, source)
+
+    assert source.read_bytes() == b"changed"
+    assert blob.read_bytes() == b"archive"
+
+
+def test_prune_removes_only_old_unreferenced_blobs(tmp_path, blobs):
+    live = blobs.put(write(tmp_path / "live.bin", b"live"))
+    orphan = blobs.put(write(tmp_path / "orphan.bin", b"orphan"))
+    blobs.release(orphan, delete=False)
+
+    assert blobs.prune(max_age_seconds=60) == 0
+    assert blobs.prune(max_age_seconds=60, now=time.time() + 120) == 1
+    assert live.exists()
+    assert not orphan.exists()
+
+
+def test_label_finds_its_blobs_and_holds_them_while_used(tmp_path, blobs):
+    archive = blobs.put(write(tmp_path / "map.zip", b"archive"))
+    manifest = blobs.put(write(tmp_path / "manifest.json", b"{}"))
+    blobs.label("build", {"archive": archive, "manifest": manifest})
+
+    found = blobs.labelled("build")
+    assert found == {"archive": archive, "manifest": manifest}
+    assert blobs.references(archive) == 2
+
+    blobs.release(archive)  # the job that produced it goes away
+    assert archive.exists()
+    blobs.release(found["archive"])
+    assert not archive.exists()
+    assert blobs.labelled("build") is None
+    assert blobs.labelled("unknown") is None
+
+
+def test_prune_drops_labels_of_deleted_blobs(tmp_path, blobs):
+    kept = blobs.put(write(tmp_path / "kept.zip", b"kept"))
+    gone = blobs.put(write(tmp_path / "gone.zip", b"gone"))
+    blobs.label("kept", {"archive": kept})
+    blobs.label("gone", {"archive": gone})
+    blobs.release(gone)
+
+    blobs.prune(max_age_seconds=60)
+
+    assert [label.stem for label in (blobs.root / "labels").glob("*.json")] == ["kept"]
+
+
+def test_label_names_cannot_leave_the_store(blobs):
+    with pytest.raises(ValueError):
+        blobs.label("../escape", {})
+
+
+def test_shared_artefact_survives_until_every_job_is_cleaned_up(tmp_path, blobs):
+    store = JobStore(retention_seconds=60, blobs=blobs)
+    old, new = store.create("m"), store.create("m")
+    first = store.store_artifact(old.job_id, "archive", write(tmp_path / "1.zip", b"zip"))
+    second = store.store_artifact(new.job_id, "archive", write(tmp_path / "2.zip", b"zip"))
+    assert first == second
+
+    store.update(old.job_id, status=JobStatus.COMPLETED)
+    assert store.cleanup_expired(now=time.time() + 120) == 1
+    assert second.exists(), "still referenced by the running job"
+
+    store.update(new.job_id, status=JobStatus.COMPLETED)
+    store.cleanup_expired(now=time.time() + 240)
+    assert not second.exists()
+
+
+def test_artefact_stored_after_the_job_expired_is_not_leaked(tmp_path, blobs):
+    store = JobStore(blobs=blobs)
+
+    blob = store.store_artifact("gone", "archive", write(tmp_path / "x.zip", b"zip"))
+
+    assert blobs.references(blob) == 0
+    assert not blob.exists()
+
+
+def test_store_artifact_without_a_blob_store_attaches_in_place(tmp_path, job_store):
+    job = job_store.create("m")
+    path = write(tmp_path / "m.zip", b"zip")
+
+    assert job_store.store_artifact(job.job_id, "archive", path) == path
+    assert job_store.get(job.job_id).artifacts["archive"] == path
@@ -0,0 +1,263 @@
+"""Cooperative cancellation: tokens, abandonable calls, and where jobs stop."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from core.cancellation import (
+    CancellationToken,
+    JobCancelledError,
+    await_cancellable,
+    cancellation_scope,
+    check_cancelled,
+    is_superseded,
+    run_abandonable,
+)
+from models.map_request import MapGenerationRequest
+from services.data_sources.base import Capability, DataSourceInterface, stream_request
+from services.export.zip_writer import write_zip
+from services.jobs import JobStatus, JobStore
+from services.pipeline import MapGenerationPipeline
+from services.terrain.processor import TerrainProcessor
+
+
+class BlockingSource(DataSourceInterface):
+    """A DEM download that hangs until released, like a stalled HTTP request."""
+
+    capabilities = frozenset({Capability.DEM})
+
+    def __init__(self) -> None:
+        super().__init__({})
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def get_dem_data(self, bbox, resolution=30):
+        self.entered.set()
+        self.release.wait(10)
+        return np.zeros((64, 64), dtype=np.float32), {"resolution": resolution}
+
+    def get_satellite_image(self, bbox, resolution=10):
+        raise NotImplementedError
+
+    def test_connection(self):
+        return True
+
+    def requires_setup(self):
+        return False
+
+    def get_source_name(self):
+        return "Blocking DEM"
+
+
+def cancelled_token() -> CancellationToken:
+    token = CancellationToken()
+    token.cancel()
+    return token
+
+
+def cancel_later(token: CancellationToken, delay: float = 0.1) -> None:
+    threading.Timer(delay, token.cancel).start()
+
+
+def test_check_cancelled_does_nothing_outside_a_job():
+    check_cancelled()
+
+
+def test_check_cancelled_raises_once_the_token_fires():
+    token = CancellationToken()
+    with cancellation_scope(token):
+        check_cancelled()
+        token.cancel()
+        with pytest.raises(JobCancelledError):
+            check_cancelled()
+    check_cancelled()  # the scope has ended
+
+
+def test_a_child_token_stops_with_its_parent_but_not_the_reverse():
+    parent = CancellationToken()
+    child = CancellationToken(parent=parent)
+    child.cancel()
+    assert child.cancelled and not parent.cancelled
+
+    child = CancellationToken(parent=parent)
+    parent.cancel()
+    assert child.cancelled
+    assert child.wait(timeout=1.0)
+
+
+def test_superseding_cancels_the_job_and_its_branches():
+    parent = CancellationToken()
+    child = CancellationToken(parent=parent)
+    with cancellation_scope(child):
+        assert not is_superseded()
+        parent.supersede()
+        assert is_superseded()
+        with pytest.raises(JobCancelledError):
+            check_cancelled()
+    assert not is_superseded()
+
+
+def test_cancellation_is_not_swallowed_by_broad_handlers():
+    with cancellation_scope(cancelled_token()), pytest.raises(JobCancelledError):
+        try:
+            check_cancelled()
+        except Exception:  # noqa: BLE001 - what the degrade paths do
+            pytest.fail("cancellation was caught as an ordinary error")
+
+
+def test_abandonable_calls_return_results_and_raise_errors():
+    def explode() -> None:
+        raise ValueError("boom")
+
+    with cancellation_scope(CancellationToken()):
+        assert run_abandonable(lambda a, b: a + b, 2, b=3) == 5
+        with pytest.raises(ValueError, match="boom"):
+            run_abandonable(explode)
+
+
+def test_a_blocked_call_is_abandoned_within_a_second_of_cancelling():
+    release = threading.Event()
+    token = CancellationToken()
+    cancel_later(token)
+
+    started = time.monotonic()
+    with cancellation_scope(token), pytest.raises(JobCancelledError):
+        run_abandonable(release.wait, 30)
+
+    assert time.monotonic() - started < 1.0
+    release.set()
+
+
+def test_the_abandoned_call_still_sees_the_token():
+    seen: list[bool] = []
+    token = CancellationToken()
+
+    def work() -> None:
+        token.wait(5)
+        try:
+            check_cancelled()
+        except JobCancelledError:
+            seen.append(True)
+            raise
+
+    cancel_later(token)
+    with cancellation_scope(token), pytest.raises(JobCancelledError):
+        run_abandonable(work)
+    deadline = time.monotonic() + 5
+    while not seen and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert seen == [True]
+
+
+def test_cancelling_an_awaitable_cancels_the_underlying_task():
+    outcome: list[str] = []
+
+    async def request() -> None:
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            outcome.append("aborted")
+            raise
+
+    token = CancellationToken()
+    cancel_later(token)
+    with cancellation_scope(token), pytest.raises(JobCancelledError):
+        asyncio.run(await_cancellable(request()))
+
+    assert outcome == ["aborted"]
+
+
+def test_a_cancelled_download_stops_reading_and_hangs_up(monkeypatch):
+    class EndlessDem:
+        """A response whose body never ends, as a huge DEM would seem to."""
+
+        closed = False
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info) -> None:
+            self.closed = True
+
+        def iter_content(self, chunk_size: int):
+            while True:
+                time.sleep(0.01)
+                yield b"\0" * chunk_size
+
+    response = EndlessDem()
+    monkeypatch.setattr("requests.request", lambda *args, **kwargs: response)
+    token = CancellationToken()
+    cancel_later(token, delay=0.2)
+
+    started = time.monotonic()
+    with cancellation_scope(token), pytest.raises(JobCancelledError):
+        stream_request("GET", "https://portal.opentopography.org/API/globaldem")
+
+    assert time.monotonic() - started < 1.0
+    assert response.closed
+
+
+# -- where jobs stop ------------------------------------------------------------
+
+
+def test_cancelling_a_stalled_download_cancels_the_job_promptly(settings, monkeypatch):
+    source = BlockingSource()
+    monkeypatch.setattr(
+        "services.pipeline.MapGenerationPipeline._resolve_dem_source",
+        staticmethod(lambda _source_id: source),
+    )
+    store = JobStore()
+    pipeline = MapGenerationPipeline(store, settings)
+    job = store.create("cancelled_map")
+    request = MapGenerationRequest(
+        name="cancelled_map",
+        bbox={"min_lat": 37.7749, "max_lat": 37.8049, "min_lon": -122.4294, "max_lon": -122.3994},
+        heightmap_size=256,
+    )
+    token = CancellationToken()
+
+    def run() -> None:
+        with cancellation_scope(token):
+            pipeline.run(job.job_id, request)
+
+    worker = threading.Thread(target=run)
+    worker.start()
+    assert source.entered.wait(5)
+    token.cancel()
+    worker.join(timeout=1.0)
+
+    assert not worker.is_alive(), "the job did not stop within a second"
+    assert store.get(job.job_id).status is JobStatus.CANCELLED
+    source.release.set()
+
+
+def test_banded_resample_matches_ndimage_zoom():
+    from scipy import ndimage
+
+    elevation = np.random.default_rng(7).random((300, 317)).astype(np.float32) * 500
+    for method, order in (("nearest", 0), ("bilinear", 1), ("bicubic", 3)):
+        expected = ndimage.zoom(elevation, (600 / 300, 600 / 317), order=order)
+        assert np.array_equal(TerrainProcessor._resize_elevation(elevation, 600, method), expected)
+
+
+def test_resampling_stops_between_bands():
+    elevation = np.zeros((64, 64), dtype=np.float32)
+    with cancellation_scope(cancelled_token()), pytest.raises(JobCancelledError):
+        TerrainProcessor._resize_elevation(elevation, 1024, "bilinear")
+
+
+def test_a_cancelled_zip_write_leaves_nothing_behind(tmp_path):
+    staging = tmp_path / "staging"
+    staging.mkdir()
+    source = staging / "terrain.bin"
+    source.write_bytes(np.random.default_rng(3).bytes(3 * 1024 * 1024))
+
+    with cancellation_scope(cancelled_token()), pytest.raises(JobCancelledError):
+        write_zip(staging / "map.zip", [("terrain.bin", source)], workers=2)
+
+    assert [path.name for path in staging.iterdir()] == ["terrain.bin"]
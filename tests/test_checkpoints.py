@@ -0,0 +1,104 @@
+"""Stage checkpoints: round trip, invalidation, and tolerance of damaged state."""
+
+from __future__ import annotations
+
+import json
+import time
+
+import numpy as np
+
+from services.checkpoints import CheckpointStore
+
+
+def store(tmp_path, max_age_seconds=3600):
+    return CheckpointStore(tmp_path / "checkpoints", max_age_seconds=max_age_seconds)
+
+
+def test_arrays_and_metadata_round_trip(tmp_path):
+    checkpoints = store(tmp_path)
+    key = checkpoints.key("heightmap", "terrain-key", 1024)
+    heightmap = np.arange(64, dtype=np.uint16).reshape(8, 8)
+
+    checkpoints.save("heightmap", key, {"heightmap": heightmap}, {"bbox": [0.0, 1.0, 2.0, 3.0]})
+    restored = checkpoints.load("heightmap", key)
+
+    assert restored is not None
+    assert restored.arrays["heightmap"].dtype == np.uint16
+    assert np.array_equal(restored.arrays["heightmap"], heightmap)
+    assert restored.metadata == {"bbox": [0.0, 1.0, 2.0, 3.0]}
+
+
+def test_key_depends_on_every_input():
+    base = CheckpointStore.key("fetch_dem", "OpenTopography", [0, 0, 1, 1], 30)
+
+    assert base == CheckpointStore.key("fetch_dem", "OpenTopography", [0, 0, 1, 1], 30)
+    assert base != CheckpointStore.key("fetch_dem", "OpenTopography", [0, 0, 1, 1], 10)
+    assert base != CheckpointStore.key("fetch_dem", "AWS Terrain", [0, 0, 1, 1], 30)
+    assert base != CheckpointStore.key("process_terrain", "OpenTopography", [0, 0, 1, 1], 30)
+
+
+def test_a_new_checkpoint_replaces_the_stage_s_old_one(tmp_path):
+    checkpoints = store(tmp_path)
+    checkpoints.save("fetch_dem", "old", {"dem": np.zeros((2, 2))})
+    checkpoints.save("fetch_dem", "new", {"dem": np.ones((2, 2))})
+    checkpoints.save("heightmap", "other", {"heightmap": np.zeros((2, 2))})
+
+    assert checkpoints.load("fetch_dem", "old") is None
+    assert checkpoints.load("fetch_dem", "new") is not None
+    assert checkpoints.load("heightmap", "other") is not None
+
+
+def test_incomplete_or_damaged_checkpoints_are_misses(tmp_path):
+    checkpoints = store(tmp_path)
+    checkpoints.save("fetch_dem", "k", {"dem": np.zeros((4, 4))})
+    directory = tmp_path / "checkpoints" / "fetch_dem-k"
+
+    (directory / "dem.npy").write_bytes(b"\x93NUMPY truncated")
+    assert checkpoints.load("fetch_dem", "k") is None
+
+    (directory / "meta.json").unlink()
+    assert checkpoints.load("fetch_dem", "k") is None
+
+
+def test_expired_checkpoints_are_ignored(tmp_path):
+    checkpoints = store(tmp_path, max_age_seconds=60)
+    checkpoints.save("fetch_dem", "k", {"dem": np.zeros((2, 2))})
+    meta_path = tmp_path / "checkpoints" / "fetch_dem-k" / "meta.json"
+    meta = json.loads(meta_path.read_text())
+    meta["created_at"] = time.time() - 120
+    meta_path.write_text(json.dumps(meta))
+
+    assert checkpoints.load("fetch_dem", "k") is None
+
+
+def test_unserialisable_provider_metadata_is_stored_as_text(tmp_path):
+    checkpoints = store(tmp_path)
+
+    checkpoints.save("fetch_dem", "k", {"dem": np.zeros((2, 2))}, {"transform": object(), "resolution": 30})
+
+    metadata = checkpoints.load("fetch_dem", "k").metadata
+    assert metadata["resolution"] == 30
+    assert isinstance(metadata["transform"], str)
+
+
+def test_a_failed_save_is_not_fatal(tmp_path):
+    blocker = tmp_path / "checkpoints"
+    blocker.write_text("not a directory")
+
+    CheckpointStore(blocker, max_age_seconds=60).save("fetch_dem", "k", {"dem": np.zeros((2, 2))})
+
+    assert blocker.read_text() == "not a directory"
+
+
+def test_values_that_cannot_be_stored_are_not_fatal(tmp_path):
+    checkpoints = store(tmp_path)
+    checkpoints.save("heightmap", "k", {"ok": np.zeros((2, 2))})
+
+    # An object array needs pickling; a tuple key is not JSON.
+    checkpoints.save("heightmap", "k2", {"bad": np.array([object()])})
+    checkpoints.save("heightmap", "k3", {"ok": np.zeros((2, 2))}, {(1, 2): "tuple key"})
+
+    assert checkpoints.load("heightmap", "k2") is None
+    assert checkpoints.load("heightmap", "k3") is None
+    assert checkpoints.load("heightmap", "k") is not None
+    assert not list(tmp_path.glob("**/*.partial"))
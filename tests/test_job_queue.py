@@ -0,0 +1,405 @@
+"""Worker mode: the SQLite queue backend, the shared job store, dispatching and workers."""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+
+import pytest
+
+from core.cancellation import JobCancelledError, check_cancelled
+from models.map_request import MapGenerationRequest
+from services.job_queue import CancelOutcome, Lease, QueueBackendError, open_backend
+from services.job_queue.dispatcher import QueueDispatcher
+from services.job_queue.sqlite_backend import SqliteJobBackend
+from services.job_queue.worker import MAX_ATTEMPTS, QueueWorker
+from services.jobs import JobStatus, JobStore
+from services.scheduler import QueueFullError
+
+
+def make_request() -> MapGenerationRequest:
+    return MapGenerationRequest(
+        name="queued_map",
+        bbox={"min_lat": 37.7749, "max_lat": 37.8049, "min_lon": -122.4294, "max_lon": -122.3994},
+        heightmap_size=256,
+    )
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SqliteJobBackend(tmp_path / "queue" / "jobs.db")
+    yield backend
+    backend.close()
+
+
+def shared_store(backend: SqliteJobBackend) -> JobStore:
+    """A job store as the API or a worker process would set it up."""
+    store = JobStore()
+    store.shared = backend
+    return store
+
+
+class HeldPipeline:
+    """Stands in for the pipeline: reports progress, then waits to be released."""
+
+    def __init__(self, job_store: JobStore) -> None:
+        self.job_store = job_store
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, job_id: str, _request: MapGenerationRequest) -> None:
+        self.job_store.update(job_id, status=JobStatus.PROCESSING, progress=40, message="Working")
+        self.started.set()
+        deadline = time.monotonic() + 10
+        while not self.release.wait(0.01):
+            check_cancelled()
+            assert time.monotonic() < deadline, "test never released the job"
+        self.job_store.update(job_id, status=JobStatus.COMPLETED, progress=100)
+
+
+class FlakyBackend(SqliteJobBackend):
+    """A backend whose lease renewals fail ``failures`` times, like a database blip."""
+
+    def __init__(self, path, failures: int) -> None:
+        super().__init__(path)
+        self.failures = failures
+        self.renewals = 0
+
+    def renew(self, job_id: str, worker_id: str, lease_seconds: float = 60) -> Lease:
+        self.renewals += 1
+        if self.failures:
+            self.failures -= 1
+            raise QueueBackendError("database is locked")
+        return super().renew(job_id, worker_id, lease_seconds)
+
+
+def wait_for_status(store: JobStore, job_id: str, status: JobStatus) -> None:
+    deadline = time.monotonic() + 10
+    while store.get(job_id).status is not status:
+        assert time.monotonic() < deadline, f"job never became {status}"
+        time.sleep(0.02)
+
+
+# -- backend ------------------------------------------------------------------
+
+
+def test_jobs_are_claimed_in_submission_order_and_only_once(backend):
+    for job_id in ("first", "second"):
+        backend.enqueue(job_id, {"name": job_id})
+
+    assert backend.claim("worker-a").job_id == "first"
+    assert backend.claim("worker-b").job_id == "second"
+    assert backend.claim("worker-c") is None
+
+
+def test_an_expired_lease_returns_the_job_to_the_queue(backend):
+    backend.enqueue("job", {})
+    backend.claim("dead-worker", lease_seconds=-1)
+
+    taken_over = backend.claim("live-worker")
+
+    assert taken_over.job_id == "job"
+    assert taken_over.attempt == 2
+    assert backend.renew("job", "dead-worker") is Lease.LOST
+    assert backend.renew("job", "live-worker") is Lease.HELD
+
+
+def test_only_the_lease_holder_completes_a_job(backend):
+    backend.enqueue("job", {})
+    backend.claim("dead-worker", lease_seconds=-1)
+    backend.claim("live-worker")
+
+    backend.complete("job", "dead-worker")
+    assert backend.renew("job", "live-worker") is Lease.HELD
+    backend.complete("job", "live-worker")
+    assert backend.cancel("job") is CancelOutcome.NOT_FOUND
+
+
+def test_cancelling_dequeues_a_waiting_job_and_signals_a_running_one(backend):
+    backend.enqueue("waiting", {})
+    backend.enqueue("running", {})
+    backend.claim("worker")  # takes "waiting"
+    backend.enqueue("later", {})
+
+    assert backend.cancel("later") is CancelOutcome.DEQUEUED
+    assert backend.cancel("waiting") is CancelOutcome.SIGNALLED
+    assert backend.renew("waiting", "worker") is Lease.CANCELLED
+    assert backend.waiting() == ["running"]
+
+
+def test_expired_jobs_are_found_through_an_index(backend):
+    backend.save_job({"job_id": "old", "status": "completed", "created_at": 1.0, "finished_at": 5.0})
+    backend.save_job({"job_id": "new", "status": "completed", "created_at": 2.0, "finished_at": 50.0})
+    backend.save_job({"job_id": "running", "status": "processing", "created_at": 3.0})
+
+    assert backend.expired_jobs(10.0) == ["old"]
+    assert [record["job_id"] for record in backend.list_jobs(status="completed")] == ["new", "old"]
+    plan = backend._connection().execute(
+        "EXPLAIN QUERY PLAN SELECT job_id FROM jobs WHERE finished_at IS NOT NULL AND finished_at <= 10"
+    ).fetchall()
+    assert "jobs_by_finish" in str(plan)
+
+
+def test_only_the_first_outcome_of_a_job_is_recorded(backend):
+    running = {"job_id": "job", "status": "processing", "created_at": 1.0}
+    backend.save_job(running)
+
+    assert backend.finish_job({**running, "status": "completed", "finished_at": 2.0})
+    assert not backend.finish_job({**running, "status": "cancelled", "finished_at": 3.0})
+    assert not backend.finish_job({**running, "job_id": "deleted", "finished_at": 3.0})
+    assert backend.load_job("job")["status"] == "completed"
+    assert backend.load_job("deleted") is None
+
+
+def test_open_backend_understands_sqlite_urls(tmp_path):
+    backend = open_backend("sqlite:///state/jobs.db", base_dir=tmp_path)
+    backend.close()
+    assert (tmp_path / "state" / "jobs.db").exists()
+
+    with pytest.raises(QueueBackendError, match="Unsupported"):
+        open_backend("amqp://localhost", base_dir=tmp_path)
+
+
+def test_a_redis_url_without_the_client_library_says_how_to_fix_it(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "redis", None)
+    with pytest.raises(QueueBackendError, match="pip install redis"):
+        open_backend("redis://localhost:6379/0", base_dir=tmp_path)
+
+
+# -- shared job store -----------------------------------------------------------
+
+
+def test_a_shared_store_sees_changes_made_by_another_process(backend, tmp_path):
+    api, worker = shared_store(backend), shared_store(backend)
+    job = api.create("queued_map", result_key="key")
+
+    archive = tmp_path / "map.zip"
+    archive.write_bytes(b"zip")
+    worker.update(job.job_id, status=JobStatus.COMPLETED, progress=100, stats={"roads": 3})
+    worker.attach_artifact(job.job_id, "archive", archive)
+
+    seen = api.get(job.job_id)
+    assert seen.status is JobStatus.COMPLETED
+    assert seen.stats == {"roads": 3}
+    assert seen.to_dict()["download_url"] == f"/api/download/{job.job_id}"
+    assert api.create_or_reuse("queued_map", "key") == (seen, True)
+    assert len(api) == 1 and api.active_count() == 0
+
+
+def test_discarding_or_expiring_a_shared_job_removes_it_everywhere(backend):
+    api, worker = shared_store(backend), shared_store(backend)
+    discarded = api.create("queued_map")
+    expired = api.create("queued_map")
+    worker.update(expired.job_id, status=JobStatus.FAILED)
+
+    api.discard(discarded.job_id)
+    assert api.cleanup_expired(now=time.time() + api.retention_seconds + 1) == 1
+
+    assert worker.get(discarded.job_id) is None
+    assert worker.get(expired.job_id) is None
+    assert backend.list_jobs() == []
+
+
+def test_a_shared_store_pages_what_other_processes_recorded(backend):
+    api, worker = shared_store(backend), shared_store(backend)
+    older, newer = worker.create("older"), worker.create("newer")
+    worker.update(older.job_id, status=JobStatus.COMPLETED)
+
+    first = api.page(limit=1)
+    assert [job.job_id for job in first.jobs] == [newer.job_id]
+    assert [job.job_id for job in api.page(limit=1, before=first.next_before).jobs] == [older.job_id]
+    assert [job.job_id for job in api.page(limit=5, status=JobStatus.COMPLETED).jobs] == [older.job_id]
+    assert first.version is None
+
+
+def test_a_shared_store_counts_and_pages_without_reading_every_record(tmp_path):
+    class UnlistableBackend(SqliteJobBackend):
+        def list_jobs(self, *, status=None):
+            raise AssertionError("read every record")
+
+    backend = UnlistableBackend(tmp_path / "jobs.db")
+    store = shared_store(backend)
+    jobs = [store.create(f"map_{index}") for index in range(7)]
+    for job in jobs[:3]:
+        store.update(job.job_id, status=JobStatus.COMPLETED)
+    # Jobs created in the same instant are ordered by id.
+    for job in jobs[3:]:
+        backend.save_job({**backend.load_job(job.job_id), "created_at": 1.0})
+
+    assert len(store) == 7
+    counts = store.status_counts()
+    assert (counts[JobStatus.COMPLETED], counts[JobStatus.QUEUED]) == (3, 4)
+
+    seen, before = [], None
+    while True:
+        page = store.page(limit=2, before=before)
+        seen += [job.job_id for job in page.jobs]
+        if page.next_before is None:
+            break
+        before = page.next_before
+    expected = sorted(jobs, key=lambda job: store.get(job.job_id).order_key, reverse=True)
+    assert seen == [job.job_id for job in expected]
+    assert [job.job_id for job in store.page(limit=5, name="MAP_5").jobs] == [jobs[5].job_id]
+    backend.close()
+
+
+# -- dispatcher and worker ------------------------------------------------------
+
+
+def test_a_worker_runs_what_the_api_queued(backend):
+    api, worker_store = shared_store(backend), shared_store(backend)
+    dispatcher = QueueDispatcher(backend, api)
+    pipeline = HeldPipeline(worker_store)
+    worker = QueueWorker(backend, pipeline, worker_store, worker_id="w", poll_seconds=0.02)
+
+    job = api.create("queued_map")
+    assert dispatcher.submit(job.job_id, make_request()) == 1
+    assert api.get(job.job_id).queue_position == 1
+
+    worker.start()
+    try:
+        assert pipeline.started.wait(5)
+        assert api.get(job.job_id).progress == 40
+        pipeline.release.set()
+        wait_for_status(api, job.job_id, JobStatus.COMPLETED)
+    finally:
+        worker.stop()
+    assert len(dispatcher) == 0
+    assert backend.claim("anyone") is None
+
+
+def test_the_queue_is_bounded(backend):
+    api = shared_store(backend)
+    dispatcher = QueueDispatcher(backend, api, max_queued=1)
+    dispatcher.submit(api.create("queued_map").job_id, make_request())
+
+    with pytest.raises(QueueFullError):
+        dispatcher.submit(api.create("queued_map").job_id, make_request())
+
+
+def test_cancelling_a_queued_job_through_the_dispatcher(backend):
+    api = shared_store(backend)
+    dispatcher = QueueDispatcher(backend, api)
+    first, second = api.create("queued_map"), api.create("queued_map")
+    dispatcher.submit(first.job_id, make_request())
+    dispatcher.submit(second.job_id, make_request())
+
+    assert dispatcher.cancel(first.job_id)
+
+    assert api.get(first.job_id).status is JobStatus.CANCELLED
+    assert api.get(second.job_id).queue_position == 1
+    assert dispatcher.position(second.job_id) == 1
+    assert not dispatcher.cancel(first.job_id)
+
+
+def test_cancelling_a_running_job_stops_its_worker(backend):
+    api, worker_store = shared_store(backend), shared_store(backend)
+    dispatcher = QueueDispatcher(backend, api)
+    pipeline = HeldPipeline(worker_store)
+    worker = QueueWorker(
+        backend, pipeline, worker_store, worker_id="w", heartbeat_seconds=0.05, poll_seconds=0.02
+    )
+    job = api.create("queued_map")
+    dispatcher.submit(job.job_id, make_request())
+
+    worker.start()
+    try:
+        assert pipeline.started.wait(5)
+        assert dispatcher.cancel(job.job_id)
+        assert dispatcher.wait_stopped(job.job_id, timeout=5)
+    finally:
+        worker.stop()
+    assert api.get(job.job_id).status is JobStatus.CANCELLED
+
+
+def test_a_worker_that_lost_its_lease_leaves_the_job_to_its_new_owner(backend):
+    api, stale_store = shared_store(backend), shared_store(backend)
+    job = api.create("queued_map")
+    QueueDispatcher(backend, api).submit(job.job_id, make_request())
+    pipeline = HeldPipeline(stale_store)
+
+    def run(job_id: str, request: MapGenerationRequest) -> None:
+        # Records its own cancellation, as the real pipeline does.
+        try:
+            pipeline(job_id, request)
+        except JobCancelledError:
+            stale_store.update(job_id, status=JobStatus.CANCELLED, message="Cancelled")
+
+    stale = QueueWorker(
+        backend, run, stale_store, worker_id="stale", lease_seconds=0.1, heartbeat_seconds=0.5
+    )
+    runner = threading.Thread(target=stale.run_once)
+    runner.start()
+    assert pipeline.started.wait(5)
+    time.sleep(0.2)  # the lease runs out before the first renewal
+    assert backend.claim("owner").job_id == job.job_id
+    api.update(job.job_id, progress=10, message="Taken over")
+    runner.join(5)
+    assert not runner.is_alive()
+
+    current = api.get(job.job_id)
+    assert current.status is JobStatus.PROCESSING
+    assert (current.progress, current.message) == (10, "Taken over")
+    assert current.stats == {}
+
+
+def test_a_failed_renewal_is_retried_on_the_next_beat(tmp_path):
+    backend = FlakyBackend(tmp_path / "jobs.db", failures=1)
+    api, worker_store = shared_store(backend), shared_store(backend)
+    job = api.create("queued_map")
+    QueueDispatcher(backend, api).submit(job.job_id, make_request())
+    pipeline = HeldPipeline(worker_store)
+    worker = QueueWorker(
+        backend, pipeline, worker_store, worker_id="w", lease_seconds=5, heartbeat_seconds=0.02
+    )
+
+    runner = threading.Thread(target=worker.run_once)
+    runner.start()
+    assert pipeline.started.wait(5)
+    deadline = time.monotonic() + 5
+    while backend.renewals < 3:
+        assert time.monotonic() < deadline, "the heartbeat stopped after the failure"
+        time.sleep(0.02)
+    pipeline.release.set()
+    runner.join(5)
+    backend.close()
+
+    assert api.get(job.job_id).status is JobStatus.COMPLETED
+
+
+def test_a_lease_that_cannot_be_renewed_for_its_whole_term_is_given_up(tmp_path):
+    backend = FlakyBackend(tmp_path / "jobs.db", failures=1000)
+    api, worker_store = shared_store(backend), shared_store(backend)
+    job = api.create("queued_map")
+    QueueDispatcher(backend, api).submit(job.job_id, make_request())
+    pipeline = HeldPipeline(worker_store)
+    worker = QueueWorker(
+        backend, pipeline, worker_store, worker_id="w", lease_seconds=0.2, heartbeat_seconds=0.02
+    )
+
+    runner = threading.Thread(target=worker.run_once)
+    runner.start()
+    runner.join(5)
+    backend.close()
+
+    assert not runner.is_alive()
+    # Another worker may own the job by now, so this one recorded nothing.
+    assert api.get(job.job_id).status is JobStatus.PROCESSING
+
+
+def test_a_job_that_keeps_killing_its_workers_is_given_up(backend):
+    api, worker_store = shared_store(backend), shared_store(backend)
+    job = api.create("queued_map")
+    QueueDispatcher(backend, api).submit(job.job_id, make_request())
+    for attempt in range(MAX_ATTEMPTS):
+        backend.claim(f"crashed-{attempt}", lease_seconds=-1)
+
+    ran: list[str] = []
+    worker = QueueWorker(backend, lambda job_id, _request: ran.append(job_id), worker_store)
+    assert worker.run_once()
+
+    assert ran == []
+    failed = api.get(job.job_id)
+    assert failed.status is JobStatus.FAILED
+    assert "given up" in failed.error
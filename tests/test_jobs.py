@@ -1,11 +1,27 @@
-"""Job registry: state transitions, artefact tracking, TTL cleanup, thread safety."""
+"""Job registry: state transitions, artefact tracking, TTL cleanup, thread safety, persistence."""
 
 from __future__ import annotations
 
+import asyncio
+import json
 import threading
 import time
 
-from services.jobs import GenerationJob, JobStatus, JobStore
+from services.blob_store import BlobStore
+from services.job_queue.sqlite_backend import SqliteJobBackend
+from services.jobs import PROGRESS_FLUSH_SECONDS, GenerationJob, JobStatus, JobStore
+
+
+class CountingDatabase(SqliteJobBackend):
+    """A job database that counts its write transactions."""
+
+    def __init__(self, path) -> None:
+        super().__init__(path)
+        self.writes = 0
+
+    def save_jobs(self, records) -> None:
+        self.writes += 1
+        super().save_jobs(records)
 
 
 def test_create_returns_unique_queued_jobs(job_store):
@@ -109,6 +125,103 @@ def test_concurrent_updates_do_not_lose_writes(job_store):
     assert len(job_store.get(job.job_id).stats) == thread_count
 
 
+def test_status_counts_follow_every_change(tmp_path):
+    store = JobStore(retention_seconds=60)
+    running, done, dropped = store.create("a"), store.create("b"), store.create("c")
+    store.update(running.job_id, status=JobStatus.PROCESSING)
+    store.update(done.job_id, status=JobStatus.COMPLETED)
+    store.discard(dropped.job_id)
+
+    counts = store.status_counts()
+    assert (counts[JobStatus.QUEUED], counts[JobStatus.PROCESSING], counts[JobStatus.COMPLETED]) == (0, 1, 1)
+    assert store.active_count() == 1
+
+    store.cleanup_expired(now=time.time() + 120)
+    assert store.status_counts()[JobStatus.COMPLETED] == 0
+    assert len(store) == 1
+
+
+def test_reads_and_other_jobs_do_not_wait_for_a_held_lock(job_store):
+    """Polls never queue behind the store lock, nor writers behind another job's lock."""
+    busy, other = job_store.create("busy"), job_store.create("other")
+    held, release = threading.Event(), threading.Event()
+
+    def hold(lock) -> None:
+        with lock:
+            held.set()
+            release.wait(10)
+
+    for lock in (job_store._lock, job_store._job_lock(busy.job_id)):
+        if lock is job_store._job_lock(other.job_id):
+            continue  # The two ids happen to share a stripe.
+        held.clear()
+        release.clear()
+        holder = threading.Thread(target=hold, args=(lock,))
+        holder.start()
+        held.wait(5)
+        try:
+            assert job_store.get(busy.job_id).job_id == busy.job_id
+            assert job_store.active_count() == 2
+            assert len(job_store) == 2
+            if lock is not job_store._lock:
+                assert job_store.update(other.job_id, progress=50).progress == 50
+        finally:
+            release.set()
+            holder.join()
+
+
+def test_concurrent_readers_and_writers_see_whole_jobs_and_lose_nothing():
+    """
+    Pollers against pipelines, each reporting progress on its own job.
+
+    With the old single lock every poll waited for whichever update held it.
+    What is asserted is correctness under contention: no update lost, every
+    read a whole job, counters exact. The rates are measured by
+    ``benchmarks/bench_jobs.py``.
+    """
+    store = JobStore()
+    writer_count, reader_count, updates = 4, 4, 200
+    jobs = [store.create(f"job_{index}") for index in range(writer_count)]
+    for job in jobs:
+        store.update(job.job_id, status=JobStatus.PROCESSING)
+    start = threading.Barrier(writer_count + reader_count)
+    writers_done = threading.Event()
+    reads = [0] * reader_count
+    torn: list[str] = []
+
+    def write(job_id: str) -> None:
+        start.wait()
+        for step in range(updates):
+            store.update(job_id, progress=step * 100 // updates, stats={f"step_{step % 50}": step})
+
+    def read(slot: int) -> None:
+        start.wait()
+        while not writers_done.is_set():
+            for job in jobs:
+                seen = store.get(job.job_id)
+                # A whole snapshot: a running job never shows a finish time.
+                if seen.finished_at is not None or seen.status is not JobStatus.PROCESSING:
+                    torn.append(seen.job_id)
+            store.active_count()
+            reads[slot] += 1
+
+    writers = [threading.Thread(target=write, args=(job.job_id,)) for job in jobs]
+    readers = [threading.Thread(target=read, args=(slot,)) for slot in range(reader_count)]
+    for thread in writers + readers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    writers_done.set()
+    for thread in readers:
+        thread.join()
+
+    assert torn == []
+    assert all(store.get(job.job_id).progress == (updates - 1) * 100 // updates for job in jobs)
+    assert all(len(store.get(job.job_id).stats) == 50 for job in jobs)
+    assert store.status_counts()[JobStatus.PROCESSING] == writer_count
+    assert sum(reads) > 0
+
+
 def test_job_status_terminality():
     assert JobStatus.COMPLETED.is_terminal
     assert JobStatus.FAILED.is_terminal
@@ -120,3 +233,222 @@ def test_job_status_terminality():
 def test_generation_job_serialises_stats():
     job = GenerationJob(job_id="abc", map_name="m", stats={"roads": 3})
     assert job.to_dict()["stats"] == {"roads": 3}
+
+
+def test_identical_request_attaches_to_the_running_job(job_store):
+    first, reused_first = job_store.create_or_reuse("m", "key")
+    job_store.update(first.job_id, status=JobStatus.PROCESSING)
+
+    second, reused_second = job_store.create_or_reuse("m", "key")
+
+    assert (reused_first, reused_second) == (False, True)
+    assert second.job_id == first.job_id
+    assert second.status is JobStatus.PROCESSING
+    assert len(job_store) == 1
+
+
+def test_finished_result_is_reused_while_its_archive_exists(job_store, tmp_path):
+    job, _ = job_store.create_or_reuse("m", "key")
+    archive = tmp_path / "m.zip"
+    archive.write_bytes(b"zip")
+    job_store.attach_artifact(job.job_id, "archive", archive)
+    job = job_store.update(job.job_id, status=JobStatus.COMPLETED)
+
+    assert job_store.create_or_reuse("m", "key") == (job, True)
+
+    archive.unlink()
+    replacement, reused = job_store.create_or_reuse("m", "key")
+    assert not reused
+    assert replacement.job_id != job.job_id
+
+
+def test_failed_jobs_and_unkeyed_requests_are_never_reused(job_store):
+    failed, _ = job_store.create_or_reuse("m", "key")
+    job_store.update(failed.job_id, status=JobStatus.FAILED)
+
+    retry, reused = job_store.create_or_reuse("m", "key")
+    assert not reused and retry.job_id != failed.job_id
+
+    assert not job_store.create_or_reuse("m", None)[1]
+    assert not job_store.create_or_reuse("m", None)[1]
+
+
+def test_cleanup_forgets_the_result_of_an_expired_job(tmp_path):
+    store = JobStore(retention_seconds=60)
+    job, _ = store.create_or_reuse("m", "key")
+    archive = tmp_path / "m.zip"
+    archive.write_bytes(b"zip")
+    store.attach_artifact(job.job_id, "archive", archive)
+    store.update(job.job_id, status=JobStatus.COMPLETED)
+
+    store.cleanup_expired(now=time.time() + 120)
+
+    assert store.create_or_reuse("m", "key")[1] is False
+
+
+def test_stage_lists_are_reported_and_cleared_on_completion(job_store):
+    job = job_store.create("m")
+    job_store.update(job.job_id, active_stages=["fetch_dem", "segment"], completed_stages=["validate"])
+
+    payload = job_store.get(job.job_id).to_dict()
+    assert payload["active_stages"] == ["fetch_dem", "segment"]
+    assert payload["completed_stages"] == ["validate"]
+
+    job_store.update(job.job_id, status=JobStatus.COMPLETED)
+    assert job_store.get(job.job_id).to_dict()["active_stages"] == []
+
+
+def test_pages_walk_back_from_the_newest_job(job_store):
+    jobs = [job_store.create(f"map_{index}") for index in range(5)]
+
+    first = job_store.page(limit=2)
+    second = job_store.page(limit=2, before=first.next_before)
+    last = job_store.page(limit=2, before=second.next_before)
+
+    walked = [job.job_id for page in (first, second, last) for job in page.jobs]
+    assert walked == [job.job_id for job in reversed(jobs)]
+    assert last.next_before is None
+
+
+def test_pages_filter_by_status_and_name(job_store):
+    mountain = job_store.create("Mountain_Pass")
+    job_store.create("coastline")
+    failed = job_store.create("mountain_lake")
+    job_store.update(failed.job_id, status=JobStatus.FAILED)
+
+    assert [job.job_id for job in job_store.page(limit=10, name="MOUNTAIN").jobs] == [
+        failed.job_id,
+        mountain.job_id,
+    ]
+    assert [job.job_id for job in job_store.page(limit=10, status=JobStatus.FAILED).jobs] == [
+        failed.job_id
+    ]
+
+
+def test_version_changes_with_any_job_and_removed_jobs_leave_the_listing(job_store):
+    kept, removed = job_store.create("kept"), job_store.create("removed")
+    version = job_store.version
+    assert job_store.version == version
+
+    job_store.update(kept.job_id, progress=10)
+    assert job_store.version != version
+
+    job_store.discard(removed.job_id)
+    assert [job.job_id for job in job_store.page(limit=10).jobs] == [kept.job_id]
+    assert JobStore().version != JobStore().version
+
+
+# -- persistence ----------------------------------------------------------------
+
+
+def test_finished_jobs_survive_a_restart(tmp_path):
+    blobs = BlobStore(tmp_path / "blobs")
+    before = JobStore(blobs=blobs)
+    before.open_database(SqliteJobBackend(tmp_path / "jobs.db"))
+    job, _ = before.create_or_reuse("m", "key")
+    source = tmp_path / "m.zip"
+    source.write_bytes(b"zip")
+    archive = before.store_artifact(job.job_id, "archive", source)
+    job = before.update(job.job_id, status=JobStatus.COMPLETED, progress=100, stats={"roads": 3})
+    before.close_database()
+
+    restarted_blobs = BlobStore(tmp_path / "blobs")
+    after = JobStore(blobs=restarted_blobs)
+    assert after.open_database(SqliteJobBackend(tmp_path / "jobs.db")) == 1
+
+    restored = after.get(job.job_id)
+    assert restored.to_dict() == job.to_dict()
+    assert restored.artifacts == {"archive": archive}
+    assert restarted_blobs.references(archive) == 1
+    assert after.create_or_reuse("m", "key") == (restored, True)
+    after.close_database()
+
+
+def test_progress_updates_are_written_in_batches(tmp_path):
+    database = CountingDatabase(tmp_path / "jobs.db")
+    store = JobStore()
+    store.open_database(database)
+    job = store.create("m")
+    store.update(job.job_id, status=JobStatus.PROCESSING)
+    writes = database.writes
+
+    for percent in range(1, 60):
+        store.update(job.job_id, status=JobStatus.PROCESSING, progress=percent)
+
+    assert database.writes == writes, "progress within one state waits for the next batch"
+    assert database.load_job(job.job_id)["progress"] == 0
+
+    store.flush()
+    assert database.load_job(job.job_id)["progress"] == 59
+
+    store.update(job.job_id, status=JobStatus.COMPLETED)
+    assert database.load_job(job.job_id)["status"] == "completed", "a new state is written at once"
+    store.close_database()
+
+
+def test_batched_progress_is_written_once_the_interval_passes(tmp_path, monkeypatch):
+    database = SqliteJobBackend(tmp_path / "jobs.db")
+    store = JobStore()
+    store.open_database(database)
+    job = store.create("m")
+    store.update(job.job_id, progress=10)
+
+    later = time.monotonic() + PROGRESS_FLUSH_SECONDS
+    monkeypatch.setattr("services.jobs.time.monotonic", lambda: later)
+    store.update(job.job_id, progress=20)
+
+    assert database.load_job(job.job_id)["progress"] == 20
+    store.close_database()
+
+
+def test_cleanup_removes_expired_jobs_from_the_database(tmp_path):
+    database = SqliteJobBackend(tmp_path / "jobs.db")
+    store = JobStore(retention_seconds=60)
+    store.open_database(database)
+    expired = store.create("old")
+    store.update(expired.job_id, status=JobStatus.FAILED)
+    running = store.create("running")
+    store.update(running.job_id, status=JobStatus.PROCESSING)
+
+    assert store.cleanup_expired(now=time.time() + 120) == 1
+
+    assert store.get(expired.job_id) is None
+    assert [record["job_id"] for record in database.list_jobs()] == [running.job_id]
+    store.close_database()
+
+
+# -- progress events --------------------------------------------------------------
+
+
+def test_a_burst_of_updates_reaches_each_watcher_as_its_newest_state(job_store):
+    job = job_store.create("streamed")
+
+    async def watch_burst():
+        loop = asyncio.get_running_loop()
+        first = job_store.events.subscribe(job.job_id, loop)
+        second = job_store.events.subscribe(job.job_id, loop)
+        for progress in (10, 20, 30):
+            job_store.update(job.job_id, status=JobStatus.PROCESSING, progress=progress)
+        assert await first.wait(1) and await second.wait(1)
+        return first.take(), second.take(), await first.wait(0.01)
+
+    seen_first, seen_second, more = asyncio.run(watch_burst())
+
+    assert json.loads(seen_first)["progress"] == 30
+    assert seen_second == seen_first
+    assert not more
+
+
+def test_watchers_hear_when_their_job_is_removed(job_store):
+    watched = job_store.create("watched")
+
+    async def watch_removal():
+        watch = job_store.events.subscribe(watched.job_id, asyncio.get_running_loop())
+        job_store.discard(watched.job_id)
+        assert await watch.wait(1)
+        job_store.events.unsubscribe(watch)
+        return watch.take()
+
+    assert asyncio.run(watch_removal()) is None
+    assert len(job_store.events) == 0
+    assert not job_store.events.watched(watched.job_id)
@@ -2,12 +2,18 @@
 
 from __future__ import annotations
 
+import re
+import time
+import zipfile
+
 import numpy as np
 import pytest
 
 from models.map_request import MapGenerationRequest
+from services.blob_store import BlobStore
 from services.data_sources.base import Capability, DataSourceInterface
-from services.jobs import JobStatus
+from services.export import zip_writer
+from services.jobs import JobStatus, JobStore
 from services.pipeline import (
     AI_STAGES,
     BASE_STAGES,
@@ -97,6 +103,38 @@ def test_progress_is_monotonic_with_ai_stages_enabled():
     assert seen[-1] == 99
 
 
+def test_concurrent_stages_are_reported_together():
+    seen = []
+    reporter = ProgressReporter(
+        BASE_STAGES[:2] + AI_STAGES, lambda percent, message: seen.append((percent, message))
+    )
+
+    reporter.start("fetch_dem")
+    reporter.start("segment")
+    assert seen[-1][1] == "Downloading elevation data + Detecting features with AI"
+
+    reporter.finish("fetch_dem")
+    reporter.close()
+    reporter.finish("segment")
+    assert len(seen) == 3, "nothing is reported after close()"
+
+
+def test_each_stage_is_measured_when_asked():
+    measured = {}
+    reporter = ProgressReporter(
+        BASE_STAGES, lambda *_: None, lambda key, figures: measured.__setitem__(key, figures)
+    )
+
+    reporter.start("validate")
+    time.sleep(0.01)
+    reporter.finish("validate")
+
+    figures = measured["validate"]
+    assert figures["wall_seconds"] >= 0.01
+    assert figures["cpu_seconds"] >= 0
+    assert measured.keys() == {"validate"}
+
+
 def test_unknown_stage_is_a_programming_error():
     reporter = ProgressReporter(BASE_STAGES, lambda *_: None)
     with pytest.raises(KeyError):
@@ -123,6 +161,133 @@ def test_pipeline_produces_an_archive(settings, job_store, sample_dem, monkeypat
     assert archive.exists()
     assert archive.suffix == ".zip"
     assert finished.artifacts["preview"].exists()
+    assert finished.active_stages == []
+    assert sorted(finished.completed_stages) == sorted(stage.key for stage in BASE_STAGES)
+
+
+def test_regenerating_a_map_reuses_the_stored_artefacts(settings, sample_dem, monkeypatch):
+    store = JobStore(blobs=BlobStore(settings.output_dir / "blobs"))
+    pipeline = MapGenerationPipeline(job_store=store, settings=settings)
+    monkeypatch.setattr(
+        MapGenerationPipeline, "_resolve_dem_source", staticmethod(lambda _s: FakeSource(sample_dem))
+    )
+
+    jobs = [store.create("pipeline_test") for _ in range(2)]
+    for job in jobs:
+        pipeline.run(job.job_id, make_request())
+
+    first, second = (store.get(job.job_id) for job in jobs)
+    assert first.status is second.status is JobStatus.COMPLETED, (first.error, second.error)
+    assert first.artifacts["archive"] == second.artifacts["archive"]
+    assert first.artifacts["preview"] == second.artifacts["preview"]
+    assert store.blobs.references(first.artifacts["archive"]) == 2
+
+
+def test_renamed_map_is_packaged_from_its_previous_archive(settings, sample_dem, monkeypatch):
+    store = JobStore(blobs=BlobStore(settings.output_dir / "blobs"))
+    pipeline = MapGenerationPipeline(job_store=store, settings=settings)
+    monkeypatch.setattr(
+        MapGenerationPipeline, "_resolve_dem_source", staticmethod(lambda _s: FakeSource(sample_dem))
+    )
+    first = store.create("pipeline_test")
+    pipeline.run(first.job_id, make_request())
+
+    compressed = []
+    original = zip_writer.deflate_chunk
+    monkeypatch.setattr(
+        zip_writer, "deflate_chunk", lambda data, *args: compressed.append(data) or original(data, *args)
+    )
+    renamed = store.create("renamed_map")
+    pipeline.run(renamed.job_id, make_request(name="renamed_map"))
+
+    finished = store.get(renamed.job_id)
+    assert finished.status is JobStatus.COMPLETED, finished.error
+    with zipfile.ZipFile(finished.artifacts["archive"]) as archive:
+        total = sum(info.file_size for info in archive.infolist())
+        assert any(name.startswith("levels/renamed_map/") for name in archive.namelist())
+    # Only the metadata that carries the name was compressed again.
+    assert 0 < sum(map(len, compressed)) < total // 10
+    assert not any((settings.output_dir / ".packaging").glob("*"))
+
+
+def test_result_key_identifies_the_output_not_the_submission(settings, job_store, monkeypatch):
+    pipeline = MapGenerationPipeline(job_store=job_store, settings=settings)
+
+    key = pipeline.result_key(make_request())
+    assert key == pipeline.result_key(make_request(name="Pipeline Test"))  # same slug
+    assert key != pipeline.result_key(make_request(heightmap_size=512))
+    assert key != pipeline.result_key(make_request(data_source="opentopography"))
+
+    monkeypatch.setattr("services.pipeline.APP_VERSION", "0.0.0")
+    assert key != pipeline.result_key(make_request())
+
+
+def test_result_key_does_not_resolve_the_source(settings, job_store, monkeypatch):
+    """Resolving ``auto`` probes providers over the network; the key is made on the event loop."""
+
+    def probe(_source_id):
+        raise AssertionError("result_key resolved the data source")
+
+    monkeypatch.setattr(MapGenerationPipeline, "_resolve_dem_source", staticmethod(probe))
+    monkeypatch.setattr("services.pipeline.DataSourceFactory.get_imagery_source", probe)
+
+    pipeline = MapGenerationPipeline(job_store=job_store, settings=settings)
+    assert pipeline.result_key(make_request(use_ai_segmentation=True)) is not None
+
+
+def test_a_retried_job_resumes_from_its_checkpoints(settings, job_store, sample_dem, monkeypatch):
+    """A failure while packaging must not repeat the download and resampling."""
+    calls = {"dem": 0, "heightmap": 0}
+    source = FakeSource(sample_dem)
+    original_fetch = source.get_dem_data
+
+    def counting_fetch(*args, **kwargs):
+        calls["dem"] += 1
+        return original_fetch(*args, **kwargs)
+
+    source.get_dem_data = counting_fetch
+    monkeypatch.setattr(MapGenerationPipeline, "_resolve_dem_source", staticmethod(lambda _s: source))
+    pipeline = MapGenerationPipeline(job_store=job_store, settings=settings)
+    original_heightmap = pipeline.terrain.generate_heightmap
+
+    def counting_heightmap(*args, **kwargs):
+        calls["heightmap"] += 1
+        return original_heightmap(*args, **kwargs)
+
+    monkeypatch.setattr(pipeline.terrain, "generate_heightmap", counting_heightmap)
+
+    def broken_export(*_args, **_kwargs):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr("services.pipeline.BeamNGExporter.create_map_structure", broken_export)
+        failed = job_store.create("pipeline_test")
+        pipeline.run(failed.job_id, make_request())
+    assert job_store.get(failed.job_id).status is JobStatus.FAILED
+
+    retry = job_store.create("pipeline_test")
+    pipeline.run(retry.job_id, make_request())
+
+    finished = job_store.get(retry.job_id)
+    assert finished.status is JobStatus.COMPLETED, finished.error
+    assert calls == {"dem": 1, "heightmap": 1}
+    assert finished.stats["resumed_stages"] == ["fetch_dem", "process_terrain", "heightmap"]
+
+
+def test_changed_inputs_rerun_only_the_affected_stages(settings, job_store, sample_dem, monkeypatch):
+    fetches = []
+    source = FakeSource(sample_dem)
+    original_fetch = source.get_dem_data
+    source.get_dem_data = lambda *a, **k: fetches.append(1) or original_fetch(*a, **k)
+    monkeypatch.setattr(MapGenerationPipeline, "_resolve_dem_source", staticmethod(lambda _s: source))
+    pipeline = MapGenerationPipeline(job_store=job_store, settings=settings)
+
+    pipeline.run(job_store.create("pipeline_test").job_id, make_request())
+    resized = job_store.create("pipeline_test")
+    pipeline.run(resized.job_id, make_request(heightmap_size=512))
+
+    assert len(fetches) == 1
+    assert job_store.get(resized.job_id).stats["resumed_stages"] == ["fetch_dem", "process_terrain"]
 
 
 def test_pipeline_records_terrain_stats(settings, job_store, sample_dem, monkeypatch):
@@ -137,6 +302,26 @@ def test_pipeline_records_terrain_stats(settings, job_store, sample_dem, monkeyp
     stats = job_store.get(job.job_id).stats
     assert stats["data_source"] == "Fake DEM"
     assert stats["terrain"]["min_elevation"] == pytest.approx(100.0, abs=0.5)
+    assert stats["stage_metrics"].keys() == {stage.key for stage in BASE_STAGES}
+    assert all(figures["wall_seconds"] >= 0 for figures in stats["stage_metrics"].values())
+
+
+def test_a_profiled_job_keeps_its_stack_samples(settings, job_store, sample_dem, monkeypatch):
+    pipeline = MapGenerationPipeline(job_store=job_store, settings=settings)
+    monkeypatch.setattr(
+        MapGenerationPipeline, "_resolve_dem_source", staticmethod(lambda _s: FakeSource(sample_dem))
+    )
+    request = make_request(profile=True)
+
+    job = job_store.create("pipeline_test")
+    pipeline.run(job.job_id, request)
+
+    finished = job_store.get(job.job_id)
+    assert finished.status is JobStatus.COMPLETED, finished.error
+    assert finished.to_dict()["profile_url"] == f"/api/profile/{job.job_id}"
+    assert pipeline.result_key(request) is None, "a profiled request always runs afresh"
+    lines = finished.artifacts["profile"].read_text().splitlines()
+    assert any("_run_stages (services/pipeline.py:" in line for line in lines)
 
 
 def test_pipeline_never_raises_on_failure(settings, job_store, sample_dem, monkeypatch):
@@ -208,3 +393,39 @@ def test_imagery_only_source_is_rejected_for_dem(monkeypatch):
 def test_unknown_source_id_is_rejected():
     with pytest.raises(PipelineError, match="Unknown data source"):
         MapGenerationPipeline._resolve_dem_source("not_a_source")
+
+
+def test_worker_processes_produce_the_same_archive(settings, sample_dem, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        MapGenerationPipeline, "_resolve_dem_source", staticmethod(lambda _s: FakeSource(sample_dem))
+    )
+    archives = []
+    for workers in (0, 1):
+        # Separate directories, so the second run neither resumes from the
+        # first one's checkpoints nor reuses its archive entries.
+        settings.process_workers = workers
+        settings.temp_dir = tmp_path / f"temp_{workers}"
+        settings.output_dir = tmp_path / f"output_{workers}"
+        store = JobStore()
+        pipeline = MapGenerationPipeline(job_store=store, settings=settings)
+        job = store.create("pipeline_test")
+        try:
+            pipeline.run(job.job_id, make_request())
+        finally:
+            pipeline.close()
+
+        finished = store.get(job.job_id)
+        assert finished.status is JobStatus.COMPLETED, finished.error
+        archives.append(entries_without_timestamp(finished.artifacts["archive"]))
+
+    assert archives[0] == archives[1]
+
+
+def entries_without_timestamp(archive) -> dict[str, bytes]:
+    """Every entry's content; the notes' generation time is to the minute, so two runs may differ."""
+    with zipfile.ZipFile(archive) as zip_file:
+        entries = {info.filename: zip_file.read(info) for info in zip_file.infolist()}
+    for name, data in entries.items():
+        if name.endswith("WORLDFORGE.md"):
+            entries[name] = re.sub(rb"Generated by .* on [^\n]*", b"", data)
+    return entries
@@ -0,0 +1,166 @@
+"""Process-pool stage runner: shared-memory handoff, cleanup, cancellation, in-thread fallback."""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from core.cancellation import (
+    CancellationToken,
+    JobCancelledError,
+    cancellation_scope,
+    check_cancelled,
+)
+from models.terrain import TerrainData
+from services.process_pool import SHARE_THRESHOLD, StageRunner, WorkerCrashedError
+
+SHM_DIR = Path("/dev/shm")
+
+
+# Worker functions are module-level so a spawned worker can import them.
+
+
+def describe_in_worker(array: np.ndarray) -> tuple[int, bool, float]:
+    # A view onto the parent's shared block does not own its data; an array
+    # that had been pickled across would.
+    return os.getpid(), not array.flags.owndata, float(array.sum())
+
+
+def double_elevation(terrain: TerrainData) -> TerrainData:
+    return TerrainData(terrain.elevation * 2, nodata_fraction=terrain.nodata_fraction)
+
+
+def fail_after_allocating(array: np.ndarray) -> np.ndarray:
+    raise ValueError(f"rejected {array.shape}")
+
+
+def die() -> None:
+    # What the OOM killer or a segfault in a native library looks like.
+    os._exit(1)
+
+
+def run_until_cancelled(started: Path, stopped: Path) -> None:
+    started.touch()
+    deadline = time.monotonic() + 30
+    try:
+        while time.monotonic() < deadline:
+            check_cancelled()
+            time.sleep(0.01)
+    except JobCancelledError:
+        stopped.touch()
+        raise
+
+
+def large_array() -> np.ndarray:
+    side = int(np.sqrt(SHARE_THRESHOLD // 4)) + 16
+    return np.arange(side * side, dtype=np.float32).reshape(side, side).copy()
+
+
+def shared_blocks() -> set[str]:
+    # The pool's own semaphores live here too; only the array blocks matter.
+    return {name for name in os.listdir(SHM_DIR) if name.startswith("psm_")}
+
+
+@pytest.fixture
+def runner():
+    runner = StageRunner(workers=1)
+    yield runner
+    runner.shutdown()
+
+
+def test_zero_workers_runs_on_the_calling_thread():
+    runner = StageRunner(workers=0)
+    array = large_array()
+
+    pid, shared, _ = runner.run(describe_in_worker, array)
+
+    assert runner.in_process
+    assert pid == os.getpid()
+    assert not shared
+
+
+def test_large_arguments_reach_the_worker_through_shared_memory(runner):
+    array = large_array()
+
+    pid, shared, total = runner.run(describe_in_worker, array)
+
+    assert pid != os.getpid()
+    assert shared
+    assert total == pytest.approx(float(array.sum()))
+
+
+def test_dataclass_results_come_back_intact(runner):
+    terrain = TerrainData(large_array(), nodata_fraction=0.25)
+
+    doubled = runner.run(double_elevation, terrain)
+
+    assert isinstance(doubled, TerrainData)
+    assert doubled.nodata_fraction == 0.25
+    np.testing.assert_array_equal(doubled.elevation, terrain.elevation * 2)
+    # The result is a private copy: the worker's block is already gone.
+    assert doubled.elevation.flags.owndata
+
+
+@pytest.mark.skipif(not SHM_DIR.is_dir(), reason="no /dev/shm on this platform")
+def test_shared_blocks_are_removed_after_success_and_failure(runner):
+    before = shared_blocks()
+
+    runner.run(double_elevation, TerrainData(large_array()))
+    with pytest.raises(ValueError, match="rejected"):
+        runner.run(fail_after_allocating, large_array())
+
+    assert shared_blocks() - before == set()
+
+
+def test_a_dead_worker_fails_its_stage_but_not_the_next(runner):
+    with pytest.raises(WorkerCrashedError, match="die"):
+        runner.run(die)
+
+    for _ in range(2):
+        pid, _, _ = runner.run(describe_in_worker, large_array())
+        assert pid != os.getpid()
+
+
+def test_threads_starting_stages_at_once_share_one_pool(runner):
+    start = threading.Barrier(8)
+    pools = []
+
+    def start_stage() -> None:
+        start.wait()
+        pools.append(runner._executor())
+
+    threads = [threading.Thread(target=start_stage) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(pool) for pool in pools}) == 1
+
+
+def test_cancelling_a_job_stops_its_stage_in_the_worker(runner, tmp_path):
+    started, stopped = tmp_path / "started", tmp_path / "stopped"
+    token = CancellationToken()
+
+    def cancel_once_started() -> None:
+        deadline = time.monotonic() + 30
+        while not started.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        token.cancel()
+
+    threading.Thread(target=cancel_once_started, daemon=True).start()
+    with cancellation_scope(token), pytest.raises(JobCancelledError):
+        runner.run(run_until_cancelled, started, stopped)
+    cancelled_at = time.monotonic()
+
+    # The worker is free again: with one worker, this would otherwise queue
+    # behind the abandoned stage for half a minute.
+    pid, _, _ = runner.run(describe_in_worker, large_array())
+    assert pid != os.getpid()
+    assert stopped.exists()
+    assert time.monotonic() - cancelled_at < 5
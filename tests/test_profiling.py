@@ -0,0 +1,47 @@
+"""The per-job sampling profiler."""
+
+from __future__ import annotations
+
+import threading
+import time
+
+from services.profiling import SamplingProfiler, sampled
+
+
+def spin(seconds: float) -> None:
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+def test_stacks_are_folded_root_first_and_counted(tmp_path):
+    profiler = SamplingProfiler(interval_seconds=0.002)
+
+    with profiler.sampling():
+        spin(0.2)
+
+    path = profiler.write_folded(tmp_path / "job.folded")
+    stacks = dict(line.rsplit(" ", 1) for line in path.read_text().splitlines())
+    thread = threading.current_thread().name
+    assert all(stack.startswith(f"{thread};") for stack in stacks)
+    leaf = f";spin (test_profiling.py:{spin.__code__.co_firstlineno})"
+    assert any(stack.endswith(leaf) for stack in stacks)
+    assert sum(int(count) for count in stacks.values()) == profiler.samples > 10
+
+
+def test_only_threads_handed_over_with_sampled_are_followed(tmp_path):
+    profiler = SamplingProfiler(interval_seconds=0.002)
+    bystander = threading.Thread(target=spin, args=(0.3,), name="bystander")
+    bystander.start()
+
+    with profiler.sampling():
+        branch = threading.Thread(target=sampled(spin), args=(0.2,), name="branch")
+        branch.start()
+        branch.join()
+
+    bystander.join()
+    folded = profiler.write_folded(tmp_path / "job.folded").read_text().splitlines()
+    threads = {line.split(";", 1)[0] for line in folded}
+    assert "branch" in threads
+    assert "bystander" not in threads
+    assert sampled(spin) is spin, "outside a profiled job nothing is wrapped"
@@ -0,0 +1,305 @@
+"""Job scheduler: ordering, fast lane, bounded queue, positions, restarts, admission, cancelling."""
+
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from core.cancellation import check_cancelled
+from models.map_request import MapGenerationRequest
+from services.admission import AdmissionController, estimate_peak_bytes
+from services.job_queue.sqlite_backend import SqliteJobBackend
+from services.jobs import JobStatus, JobStore
+from services.scheduler import JobScheduler, Lane, QueueFullError, lane_for
+
+
+def make_request(**overrides) -> MapGenerationRequest:
+    payload = {
+        "name": "scheduled_map",
+        "bbox": {
+            "min_lat": 37.7749,
+            "max_lat": 37.8049,
+            "min_lon": -122.4294,
+            "max_lon": -122.3994,
+        },
+        "heightmap_size": 4096,
+        "data_source": "auto",
+        "use_ai_segmentation": False,
+    }
+    payload.update(overrides)
+    return MapGenerationRequest(**payload)
+
+
+class Recorder:
+    """Stands in for the pipeline: records start order and blocks until released."""
+
+    def __init__(self, job_store: JobStore) -> None:
+        self.job_store = job_store
+        self.started: list[str] = []
+        self.gate = threading.Event()
+        self._started = threading.Condition()
+
+    def __call__(self, job_id: str, _request: MapGenerationRequest) -> None:
+        with self._started:
+            self.started.append(job_id)
+            self._started.notify_all()
+        # Polls like a pipeline stage does, so a held job can be cancelled.
+        deadline = time.monotonic() + 10
+        while not self.gate.wait(0.01):
+            check_cancelled()
+            assert time.monotonic() < deadline, "test never released the job"
+        self.job_store.update(job_id, status=JobStatus.COMPLETED)
+
+    def wait_started(self, count: int) -> None:
+        with self._started:
+            assert self._started.wait_for(lambda: len(self.started) >= count, timeout=10)
+
+
+@pytest.fixture
+def recorder(job_store):
+    recorder = Recorder(job_store)
+    yield recorder
+    recorder.gate.set()
+
+
+def submit(scheduler: JobScheduler, job_store: JobStore, **overrides) -> str:
+    job = job_store.create("scheduled_map")
+    scheduler.submit(job.job_id, make_request(**overrides))
+    return job.job_id
+
+
+def finish(scheduler: JobScheduler, recorder: Recorder) -> None:
+    recorder.gate.set()
+    assert scheduler.drain(timeout=10)
+    scheduler.shutdown()
+
+
+def test_small_jobs_without_ai_take_the_fast_lane():
+    assert lane_for(make_request(heightmap_size=1024), fast_max_heightmap=1024) is Lane.FAST
+    assert lane_for(make_request(heightmap_size=2048), fast_max_heightmap=1024) is Lane.STANDARD
+    ai_request = make_request(heightmap_size=256, use_ai_segmentation=True)
+    assert lane_for(ai_request, fast_max_heightmap=1024) is Lane.STANDARD
+
+
+def test_jobs_in_one_lane_run_in_submission_order(job_store, recorder):
+    scheduler = JobScheduler(recorder, job_store, workers=1)
+    running = submit(scheduler, job_store)
+    recorder.wait_started(1)
+    waiting = [submit(scheduler, job_store) for _ in range(3)]
+
+    finish(scheduler, recorder)
+
+    assert recorder.started == [running, *waiting]
+
+
+def test_fast_lane_jobs_overtake_queued_standard_jobs(job_store, recorder):
+    scheduler = JobScheduler(recorder, job_store, workers=1)
+    running = submit(scheduler, job_store)
+    recorder.wait_started(1)
+    large = submit(scheduler, job_store, heightmap_size=4096)
+    small = submit(scheduler, job_store, heightmap_size=512)
+
+    assert scheduler.position(small) == 1
+    assert scheduler.position(large) == 2
+    finish(scheduler, recorder)
+
+    assert recorder.started == [running, small, large]
+
+
+def test_long_waiting_standard_jobs_are_promoted(job_store, recorder, monkeypatch):
+    monkeypatch.setattr("services.scheduler.PROMOTE_AFTER_SECONDS", 0)
+    scheduler = JobScheduler(recorder, job_store, workers=1)
+    submit(scheduler, job_store)
+    recorder.wait_started(1)
+    large = submit(scheduler, job_store, heightmap_size=4096)
+    small = submit(scheduler, job_store, heightmap_size=512)
+
+    assert [scheduler.position(large), scheduler.position(small)] == [1, 2]
+    finish(scheduler, recorder)
+
+
+def test_fast_lane_worker_runs_small_jobs_while_every_slot_is_busy(job_store, recorder):
+    scheduler = JobScheduler(recorder, job_store, workers=1, fast_lane_workers=1)
+    submit(scheduler, job_store, heightmap_size=4096)
+    recorder.wait_started(1)
+    queued_large = submit(scheduler, job_store, heightmap_size=4096)
+    small = submit(scheduler, job_store, heightmap_size=256)
+
+    recorder.wait_started(2)
+    assert recorder.started[1] == small
+    assert scheduler.position(queued_large) == 1, "the fast lane worker never takes large jobs"
+    finish(scheduler, recorder)
+
+
+def test_a_full_queue_refuses_new_jobs(job_store, recorder):
+    scheduler = JobScheduler(recorder, job_store, workers=1, max_queued=1)
+    submit(scheduler, job_store)
+    recorder.wait_started(1)
+    submit(scheduler, job_store)
+
+    with pytest.raises(QueueFullError):
+        submit(scheduler, job_store)
+    finish(scheduler, recorder)
+
+
+def test_queue_positions_are_reported_on_the_job_and_cleared_on_start(job_store, recorder):
+    scheduler = JobScheduler(recorder, job_store, workers=1)
+    first = submit(scheduler, job_store)
+    recorder.wait_started(1)
+    second = submit(scheduler, job_store)
+    third = submit(scheduler, job_store)
+
+    assert job_store.get(second).to_dict()["queue_position"] == 1
+    assert job_store.get(third).to_dict()["queue_position"] == 2
+    assert "queue_position" not in job_store.get(first).to_dict()
+
+    assert scheduler.cancel(second)
+    assert job_store.get(second).status is JobStatus.CANCELLED
+    assert job_store.get(third).queue_position == 1
+    finish(scheduler, recorder)
+    assert recorder.started == [first, third]
+
+
+def test_cancelling_a_running_job_frees_its_slot(job_store, recorder):
+    scheduler = JobScheduler(recorder, job_store, workers=1)
+    running = submit(scheduler, job_store)
+    recorder.wait_started(1)
+    waiting = submit(scheduler, job_store)
+
+    assert scheduler.cancel(running)
+    assert scheduler.wait_stopped(running, timeout=1)
+    recorder.wait_started(2)
+
+    assert job_store.get(running).status is JobStatus.CANCELLED
+    assert recorder.started == [running, waiting]
+    assert not scheduler.cancel(running), "a finished job has nothing to cancel"
+    finish(scheduler, recorder)
+
+
+def test_queued_and_running_jobs_survive_a_restart(tmp_path, recorder):
+    state = tmp_path / "queue.json"
+    before = JobStore()
+    stopped = JobScheduler(recorder, before, workers=1, state_path=state)
+    running = submit(stopped, before)
+    recorder.wait_started(1)
+    waiting = submit(stopped, before)
+    # The process goes away with one job running and one waiting.
+    stopped.shutdown(wait=False)
+
+    after = JobStore()
+    ran: list[str] = []
+    restarted = JobScheduler(
+        lambda job_id, _request: ran.append(job_id), after, workers=1, state_path=state
+    )
+
+    assert restarted.restore() == 2
+    assert after.get(running).map_name == "scheduled_map"
+    assert restarted.drain(timeout=10)
+    restarted.shutdown()
+    assert ran == [running, waiting]
+
+
+def test_a_reloaded_job_is_requeued_under_its_own_record(tmp_path, recorder):
+    state = tmp_path / "queue.json"
+    before = JobStore()
+    before.open_database(SqliteJobBackend(tmp_path / "jobs.db"))
+    stopped = JobScheduler(recorder, before, workers=1, state_path=state)
+    running = submit(stopped, before)
+    recorder.wait_started(1)
+    stopped.shutdown(wait=False)
+    before.close_database()
+
+    after = JobStore()
+    after.open_database(SqliteJobBackend(tmp_path / "jobs.db"))
+    ran: list[str] = []
+    restarted = JobScheduler(
+        lambda job_id, _request: ran.append(job_id), after, workers=1, state_path=state
+    )
+
+    assert restarted.restore() == 1
+    assert restarted.drain(timeout=10)
+    restarted.shutdown()
+    assert ran == [running]
+    assert len(after) == 1
+    after.close_database()
+
+
+def test_unfinished_jobs_the_queue_file_lost_are_failed(tmp_path, job_store):
+    orphan = job_store.create("scheduled_map")
+    job_store.update(orphan.job_id, status=JobStatus.PROCESSING)
+    scheduler = JobScheduler(lambda *_: None, job_store, workers=1, state_path=tmp_path / "queue.json")
+
+    assert scheduler.restore() == 0
+
+    failed = job_store.get(orphan.job_id)
+    assert failed.status is JobStatus.FAILED
+    assert "restart" in failed.error
+
+
+def test_a_corrupt_queue_file_restores_nothing(tmp_path, job_store):
+    state = tmp_path / "queue.json"
+    state.write_text("{not json", encoding="utf-8")
+
+    scheduler = JobScheduler(lambda *_: None, job_store, workers=1, state_path=state)
+
+    assert scheduler.restore() == 0
+    assert len(job_store) == 0
+
+
+# -- memory admission -----------------------------------------------------------
+
+
+def test_small_jobs_run_side_by_side_within_the_memory_budget(job_store, recorder):
+    small = estimate_peak_bytes(make_request(heightmap_size=256))
+    scheduler = JobScheduler(
+        recorder, job_store, workers=3, admission=AdmissionController(3 * small)
+    )
+    for _ in range(3):
+        submit(scheduler, job_store, heightmap_size=256)
+
+    recorder.wait_started(3)
+    finish(scheduler, recorder)
+
+
+def test_a_job_waits_until_running_jobs_leave_it_room(job_store, recorder):
+    large_request = make_request(heightmap_size=4096, use_ai_segmentation=True)
+    scheduler = JobScheduler(
+        recorder,
+        job_store,
+        workers=2,
+        admission=AdmissionController(estimate_peak_bytes(large_request)),
+    )
+    large = submit(scheduler, job_store, heightmap_size=4096, use_ai_segmentation=True)
+    recorder.wait_started(1)
+    small = submit(scheduler, job_store, heightmap_size=256)
+
+    time.sleep(0.2)
+    assert recorder.started == [large], "the budget is fully used by the large job"
+    assert scheduler.position(small) == 1
+
+    finish(scheduler, recorder)
+    assert recorder.started == [large, small]
+    stats = job_store.get(large).stats
+    assert stats["estimated_peak_mb"] == pytest.approx(
+        estimate_peak_bytes(large_request) / (1024 * 1024), abs=0.1
+    )
+
+
+def test_a_promoted_job_that_does_not_fit_is_not_overtaken(job_store, recorder, monkeypatch):
+    monkeypatch.setattr("services.scheduler.PROMOTE_AFTER_SECONDS", 0)
+    small_request = make_request(heightmap_size=256)
+    large_request = make_request(heightmap_size=4096)
+    budget = estimate_peak_bytes(large_request) + estimate_peak_bytes(small_request) // 2
+    scheduler = JobScheduler(recorder, job_store, workers=2, admission=AdmissionController(budget))
+
+    first = submit(scheduler, job_store, heightmap_size=256)
+    recorder.wait_started(1)
+    large = submit(scheduler, job_store, heightmap_size=4096)
+    late_small = submit(scheduler, job_store, heightmap_size=256)
+
+    time.sleep(0.2)
+    assert recorder.started == [first], "the small job would fit, but must not overtake"
+    finish(scheduler, recorder)
+    assert recorder.started == [first, large, late_small]
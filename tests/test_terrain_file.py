@@ -133,3 +133,70 @@ def test_reading_an_unknown_version_fails_loudly(tmp_path, heightmap):
 
     with pytest.raises(TerrainFileError, match="version"):
         read_ter(path)
+
+
+def test_read_returns_read_only_views_into_the_file(tmp_path, heightmap):
+    path = write_ter(tmp_path / "t.ter", heightmap)
+    heights, indices, _ = read_ter(path)
+
+    assert isinstance(heights, np.memmap)
+    assert isinstance(indices, np.memmap)
+    with pytest.raises(ValueError):
+        heights[0, 0] = 1
+
+
+def test_truncated_file_is_reported_as_such(tmp_path, heightmap):
+    path = write_ter(tmp_path / "t.ter", heightmap)
+    path.write_bytes(path.read_bytes()[:1000])
+
+    with pytest.raises(TerrainFileError, match="truncated"):
+        read_ter(path)
+
+
+def test_out_of_range_indices_are_not_wrapped_into_valid_ones(tmp_path, heightmap):
+    """256 cast to uint8 is 0 - the range check has to see the original value."""
+    indices = np.zeros((128, 128), dtype=np.int32)
+    indices[0, 0] = 256
+
+    with pytest.raises(TerrainFileError, match="not declared"):
+        write_ter(tmp_path / "t.ter", heightmap, material_indices=indices)
+
+
+def test_round_trip_stays_within_a_few_blocks_of_memory(tmp_path, monkeypatch):
+    """
+    Writing streams row blocks and reading maps the file, at any size.
+
+    Blocks are shrunk to 128 KB so a 2048 grid spans 64 of them; the timed
+    8192 round trip is ``benchmarks/bench_export.py::test_ter_round_trip``.
+    The heightmap itself (8 MB) is memory-mapped so it does not count against
+    the budget; what is measured is what writing and reading *add*. Before
+    streaming, writing added a full ``tobytes`` of each grid and reading the
+    file plus a copy of each grid.
+    """
+    import tracemalloc
+
+    from services.export import terrain_file
+
+    monkeypatch.setattr(terrain_file, "BLOCK_BYTES", 128 * 1024)
+    size = 2048
+    source = np.memmap(tmp_path / "source.u16", dtype="<u2", mode="w+", shape=(size, size))
+    source[:] = np.arange(size, dtype=np.uint16)[:, None]
+    source.flush()
+
+    tracemalloc.start()
+    try:
+        path = write_ter(tmp_path / "big.ter", source)
+        _, write_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        heights, indices, materials = read_ter(path)
+        assert heights[2000, 17] == 2000
+        assert int(indices[::512, ::512].max()) == 0
+        _, read_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert materials == ["grass"]
+    assert path.stat().st_size == 5 + size * size * 3 + 4 + 1 + len("grass")
+    assert write_peak < 1024 * 1024, f"write peaked at {write_peak / 1e6:.1f} MB"
+    assert read_peak < 256 * 1024, f"read peaked at {read_peak / 1e3:.0f} KB"
@@ -0,0 +1,173 @@
+"""Terrain material painting: rule evaluation, mask alignment, streaming, cost."""
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from services.export import terrain_materials
+from services.export.terrain_file import read_ter, write_ter
+from services.export.terrain_materials import (
+    DEFAULT_LAYERS,
+    DEFAULT_MATERIALS,
+    LandCoverMask,
+    MaterialClassifier,
+    MaterialLayer,
+)
+
+GRASS, DIRT, ROCK, SAND, FOREST = range(5)
+
+
+def classifier_for(metres: np.ndarray, **kwargs) -> MaterialClassifier:
+    """Normalise a metre grid into a heightmap exactly as the pipeline does."""
+    low, high = float(metres.min()), float(metres.max())
+    span = max(high - low, 1e-6)
+    heights = np.rint((metres - low) / span * 65535).astype(np.uint16)
+    kwargs.setdefault("square_size", 1.0)
+    return MaterialClassifier(heights, min_elevation=low, elevation_range=span, **kwargs)
+
+
+def terraced(size: int = 128) -> np.ndarray:
+    """Flat west third, a 0.5 (27 degree) middle third, a 1.5 (56 degree) east third."""
+    column = np.arange(size, dtype=np.float64)
+    third = size // 3
+    profile = np.where(
+        column < third,
+        0.0,
+        np.where(column < 2 * third, (column - third) * 0.5, third * 0.5 + (column - 2 * third) * 1.5),
+    )
+    return np.tile(profile, (size, 1))
+
+
+def test_every_layer_paints_a_declared_material():
+    declared = {material.name for material in DEFAULT_MATERIALS}
+    assert {layer.material for layer in DEFAULT_LAYERS} <= declared
+    assert DEFAULT_MATERIALS[0].name == "grass"
+
+
+def test_flat_terrain_is_all_grass():
+    indices = classifier_for(np.zeros((64, 64))).classify()
+
+    assert indices.dtype == np.uint8
+    assert np.all(indices == GRASS)
+
+
+def test_slope_rules_paint_dirt_and_rock():
+    indices = classifier_for(terraced()).classify()
+    row = indices[64]
+
+    assert np.all(row[5:38] == GRASS)
+    assert np.all(row[48:80] == DIRT)
+    assert np.all(row[92:123] == ROCK)
+
+
+def test_height_rule_paints_high_alpine_rock():
+    metres = np.full((64, 64), 3000.0)
+    metres[:, 32:] = 3500.0
+    metres[0, 0] = 2999.0  # give the grid a span so the two plateaus differ
+
+    indices = classifier_for(metres, square_size=1000.0).classify()
+
+    assert np.all(indices[10:, 5:25] == GRASS)
+    assert np.all(indices[10:, 40:60] == ROCK)
+
+
+def test_ridges_are_detected_by_curvature():
+    column = np.arange(128, dtype=np.float64)
+    # A sharp tent ridge at column 64 with 0.35 (19 degree) flanks: too gentle
+    # for the slope rules on their own.
+    metres = np.tile(-np.abs(column - 64) * 0.35, (128, 1))
+
+    indices = classifier_for(metres).classify()
+
+    assert indices[64, 64] == ROCK
+    assert np.all(indices[64, 10:50] == GRASS)
+
+
+def test_masks_are_skipped_when_segmentation_did_not_run():
+    classifier = classifier_for(np.zeros((64, 64)))
+    assert all(rule.mask is None for rule in classifier._rules)
+
+
+def test_water_mask_paints_sand_in_the_right_place():
+    mask = np.zeros((100, 100), dtype=np.uint8)
+    mask[:, :50] = 255  # west half of the imagery is a lake
+
+    indices = classifier_for(
+        np.zeros((64, 64)),
+        bbox=[0.0, 0.0, 1.0, 1.0],
+        land_cover={"water": LandCoverMask(mask, [0.0, 0.0, 1.0, 1.0])},
+    ).classify()
+
+    assert np.all(indices[:, :31] == SAND)
+    assert np.all(indices[:, 33:] == GRASS)
+
+
+def test_masks_are_aligned_to_the_cropped_terrain_region():
+    """The terrain covers the square crop; the mask covers the whole request."""
+    mask = np.zeros((100, 200), dtype=np.uint8)
+    mask[:, 100:] = 255  # forest on the east half of a 2:1 request
+
+    indices = classifier_for(
+        np.zeros((64, 64)),
+        # The centred square crop: longitudes 0.5-1.5 of a 0-2 request.
+        bbox=[0.5, 0.0, 1.5, 1.0],
+        land_cover={"forest": LandCoverMask(mask, [0.0, 0.0, 2.0, 1.0])},
+    ).classify()
+
+    assert np.all(indices[:, :31] == GRASS)
+    assert np.all(indices[:, 33:] == FOREST)
+
+
+def test_terrain_outside_the_imagery_gets_the_default_material():
+    mask = np.full((100, 100), 255, dtype=np.uint8)  # all forest, up to its east edge
+
+    indices = classifier_for(
+        np.zeros((64, 64)),
+        # The terrain reaches half a degree further east than the imagery.
+        bbox=[0.0, 0.0, 1.0, 1.0],
+        land_cover={"forest": LandCoverMask(mask, [0.0, 0.0, 0.5, 1.0])},
+    ).classify()
+
+    assert np.all(indices[:, :31] == FOREST)
+    assert np.all(indices[:, 33:] == GRASS)
+
+
+def test_blocked_classification_matches_a_single_block(monkeypatch):
+    rng = np.random.default_rng(3)
+    metres = np.cumsum(rng.normal(0, 1.0, size=(128, 128)), axis=0) * 2.0
+    whole = classifier_for(metres).classify()
+
+    # Force ~3-row blocks; the one-row halo must make block edges invisible.
+    monkeypatch.setattr(terrain_materials, "BLOCK_BYTES", 128 * 4 * 3)
+    blocked = classifier_for(metres).classify()
+
+    assert len(np.unique(whole)) > 1
+    assert np.array_equal(whole, blocked)
+
+
+def test_streamed_into_the_ter_file(tmp_path):
+    classifier = classifier_for(terraced())
+
+    path = write_ter(
+        tmp_path / "t.ter",
+        classifier.heightmap,
+        material_names=classifier.material_names,
+        material_indices=classifier.block,
+    )
+    _, indices, materials = read_ter(path)
+
+    assert materials == [material.name for material in DEFAULT_MATERIALS]
+    assert np.array_equal(indices, classifier.classify())
+
+
+def test_undeclared_layer_material_is_rejected():
+    with pytest.raises(ValueError, match="undeclared"):
+        MaterialClassifier(
+            np.zeros((64, 64), dtype=np.uint16),
+            min_elevation=0,
+            elevation_range=1,
+            square_size=1,
+            layers=(MaterialLayer("lava", "lava"),),
+        )
+
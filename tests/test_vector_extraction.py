@@ -16,7 +16,11 @@ from core.geo import meters_per_degree_lon
 from core.projection import LocalProjection
 from services.beamng_integration import BuildingPlacer, MeshBuilder, RoadBuilder
 from services.vector_extraction.contour_extractor import ContourExtractor
-from services.vector_extraction.skeleton import simplify_polyline, trace_skeleton
+from services.vector_extraction.skeleton import (
+    simplify_polyline,
+    simplify_polylines,
+    trace_skeleton,
+)
 from services.vector_extraction.vectorizer import Vectorizer
 
 SF_BBOX = [-122.62, 37.88, -122.55, 37.94]
@@ -99,6 +103,52 @@ def test_empty_and_invalid_input():
         trace_skeleton(np.zeros((4, 4, 3)))
 
 
+def reference_trace(mask: np.ndarray) -> list[list[tuple[int, int]]]:
+    """The pixel-by-pixel walker ``trace_skeleton`` replaced, as the oracle."""
+    offsets = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc]
+    pixels = {(int(r), int(c)) for r, c in zip(*np.nonzero(mask), strict=True)}
+
+    def around(point):
+        candidates = [(point[0] + dr, point[1] + dc) for dr, dc in offsets]
+        return [candidate for candidate in candidates if candidate in pixels]
+
+    degree = {point: len(around(point)) for point in pixels}
+    visited: set[frozenset] = set()
+    paths = []
+    ends = sorted(point for point in pixels if degree[point] == 1)
+    junctions = sorted(point for point in pixels if degree[point] >= 3)
+    for start in ends + junctions + sorted(pixels):
+        for step in around(start):
+            if frozenset((start, step)) in visited:
+                continue
+            visited.add(frozenset((start, step)))
+            path, previous = [start, step], start
+            while degree[path[-1]] == 2:
+                options = [
+                    point
+                    for point in around(path[-1])
+                    if point != previous and frozenset((path[-1], point)) not in visited
+                ]
+                if not options:
+                    break
+                visited.add(frozenset((path[-1], options[0])))
+                previous = path[-1]
+                path.append(options[0])
+                if path[-1] == start:
+                    break
+            paths.append([(c, r) for r, c in path])
+    return paths
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_tracing_matches_the_pixel_walker(seed):
+    """Tangles of junctions, spurs, rings and diagonal steps, path for path."""
+    rng = np.random.default_rng(seed)
+    noise = rng.random((60, 60)) < 0.45
+    for mask in (noise, skeletonise(noise.astype(np.uint8))):
+        assert trace_skeleton(mask) == reference_trace(mask)
+
+
 def test_simplify_keeps_the_shape():
     straight = [(x, 10) for x in range(50)]
     assert simplify_polyline(straight, 2.0) == [(0, 10), (49, 10)]
@@ -110,6 +160,43 @@ def test_simplify_keeps_the_shape():
     assert simplified[-1] == corner[-1]
 
 
+def reference_simplify(points: list, tolerance: float) -> list:
+    """Recursive Douglas-Peucker, as ``simplify_polyline`` was written before batching."""
+    if len(points) <= 2:
+        return list(points)
+    (x0, y0), (x1, y1) = points[0], points[-1]
+    chord = float(np.hypot(x1 - x0, y1 - y0))
+    distances = [
+        abs((y1 - y0) * x - (x1 - x0) * y + x1 * y0 - y1 * x0) / chord
+        if chord
+        else float(np.hypot(x - x0, y - y0))
+        for x, y in points[1:-1]
+    ]
+    farthest = int(np.argmax(distances)) + 1
+    if distances[farthest - 1] <= tolerance:
+        return [points[0], points[-1]]
+    left = reference_simplify(points[: farthest + 1], tolerance)
+    return left[:-1] + reference_simplify(points[farthest:], tolerance)
+
+
+def test_simplifying_in_a_batch_matches_the_recursion():
+    rng = np.random.default_rng(7)
+    walks = [np.cumsum(rng.integers(-2, 3, (n, 2)), axis=0) for n in (0, 1, 2, 3, 40, 900)]
+    lines = [[(int(x), int(y)) for x, y in walk] for walk in walks]
+
+    batched = simplify_polylines(walks, 1.5)
+
+    assert all(kept.dtype == np.int32 for kept in batched)
+    assert [kept.tolist() for kept in batched] == [
+        [list(point) for point in reference_simplify(line, 1.5)] for line in lines
+    ]
+    assert simplify_polyline(lines[-1], 1.5) == reference_simplify(lines[-1], 1.5)
+    assert [len(kept) for kept in batched[:3]] == [0, 1, 2]
+    assert len(batched[-1]) < len(lines[-1]) / 2
+    assert batched[-1][0].tolist() == list(lines[-1][0])
+    assert simplify_polylines([]) == []
+
+
 # -- contour extraction ---------------------------------------------------------
 
 
@@ -165,6 +252,35 @@ def test_rectangle_to_polygon_works_on_numpy_2(extractor):
     assert all(isinstance(value, int) for point in polygon for value in point)
 
 
+def town_mask(size: int = 520) -> np.ndarray:
+    """Roads of several widths plus buildings across tile seams, a courtyard and a plaza."""
+    import cv2
+
+    rng = np.random.default_rng(3)
+    mask = np.zeros((size, size), np.uint8)
+    for _ in range(12):
+        start, end = rng.integers(0, size, (2, 2)).tolist()
+        cv2.line(mask, start, end, 255, int(rng.integers(3, 15)))
+    for x, y in rng.integers(0, size - 30, (60, 2)).tolist():
+        mask[y : y + int(rng.integers(8, 30)), x : x + int(rng.integers(8, 30))] = 255
+    mask[150:330, 150:330] = 255  # larger than a tile's halo
+    mask[190:290, 190:290] = 0  # a courtyard...
+    mask[230:250, 230:250] = 255  # ...with a building inside it
+    return mask
+
+
+def test_tiled_extraction_matches_the_whole_mask():
+    mask = town_mask()
+    whole = ContourExtractor(simplify_tolerance=2.0)
+    tiled = ContourExtractor(simplify_tolerance=2.0, tile_size=160, workers=3)
+
+    for method in ("extract_centerlines", "extract_contours"):
+        expected = getattr(whole, method)(mask)
+        result = getattr(tiled, method)(mask)
+        assert len(result) == len(expected) > 10
+        assert all(np.array_equal(a, b) for a, b in zip(result, expected, strict=True))
+
+
 # -- vectorising ----------------------------------------------------------------
 
 
@@ -0,0 +1,229 @@
+"""
+Parallel ZIP writer.
+
+The properties that matter: the output is an ordinary archive any reader
+accepts, chunked compression reassembles to the original bytes, and the bytes
+depend on the input alone - not on thread count or file timestamps.
+"""
+
+from __future__ import annotations
+
+import os
+import zipfile
+import zlib
+
+import numpy as np
+import pytest
+
+from services.export import zip_writer
+from services.export.zip_writer import Build, deflate_chunk, write_zip
+
+
+@pytest.fixture
+def sources(tmp_path):
+    """A mix of entry sizes: empty, tiny, and several chunks of compressible data."""
+    directory = tmp_path / "src"
+    directory.mkdir()
+
+    rng = np.random.default_rng(7)
+    terrain = np.cumsum(rng.integers(-3, 4, size=300_000), dtype=np.int64).astype("<u2")
+
+    files = {
+        "a/empty.txt": b"",
+        "a/info.json": b'{"title": "Test"}',
+        "b/terrain.ter": terrain.tobytes(),
+        "b/noise.bin": rng.integers(0, 256, size=50_000, dtype=np.uint8).tobytes(),
+    }
+    pairs = []
+    for name, payload in files.items():
+        path = directory / name.replace("/", "_")
+        path.write_bytes(payload)
+        pairs.append((name, path))
+    return pairs, files
+
+
+def read_all(archive):
+    with zipfile.ZipFile(archive) as zip_file:
+        assert zip_file.testzip() is None
+        return {info.filename: zip_file.read(info) for info in zip_file.infolist()}
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_archive_round_trips_through_zipfile(tmp_path, sources, workers):
+    pairs, expected = sources
+
+    archive = write_zip(tmp_path / "out.zip", pairs, workers=workers, chunk_size=64 * 1024)
+
+    assert read_all(archive) == expected
+
+
+def test_entries_are_deflated(tmp_path, sources):
+    pairs, _ = sources
+
+    archive = write_zip(tmp_path / "out.zip", pairs, chunk_size=64 * 1024)
+
+    with zipfile.ZipFile(archive) as zip_file:
+        for info in zip_file.infolist():
+            assert info.compress_type == zipfile.ZIP_DEFLATED
+        terrain = zip_file.getinfo("b/terrain.ter")
+        assert terrain.compress_size < terrain.file_size / 2
+
+
+def test_bytes_do_not_depend_on_worker_count(tmp_path, sources):
+    pairs, _ = sources
+
+    serial = write_zip(tmp_path / "serial.zip", pairs, workers=1, chunk_size=64 * 1024)
+    parallel = write_zip(tmp_path / "parallel.zip", pairs, workers=8, chunk_size=64 * 1024)
+
+    assert serial.read_bytes() == parallel.read_bytes()
+
+
+def test_bytes_do_not_depend_on_file_timestamps(tmp_path, sources):
+    """zipfile recorded each staging file's mtime, so re-exports never matched."""
+    pairs, _ = sources
+
+    first = write_zip(tmp_path / "first.zip", pairs).read_bytes()
+    for _, path in pairs:
+        os.utime(path, (1_700_000_000, 1_700_000_000))
+    second = write_zip(tmp_path / "second.zip", pairs).read_bytes()
+
+    assert first == second
+
+
+def test_chunked_stream_is_one_valid_deflate_stream():
+    data = bytes(range(256)) * 4096
+    pieces = [data[i : i + 100_000] for i in range(0, len(data), 100_000)]
+
+    stream = b"".join(
+        deflate_chunk(
+            piece,
+            data[max(0, index * 100_000 - 32 * 1024) : index * 100_000] or None,
+            last=index == len(pieces) - 1,
+            level=6,
+        )
+        for index, piece in enumerate(pieces)
+    )
+
+    assert zlib.decompress(stream, -15) == data
+
+
+def test_chunking_costs_almost_nothing_in_ratio():
+    rng = np.random.default_rng(1)
+    data = np.cumsum(rng.integers(-2, 3, size=1_000_000), dtype=np.int64).astype("<u2").tobytes()
+
+    whole = len(deflate_chunk(data, None, last=True, level=6))
+    chunk = 256 * 1024
+    pieces = [data[i : i + chunk] for i in range(0, len(data), chunk)]
+    chunked = sum(
+        len(
+            deflate_chunk(
+                piece,
+                data[max(0, i * chunk - 32 * 1024) : i * chunk] or None,
+                last=i == len(pieces) - 1,
+                level=6,
+            )
+        )
+        for i, piece in enumerate(pieces)
+    )
+
+    assert chunked < whole * 1.01
+
+
+def test_non_ascii_names_are_flagged_utf8(tmp_path):
+    source = tmp_path / "f.txt"
+    source.write_bytes(b"x")
+
+    archive = write_zip(tmp_path / "out.zip", [("levels/zürich/f.txt", source)])
+
+    with zipfile.ZipFile(archive) as zip_file:
+        assert zip_file.namelist() == ["levels/zürich/f.txt"]
+
+
+def test_failed_write_leaves_the_previous_archive_alone(tmp_path, sources):
+    pairs, expected = sources
+    archive = write_zip(tmp_path / "out.zip", pairs)
+
+    with pytest.raises(FileNotFoundError):
+        write_zip(archive, [*pairs, ("missing", tmp_path / "does-not-exist")])
+
+    assert read_all(archive) == expected
+    assert not list(tmp_path.glob("*.partial"))
+
+
+def build(tmp_path, pairs, name="out.zip", **kwargs) -> Build:
+    """Write an archive with its manifest, ready to be rebuilt from."""
+    manifest = tmp_path / f"{name}.manifest.json"
+    return Build(write_zip(tmp_path / name, pairs, manifest=manifest, **kwargs), manifest)
+
+
+def test_incremental_rebuild_matches_a_full_rebuild(tmp_path, sources):
+    pairs, expected = sources
+    previous = build(tmp_path, pairs, chunk_size=64 * 1024)
+    assert previous.manifest.is_file()
+
+    expected["a/info.json"] = b'{"title": "Renamed"}'
+    dict(pairs)["a/info.json"].write_bytes(expected["a/info.json"])
+
+    incremental = write_zip(
+        tmp_path / "next.zip", pairs, previous=previous, chunk_size=64 * 1024
+    )
+    full = write_zip(tmp_path / "full.zip", pairs, chunk_size=64 * 1024)
+
+    assert incremental.read_bytes() == full.read_bytes()
+    assert read_all(incremental) == expected
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_unchanged_entries_are_not_recompressed(tmp_path, sources, monkeypatch, workers):
+    pairs, _ = sources
+    previous = build(tmp_path, pairs, chunk_size=64 * 1024)
+    dict(pairs)["a/info.json"].write_bytes(b'{"title": "Renamed"}')
+
+    compressed = []
+    original = zip_writer.deflate_chunk
+    monkeypatch.setattr(
+        zip_writer, "deflate_chunk", lambda data, *args: compressed.append(data) or original(data, *args)
+    )
+    write_zip(previous.archive, pairs, previous=previous, workers=workers, chunk_size=64 * 1024)
+
+    assert compressed == [b'{"title": "Renamed"}']
+
+
+def test_renamed_entries_are_matched_by_content(tmp_path, sources, monkeypatch):
+    """Renaming a map renames its level directory, and so every entry."""
+    pairs, expected = sources
+    previous = build(tmp_path, pairs)
+    renamed = [(f"renamed/{name}", source) for name, source in pairs]
+
+    calls = []
+    original = zip_writer.deflate_chunk
+    monkeypatch.setattr(zip_writer, "deflate_chunk", lambda *args: calls.append(1) or original(*args))
+    archive = write_zip(tmp_path / "renamed.zip", renamed, previous=previous)
+
+    assert calls == []
+    assert read_all(archive) == {f"renamed/{name}": data for name, data in expected.items()}
+
+
+def test_changed_settings_invalidate_the_manifest(tmp_path, sources, monkeypatch):
+    pairs, expected = sources
+    previous = build(tmp_path, pairs, compresslevel=6)
+
+    calls = []
+    original = zip_writer.deflate_chunk
+    monkeypatch.setattr(zip_writer, "deflate_chunk", lambda *args: calls.append(1) or original(*args))
+    archive = write_zip(tmp_path / "next.zip", pairs, previous=previous, compresslevel=9)
+
+    assert len(calls) >= len(pairs)
+    assert read_all(archive) == expected
+
+
+def test_archive_replaced_behind_the_manifest_is_not_trusted(tmp_path, sources):
+    pairs, expected = sources
+    previous = build(tmp_path, pairs)
+    # Something else overwrote the archive but left the old manifest behind.
+    with zipfile.ZipFile(previous.archive, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr("b/terrain.ter", b"not the terrain")
+
+    archive = write_zip(tmp_path / "next.zip", pairs, previous=previous)
+
+    assert read_all(archive) == expected